@@ -908,18 +908,27 @@ class CloudController(object):
                 'status': volume['attach_status'],
                 'volumeId': ec2utils.id_to_ec2_vol_id(volume_id)}
 
-    def _format_kernel_id(self, context, instance_ref, result, key):
+    def _format_kernel_id(self, context, instance_ref, result, key,
+                          memo=None):
         kernel_uuid = instance_ref['kernel_id']
         if kernel_uuid is None or kernel_uuid == '':
             return
-        result[key] = ec2utils.glance_id_to_ec2_id(context, kernel_uuid, 'aki')
+        if memo:
+            result[key] = memo.glance_id_to_ec2_id(kernel_uuid, 'aki')
+        else:
+            result[key] = ec2utils.glance_id_to_ec2_id(context, kernel_uuid,
+                                                       'aki')
 
-    def _format_ramdisk_id(self, context, instance_ref, result, key):
+    def _format_ramdisk_id(self, context, instance_ref, result, key,
+                           memo=None):
         ramdisk_uuid = instance_ref['ramdisk_id']
         if ramdisk_uuid is None or ramdisk_uuid == '':
             return
-        result[key] = ec2utils.glance_id_to_ec2_id(context, ramdisk_uuid,
-                                                   'ari')
+        if memo:
+            result[key] = memo.glance_id_to_ec2_id(ramdisk_uuid, 'ari')
+        else:
+            result[key] = ec2utils.glance_id_to_ec2_id(context, ramdisk_uuid,
+                                                       'ari')
 
     def describe_instance_attribute(self, context, instance_id, attribute,
                                     **kwargs):
@@ -1123,18 +1132,24 @@ class CloudController(object):
             except exception.NotFound:
                 instances = []
 
+        if not context.is_admin:
+            instances = [instance for instance in instances
+                         if not pipelib.is_vpn_image(instance['image_ref'])]
+
+        # NOTE: translate the ids and zones of all the instances up front,
+        # rather than with a few database queries per instance.
+        memo = ec2utils.InstanceMemo(context)
+        memo.prime(instances)
+
         for instance in instances:
-            if not context.is_admin:
-                if pipelib.is_vpn_image(instance['image_ref']):
-                    continue
             i = {}
             instance_uuid = instance['uuid']
-            ec2_id = ec2utils.id_to_ec2_inst_id(instance_uuid)
+            ec2_id = memo.id_to_ec2_inst_id(instance_uuid)
             i['instanceId'] = ec2_id
             image_uuid = instance['image_ref']
-            i['imageId'] = ec2utils.glance_id_to_ec2_id(context, image_uuid)
-            self._format_kernel_id(context, instance, i, 'kernelId')
-            self._format_ramdisk_id(context, instance, i, 'ramdiskId')
+            i['imageId'] = memo.glance_id_to_ec2_id(image_uuid)
+            self._format_kernel_id(context, instance, i, 'kernelId', memo)
+            self._format_ramdisk_id(context, instance, i, 'ramdiskId', memo)
             i['instanceState'] = _state_description(
                 instance['vm_state'], instance['shutdown_terminate'])
 
@@ -1170,7 +1185,7 @@ class CloudController(object):
             self._format_instance_bdm(context, instance['uuid'],
                                       i['rootDeviceName'], i)
             host = instance['host']
-            zone = ec2utils.get_availability_zone_by_host(host)
+            zone = memo.get_availability_zone_by_host(host)
             i['placement'] = {'availabilityZone': zone}
             if instance['reservation_id'] not in reservations:
                 r = {}
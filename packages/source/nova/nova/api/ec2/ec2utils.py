@@ -51,6 +51,31 @@ def memoize(func):
     return memoizer
 
 
+def _memoize_multi(func_name, reqids, lookup):
+    """Look up many ids at once, sharing the cache of @memoize'd func_name.
+
+    lookup is called once with the ids that were not cached, and must
+    return a dict of the values it found.
+    """
+    global _CACHE
+    if not _CACHE:
+        _CACHE = memorycache.get_client()
+    values = {}
+    missing = []
+    for reqid in set(reqids):
+        value = _CACHE.get(str("%s:%s" % (func_name, reqid)))
+        if value is None:
+            missing.append(reqid)
+        else:
+            values[reqid] = value
+    if missing:
+        for reqid, value in lookup(missing).iteritems():
+            _CACHE.set(str("%s:%s" % (func_name, reqid)), value,
+                       time=_CACHE_TIME)
+            values[reqid] = value
+    return values
+
+
 def reset_cache():
     global _CACHE
     _CACHE = None
@@ -90,6 +115,19 @@ def glance_id_to_id(context, glance_id):
         return db.s3_image_create(context, glance_id)['id']
 
 
+def glance_ids_to_ids(context, glance_ids):
+    """Convert many glance ids to internal (db) ids, as a dict."""
+    def _lookup(glance_ids):
+        ids = db.s3_image_get_ids_by_uuids(context, glance_ids)
+        for glance_id in glance_ids:
+            if glance_id not in ids:
+                ids[glance_id] = db.s3_image_create(context, glance_id)['id']
+        return ids
+
+    return _memoize_multi('glance_id_to_id',
+                          [i for i in glance_ids if i is not None], _lookup)
+
+
 def ec2_id_to_glance_id(context, ec2_id):
     image_id = ec2_id_to_id(ec2_id)
     return id_to_glance_id(context, image_id)
@@ -148,6 +186,11 @@ def get_availability_zone_by_host(host, conductor_api=None):
         context.get_admin_context(), host, conductor_api)
 
 
+def get_availability_zones_by_hosts(hosts):
+    return availability_zones.get_hosts_availability_zones(
+        context.get_admin_context(), hosts)
+
+
 def id_to_ec2_id(instance_id, template='i-%08x'):
     """Convert an instance ID (int) to an ec2 ID (i-[base 16 number])."""
     return template % int(instance_id)
@@ -258,6 +301,21 @@ def get_int_id_from_instance_uuid(context, instance_uuid):
         return db.ec2_instance_create(context, instance_uuid)['id']
 
 
+def get_int_ids_from_instance_uuids(context, instance_uuids):
+    """Get or create the ec2 ids of many instances, as a uuid->id dict."""
+    def _lookup(instance_uuids):
+        int_ids = db.get_ec2_instance_ids_by_uuids(context, instance_uuids)
+        for instance_uuid in instance_uuids:
+            if instance_uuid not in int_ids:
+                int_ids[instance_uuid] = db.ec2_instance_create(
+                    context, instance_uuid)['id']
+        return int_ids
+
+    return _memoize_multi('get_int_id_from_instance_uuid',
+                          [i for i in instance_uuids if i is not None],
+                          _lookup)
+
+
 @memoize
 def get_int_id_from_volume_uuid(context, volume_uuid):
     if volume_uuid is None:
@@ -379,3 +437,50 @@ def dict_from_dotted_str(items):
 def search_opts_from_filters(filters):
     return dict((f['name'].replace('-', '_'), f['value']['1'])
                 for f in filters if f['value']['1']) if filters else {}
+
+
+class InstanceMemo(object):
+    """Request-scoped memo table for formatting many instances.
+
+    prime() translates the ids, images and hosts of a whole list of
+    instances with a handful of bulk queries. The other methods read
+    from the table, and fall back to looking up one item at a time for
+    anything that was not primed.
+    """
+
+    def __init__(self, context):
+        self.context = context
+        self.instance_ids = {}
+        self.image_ids = {}
+        self.zones = {}
+
+    def prime(self, instances):
+        ctxt = context.get_admin_context()
+        self.instance_ids.update(get_int_ids_from_instance_uuids(
+            ctxt, [instance['uuid'] for instance in instances]))
+        glance_ids = set()
+        for instance in instances:
+            for key in ('image_ref', 'kernel_id', 'ramdisk_id'):
+                if instance[key]:
+                    glance_ids.add(instance[key])
+        self.image_ids.update(glance_ids_to_ids(self.context, glance_ids))
+        self.zones.update(get_availability_zones_by_hosts(
+            [instance['host'] for instance in instances]))
+
+    def id_to_ec2_inst_id(self, instance_uuid):
+        """Memoized version of id_to_ec2_inst_id()."""
+        if instance_uuid not in self.instance_ids:
+            return id_to_ec2_inst_id(instance_uuid)
+        return id_to_ec2_id(self.instance_ids[instance_uuid])
+
+    def glance_id_to_ec2_id(self, glance_id, image_type='ami'):
+        """Memoized version of glance_id_to_ec2_id()."""
+        if glance_id not in self.image_ids:
+            return glance_id_to_ec2_id(self.context, glance_id, image_type)
+        return image_ec2_id(self.image_ids[glance_id], image_type=image_type)
+
+    def get_availability_zone_by_host(self, host):
+        """Memoized version of get_availability_zone_by_host()."""
+        if host not in self.zones:
+            self.zones[host] = get_availability_zone_by_host(host)
+        return self.zones[host]
@@ -278,6 +278,18 @@ class InstanceMetadata():
             raise KeyError(path)
 
         # right now, the only valid path is metadata.json
+        metadata = self._get_openstack_metadata()
+
+        if self._check_os_version(GRIZZLY, version):
+            metadata['random_seed'] = _random_seed()
+
+        data = {
+            MD_JSON_NAME: json.dumps(metadata),
+        }
+
+        return data[path]
+
+    def _get_openstack_metadata(self):
         metadata = {}
         metadata['uuid'] = self.uuid
 
@@ -307,14 +319,7 @@ class InstanceMetadata():
         metadata['launch_index'] = self.instance['launch_index']
         metadata['availability_zone'] = self.availability_zone
 
-        if self._check_os_version(GRIZZLY, version):
-            metadata['random_seed'] = base64.b64encode(os.urandom(512))
-
-        data = {
-            MD_JSON_NAME: json.dumps(metadata),
-        }
-
-        return data[path]
+        return metadata
 
     def _check_version(self, required, requested, versions=VERSIONS):
         return versions.index(requested) >= versions.index(required)
@@ -328,20 +333,8 @@ class InstanceMetadata():
                            CONF.dhcp_domain)
 
     def lookup(self, path):
-        if path == "" or path[0] != "/":
-            path = posixpath.normpath("/" + path)
-        else:
-            path = posixpath.normpath(path)
-
-        # fix up requests, prepending /ec2 to anything that does not match
-        path_tokens = path.split('/')[1:]
-        if path_tokens[0] not in ("ec2", "openstack"):
-            if path_tokens[0] == "":
-                # request for /
-                path_tokens = ["ec2"]
-            else:
-                path_tokens = ["ec2"] + path_tokens
-            path = "/" + "/".join(path_tokens)
+        path_tokens = _path_tokens(path)
+        path = "/" + "/".join(path_tokens)
 
         # all values of 'path' input starts with '/' and have no trailing /
 
@@ -366,6 +359,63 @@ class InstanceMetadata():
 
         return data
 
+    def prerender(self):
+        """Renders the common paths into response bodies up front.
+
+        The metadata service serves the same handful of paths to every
+        instance as it boots, so they are rendered once when the metadata
+        is cached rather than walked with lookup() on each request.
+        """
+        rendered = {}
+        seeded = {}
+
+        def render(path, data):
+            try:
+                rendered[path] = ec2_md_print(data)
+            except UnicodeError:
+                # leave it to lookup() to fail the same way at request time
+                pass
+            if isinstance(data, dict):
+                for key, value in data.iteritems():
+                    render('%s/%s' % (path, key), value)
+
+        for version in VERSIONS + ["latest"]:
+            render('ec2/%s' % version, self.get_ec2_metadata(version))
+
+        render('openstack', self.lookup('openstack'))
+        for version in OPENSTACK_VERSIONS + ["latest"]:
+            path = 'openstack/%s' % version
+            render(path, self.lookup(path))
+
+            md_path = '%s/%s' % (path, MD_JSON_NAME)
+            if version == "latest" or self._check_os_version(GRIZZLY,
+                                                             version):
+                # NOTE: random_seed has to differ on every request, so
+                # keep the document open and add it in get_rendered()
+                seeded[md_path] = json.dumps(
+                    self._get_openstack_metadata())[:-1]
+            else:
+                render(md_path, self.lookup(md_path))
+
+            if self.userdata_raw is not None:
+                render('%s/%s' % (path, UD_NAME), self.userdata_raw)
+
+        for (cid, content) in self.content.iteritems():
+            render('openstack/%s/%s' % (CONTENT_DIR, cid), content)
+
+        self._rendered = rendered
+        self._seeded = seeded
+
+    def get_rendered(self, path):
+        """Returns the response body prerender() made for path, or None."""
+        path = '/'.join(_path_tokens(path))
+        body = getattr(self, '_rendered', {}).get(path)
+        if body is None and path in getattr(self, '_seeded', {}):
+            # the open document always holds at least the uuid
+            body = '%s, "random_seed": "%s"}' % (self._seeded[path],
+                                                 _random_seed())
+        return body
+
     def metadata_for_config_drive(self):
         """Yields (path, value) tuples for metadata elements."""
         # EC2 style metadata
@@ -399,6 +449,27 @@ class InstanceMetadata():
             yield ('%s/%s/%s' % ("openstack", CONTENT_DIR, cid), content)
 
 
+def _path_tokens(path):
+    if path == "" or path[0] != "/":
+        path = posixpath.normpath("/" + path)
+    else:
+        path = posixpath.normpath(path)
+
+    # fix up requests, prepending /ec2 to anything that does not match
+    path_tokens = path.split('/')[1:]
+    if path_tokens[0] not in ("ec2", "openstack"):
+        if path_tokens[0] == "":
+            # request for /
+            path_tokens = ["ec2"]
+        else:
+            path_tokens = ["ec2"] + path_tokens
+    return path_tokens
+
+
+def _random_seed():
+    return base64.b64encode(os.urandom(512))
+
+
 def get_metadata_by_address(conductor_api, address):
     ctxt = context.get_admin_context()
     fixed_ip = network.API().get_fixed_ip_by_address(ctxt, address)
@@ -20,7 +20,10 @@
 import hashlib
 import hmac
 import os
+import sys
 
+from eventlet import event
+from eventlet import greenthread
 from oslo.config import cfg
 import webob.dec
 import webob.exc
@@ -33,6 +36,7 @@ from nova.openstack.common import memorycache
 from nova import wsgi
 
 CACHE_EXPIRATION = 15  # in seconds
+FILL_POLL_INTERVAL = 0.05  # in seconds
 
 CONF = cfg.CONF
 CONF.import_opt('use_forwarded_for', 'nova.api.auth')
@@ -59,39 +63,75 @@ class MetadataRequestHandler(wsgi.Application):
 
     def __init__(self):
         self._cache = memorycache.get_client()
+        self._pending = {}
         self.conductor_api = conductor.API()
 
     def get_metadata_by_remote_address(self, address):
         if not address:
             raise exception.FixedIpNotFoundForAddress(address=address)
 
-        cache_key = 'metadata-%s' % address
+        def fetch():
+            return base.get_metadata_by_address(self.conductor_api, address)
+
+        return self._get_cached('metadata-%s' % address, fetch)
+
+    def get_metadata_by_instance_id(self, instance_id, address):
+        def fetch():
+            return base.get_metadata_by_instance_id(self.conductor_api,
+                                                    instance_id, address)
+
+        return self._get_cached('metadata-%s' % instance_id, fetch)
+
+    def _get_cached(self, cache_key, fetch):
+        """Returns the cached metadata, fetching it on a miss.
+
+        Requests that miss while another greenthread is already fetching
+        the same metadata wait for its result instead of asking the
+        conductor again.
+        """
         data = self._cache.get(cache_key)
         if data:
             return data
 
-        try:
-            data = base.get_metadata_by_address(self.conductor_api, address)
-        except exception.NotFound:
-            return None
+        pending = self._pending.get(cache_key)
+        if pending is not None:
+            return pending.wait()
 
-        self._cache.set(cache_key, data, CACHE_EXPIRATION)
+        pending = self._pending[cache_key] = event.Event()
+        try:
+            data = self._fill(cache_key, fetch)
+        except Exception:
+            pending.send_exception(*sys.exc_info())
+            raise
+        else:
+            pending.send(data)
+        finally:
+            del self._pending[cache_key]
 
         return data
 
-    def get_metadata_by_instance_id(self, instance_id, address):
-        cache_key = 'metadata-%s' % instance_id
-        data = self._cache.get(cache_key)
-        if data:
-            return data
+    def _fill(self, cache_key, fetch):
+        # With memcached_servers set the cache is shared by all the API
+        # workers, so the lock also keeps the other workers from fetching
+        # the same metadata; they wait for it to show up in the cache.
+        lock_key = '%s-lock' % cache_key
+        locked = self._cache.add(lock_key, '1', CACHE_EXPIRATION)
+        if not locked:
+            while self._cache.get(lock_key) is not None:
+                greenthread.sleep(FILL_POLL_INTERVAL)
+                data = self._cache.get(cache_key)
+                if data:
+                    return data
 
         try:
-            data = base.get_metadata_by_instance_id(self.conductor_api,
-                                                    instance_id, address)
+            data = fetch()
+            data.prerender()
+            self._cache.set(cache_key, data, CACHE_EXPIRATION)
         except exception.NotFound:
             return None
-
-        self._cache.set(cache_key, data, CACHE_EXPIRATION)
+        finally:
+            if locked:
+                self._cache.delete(lock_key)
 
         return data
 
@@ -113,6 +153,10 @@ class MetadataRequestHandler(wsgi.Application):
         if meta_data is None:
             raise webob.exc.HTTPNotFound()
 
+        body = meta_data.get_rendered(req.path_info)
+        if body is not None:
+            return body
+
         try:
             data = meta_data.lookup(req.path_info)
         except base.InvalidMetadataPath:
@@ -462,20 +462,40 @@ class ViewBuilder(object):
                            collection_name)
         return "%s?%s" % (url, dict_to_query_str(params))
 
+    def _get_request_cache(self, request, name):
+        """Return a dict for memoizing view data for the life of a request.
+
+        List views render the same links and sub-views over and over, so
+        anything that depends only on the request is worked out once.
+        """
+        caches = request.environ.setdefault('nova.api.view_cache', {})
+        return caches.setdefault(name, {})
+
+    def _get_link_prefix(self, request, kind):
+        """Return the 'self' or 'bookmark' link prefix for this request."""
+        prefixes = self._get_request_cache(request, 'link_prefixes')
+        try:
+            return prefixes[kind]
+        except KeyError:
+            pass
+        base_url = request.application_url
+        if kind == 'bookmark':
+            base_url = remove_version_from_href(base_url)
+        base_url = self._update_compute_link_prefix(base_url)
+        prefix = os.path.join(base_url,
+                              request.environ["nova.context"].project_id)
+        prefixes[kind] = prefix
+        return prefix
+
     def _get_href_link(self, request, identifier, collection_name):
         """Return an href string pointing to this object."""
-        prefix = self._update_compute_link_prefix(request.application_url)
-        return os.path.join(prefix,
-                            request.environ["nova.context"].project_id,
+        return os.path.join(self._get_link_prefix(request, 'self'),
                             collection_name,
                             str(identifier))
 
     def _get_bookmark_link(self, request, identifier, collection_name):
         """Create a URL that refers to a specific resource."""
-        base_url = remove_version_from_href(request.application_url)
-        base_url = self._update_compute_link_prefix(base_url)
-        return os.path.join(base_url,
-                            request.environ["nova.context"].project_id,
+        return os.path.join(self._get_link_prefix(request, 'bookmark'),
                             collection_name,
                             str(identifier))
 
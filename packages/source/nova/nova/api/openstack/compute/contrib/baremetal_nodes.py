@@ -22,9 +22,11 @@ from nova.api.openstack import wsgi
 from nova.api.openstack import xmlutil
 from nova import exception
 from nova.openstack.common import log as logging
-from nova.virt.baremetal import db
+from nova import utils
 
 LOG = logging.getLogger(__name__)
+# Importing it loads the bare-metal driver, only do so once it's used.
+db = utils.LazyModule('nova.virt.baremetal.db')
 authorize = extensions.extension_authorizer('compute', 'baremetal_nodes')
 
 node_fields = ['id', 'cpus', 'local_gb', 'memory_mb', 'pm_address',
@@ -14,6 +14,8 @@
 
 """The Extended Server Attributes API extension."""
 
+import functools
+
 from nova.api.openstack import extensions
 from nova.api.openstack import wsgi
 from nova.api.openstack import xmlutil
@@ -50,19 +52,19 @@ class ExtendedServerAttributesController(wsgi.Controller):
             self._extend_server(context, server, db_instance)
 
     @wsgi.extends
-    def detail(self, req, resp_obj):
+    def detail(self, req):
         context = req.environ['nova.context']
-        if authorize(context):
+        authorized = authorize(context)
+        if authorized:
+            # Extend each server as the view builder renders it, rather
+            # than walking the list again afterwards
+            req.add_view_hook('servers', functools.partial(
+                    self._extend_server, context))
+        resp_obj = (yield)
+        if authorized:
             # Attach our slave template to the response object
             resp_obj.attach(xml=ExtendedServerAttributesTemplate())
 
-            servers = list(resp_obj.obj['servers'])
-            for server in servers:
-                db_instance = req.get_db_instance(server['id'])
-                # server['id'] is guaranteed to be in the cache due to
-                # the core API adding it in its 'detail' method.
-                self._extend_server(context, server, db_instance)
-
 
 class Extended_server_attributes(extensions.ExtensionDescriptor):
     """Extended Server Attributes support."""
@@ -47,17 +47,17 @@ class ExtendedStatusController(wsgi.Controller):
             self._extend_server(server, db_instance)
 
     @wsgi.extends
-    def detail(self, req, resp_obj):
+    def detail(self, req):
         context = req.environ['nova.context']
-        if authorize(context):
+        authorized = authorize(context)
+        if authorized:
+            # Extend each server as the view builder renders it, rather
+            # than walking the list again afterwards
+            req.add_view_hook('servers', self._extend_server)
+        resp_obj = (yield)
+        if authorized:
             # Attach our slave template to the response object
             resp_obj.attach(xml=ExtendedStatusesTemplate())
-            servers = list(resp_obj.obj['servers'])
-            for server in servers:
-                db_instance = req.get_db_instance(server['id'])
-                # server['id'] is guaranteed to be in the cache due to
-                # the core API adding it in its 'detail' method.
-                self._extend_server(server, db_instance)
 
 
 class Extended_status(extensions.ExtensionDescriptor):
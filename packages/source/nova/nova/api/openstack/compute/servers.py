@@ -482,14 +482,12 @@ class Controller(wsgi.Controller):
         return servers
 
     def _add_instance_faults(self, ctxt, instances):
-        faults = self.compute_api.get_instance_faults(ctxt, instances)
-        if faults is not None:
+        faults = self.compute_api.get_latest_instance_faults(ctxt, instances)
+        if faults:
             for instance in instances:
-                faults_list = faults.get(instance['uuid'], [])
-                try:
-                    instance['fault'] = faults_list[0]
-                except IndexError:
-                    pass
+                fault = faults.get(instance['uuid'])
+                if fault is not None:
+                    instance['fault'] = fault
 
         return instances
 
@@ -129,7 +129,13 @@ class ViewBuilder(common.ViewBuilder):
 
     def _list_view(self, func, request, servers):
         """Provide a view for a list of servers."""
-        server_list = [func(request, server)["server"] for server in servers]
+        hooks = self._get_view_hooks(request)
+        server_list = []
+        for server in servers:
+            server_dict = func(request, server)["server"]
+            for hook in hooks:
+                hook(server_dict, server)
+            server_list.append(server_dict)
         servers_links = self._get_collection_links(request,
                                                    servers,
                                                    self._collection_name)
@@ -140,6 +146,13 @@ class ViewBuilder(common.ViewBuilder):
 
         return servers_dict
 
+    def _get_view_hooks(self, request):
+        """Return the extension hooks to apply to each listed server."""
+        get_view_hooks = getattr(request, "get_view_hooks", None)
+        if get_view_hooks is None:
+            return []
+        return get_view_hooks(self._collection_name)
+
     @staticmethod
     def _get_metadata(instance):
         metadata = instance.get("metadata", [])
@@ -166,17 +179,21 @@ class ViewBuilder(common.ViewBuilder):
     def _get_image(self, request, instance):
         image_ref = instance["image_ref"]
         if image_ref:
-            image_id = str(common.get_id_from_href(image_ref))
-            bookmark = self._image_builder._get_bookmark_link(request,
-                                                              image_id,
-                                                              "images")
-            return {
-                "id": image_id,
-                "links": [{
-                    "rel": "bookmark",
-                    "href": bookmark,
-                }],
-            }
+            images = self._get_request_cache(request, "images")
+            image = images.get(image_ref)
+            if image is None:
+                image_id = str(common.get_id_from_href(image_ref))
+                bookmark = self._image_builder._get_bookmark_link(request,
+                                                                  image_id,
+                                                                  "images")
+                image = images[image_ref] = {
+                    "id": image_id,
+                    "links": [{
+                        "rel": "bookmark",
+                        "href": bookmark,
+                    }],
+                }
+            return image
         else:
             return ""
 
@@ -187,16 +204,19 @@ class ViewBuilder(common.ViewBuilder):
                     "from the DB"), instance=instance)
             return {}
         flavor_id = instance_type["flavorid"]
-        flavor_bookmark = self._flavor_builder._get_bookmark_link(request,
-                                                                  flavor_id,
-                                                                  "flavors")
-        return {
-            "id": str(flavor_id),
-            "links": [{
-                "rel": "bookmark",
-                "href": flavor_bookmark,
-            }],
-        }
+        flavors = self._get_request_cache(request, "flavors")
+        flavor = flavors.get(flavor_id)
+        if flavor is None:
+            flavor_bookmark = self._flavor_builder._get_bookmark_link(
+                request, flavor_id, "flavors")
+            flavor = flavors[flavor_id] = {
+                "id": str(flavor_id),
+                "links": [{
+                    "rel": "bookmark",
+                    "href": flavor_bookmark,
+                }],
+            }
+        return flavor
 
     def _get_fault(self, request, instance):
         fault = instance.get("fault", None)
@@ -17,6 +17,7 @@
 #    under the License.
 
 import os
+import time
 
 import webob.dec
 import webob.exc
@@ -253,6 +254,7 @@ class ExtensionManager(object):
         """
 
         LOG.debug(_("Loading extension %s"), ext_factory)
+        start = time.time()
 
         if isinstance(ext_factory, basestring):
             # Load the factory
@@ -263,6 +265,11 @@ class ExtensionManager(object):
         # Call it
         LOG.debug(_("Calling extension factory %s"), ext_factory)
         factory(self)
+        # Most of the time goes into importing the extension, which is
+        # what makes building the API slow.
+        LOG.debug(_("Loaded extension %(ext_factory)s in %(seconds).3f "
+                    "seconds"),
+                  {'ext_factory': ext_factory, 'seconds': time.time() - start})
 
     def _load_extensions(self):
         """Load extensions specified on the command line."""
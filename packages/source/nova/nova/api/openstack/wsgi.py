@@ -66,7 +66,7 @@ class Request(webob.Request):
 
     def __init__(self, *args, **kwargs):
         super(Request, self).__init__(*args, **kwargs)
-        self._extension_data = {'db_items': {}}
+        self._extension_data = {'db_items': {}, 'view_hooks': {}}
 
     def cache_db_items(self, key, items, item_key='id'):
         """
@@ -123,6 +123,20 @@ class Request(webob.Request):
     def get_db_flavor(self, flavorid):
         return self.get_db_item('flavors', flavorid)
 
+    def add_view_hook(self, key, hook):
+        """
+        Allow API extensions to extend the items of a list view while
+        the view builder renders them, instead of walking the whole
+        response again once it has been built.
+
+        The hook is called as hook(item, db_item) for every item of the
+        collection named by key rendered during this request.
+        """
+        self._extension_data['view_hooks'].setdefault(key, []).append(hook)
+
+    def get_view_hooks(self, key):
+        return self._extension_data['view_hooks'].get(key, [])
+
     def best_match_content_type(self):
         """Determine the requested response content-type."""
         if 'nova.best_content_type' not in self.environ:
@@ -972,6 +986,11 @@ class Resource(wsgi.Application):
                 response = resp_obj.serialize(request, accept,
                                               self.default_serializers)
 
+        if context:
+            LOG.debug(_("%(method)s %(url)s issued %(count)d DB queries"),
+                      {'method': request.method, 'url': request.url,
+                       'count': getattr(context, 'db_query_count', 0)})
+
         return response
 
     def get_method(self, request, action, content_type, body):
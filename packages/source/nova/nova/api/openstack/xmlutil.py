@@ -32,6 +32,11 @@ XMLNS_V11 = 'http://docs.openstack.org/compute/api/v1.1'
 XMLNS_COMMON_V10 = 'http://docs.openstack.org/common/api/v1.0'
 XMLNS_ATOM = 'http://www.w3.org/2005/Atom'
 
+# Compiled forms of lists of sibling elements, dropped whenever the shape
+# of any template tree changes
+_compiled_siblings = {}
+_COMPILED_SIBLINGS_MAX = 512
+
 
 def validate_schema(xml, schema_name):
     if isinstance(xml, str):
@@ -136,6 +141,12 @@ class ConstantSelector(object):
         return self.value
 
 
+def _template_changed():
+    """Discard compiled templates after a template tree is modified."""
+
+    _compiled_siblings.clear()
+
+
 class TemplateElement(object):
     """Represent an element in the template."""
 
@@ -224,6 +235,7 @@ class TemplateElement(object):
 
         self._children.append(elem)
         self._childmap[elem.tag] = elem
+        _template_changed()
 
     def extend(self, elems):
         """Append children to the element."""
@@ -245,6 +257,7 @@ class TemplateElement(object):
         # Update the children
         self._children.extend(elemlist)
         self._childmap.update(elemmap)
+        _template_changed()
 
     def insert(self, idx, elem):
         """Insert a child element at the given index."""
@@ -258,6 +271,7 @@ class TemplateElement(object):
 
         self._children.insert(idx, elem)
         self._childmap[elem.tag] = elem
+        _template_changed()
 
     def remove(self, elem):
         """Remove a child element."""
@@ -271,6 +285,7 @@ class TemplateElement(object):
 
         self._children.remove(elem)
         del self._childmap[elem.tag]
+        _template_changed()
 
     def get(self, key):
         """Get an attribute.
@@ -340,7 +355,7 @@ class TemplateElement(object):
             elem.text = unicode(self.text(obj))
 
         # Now set up all the attributes...
-        for key, value in self.attrib.items():
+        for key, value in self.attrib.iteritems():
             try:
                 elem.set(key, unicode(value(obj, True)))
             except KeyError:
@@ -366,11 +381,11 @@ class TemplateElement(object):
             tagname = self.tag(datum)
         else:
             tagname = self.tag
-        elem = etree.Element(tagname, nsmap=nsmap)
-
-        # If we have a parent, append the node to the parent
+        # If we have a parent, create the node as its child
         if parent is not None:
-            parent.append(elem)
+            elem = etree.SubElement(parent, tagname, nsmap=nsmap)
+        else:
+            elem = etree.Element(tagname, nsmap=nsmap)
 
         # If the datum is None, do nothing else
         if datum is None:
@@ -494,6 +509,83 @@ class TemplateElement(object):
                 (' '.join(contents), ''.join(children), self.tag))
 
 
+class CompiledElement(object):
+    """Represent a set of sibling template elements, compiled.
+
+    Master and slave templates are merged while serializing: the
+    template elements with the same tag at the same position are
+    rendered together, the first one creating the etree.Element and
+    the others patching it.  Working out which elements go together
+    only depends on the templates, so it is done once here rather
+    than for every datum serialized.
+    """
+
+    def __init__(self, siblings):
+        """Initialize a compiled element.
+
+        :param siblings: The TemplateElement instances rendered
+                         together; the first one is the element
+                         rendered, the rest are its patches.
+        """
+
+        self.element = siblings[0]
+        self.patches = siblings[1:]
+        self.children = []
+
+        # Merge the children of all the siblings, in order
+        seen = set()
+        for idx, sibling in enumerate(siblings):
+            for child in sibling:
+                # Have we handled this child already?
+                if child.tag in seen:
+                    continue
+                seen.add(child.tag)
+
+                # Determine the child's siblings
+                nieces = [child]
+                for sib in siblings[idx + 1:]:
+                    if child.tag in sib:
+                        nieces.append(sib[child.tag])
+
+                self.children.append(CompiledElement(nieces))
+
+    def serialize(self, parent, obj, nsmap=None):
+        """Render an object against the compiled elements.
+
+        Returns the first etree.Element instance rendered, or None.
+        """
+
+        elems = self.element.render(parent, obj, self.patches, nsmap)
+
+        # Now, recurse to all child elements for every data element
+        for child in self.children:
+            for elem, datum in elems:
+                child.serialize(elem, datum)
+
+        if elems:
+            return elems[0][0]
+
+
+def compile_siblings(siblings):
+    """Return the CompiledElement for a list of sibling elements.
+
+    Compiled forms are cached, so that a master template and the
+    slave templates attached to it are only merged once.
+    """
+
+    key = tuple(siblings)
+    try:
+        return _compiled_siblings[key]
+    except KeyError:
+        pass
+
+    if len(_compiled_siblings) >= _COMPILED_SIBLINGS_MAX:
+        _compiled_siblings.clear()
+    compiled = CompiledElement(siblings)
+    _compiled_siblings[key] = compiled
+    return compiled
+
+
 def SubTemplateElement(parent, tag, attrib=None, selector=None,
                        subselector=None, **extra):
     """Create a template element as a child of another.
@@ -550,32 +642,7 @@ class Template(object):
                       rendered.
         """
 
-        # First step, render the element
-        elems = siblings[0].render(parent, obj, siblings[1:], nsmap)
-
-        # Now, recurse to all child elements
-        seen = set()
-        for idx, sibling in enumerate(siblings):
-            for child in sibling:
-                # Have we handled this child already?
-                if child.tag in seen:
-                    continue
-                seen.add(child.tag)
-
-                # Determine the child's siblings
-                nieces = [child]
-                for sib in siblings[idx + 1:]:
-                    if child.tag in sib:
-                        nieces.append(sib[child.tag])
-
-                # Now we recurse for every data element
-                for elem, datum in elems:
-                    self._serialize(elem, datum, nieces)
-
-        # Return the first element; at the top level, this will be the
-        # root element
-        if elems:
-            return elems[0][0]
+        return compile_siblings(siblings).serialize(parent, obj, nsmap)
 
     def serialize(self, obj, *args, **kwargs):
         """Serialize an object.
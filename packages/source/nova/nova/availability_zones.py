@@ -66,6 +66,21 @@ def get_host_availability_zone(context, host, conductor_api=None):
         return CONF.default_availability_zone
 
 
+def get_hosts_availability_zones(context, hosts):
+    """Return a host->availability zone dict, with one database query."""
+    metadata = db.aggregate_metadata_get_by_hosts(
+        context, [host for host in set(hosts) if host is not None],
+        key='availability_zone')
+    zones = {}
+    for host in hosts:
+        host_metadata = metadata.get(host, {})
+        if 'availability_zone' in host_metadata:
+            zones[host] = list(host_metadata['availability_zone'])[0]
+        else:
+            zones[host] = CONF.default_availability_zone
+    return zones
+
+
 def get_availability_zones(context):
     """Return available and unavailable zones."""
     enabled_services = db.service_get_all(context, False)
@@ -33,7 +33,9 @@ class BaseCellsDriver(object):
         raise NotImplementedError()
 
     def stop_consumers(self):
-        """Stop consuming messages."""
+        """Stop consuming messages, and send whatever is still held
+        for other cells.
+        """
         raise NotImplementedError()
 
     def send_message_to_cell(self, cell_state, message):
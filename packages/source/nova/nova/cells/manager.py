@@ -68,6 +68,10 @@ class CellsManager(manager.Manager):
     """
     RPC_API_VERSION = '1.6'
 
+    # Updates cast up to the top cell, on every change of an instance
+    RPC_METHOD_PRIORITIES = {'instance_update_at_top': 'low',
+                             'bw_usage_update_at_top': 'low'}
+
     def __init__(self, *args, **kwargs):
         # Mostly for tests.
         cell_state_manager = kwargs.pop('cell_state_manager', None)
@@ -89,8 +93,6 @@ class CellsManager(manager.Manager):
         update our parents.  If we don't have any children, just update
         our parents immediately.
         """
-        # FIXME(comstud): There's currently no hooks when services are
-        # stopping, so we have no way to stop consumers cleanly.
         self.driver.start_consumers(self.msg_runner)
         ctxt = context.get_admin_context()
         if self.state_manager.get_child_cells():
@@ -99,6 +101,15 @@ class CellsManager(manager.Manager):
         else:
             self._update_our_parents(ctxt)
 
+    def cleanup_host(self):
+        """Stop the consumers for inter-cell communication.  The drivers
+        of our neighbor cells send the casts they still hold for them.
+        """
+        self.driver.stop_consumers()
+        for cell in (self.state_manager.get_parent_cells() +
+                     self.state_manager.get_child_cells()):
+            cell.driver.stop_consumers()
+
     @manager.periodic_task
     def _update_our_parents(self, ctxt):
         """Update our parent cells with our capabilities and capacity
@@ -22,7 +22,9 @@ reached.
 
 The interface into this module is the MessageRunner class.
 """
+import base64
 import sys
+import zlib
 
 from eventlet import queue
 from oslo.config import cfg
@@ -65,6 +67,11 @@ LOG = logging.getLogger(__name__)
 # path.
 _PATH_CELL_SEP = cells_utils._PATH_CELL_SEP
 
+# Methods where a newer message for the same instance makes any older
+# one that has not been sent yet redundant.  These carry the whole
+# instance, so only the latest one needs to be delivered.
+_COLLAPSIBLE_METHODS = ['instance_update_at_top']
+
 
 def _reverse_path(path):
     """Reverse a path.  Used for sending responses upstream."""
@@ -305,6 +312,18 @@ class _BaseMessage(object):
         _dict['ctxt'] = _dict['ctxt'].to_dict()
         return jsonutils.dumps(_dict)
 
+    def collapse_key(self):
+        """Return a key shared by all messages of which only the latest
+        needs to be delivered, or None if this message can't be dropped
+        in favour of a newer one.
+        """
+        if self.need_response or self.method_name not in _COLLAPSIBLE_METHODS:
+            return None
+        instance = self.method_kwargs.get('instance')
+        if not instance or 'uuid' not in instance:
+            return None
+        return (self.message_type, self.method_name, instance['uuid'])
+
     def source_is_us(self):
         """Did this cell create this message?"""
         return self.routing_path == self.our_path_part
@@ -1019,10 +1038,51 @@ class MessageRunner(object):
         another cell.
         """
         message_dict = jsonutils.loads(json_message)
-        message_type = message_dict.pop('message_type')
         # Need to convert context back.
         ctxt = message_dict['ctxt']
         message_dict['ctxt'] = context.RequestContext.from_dict(ctxt)
+        return self._message_from_dict(message_dict)
+
+    def messages_to_batch(self, messages):
+        """Encode a list of messages for sending to a sibling cell in
+        one go.  This is used by CellsDrivers that batch messages.
+
+        Contexts are usually shared by many of the messages, so each
+        distinct one is only included once.  The whole batch is
+        compressed, as the messages repeat most of their keys and routing
+        information.  Use messages_from_batch() to turn it back into
+        messages.
+        """
+        contexts = []
+        context_idx = {}
+        msg_dicts = []
+        for message in messages:
+            _dict = message._to_dict()
+            ctxt = _dict['ctxt'].to_dict()
+            ctxt_key = jsonutils.dumps(ctxt, sort_keys=True)
+            if ctxt_key not in context_idx:
+                context_idx[ctxt_key] = len(contexts)
+                contexts.append(ctxt)
+            _dict['ctxt'] = context_idx[ctxt_key]
+            msg_dicts.append(_dict)
+        batch = {'contexts': contexts, 'messages': msg_dicts}
+        return base64.b64encode(zlib.compress(jsonutils.dumps(batch)))
+
+    def messages_from_batch(self, batch):
+        """Turns a batch of messages made by messages_to_batch() back
+        into a list of Message instances, in the order they were sent.
+        """
+        batch = jsonutils.loads(zlib.decompress(base64.b64decode(batch)))
+        contexts = [context.RequestContext.from_dict(ctxt)
+                    for ctxt in batch['contexts']]
+        messages = []
+        for message_dict in batch['messages']:
+            message_dict['ctxt'] = contexts[message_dict['ctxt']]
+            messages.append(self._message_from_dict(message_dict))
+        return messages
+
+    def _message_from_dict(self, message_dict):
+        message_type = message_dict.pop('message_type')
         message_cls = _CELL_MESSAGE_TYPE_TO_MESSAGE_CLS[message_type]
         return message_cls(self, **message_dict)
 
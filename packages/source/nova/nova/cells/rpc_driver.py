@@ -16,9 +16,11 @@
 """
 Cells RPC Communication Driver
 """
+from eventlet import greenthread
 from oslo.config import cfg
 
 from nova.cells import driver
+from nova.openstack.common import log as logging
 from nova.openstack.common import rpc
 from nova.openstack.common.rpc import dispatcher as rpc_dispatcher
 from nova.openstack.common.rpc import proxy as rpc_proxy
@@ -28,15 +30,78 @@ cell_rpc_driver_opts = [
                    default='cells.intercell',
                    help="Base queue name to use when communicating between "
                         "cells.  Various topics by message type will be "
-                        "appended to this.")]
+                        "appended to this."),
+        cfg.FloatOpt('rpc_driver_batch_window',
+                     default=0.0,
+                     help="Seconds to hold casts to a neighbor cell so they "
+                          "can be sent in a single batch, with repeated "
+                          "updates of the same instance collapsed.  All "
+                          "neighbor cells must understand batches before "
+                          "this is enabled.  0 sends every message on its "
+                          "own."),
+        cfg.IntOpt('rpc_driver_batch_size',
+                   default=100,
+                   help="Maximum number of messages to hold for a neighbor "
+                        "cell before sending them, even if "
+                        "rpc_driver_batch_window has not passed yet.")]
 
 CONF = cfg.CONF
 CONF.register_opts(cell_rpc_driver_opts, group='cells')
 CONF.import_opt('call_timeout', 'nova.cells.opts', group='cells')
 
+LOG = logging.getLogger(__name__)
+
 _CELL_TO_CELL_RPC_API_VERSION = '1.0'
 
 
+class _HopQueue(object):
+    """Casts waiting to be sent to one neighbor cell, along with some
+    statistics about them.
+    """
+    def __init__(self, cell_state):
+        self.cell_state = cell_state
+        self.messages = []
+        self.by_collapse_key = {}
+        self.timer = None
+        self.max_depth = 0
+        self.queued = 0
+        self.collapsed = 0
+        self.sent = 0
+        self.batches = 0
+
+    def add(self, message):
+        """Queue a message, dropping an older one it makes redundant.
+
+        The newer message goes to the end of the queue, so it is never
+        delivered before anything that was queued ahead of it.
+        """
+        self.queued += 1
+        key = message.collapse_key()
+        if key is not None:
+            older = self.by_collapse_key.pop(key, None)
+            if older is not None:
+                self.messages.remove(older)
+                self.collapsed += 1
+            self.by_collapse_key[key] = message
+        self.messages.append(message)
+        self.max_depth = max(self.max_depth, len(self.messages))
+
+    def take(self):
+        """Return all queued messages and empty the queue."""
+        messages = self.messages
+        self.messages = []
+        self.by_collapse_key = {}
+        return messages
+
+    def get_stats(self):
+        return {'depth': len(self.messages),
+                'max_depth': self.max_depth,
+                'queued': self.queued,
+                'collapsed': self.collapsed,
+                'sent': self.sent,
+                'batches': self.batches}
+
+
 class CellsRPCDriver(driver.BaseCellsDriver):
     """Driver for cell<->cell communication via RPC.  This is used to
     setup the RPC consumers as well as to send a message to another cell.
@@ -55,6 +120,7 @@ class CellsRPCDriver(driver.BaseCellsDriver):
         self.rpc_connections = []
         self.intercell_rpcapi = InterCellRPCAPI(
                 self.BASE_RPC_API_VERSION)
+        self.hop_queues = {}
 
     def _start_consumer(self, dispatcher, topic):
         """Start an RPC consumer."""
@@ -83,17 +149,94 @@ class CellsRPCDriver(driver.BaseCellsDriver):
             self._start_consumer(dispatcher, topic)
 
     def stop_consumers(self):
-        """Stop RPC consumers.
-
-        NOTE: Currently there's no hooks when stopping services
-        to have managers cleanup, so this is not currently called.
+        """Stop RPC consumers, and send the casts still queued for
+        neighbor cells instead of waiting for their timers.
         """
         for conn in self.rpc_connections:
             conn.close()
+        for hop_queue in self.hop_queues.values():
+            self.flush_messages(hop_queue.cell_state)
 
     def send_message_to_cell(self, cell_state, message):
-        """Use the IntercellRPCAPI to send a message to a cell."""
-        self.intercell_rpcapi.send_message_to_cell(cell_state, message)
+        """Use the IntercellRPCAPI to send a message to a cell.
+
+        If CONF.cells.rpc_driver_batch_window is set, casts are held for
+        up to that long and then sent together.  Calls and responses have
+        somebody waiting on them, so they are sent right away, after
+        whatever is queued for the same cell.
+        """
+        if CONF.cells.rpc_driver_batch_window <= 0:
+            self.intercell_rpcapi.send_message_to_cell(cell_state, message)
+            return
+        if message.need_response or message.message_type == 'response':
+            self.flush_messages(cell_state)
+            self.intercell_rpcapi.send_message_to_cell(cell_state, message)
+            return
+
+        hop_queue = self.hop_queues.get(cell_state.name)
+        if hop_queue is None:
+            hop_queue = self.hop_queues[cell_state.name] = _HopQueue(
+                    cell_state)
+        # NOTE: The message is only serialized when the queue is sent.
+        # Messages are not changed once they've been handed to a cell.
+        hop_queue.add(message)
+        if len(hop_queue.messages) >= CONF.cells.rpc_driver_batch_size:
+            self.flush_messages(cell_state)
+        elif hop_queue.timer is None:
+            hop_queue.timer = greenthread.spawn_after(
+                    CONF.cells.rpc_driver_batch_window,
+                    self._flush_from_timer, cell_state)
+
+    def _flush_from_timer(self, cell_state):
+        hop_queue = self.hop_queues[cell_state.name]
+        hop_queue.timer = None
+        self.flush_messages(cell_state)
+
+    def flush_messages(self, cell_state):
+        """Send whatever casts are queued for a cell.
+
+        Messages of the same type and fanout are sent in one batch, in
+        the order they were queued.  Failures are logged, just like
+        failures to send single casts are.
+        """
+        hop_queue = self.hop_queues.get(cell_state.name)
+        if hop_queue is None:
+            return
+        if hop_queue.timer is not None:
+            hop_queue.timer.cancel()
+            hop_queue.timer = None
+        messages = hop_queue.take()
+        batches = []
+        by_topic = {}
+        for message in messages:
+            key = (message.message_type, message.fanout)
+            if key not in by_topic:
+                by_topic[key] = []
+                batches.append(by_topic[key])
+            by_topic[key].append(message)
+        for batch in batches:
+            try:
+                self.intercell_rpcapi.send_messages_to_cell(cell_state,
+                                                            batch)
+            except Exception as exc:
+                LOG.exception(_("Failed to send %(count)d messages to cell "
+                                "%(cell)s: %(exc)s"),
+                              {'count': len(batch), 'cell': cell_state.name,
+                               'exc': exc})
+                continue
+            hop_queue.sent += len(batch)
+            hop_queue.batches += 1
+        if messages:
+            LOG.debug(_("Sent queued messages to cell %(cell)s: %(stats)s"),
+                      {'cell': cell_state.name,
+                       'stats': hop_queue.get_stats()})
+
+    def get_hop_stats(self):
+        """Return queue statistics for every neighbor cell casts were
+        queued for, by cell name.
+        """
+        return dict((cell_name, hop_queue.get_stats())
+                    for cell_name, hop_queue in self.hop_queues.iteritems())
 
 
 class InterCellRPCAPI(rpc_proxy.RpcProxy):
@@ -103,6 +246,7 @@ class InterCellRPCAPI(rpc_proxy.RpcProxy):
 
     API version history:
         1.0 - Initial version.
+        1.1 - Adds process_messages.
     """
     def __init__(self, default_version):
         super(InterCellRPCAPI, self).__init__(None, default_version)
@@ -142,6 +286,24 @@ class InterCellRPCAPI(rpc_proxy.RpcProxy):
             self.cast_to_server(ctxt, server_params,
                     rpc_message, topic=topic)
 
+    def send_messages_to_cell(self, cell_state, messages):
+        """Send a batch of messages to another cell with a single RPC
+        cast to 'process_messages'.  All messages must have the same
+        message type and fanout setting.
+        """
+        first = messages[0]
+        batch = first.msg_runner.messages_to_batch(messages)
+        rpc_message = self.make_msg('process_messages', batch=batch)
+        topic_base = CONF.cells.rpc_driver_queue_base
+        topic = '%s.%s' % (topic_base, first.message_type)
+        server_params = self._get_server_params_for_cell(cell_state)
+        if first.fanout:
+            self.fanout_cast_to_server(first.ctxt, server_params,
+                    rpc_message, topic=topic, version='1.1')
+        else:
+            self.cast_to_server(first.ctxt, server_params,
+                    rpc_message, topic=topic, version='1.1')
+
 
 class InterCellRPCDispatcher(object):
     """RPC Dispatcher to handle messages received from other cells.
@@ -151,7 +313,7 @@ class InterCellRPCDispatcher(object):
     in this cell, relay the message to another sibling cell, or both.  This
     logic is defined by the message class in the messaging module.
     """
-    BASE_RPC_API_VERSION = _CELL_TO_CELL_RPC_API_VERSION
+    BASE_RPC_API_VERSION = '1.1'
 
     def __init__(self, msg_runner):
         """Init the Intercell RPC Dispatcher."""
@@ -164,3 +326,10 @@ class InterCellRPCDispatcher(object):
         """
         message = self.msg_runner.message_from_json(message)
         message.process()
+
+    def process_messages(self, _ctxt, batch):
+        """We received a batch of messages from another cell.  Process
+        them one after the other, in the order they were sent.
+        """
+        for message in self.msg_runner.messages_from_batch(batch):
+            message.process()
@@ -44,7 +44,7 @@ def get_instances_to_sync(context, updated_since=None, project_id=None,
         filters['deleted'] = False
     # Active instances first.
     instances = db.instance_get_all_by_filters(
-            context, filters, 'deleted', 'asc')
+            context, filters, 'deleted', 'asc', use_slave=True)
     if shuffle:
         random.shuffle(instances)
     for instance in instances:
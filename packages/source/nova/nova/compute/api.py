@@ -2424,6 +2424,19 @@ class API(base.Base):
         uuids = [instance['uuid'] for instance in instances]
         return self.db.instance_fault_get_by_instance_uuids(context, uuids)
 
+    def get_latest_instance_faults(self, context, instances):
+        """Get the most recent fault for each of a list of instances."""
+
+        if not instances:
+            return {}
+
+        for instance in instances:
+            check_policy(context, 'get_instance_faults', instance)
+
+        uuids = [instance['uuid'] for instance in instances]
+        return self.db.instance_fault_get_latest_by_instance_uuids(context,
+                                                                   uuids)
+
     def get_instance_bdms(self, context, instance):
         """Get all bdm tables for specified instance."""
         return self.db.block_device_mapping_get_all_by_instance(context,
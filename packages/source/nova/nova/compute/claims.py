@@ -25,6 +25,13 @@ LOG = logging.getLogger(__name__)
 COMPUTE_RESOURCE_SEMAPHORE = "compute_resources"
 
 
+def _nodename_key(claim):
+    """Key of the compute_resources lock for a claim, the resource
+    trackers of the nodes of a host lock their resources separately.
+    """
+    return claim.tracker.nodename
+
+
 class NopClaim(object):
     """For use with compute drivers that do not support resource tracking."""
 
@@ -86,7 +93,8 @@ class Claim(NopClaim):
     def vcpus(self):
         return self.instance['vcpus']
 
-    @lockutils.synchronized(COMPUTE_RESOURCE_SEMAPHORE, 'nova-')
+    @lockutils.synchronized(COMPUTE_RESOURCE_SEMAPHORE, 'nova-',
+                            key=_nodename_key)
     def abort(self):
         """Compute operation requiring claimed resources has failed or
         been aborted.
@@ -210,7 +218,8 @@ class ResizeClaim(Claim):
     def vcpus(self):
         return self.instance_type['vcpus']
 
-    @lockutils.synchronized(COMPUTE_RESOURCE_SEMAPHORE, 'nova-')
+    @lockutils.synchronized(COMPUTE_RESOURCE_SEMAPHORE, 'nova-',
+                            key=_nodename_key)
     def abort(self):
         """Compute operation requiring claimed resources has failed or
         been aborted.
@@ -50,6 +50,11 @@ LOG = logging.getLogger(__name__)
 COMPUTE_RESOURCE_SEMAPHORE = claims.COMPUTE_RESOURCE_SEMAPHORE
 
 
+def _nodename_key(tracker, *args, **kwargs):
+    """Key of the compute_resources lock, each node has its own."""
+    return tracker.nodename
+
+
 class ResourceTracker(object):
     """Compute helper class for keeping track of resource usage as instances
     are built and destroyed.
@@ -65,7 +70,8 @@ class ResourceTracker(object):
         self.tracked_migrations = {}
         self.conductor_api = conductor.API()
 
-    @lockutils.synchronized(COMPUTE_RESOURCE_SEMAPHORE, 'nova-')
+    @lockutils.synchronized(COMPUTE_RESOURCE_SEMAPHORE, 'nova-',
+                            key=_nodename_key)
     def instance_claim(self, context, instance_ref, limits=None):
         """Indicate that some resources are needed for an upcoming compute
         instance build operation.
@@ -115,7 +121,8 @@ class ResourceTracker(object):
         else:
             raise exception.ComputeResourcesUnavailable()
 
-    @lockutils.synchronized(COMPUTE_RESOURCE_SEMAPHORE, 'nova-')
+    @lockutils.synchronized(COMPUTE_RESOURCE_SEMAPHORE, 'nova-',
+                            key=_nodename_key)
     def resize_claim(self, context, instance_ref, instance_type, limits=None):
         """Indicate that resources are needed for a resize operation to this
         compute host.
@@ -205,7 +212,8 @@ class ResourceTracker(object):
                 ctxt = context.get_admin_context()
                 self._update(ctxt, self.compute_node)
 
-    @lockutils.synchronized(COMPUTE_RESOURCE_SEMAPHORE, 'nova-')
+    @lockutils.synchronized(COMPUTE_RESOURCE_SEMAPHORE, 'nova-',
+                            key=_nodename_key)
     def update_usage(self, context, instance):
         """Update the resource usage and stats after a change in an
         instance
@@ -225,7 +233,8 @@ class ResourceTracker(object):
     def disabled(self):
         return self.compute_node is None
 
-    @lockutils.synchronized(COMPUTE_RESOURCE_SEMAPHORE, 'nova-')
+    @lockutils.synchronized(COMPUTE_RESOURCE_SEMAPHORE, 'nova-',
+                            key=_nodename_key)
     def update_available_resource(self, context):
         """Override in-memory calculations of compute node resource usage based
         on data audited from the hypervisor layer.
@@ -14,7 +14,8 @@
 
 """Handles database requests from other nova services."""
 
-from nova.api.ec2 import ec2utils
+from oslo.config import cfg
+
 from nova.compute import api as compute_api
 from nova.compute import utils as compute_utils
 from nova import exception
@@ -27,9 +28,19 @@ from nova.openstack.common import log as logging
 from nova.openstack.common.rpc import common as rpc_common
 from nova.openstack.common import timeutils
 from nova import quota
+from nova.servicegroup import membership
+from nova import utils
+
+CONF = cfg.CONF
+CONF.import_opt('servicegroup_persist_interval',
+                'nova.servicegroup.membership')
 
 LOG = logging.getLogger(__name__)
 
+# Importing it pulls in the whole EC2 API, which every service would pay
+# for at startup, as they all import this module.
+ec2utils = utils.LazyModule('nova.api.ec2.ec2utils')
+
 # Instead of having a huge list of arguments to instance_update(), we just
 # accept a dict of fields to update and use this whitelist to validate it.
 allowed_updates = ['task_state', 'vm_state', 'expected_task_state',
@@ -49,7 +60,7 @@ datetime_fields = ['launched_at', 'terminated_at', 'updated_at']
 class ConductorManager(manager.Manager):
     """Mission: TBD."""
 
-    RPC_API_VERSION = '1.48'
+    RPC_API_VERSION = '1.49'
 
     def __init__(self, *args, **kwargs):
         super(ConductorManager, self).__init__(*args, **kwargs)
@@ -58,6 +69,7 @@ class ConductorManager(manager.Manager):
         self._network_api = None
         self._compute_api = None
         self.quotas = quota.QUOTAS
+        self.membership = membership.Membership(self.db)
 
     @property
     def network_api(self):
@@ -431,3 +443,13 @@ class ConductorManager(manager.Manager):
 
     def compute_unrescue(self, context, instance):
         self.compute_api.unrescue(context, instance)
+
+    def service_heartbeats(self, context, heartbeats):
+        self.membership.heartbeat(heartbeats)
+
+    def service_membership(self, context):
+        return self.membership.snapshot(context.elevated())
+
+    @manager.periodic_task(spacing=CONF.servicegroup_persist_interval)
+    def _persist_service_heartbeats(self, context):
+        self.membership.persist(context)
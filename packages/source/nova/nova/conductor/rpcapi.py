@@ -87,6 +87,7 @@ class ConductorAPI(nova.openstack.common.rpc.proxy.RpcProxy):
     1.47 - Added columns_to_join to instance_get_all_by_host and
                  instance_get_all_by_filters
     1.48 - Added compute_unrescue
+    1.49 - Added service_heartbeats and service_membership
     """
 
     BASE_RPC_API_VERSION = '1.0'
@@ -455,3 +456,11 @@ class ConductorAPI(nova.openstack.common.rpc.proxy.RpcProxy):
         instance_p = jsonutils.to_primitive(instance)
         msg = self.make_msg('compute_unrescue', instance=instance_p)
         return self.call(context, msg, version='1.48')
+
+    def service_heartbeats(self, context, heartbeats):
+        msg = self.make_msg('service_heartbeats', heartbeats=heartbeats)
+        self.fanout_cast(context, msg, version='1.49')
+
+    def service_membership(self, context):
+        msg = self.make_msg('service_membership')
+        return self.call(context, msg, version='1.49')
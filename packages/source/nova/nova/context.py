@@ -97,6 +97,9 @@ class RequestContext(object):
         self.is_admin = is_admin
         if self.is_admin is None:
             self.is_admin = policy.check_is_admin(self)
+        # NOTE: bumped by the database layer for every statement it runs
+        # while this is the greenthread's current context.
+        self.db_query_count = 0
         if overwrite or not hasattr(local.store, 'context'):
             self.update_store()
 
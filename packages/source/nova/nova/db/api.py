@@ -177,9 +177,12 @@ def compute_node_get(context, compute_id):
     return IMPL.compute_node_get(context, compute_id)
 
 
-def compute_node_get_all(context):
-    """Get all computeNodes."""
-    return IMPL.compute_node_get_all(context)
+def compute_node_get_all(context, use_slave=False):
+    """Get all computeNodes.
+
+    With use_slave, read from the slave database if there's one.
+    """
+    return IMPL.compute_node_get_all(context, use_slave=use_slave)
 
 
 def compute_node_search_by_hypervisor(context, hypervisor_match):
@@ -443,6 +446,35 @@ def fixed_ip_associate_pool(context, network_id, instance_uuid=None,
                                         instance_uuid, host)
 
 
+def fixed_ip_claim_block(context, network_id, claimed_by, count):
+    """Claim up to count free fixed ips of a network for claimed_by and
+    return their addresses."""
+    return IMPL.fixed_ip_claim_block(context, network_id, claimed_by, count)
+
+
+def fixed_ip_associate_claimed(context, address, network_id, instance_uuid,
+                               claimed_by):
+    """Associate a fixed ip claimed by claimed_by to an instance.
+
+    Returns False if it is no longer claimed by claimed_by.
+
+    """
+    return IMPL.fixed_ip_associate_claimed(context, address, network_id,
+                                           instance_uuid, claimed_by)
+
+
+def fixed_ip_renew_claims(context, claimed_by):
+    """Restart the expiry of the fixed ips claimed by claimed_by that
+    were not associated."""
+    return IMPL.fixed_ip_renew_claims(context, claimed_by)
+
+
+def fixed_ip_release_claims(context, claimed_by):
+    """Release the fixed ips claimed by claimed_by that were not
+    associated."""
+    return IMPL.fixed_ip_release_claims(context, claimed_by)
+
+
 def fixed_ip_create(context, values):
     """Create a fixed ip from the values dictionary."""
     return IMPL.fixed_ip_create(context, values)
@@ -610,12 +642,16 @@ def instance_get_all(context, columns_to_join=None):
 
 def instance_get_all_by_filters(context, filters, sort_key='created_at',
                                 sort_dir='desc', limit=None, marker=None,
-                                columns_to_join=None):
-    """Get all instances that match all filters."""
+                                columns_to_join=None, use_slave=False):
+    """Get all instances that match all filters.
+
+    With use_slave, read from the slave database if there's one.
+    """
     return IMPL.instance_get_all_by_filters(context, filters, sort_key,
                                             sort_dir, limit=limit,
                                             marker=marker,
-                                            columns_to_join=columns_to_join)
+                                            columns_to_join=columns_to_join,
+                                            use_slave=use_slave)
 
 
 def instance_get_active_by_window_joined(context, begin, end=None,
@@ -845,9 +881,14 @@ def network_in_use_on_host(context, network_id, host=None):
     return IMPL.network_in_use_on_host(context, network_id, host)
 
 
-def network_get_associated_fixed_ips(context, network_id, host=None):
-    """Get all network's ips that have been associated."""
-    return IMPL.network_get_associated_fixed_ips(context, network_id, host)
+def network_get_associated_fixed_ips(context, network_id, host=None,
+                                     address=None):
+    """Get all network's ips that have been associated.
+
+    If address is given only that ip is returned, if it is associated.
+    """
+    return IMPL.network_get_associated_fixed_ips(context, network_id, host,
+                                                 address)
 
 
 def network_get_by_uuid(context, uuid):
@@ -1490,6 +1531,11 @@ def s3_image_get_by_uuid(context, image_uuid):
     return IMPL.s3_image_get_by_uuid(context, image_uuid)
 
 
+def s3_image_get_ids_by_uuids(context, image_uuids):
+    """Find the local s3 image ids of many uuids, as a uuid->id dict."""
+    return IMPL.s3_image_get_ids_by_uuids(context, image_uuids)
+
+
 def s3_image_create(context, image_uuid):
     """Create local s3 image represented by provided uuid."""
     return IMPL.s3_image_create(context, image_uuid)
@@ -1522,6 +1568,15 @@ def aggregate_metadata_get_by_host(context, host, key=None):
     return IMPL.aggregate_metadata_get_by_host(context, host, key)
 
 
+def aggregate_metadata_get_by_hosts(context, hosts, key=None):
+    """Get metadata for all aggregates that each of hosts belongs to.
+
+    Returns a dictionary mapping each host that is in an aggregate to a
+    dictionary like the one aggregate_metadata_get_by_host() returns.
+    Optional key filter"""
+    return IMPL.aggregate_metadata_get_by_hosts(context, hosts, key)
+
+
 def aggregate_host_get_by_metadata_key(context, key):
     """Get hosts with a specific metadata key metadata for all aggregates.
 
@@ -1597,6 +1652,15 @@ def instance_fault_get_by_instance_uuids(context, instance_uuids):
     return IMPL.instance_fault_get_by_instance_uuids(context, instance_uuids)
 
 
+def instance_fault_get_latest_by_instance_uuids(context, instance_uuids):
+    """Get the most recent instance fault for each of instance_uuids.
+
+    Instances without any faults are left out of the returned dict.
+    """
+    return IMPL.instance_fault_get_latest_by_instance_uuids(context,
+                                                            instance_uuids)
+
+
 ####################
 
 
@@ -1647,6 +1711,11 @@ def get_ec2_instance_id_by_uuid(context, instance_id):
     return IMPL.get_ec2_instance_id_by_uuid(context, instance_id)
 
 
+def get_ec2_instance_ids_by_uuids(context, instance_uuids):
+    """Get the ec2 ids of many instance uuids, as a uuid->id dict."""
+    return IMPL.get_ec2_instance_ids_by_uuids(context, instance_uuids)
+
+
 def get_instance_uuid_by_ec2_id(context, ec2_id):
     """Get uuid through ec2 id from instance_id_mappings table."""
     return IMPL.get_instance_uuid_by_ec2_id(context, ec2_id)
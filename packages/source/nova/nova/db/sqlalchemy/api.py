@@ -23,10 +23,12 @@ import collections
 import copy
 import datetime
 import functools
+import random
 import sys
 import time
 import uuid
 
+from eventlet import greenthread
 from oslo.config import cfg
 from sqlalchemy import and_
 from sqlalchemy import Boolean
@@ -65,6 +67,26 @@ db_opts = [
                help='When set, compute API will consider duplicate hostnames '
                     'invalid within the specified scope, regardless of case. '
                     'Should be empty, "project" or "global".'),
+    cfg.BoolOpt('quota_optimistic_reservations',
+                default=False,
+                help='Update quota usages with compare-and-swap instead of '
+                     'locking all usages of a project while reserving, '
+                     'committing or rolling back quota. Due usage refreshes '
+                     'then happen in the background'),
+    cfg.IntOpt('quota_reserve_retries',
+               default=5,
+               help='How often to retry a quota reservation that raced with '
+                    'another one, before falling back to locking'),
+    cfg.FloatOpt('quota_reserve_retry_interval',
+                 default=0.01,
+                 help='Seconds to wait at most before the first retry of a '
+                      'quota reservation, doubled for every further retry'),
+    cfg.IntOpt('fixed_ip_claim_ttl',
+               default=600,
+               help='Seconds after which fixed ips a network host claimed '
+                    'for allocation, but did not allocate, can be claimed '
+                    'or allocated by others. The network host renews its '
+                    'claims every periodic_interval seconds'),
 ]
 
 CONF = cfg.CONF
@@ -173,8 +195,11 @@ def model_query(context, model, *args, **kwargs):
             not a subclass of NovaBase, we should pass an extra base_model
             parameter that is a subclass of NovaBase and corresponds to the
             model parameter.
+    :param use_slave: if present and no session is given, read from the
+            slave database, if one is configured.
     """
-    session = kwargs.get('session') or get_session()
+    session = kwargs.get('session') or get_session(
+            slave_session=kwargs.get('use_slave', False))
     read_deleted = kwargs.get('read_deleted') or context.read_deleted
     project_only = kwargs.get('project_only', False)
 
@@ -458,8 +483,8 @@ def _compute_node_get(context, compute_id, session=None):
 
 
 @require_admin_context
-def compute_node_get_all(context):
-    return model_query(context, models.ComputeNode).\
+def compute_node_get_all(context, use_slave=False):
+    return model_query(context, models.ComputeNode, use_slave=use_slave).\
             options(joinedload('service')).\
             options(joinedload('stats')).\
             all()
@@ -1021,6 +1046,8 @@ def fixed_ip_associate(context, address, instance_uuid, network_id=None,
         if not fixed_ip_ref.network_id:
             fixed_ip_ref.network_id = network_id
         fixed_ip_ref.instance_uuid = instance_uuid
+        fixed_ip_ref.claimed_by = None
+        fixed_ip_ref.claimed_at = None
         session.add(fixed_ip_ref)
     return fixed_ip_ref['address']
 
@@ -1041,6 +1068,7 @@ def fixed_ip_associate_pool(context, network_id, instance_uuid=None,
                                filter_by(reserved=False).\
                                filter_by(instance_uuid=None).\
                                filter_by(host=None).\
+                               filter(_fixed_ip_unclaimed()).\
                                with_lockmode('update').\
                                first()
         # NOTE(vish): if with_lockmode isn't supported, as in sqlite,
@@ -1056,10 +1084,127 @@ def fixed_ip_associate_pool(context, network_id, instance_uuid=None,
 
         if host:
             fixed_ip_ref['host'] = host
+        fixed_ip_ref['claimed_by'] = None
+        fixed_ip_ref['claimed_at'] = None
         session.add(fixed_ip_ref)
     return fixed_ip_ref['address']
 
 
+def _fixed_ip_unclaimed():
+    """Filter for fixed ips no network host claimed, or whose claim has
+    expired.
+    """
+    expired = timeutils.utcnow() - datetime.timedelta(
+            seconds=CONF.fixed_ip_claim_ttl)
+    return or_(models.FixedIp.claimed_by == None,
+               models.FixedIp.claimed_at < expired)
+
+
+@require_admin_context
+def fixed_ip_claim_block(context, network_id, claimed_by, count):
+    """Claim up to count free fixed ips of a network for claimed_by, with
+    a single UPDATE that only claims those still free, and return their
+    addresses.  No rows are locked while looking for free ones.
+    """
+    session = get_session()
+    with session.begin():
+        network_or_none = or_(models.FixedIp.network_id == network_id,
+                              models.FixedIp.network_id == None)
+        # Pick among more free ips than needed, so that network hosts
+        # claiming at the same time mostly pick different ones.
+        candidates = model_query(context, models.FixedIp.id,
+                                 base_model=models.FixedIp, session=session,
+                                 read_deleted="no").\
+                               filter(network_or_none).\
+                               filter_by(reserved=False).\
+                               filter_by(instance_uuid=None).\
+                               filter_by(host=None).\
+                               filter(_fixed_ip_unclaimed()).\
+                               limit(count * 4).\
+                               all()
+        fixed_ip_ids = [candidate[0] for candidate in candidates]
+        if len(fixed_ip_ids) > count:
+            fixed_ip_ids = random.sample(fixed_ip_ids, count)
+        if not fixed_ip_ids:
+            return []
+
+        model_query(context, models.FixedIp, session=session,
+                    read_deleted="no").\
+                filter(models.FixedIp.id.in_(fixed_ip_ids)).\
+                filter_by(reserved=False).\
+                filter_by(instance_uuid=None).\
+                filter_by(host=None).\
+                filter(_fixed_ip_unclaimed()).\
+                update({'claimed_by': claimed_by,
+                        'claimed_at': timeutils.utcnow()},
+                       synchronize_session=False)
+
+        claimed = model_query(context, models.FixedIp.address,
+                              base_model=models.FixedIp, session=session,
+                              read_deleted="no").\
+                filter(models.FixedIp.id.in_(fixed_ip_ids)).\
+                filter_by(claimed_by=claimed_by).\
+                all()
+    return [fixed_ip[0] for fixed_ip in claimed]
+
+
+@require_admin_context
+def fixed_ip_associate_claimed(context, address, network_id, instance_uuid,
+                               claimed_by):
+    """Associate a fixed ip claimed with fixed_ip_claim_block(), returning
+    False if it is no longer claimed by claimed_by.
+    """
+    if not uuidutils.is_uuid_like(instance_uuid):
+        raise exception.InvalidUUID(uuid=instance_uuid)
+
+    session = get_session()
+    with session.begin():
+        network_or_none = or_(models.FixedIp.network_id == network_id,
+                              models.FixedIp.network_id == None)
+        result = model_query(context, models.FixedIp, session=session,
+                             read_deleted="no").\
+                filter(network_or_none).\
+                filter_by(address=address).\
+                filter_by(instance_uuid=None).\
+                filter_by(claimed_by=claimed_by).\
+                update({'network_id': network_id,
+                        'instance_uuid': instance_uuid,
+                        'claimed_by': None,
+                        'claimed_at': None},
+                       synchronize_session=False)
+    return result == 1
+
+
+@require_admin_context
+def fixed_ip_renew_claims(context, claimed_by):
+    """Restart the expiry of the claims of claimed_by on fixed ips it did
+    not allocate, returning how many there were.
+    """
+    session = get_session()
+    with session.begin():
+        return model_query(context, models.FixedIp, session=session,
+                           read_deleted="no").\
+                filter_by(claimed_by=claimed_by).\
+                filter_by(instance_uuid=None).\
+                update({'claimed_at': timeutils.utcnow()},
+                       synchronize_session=False)
+
+
+@require_admin_context
+def fixed_ip_release_claims(context, claimed_by):
+    """Release the claims of claimed_by on fixed ips it did not allocate,
+    returning how many there were.
+    """
+    session = get_session()
+    with session.begin():
+        return model_query(context, models.FixedIp, session=session,
+                           read_deleted="no").\
+                filter_by(claimed_by=claimed_by).\
+                update({'claimed_by': None,
+                        'claimed_at': None},
+                       synchronize_session=False)
+
+
 @require_context
 def fixed_ip_create(context, values):
     fixed_ip_ref = models.FixedIp()
@@ -1635,7 +1780,7 @@ def instance_get_all(context, columns_to_join=None):
 @require_context
 def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
                                 limit=None, marker=None, columns_to_join=None,
-                                session=None):
+                                session=None, use_slave=False):
     """Return instances that match all filters.  Deleted instances
     will be returned by default, unless there's a filter that says
     otherwise"""
@@ -1643,7 +1788,7 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
     sort_fn = {'desc': desc, 'asc': asc}
 
     if not session:
-        session = get_session()
+        session = get_session(slave_session=use_slave)
 
     if columns_to_join is None:
         columns_to_join = ['info_cache', 'security_groups']
@@ -2254,7 +2399,8 @@ def network_get_all_by_uuids(context, network_uuids,
 
 
 @require_admin_context
-def network_get_associated_fixed_ips(context, network_id, host=None):
+def network_get_associated_fixed_ips(context, network_id, host=None,
+                                     address=None):
     # FIXME(sirp): since this returns fixed_ips, this would be better named
     # fixed_ip_get_all_by_network.
     # NOTE(vish): The ugly joins here are to solve a performance issue and
@@ -2285,6 +2431,8 @@ def network_get_associated_fixed_ips(context, network_id, host=None):
                           filter(models.FixedIp.virtual_interface_id != None)
     if host:
         query = query.filter(models.Instance.host == host)
+    if address:
+        query = query.filter(models.FixedIp.address == address)
     result = query.all()
     data = []
     for datum in result:
@@ -2567,6 +2715,8 @@ def quota_usage_update(context, project_id, resource, **kwargs):
         updates['reserved'] = kwargs['reserved']
     if 'until_refresh' in kwargs:
         updates['until_refresh'] = kwargs['until_refresh']
+    if 'in_use' in kwargs:
+        updates['version'] = models.QuotaUsage.version + 1
 
     result = model_query(context, models.QuotaUsage, read_deleted="no").\
                      filter_by(project_id=project_id).\
@@ -2613,21 +2763,98 @@ def reservation_create(context, uuid, usage, project_id, resource, delta,
 # cause under or over counting of resources. To avoid deadlocks, this
 # code always acquires the lock on quota_usages before acquiring the lock
 # on reservations.
-
-def _get_quota_usages(context, session, project_id):
+#
+# With quota_optimistic_reservations, nothing is locked up front. Deltas
+# are applied with relative updates, and reservations only add to the
+# reserved count of a usage if the same update finds it within quota.
+# Commits and rollbacks first claim their reservation by soft-deleting
+# it. Every change to the in_use of a usage bumps its version, so that
+# writing back a recounted in_use can be made conditional on no commit
+# having changed it since it was counted, starting over otherwise.
+# Changes to the reserved count leave the version alone, so that busy
+# projects don't keep recounts from landing.
+
+def _get_quota_usages(context, session, project_id, lock=True):
     # Broken out for testability
-    rows = model_query(context, models.QuotaUsage,
-                       read_deleted="no",
-                       session=session).\
-                   filter_by(project_id=project_id).\
-                   with_lockmode('update').\
-                   all()
-    return dict((row.resource, row) for row in rows)
+    query = model_query(context, models.QuotaUsage,
+                        read_deleted="no",
+                        session=session).\
+                    filter_by(project_id=project_id)
+    if lock:
+        query = query.with_lockmode('update')
+    return dict((row.resource, row) for row in query.all())
+
+
+class _QuotaUsageConflict(Exception):
+    """A quota usage changed between reading and writing it."""
+    pass
+
+
+def _quota_usage_cas(context, session, usage, **values):
+    """Update a quota usage unless it changed since it was read.
+
+    Raises _QuotaUsageConflict if it did.
+    """
+    values['version'] = usage.version + 1
+    result = model_query(context, models.QuotaUsage, session=session,
+                         read_deleted="no").\
+                     filter_by(id=usage.id).\
+                     filter_by(version=usage.version).\
+                     update(values, synchronize_session=False)
+    if not result:
+        raise _QuotaUsageConflict()
+
+
+def _bump_version(usage_ref):
+    usage_ref.version = models.QuotaUsage.version + 1
+
+
+def _quota_usage_create_missing(context, session, project_id, resource,
+                                until_refresh):
+    """Create a usage which wasn't there when the usages were read.
+
+    Raises _QuotaUsageConflict if a concurrent reservation created it
+    first, which the unique constraint on the usages makes sure of.
+    """
+    try:
+        return _quota_usage_create(context, project_id, resource, 0, 0,
+                                   until_refresh or None, session=session)
+    except db_exc.DBDuplicateEntry:
+        raise _QuotaUsageConflict()
 
 
 @require_context
 def quota_reserve(context, resources, quotas, deltas, expire,
                   until_refresh, max_age, project_id=None):
+    if CONF.quota_optimistic_reservations:
+        interval = CONF.quota_reserve_retry_interval
+        for attempt in xrange(CONF.quota_reserve_retries + 1):
+            try:
+                return _quota_reserve_optimistic(context, resources, quotas,
+                                                 deltas, expire,
+                                                 until_refresh, max_age,
+                                                 project_id)
+            except _QuotaUsageConflict:
+                # Randomized so that racing reservations spread out
+                time.sleep(random.uniform(0, interval * 2 ** attempt))
+        LOG.warn(_("Quota reservation kept racing with other changes to "
+                   "the usages of project %s, locking them instead"),
+                 project_id or context.project_id)
+
+    try:
+        return _quota_reserve_locked(context, resources, quotas, deltas,
+                                     expire, until_refresh, max_age,
+                                     project_id)
+    except _QuotaUsageConflict:
+        # Another reservation created a missing usage first, which can
+        # be locked along with the others now
+        return _quota_reserve_locked(context, resources, quotas, deltas,
+                                     expire, until_refresh, max_age,
+                                     project_id)
+
+
+def _quota_reserve_locked(context, resources, quotas, deltas, expire,
+                          until_refresh, max_age, project_id):
     elevated = context.elevated()
     session = get_session()
     with session.begin():
@@ -2639,19 +2866,16 @@ def quota_reserve(context, resources, quotas, deltas, expire,
         usages = _get_quota_usages(context, session, project_id)
 
         # Handle usage refresh
-        work = set(deltas.keys())
-        while work:
-            resource = work.pop()
+        refreshed = set()
+        for resource in sorted(deltas):
+            if resource in refreshed:
+                continue
 
             # Do we need to refresh the usage?
             refresh = False
             if resource not in usages:
-                usages[resource] = _quota_usage_create(elevated,
-                                                      project_id,
-                                                      resource,
-                                                      0, 0,
-                                                      until_refresh or None,
-                                                      session=session)
+                usages[resource] = _quota_usage_create_missing(
+                    elevated, session, project_id, resource, until_refresh)
                 refresh = True
             elif usages[resource].in_use < 0:
                 # Negative in_use count indicates a desync, so try to
@@ -2671,25 +2895,23 @@ def quota_reserve(context, resources, quotas, deltas, expire,
                 sync = resources[resource].sync
 
                 updates = sync(elevated, project_id, session)
-                for res, in_use in updates.items():
+                for res, in_use in sorted(updates.items()):
                     # Make sure we have a destination for the usage!
                     if res not in usages:
-                        usages[res] = _quota_usage_create(elevated,
-                                                         project_id,
-                                                         res,
-                                                         0, 0,
-                                                         until_refresh or None,
-                                                         session=session)
+                        usages[res] = _quota_usage_create_missing(
+                            elevated, session, project_id, res,
+                            until_refresh)
 
                     # Update the usage
                     usages[res].in_use = in_use
                     usages[res].until_refresh = until_refresh or None
+                    _bump_version(usages[res])
 
                     # Because more than one resource may be refreshed
                     # by the call to the sync routine, and we don't
                     # want to double-sync, we make sure all refreshed
-                    # resources are dropped from the work set.
-                    work.discard(res)
+                    # resources are skipped.
+                    refreshed.add(res)
 
                     # NOTE(Vek): We make the assumption that the sync
                     #            routine actually refreshes the
@@ -2698,18 +2920,18 @@ def quota_reserve(context, resources, quotas, deltas, expire,
                     #            a best-effort mechanism.
 
         # Check for deltas that would go negative
-        unders = [resource for resource, delta in deltas.items()
+        unders = [name for name, delta in deltas.items()
                   if delta < 0 and
-                  delta + usages[resource].in_use < 0]
+                  delta + usages[name].in_use < 0]
 
         # Now, let's check the quotas
         # NOTE(Vek): We're only concerned about positive increments.
         #            If a project has gone over quota, we want them to
         #            be able to reduce their usage without any
         #            problems.
-        overs = [resource for resource, delta in deltas.items()
-                 if quotas[resource] >= 0 and delta >= 0 and
-                 quotas[resource] < delta + usages[resource].total]
+        overs = [name for name, delta in deltas.items()
+                 if quotas[name] >= 0 and delta >= 0 and
+                 quotas[name] < delta + usages[name].total]
 
         # NOTE(Vek): The quota check needs to be in the transaction,
         #            but the transaction doesn't fail just because
@@ -2761,6 +2983,184 @@ def quota_reserve(context, resources, quotas, deltas, expire,
     return reservations
 
 
+def _quota_reserve_optimistic(context, resources, quotas, deltas, expire,
+                              until_refresh, max_age, project_id):
+    """Like _quota_reserve_locked(), without locking the usages.
+
+    The quota check is part of the update that adds to the reserved
+    count, so concurrent reservations don't get in each other's way.
+    Usages that are due a refresh because of until_refresh or max_age
+    are refreshed in the background once the reservation is done.
+    """
+    elevated = context.elevated()
+    session = get_session()
+    with session.begin():
+
+        if project_id is None:
+            project_id = context.project_id
+
+        usages = _get_quota_usages(context, session, project_id, lock=False)
+        refresh_later = set()
+
+        def usage_query(resource):
+            return model_query(elevated, models.QuotaUsage, session=session,
+                               read_deleted="no").\
+                           filter_by(id=usages[resource].id)
+
+        # In the same order everywhere, as the updates lock the usages
+        refreshed = set()
+        for resource in sorted(deltas):
+            if resource in refreshed:
+                continue
+
+            refresh = False
+            if resource not in usages:
+                usages[resource] = _quota_usage_create_missing(
+                    elevated, session, project_id, resource, until_refresh)
+                refresh = True
+            elif usages[resource].in_use < 0:
+                refresh = True
+            elif usages[resource].until_refresh is not None:
+                usage_query(resource).update(
+                    {'until_refresh': models.QuotaUsage.until_refresh - 1},
+                    synchronize_session=False)
+                if usages[resource].until_refresh <= 1:
+                    refresh_later.add(resource)
+            elif max_age and (usages[resource].updated_at -
+                              timeutils.utcnow()).seconds >= max_age:
+                refresh_later.add(resource)
+
+            # Without a usage to go by, there is no way around counting
+            if refresh:
+                sync = resources[resource].sync
+                for res, in_use in sorted(sync(elevated, project_id,
+                                               session).items()):
+                    if res not in usages:
+                        usages[res] = _quota_usage_create_missing(
+                            elevated, session, project_id, res,
+                            until_refresh)
+                    _quota_usage_cas(elevated, session, usages[res],
+                                     in_use=in_use,
+                                     until_refresh=until_refresh or None)
+                    usages[res].in_use = in_use
+                    refreshed.add(res)
+                    refresh_later.discard(res)
+
+        unders = [name for name, delta in deltas.items()
+                  if delta < 0 and
+                  delta + usages[name].in_use < 0]
+
+        # Add to the reserved counts, in the same order everywhere to
+        # avoid deadlocks, as long as that keeps them within quota
+        overs = []
+        reserved = []
+        for resource in sorted(deltas):
+            delta = deltas[resource]
+            if delta < 0:
+                continue
+            query = usage_query(resource)
+            if quotas[resource] >= 0:
+                query = query.filter(models.QuotaUsage.in_use +
+                                     models.QuotaUsage.reserved + delta <=
+                                     quotas[resource])
+            if query.update({'reserved': models.QuotaUsage.reserved + delta},
+                            synchronize_session=False):
+                reserved.append(resource)
+            else:
+                overs.append(resource)
+
+        if overs:
+            # Nobody else can see these before we commit
+            for resource in reserved:
+                usage_query(resource).update(
+                    {'reserved': (models.QuotaUsage.reserved -
+                                  deltas[resource])},
+                    synchronize_session=False)
+        else:
+            reservations = []
+            for resource, delta in sorted(deltas.items()):
+                reservation = reservation_create(elevated,
+                                                 str(uuid.uuid4()),
+                                                 usages[resource],
+                                                 project_id,
+                                                 resource, delta, expire,
+                                                 session=session)
+                reservations.append(reservation.uuid)
+
+    if refresh_later:
+        greenthread.spawn_n(_quota_usage_refresh, elevated, resources,
+                            project_id, refresh_later, until_refresh)
+
+    if unders:
+        LOG.warning(_("Change will make usage less than 0 for the following "
+                      "resources: %(unders)s") % locals())
+    if overs:
+        usages = dict((k, dict(in_use=v['in_use'], reserved=v['reserved']))
+                      for k, v in usages.items())
+        raise exception.OverQuota(overs=sorted(overs), quotas=quotas,
+                                  usages=usages)
+
+    return reservations
+
+
+def _quota_usage_refresh(context, resources, project_id, names,
+                         until_refresh):
+    """Recount the in_use of some usages of a project."""
+    for attempt in xrange(CONF.quota_reserve_retries + 1):
+        try:
+            session = get_session()
+            with session.begin():
+                usages = _get_quota_usages(context, session, project_id,
+                                           lock=False)
+                counted = {}
+                for name in names:
+                    if name not in counted:
+                        counted.update(resources[name].sync(
+                            context, project_id, session))
+                for res, in_use in sorted(counted.items()):
+                    if res in usages:
+                        _quota_usage_cas(context, session, usages[res],
+                                         in_use=in_use,
+                                         until_refresh=until_refresh or None)
+            return
+        except _QuotaUsageConflict:
+            time.sleep(random.uniform(
+                0, CONF.quota_reserve_retry_interval * 2 ** attempt))
+    # The usages are still due, so the next reservation tries again
+    LOG.info(_("Gave up refreshing quota usages %(names)s of project "
+               "%(project_id)s"),
+             {'names': ', '.join(sorted(names)), 'project_id': project_id})
+
+
+def _release_reservations(context, session, reservations, commit):
+    """Apply reservations to their usages without locking either.
+
+    A reservation is only applied by whoever manages to soft-delete it,
+    so racing commits, rollbacks and expiries apply it once.
+    """
+    for reservation in sorted(reservations, key=lambda r: r.usage_id):
+        claimed = model_query(context, models.Reservation, session=session,
+                              read_deleted="no").\
+                          filter_by(id=reservation.id).\
+                          soft_delete(synchronize_session=False)
+        if not claimed:
+            continue
+
+        updates = {}
+        if commit:
+            updates['in_use'] = models.QuotaUsage.in_use + reservation.delta
+            updates['version'] = models.QuotaUsage.version + 1
+        if reservation.delta >= 0:
+            updates['reserved'] = (models.QuotaUsage.reserved -
+                                   reservation.delta)
+        if not updates:
+            continue
+        model_query(context, models.QuotaUsage, session=session,
+                    read_deleted="no").\
+                filter_by(id=reservation.usage_id).\
+                update(updates, synchronize_session=False)
+
+
 def _quota_reservations_query(session, context, reservations):
     """Return the relevant reservations."""
 
@@ -2776,6 +3176,14 @@ def _quota_reservations_query(session, context, reservations):
 def reservation_commit(context, reservations, project_id=None):
     session = get_session()
     with session.begin():
+        if CONF.quota_optimistic_reservations:
+            rows = model_query(context, models.Reservation,
+                               read_deleted="no", session=session).\
+                           filter(models.Reservation.uuid.in_(reservations)).\
+                           all()
+            _release_reservations(context, session, rows, commit=True)
+            return
+
         usages = _get_quota_usages(context, session, project_id)
         reservation_query = _quota_reservations_query(session, context,
                                                       reservations)
@@ -2784,6 +3192,7 @@ def reservation_commit(context, reservations, project_id=None):
             if reservation.delta >= 0:
                 usage.reserved -= reservation.delta
             usage.in_use += reservation.delta
+            _bump_version(usage)
         reservation_query.soft_delete(synchronize_session=False)
 
 
@@ -2791,6 +3200,14 @@ def reservation_commit(context, reservations, project_id=None):
 def reservation_rollback(context, reservations, project_id=None):
     session = get_session()
     with session.begin():
+        if CONF.quota_optimistic_reservations:
+            rows = model_query(context, models.Reservation,
+                               read_deleted="no", session=session).\
+                           filter(models.Reservation.uuid.in_(reservations)).\
+                           all()
+            _release_reservations(context, session, rows, commit=False)
+            return
+
         usages = _get_quota_usages(context, session, project_id)
         reservation_query = _quota_reservations_query(session, context,
                                                       reservations)
@@ -2830,6 +3247,11 @@ def reservation_expire(context):
                                         session=session, read_deleted="no").\
                             filter(models.Reservation.expire < current_time)
 
+        if CONF.quota_optimistic_reservations:
+            _release_reservations(context, session, reservation_query.all(),
+                                  commit=False)
+            return
+
         for reservation in reservation_query.join(models.QuotaUsage).all():
             if reservation.delta >= 0:
                 reservation.usage.reserved -= reservation.delta
@@ -4243,6 +4665,17 @@ def s3_image_get_by_uuid(context, image_uuid):
     return result
 
 
+def s3_image_get_ids_by_uuids(context, image_uuids):
+    """Find the local s3 image ids of many uuids, as a uuid->id dict."""
+    if not image_uuids:
+        return {}
+    rows = model_query(context, models.S3Image.uuid, models.S3Image.id,
+                       base_model=models.S3Image, read_deleted="yes").\
+                filter(models.S3Image.uuid.in_(image_uuids)).\
+                all()
+    return dict(rows)
+
+
 def s3_image_create(context, image_uuid):
     """Create local s3 image represented by provided uuid."""
     try:
@@ -4340,6 +4773,31 @@ def aggregate_metadata_get_by_host(context, host, key=None):
     return dict(metadata)
 
 
+@require_admin_context
+def aggregate_metadata_get_by_hosts(context, hosts, key=None):
+    if not hosts:
+        return {}
+    query = model_query(context, models.AggregateHost.host,
+                        models.AggregateMetadata.key,
+                        models.AggregateMetadata.value,
+                        base_model=models.AggregateHost).\
+                filter(models.AggregateHost.host.in_(hosts)).\
+                filter(models.Aggregate.id ==
+                       models.AggregateHost.aggregate_id).\
+                filter(models.Aggregate.deleted == 0).\
+                filter(models.AggregateMetadata.aggregate_id ==
+                       models.Aggregate.id).\
+                filter(models.AggregateMetadata.deleted == 0)
+
+    if key:
+        query = query.filter(models.AggregateMetadata.key == key)
+    metadata = collections.defaultdict(lambda: collections.defaultdict(set))
+    for host, meta_key, value in query.all():
+        metadata[host][meta_key].add(value)
+    return dict((host, dict(host_metadata))
+                for host, host_metadata in metadata.iteritems())
+
+
 @require_admin_context
 def aggregate_host_get_by_metadata_key(context, key):
     query = model_query(context, models.Aggregate).join(
@@ -4556,6 +5014,40 @@ def instance_fault_get_by_instance_uuids(context, instance_uuids):
     return output
 
 
+def instance_fault_get_latest_by_instance_uuids(context, instance_uuids):
+    """Get the most recent instance fault for each of instance_uuids."""
+    if not instance_uuids:
+        return {}
+
+    created_at = func.max(models.InstanceFault.created_at)
+    newest = model_query(context, models.InstanceFault.instance_uuid,
+                         created_at.label('created_at'),
+                         base_model=models.InstanceFault,
+                         read_deleted='no').\
+                     filter(models.InstanceFault.instance_uuid.in_(
+                         instance_uuids)).\
+                     group_by(models.InstanceFault.instance_uuid).\
+                     subquery()
+
+    # NOTE: faults created in the same instant all match the newest
+    # created_at, so order by id to keep the last one recorded.
+    rows = model_query(context, models.InstanceFault, read_deleted='no').\
+                       join(newest, and_(
+                           models.InstanceFault.instance_uuid ==
+                               newest.c.instance_uuid,
+                           models.InstanceFault.created_at ==
+                               newest.c.created_at)).\
+                       order_by(desc(models.InstanceFault.id)).\
+                       all()
+
+    output = {}
+    for row in rows:
+        if row['instance_uuid'] not in output:
+            output[row['instance_uuid']] = dict(row.iteritems())
+
+    return output
+
+
 ##################
 
 
@@ -4708,6 +5200,19 @@ def get_ec2_instance_id_by_uuid(context, instance_id, session=None):
     return result['id']
 
 
+@require_context
+def get_ec2_instance_ids_by_uuids(context, instance_uuids):
+    if not instance_uuids:
+        return {}
+    rows = model_query(context, models.InstanceIdMapping.uuid,
+                       models.InstanceIdMapping.id,
+                       base_model=models.InstanceIdMapping,
+                       read_deleted='yes').\
+                filter(models.InstanceIdMapping.uuid.in_(instance_uuids)).\
+                all()
+    return dict(rows)
+
+
 @require_context
 def get_instance_uuid_by_ec2_id(context, ec2_id, session=None):
     result = _ec2_instance_get_query(context,
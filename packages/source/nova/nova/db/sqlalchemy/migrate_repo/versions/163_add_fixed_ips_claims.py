@@ -0,0 +1,41 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+
+from sqlalchemy import Column, DateTime, MetaData, String, Table
+
+
+TABLES = ['fixed_ips', 'shadow_fixed_ips']
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    for table_name in TABLES:
+        table = Table(table_name, meta, autoload=True)
+        table.create_column(Column('claimed_by', String(255)))
+        table.create_column(Column('claimed_at', DateTime))
+
+
+def downgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    for table_name in TABLES:
+        table = Table(table_name, meta, autoload=True)
+        table.drop_column('claimed_by')
+        table.drop_column('claimed_at')
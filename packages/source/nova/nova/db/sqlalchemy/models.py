@@ -352,6 +352,8 @@ class QuotaUsage(BASE, NovaBase):
     """Represents the current usage for a given resource."""
 
     __tablename__ = 'quota_usages'
+    __table_args__ = (schema.UniqueConstraint("project_id", "resource",
+                                              "deleted"), )
     id = Column(Integer, primary_key=True)
 
     project_id = Column(String(255), index=True)
@@ -366,6 +368,10 @@ class QuotaUsage(BASE, NovaBase):
 
     until_refresh = Column(Integer, nullable=True)
 
+    # Bumped whenever in_use changes, but not for reserved, see
+    # quota_reserve()
+    version = Column(Integer, default=0)
+
 
 class Reservation(BASE, NovaBase):
     """Represents a resource reservation for quotas."""
@@ -648,6 +654,10 @@ class FixedIp(BASE, NovaBase):
     leased = Column(Boolean, default=False)
     reserved = Column(Boolean, default=False)
     host = Column(String(255))
+    # claimed means a network host took the fixed_ip into a block of
+    # addresses it allocates from, see nova.network.fixed_ip_blocks
+    claimed_by = Column(String(255), nullable=True)
+    claimed_at = Column(DateTime, nullable=True)
     network = relationship(Network,
                            backref=backref('fixed_ips'),
                            foreign_keys=network_id,
@@ -36,8 +36,13 @@ class MyLoader(nova.loadables.BaseLoader)
 If you create modules in the same directory and subclass SomeLoadableClass
 within them, MyLoader().get_all_classes() will return a list
 of such classes.
+
+MyLoader().get_all_classes(lazy=True) finds the classes by reading the
+source of the modules instead, and returns LazyLoadable references that
+only import a module once one of its classes is used.
 """
 
+import ast
 import inspect
 import os
 import sys
@@ -46,6 +51,55 @@ from nova import exception
 from nova.openstack.common import importutils
 
 
+def _get_base_name(node):
+    """Return the name a base class is referred to by in a class
+    statement, without any module prefix.
+    """
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        return node.attr
+    return None
+
+
+class LazyLoadable(object):
+    """A loadable class that is only imported when it is first used.
+
+    Calling it creates an instance of the class, any other attribute is
+    looked up on the class.
+    """
+
+    def __init__(self, loader, module_name, class_name):
+        self.__name__ = class_name
+        self.module_name = module_name
+        self._loader = loader
+        self._cls = None
+
+    def resolve(self):
+        """Import the class, raising ClassNotFound if it turns out not
+        to be of the type the loader wants.
+        """
+        if self._cls is None:
+            module = importutils.import_module(self.module_name)
+            cls = getattr(module, self.__name__, None)
+            if not self._loader._is_correct_class(cls):
+                error_str = 'Not a class of the correct type'
+                raise exception.ClassNotFound(
+                        class_name='%s.%s' % (self.module_name, self.__name__),
+                        exception=error_str)
+            self._cls = cls
+        return self._cls
+
+    def __call__(self, *args, **kwargs):
+        return self.resolve()(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.resolve(), name)
+
+    def __repr__(self):
+        return '<LazyLoadable %s.%s>' % (self.module_name, self.__name__)
+
+
 class BaseLoader(object):
     def __init__(self, loadable_cls_type):
         mod = sys.modules[self.__class__.__module__]
@@ -74,11 +128,10 @@ class BaseLoader(object):
                 classes.append(itm)
         return classes
 
-    def get_all_classes(self):
-        """Get the classes of the type we want from all modules found
-        in the directory that defines this class.
+    def _get_modules(self):
+        """Yield the name and file of every module found in the
+        directory that defines this class.
         """
-        classes = []
         for dirpath, dirnames, filenames in os.walk(self.path):
             relpath = os.path.relpath(dirpath, self.path)
             if relpath == '.':
@@ -90,8 +143,55 @@ class BaseLoader(object):
                 if ext != '.py' or root == '__init__':
                     continue
                 module_name = "%s%s.%s" % (self.package, relpkg, root)
-                mod_classes = self._get_classes_from_module(module_name)
-                classes.extend(mod_classes)
+                yield module_name, os.path.join(dirpath, fname)
+
+    def _get_lazy_classes(self):
+        """Find the classes of the type we want by reading the source of
+        the modules, without importing them.
+
+        A class is taken to be of the type we want if one of its base
+        classes has the name of the type, or of another class taken to
+        be of the type.  The guess is checked when the class is used.
+        """
+        class_defs = []
+        for module_name, filename in self._get_modules():
+            with open(filename) as f:
+                tree = ast.parse(f.read(), filename)
+            for node in tree.body:
+                if isinstance(node, ast.ClassDef):
+                    bases = frozenset(_get_base_name(base)
+                                      for base in node.bases)
+                    class_defs.append((module_name, node.name, bases))
+
+        type_names = set([self.loadable_cls_type.__name__])
+        found = set()
+        # Subclasses of subclasses can be defined in any module
+        while True:
+            new = [class_def for class_def in class_defs
+                   if class_def not in found and class_def[2] & type_names]
+            if not new:
+                break
+            for class_def in new:
+                found.add(class_def)
+                type_names.add(class_def[1])
+
+        return [LazyLoadable(self, module_name, class_name)
+                for module_name, class_name, bases in class_defs
+                if (module_name, class_name, bases) in found and
+                not class_name.startswith('_')]
+
+    def get_all_classes(self, lazy=False):
+        """Get the classes of the type we want from all modules found
+        in the directory that defines this class.  If lazy is True,
+        return LazyLoadable references to them instead of importing
+        the modules.
+        """
+        if lazy:
+            return self._get_lazy_classes()
+        classes = []
+        for module_name, filename in self._get_modules():
+            mod_classes = self._get_classes_from_module(module_name)
+            classes.extend(mod_classes)
         return classes
 
     def get_matching_classes(self, loadable_class_names):
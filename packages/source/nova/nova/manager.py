@@ -53,9 +53,11 @@ This module provides Manager, a base class for managers.
 
 """
 
+import random
 import time
 
 import eventlet
+from eventlet import greenpool
 from oslo.config import cfg
 
 from nova.db import base
@@ -71,6 +73,19 @@ periodic_opts = [
                default=True,
                help=('Some periodic tasks can be run in a separate process. '
                      'Should we run them here?')),
+    cfg.IntOpt('periodic_task_pool_size',
+               default=1,
+               help='Number of greenthreads available for running periodic '
+                    'tasks concurrently. The default of 1 runs them one at '
+                    'a time, as older releases did. Setting this to 0 runs '
+                    'every due task in the caller.'),
+    cfg.FloatOpt('periodic_task_jitter',
+                 default=0.25,
+                 help='Maximum fraction of a periodic task\'s spacing, or '
+                      'of the default interval for tasks run on every '
+                      'pass, by which its first run is randomly delayed, '
+                      'so that hosts started together do not run their '
+                      'tasks in lockstep. (Disable by setting to 0)'),
     ]
 
 CONF = cfg.CONF
@@ -200,8 +215,64 @@ class Manager(base.Base):
         self.host = host
         self.load_plugins()
         self.backdoor_port = None
+        self._init_periodic_tasks()
         super(Manager, self).__init__(db_driver)
 
+    def _init_periodic_tasks(self):
+        """Set up the per-instance state of the periodic task runner.
+
+        The schedule collected by ManagerMeta lives on the class; each
+        manager gets its own copy so that the initial jitter applied here
+        and the bookkeeping done while running tasks do not leak between
+        instances.
+        """
+        self._periodic_last_run = self._periodic_last_run.copy()
+        self._periodic_running = set()
+        self._periodic_metrics = {}
+        self._periodic_pool = None
+        if CONF.periodic_task_pool_size > 0:
+            self._periodic_pool = greenpool.GreenPool(
+                    CONF.periodic_task_pool_size)
+
+        now = time.time()
+        for task_name, _task in self._periodic_tasks:
+            self._periodic_metrics[task_name] = {'runs': 0,
+                                                 'errors': 0,
+                                                 'skipped': 0,
+                                                 'overruns': 0,
+                                                 'last_runtime': None,
+                                                 'max_runtime': 0.0,
+                                                 'total_runtime': 0.0}
+            if CONF.periodic_task_jitter <= 0:
+                continue
+            spacing = self._periodic_spacing[task_name]
+            if spacing is None:
+                # Due on every pass, so only the first run can be delayed
+                jitter = random.uniform(
+                        0, DEFAULT_INTERVAL * CONF.periodic_task_jitter)
+                self._periodic_last_run[task_name] = now + jitter
+                continue
+            jitter = random.uniform(0, spacing * CONF.periodic_task_jitter)
+            last_run = self._periodic_last_run[task_name]
+            if last_run is None:
+                # run_immediately tasks become due within the jitter window
+                last_run = now - spacing
+            self._periodic_last_run[task_name] = last_run + jitter
+
+    def get_periodic_task_metrics(self):
+        """Return a snapshot of runtime statistics for each periodic task.
+
+        'skipped' counts passes where a task was due while a previous run
+        of it was still in progress; 'overruns' counts runs that took
+        longer than the task's spacing.
+        """
+        metrics = {}
+        for task_name, stats in self._periodic_metrics.iteritems():
+            metrics[task_name] = dict(stats)
+            metrics[task_name]['running'] = (task_name in
+                                             self._periodic_running)
+        return metrics
+
     def load_plugins(self):
         pluginmgr = pluginmanager.PluginManager('nova', self.__class__)
         pluginmgr.load_plugins()
@@ -215,35 +286,47 @@ class Manager(base.Base):
         return rpc_dispatcher.RpcDispatcher([self])
 
     def periodic_tasks(self, context, raise_on_error=False):
-        """Tasks to be run at a periodic interval."""
+        """Tasks to be run at a periodic interval.
+
+        Due tasks are handed to a bounded greenpool so that a slow task
+        does not hold up the others.  A task whose previous run has not
+        finished yet is skipped for this pass.  If raise_on_error is set,
+        tasks run serially in the caller so their exceptions propagate.
+        """
         idle_for = DEFAULT_INTERVAL
         for task_name, task in self._periodic_tasks:
             full_task_name = '.'.join([self.__class__.__name__, task_name])
 
-            # If a periodic task is _nearly_ due, then we'll run it early
-            if self._periodic_spacing[task_name] is None:
-                wait = 0
-            elif self._periodic_last_run[task_name] is None:
+            # If a periodic task is _nearly_ due, then we'll run it early.
+            # Tasks without a spacing are due on every pass, once their
+            # jittered first run is.
+            if self._periodic_last_run[task_name] is None:
                 wait = 0
             else:
                 due = (self._periodic_last_run[task_name] +
-                       self._periodic_spacing[task_name])
+                       (self._periodic_spacing[task_name] or 0))
                 wait = max(0, due - time.time())
                 if wait > 0.2:
                     if wait < idle_for:
                         idle_for = wait
                     continue
 
-            LOG.debug(_("Running periodic task %(full_task_name)s"), locals())
-            self._periodic_last_run[task_name] = time.time()
-
-            try:
-                task(self, context)
-            except Exception as e:
-                if raise_on_error:
-                    raise
-                LOG.exception(_("Error during %(full_task_name)s: %(e)s"),
-                              locals())
+            if task_name in self._periodic_running:
+                LOG.debug(_("Skipping periodic task %(full_task_name)s "
+                            "because its previous run is still in progress"),
+                          locals())
+                self._periodic_metrics[task_name]['skipped'] += 1
+            else:
+                LOG.debug(_("Running periodic task %(full_task_name)s"),
+                          locals())
+                self._periodic_last_run[task_name] = time.time()
+                self._periodic_running.add(task_name)
+                if self._periodic_pool is None or raise_on_error:
+                    self._run_periodic_task(context, task_name, task,
+                                            raise_on_error)
+                else:
+                    self._periodic_pool.spawn_n(self._run_periodic_task,
+                                                context, task_name, task)
 
             if (not self._periodic_spacing[task_name] is None and
                 self._periodic_spacing[task_name] < idle_for):
@@ -252,6 +335,34 @@ class Manager(base.Base):
 
         return idle_for
 
+    def _run_periodic_task(self, context, task_name, task,
+                           raise_on_error=False):
+        """Run a single periodic task and record its runtime statistics."""
+        full_task_name = '.'.join([self.__class__.__name__, task_name])
+        stats = self._periodic_metrics[task_name]
+        start = time.time()
+        try:
+            task(self, context)
+        except Exception as e:
+            stats['errors'] += 1
+            if raise_on_error:
+                raise
+            LOG.exception(_("Error during %(full_task_name)s: %(e)s"),
+                          locals())
+        finally:
+            self._periodic_running.discard(task_name)
+            runtime = time.time() - start
+            stats['runs'] += 1
+            stats['last_runtime'] = runtime
+            stats['total_runtime'] += runtime
+            stats['max_runtime'] = max(stats['max_runtime'], runtime)
+            spacing = self._periodic_spacing[task_name]
+            if spacing and runtime > spacing:
+                stats['overruns'] += 1
+                LOG.warn(_("Periodic task %(full_task_name)s took "
+                           "%(runtime).2f seconds, longer than its spacing "
+                           "of %(spacing)s seconds"), locals())
+
     def init_host(self):
         """Hook to do additional manager initialization when one requests
         the service be started.  This is called before any service record
@@ -280,6 +391,14 @@ class Manager(base.Base):
         """
         pass
 
+    def cleanup_host(self):
+        """Hook to do cleanup work when the service shuts down, after its
+        RPC consumers have stopped.
+
+        Child classes should override this method.
+        """
+        pass
+
 
 class SchedulerDependentManager(Manager):
     """Periodically send capability updates to the Scheduler services.
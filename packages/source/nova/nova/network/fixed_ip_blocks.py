@@ -0,0 +1,121 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Allocation of fixed ips from blocks a network host claimed in advance.
+
+fixed_ip_associate_pool() picks a free fixed ip with SELECT ... FOR UPDATE,
+so concurrent allocations on a network all wait for the same rows and
+deadlock with each other.  Instead, the BlockAllocator of a network host
+claims a few free fixed ips at a time with a single UPDATE, and hands them
+out from memory, associating each with an UPDATE of its own row only.
+The network manager renews the claims from a periodic task, releases
+those that weren't used when the service stops, and those of a host that
+died expire after fixed_ip_claim_ttl seconds.  Until then
+no one else can allocate them, so up to fixed_ip_claim_block_size - 1
+addresses per network host may be out of reach on a network that is
+nearly full.
+"""
+
+import collections
+
+from nova import exception
+from nova.openstack.common import lockutils
+from nova.openstack.common import log as logging
+from nova.openstack.common import uuidutils
+
+LOG = logging.getLogger(__name__)
+
+
+def _network_id(allocator, context, network_id):
+    """Key of the lock for claiming blocks, networks are independent."""
+    return network_id
+
+
+class BlockAllocator(object):
+    """Allocates fixed ips from blocks of block_size addresses."""
+
+    def __init__(self, db, host, block_size):
+        self.db = db
+        # Several services can run on the same host
+        self.claimed_by = '%s/%s' % (host, uuidutils.generate_uuid())
+        self.block_size = block_size
+        # network_id -> addresses claimed but not allocated yet
+        self.free = collections.defaultdict(collections.deque)
+        self.stats = {'blocks': 0,
+                      'claimed': 0,
+                      'allocated': 0,
+                      'lost': 0}
+
+    @lockutils.synchronized('fixed_ip_block', 'nova-', key=_network_id)
+    def _claim_block(self, context, network_id):
+        # Another greenthread may have claimed one while we waited
+        if self.free[network_id]:
+            return
+        addresses = self.db.fixed_ip_claim_block(context, network_id,
+                                                 self.claimed_by,
+                                                 self.block_size)
+        if not addresses:
+            raise exception.NoMoreFixedIps()
+        self.free[network_id].extend(addresses)
+        self.stats['blocks'] += 1
+        self.stats['claimed'] += len(addresses)
+
+    def associate(self, context, network_id, instance_uuid):
+        """Associate a free fixed ip of the network to an instance,
+        claiming a new block when we have none left, and return its
+        address.
+        """
+        free = self.free[network_id]
+        while True:
+            if not free:
+                self._claim_block(context, network_id)
+                # Other greenthreads may have taken the whole block
+                if not free:
+                    raise exception.NoMoreFixedIps()
+            address = free.popleft()
+            if self.db.fixed_ip_associate_claimed(context, address,
+                                                  network_id, instance_uuid,
+                                                  self.claimed_by):
+                self.stats['allocated'] += 1
+                return address
+            # Our claim expired and someone else took it
+            self.stats['lost'] += 1
+            LOG.debug(_('Lost claim on fixed ip %s'), address)
+
+    def renew(self, context):
+        """Renew the claims on the fixed ips not allocated yet, so they
+        don't expire while we are running.
+        """
+        if not any(self.free.itervalues()):
+            return
+        renewed = self.db.fixed_ip_renew_claims(context, self.claimed_by)
+        LOG.debug(_('Renewed %d claimed fixed ips'), renewed)
+
+    def release(self, context):
+        """Release the claims on the fixed ips not allocated yet."""
+        self.free.clear()
+        released = self.db.fixed_ip_release_claims(context, self.claimed_by)
+        if released:
+            LOG.info(_('Released %d claimed fixed ips'), released)
+
+    def get_stats(self):
+        """Return the number of blocks and fixed ips claimed, allocated
+        and lost to expiry so far, and the number still free.
+        """
+        stats = self.stats.copy()
+        stats['free'] = sum(len(free) for free in self.free.itervalues())
+        return stats
@@ -20,11 +20,13 @@
 """Implements vlans, bridges, and iptables rules using linux utilities."""
 
 import calendar
+import collections
 import inspect
 import netaddr
 import os
 import re
 
+from eventlet import greenthread
 from oslo.config import cfg
 
 from nova import db
@@ -118,6 +120,26 @@ linux_net_opts = [
                default='',
                help='Regular expression to match iptables rule that should'
                     'always be on the bottom.'),
+    cfg.BoolOpt('iptables_incremental_apply',
+                default=False,
+                help='Only rewrite the iptables tables whose nova rules '
+                     'changed since the last apply, and skip calling '
+                     'iptables-save/iptables-restore when nothing changed'),
+    cfg.BoolOpt('dhcp_hosts_incremental',
+                default=False,
+                help='Keep the dhcp-host entries of each network in memory '
+                     'and update them one fixed ip at a time, instead of '
+                     'rebuilding the dnsmasq host file from the database '
+                     'on every allocation and release'),
+    cfg.FloatOpt('dhcp_hosts_update_delay',
+                 default=0.5,
+                 help='Seconds to wait before writing the dnsmasq host file '
+                      'and reloading dnsmasq after an incremental update, '
+                      'so a burst of allocations is written only once'),
+    cfg.IntOpt('dhcp_hosts_resync_interval',
+               default=600,
+               help='Seconds after which the in-memory dhcp-host entries '
+                    'are rebuilt from the database'),
     ]
 
 CONF = cfg.CONF
@@ -179,6 +201,17 @@ class IptablesTable(object):
         self.chains = set()
         self.unwrapped_chains = set()
         self.remove_chains = set()
+        self.applied_state = None
+
+    def get_state(self):
+        """Return a snapshot of the table to compare against later ones."""
+        return (frozenset(self.chains), frozenset(self.unwrapped_chains),
+                tuple((r.chain, r.rule, r.wrap, r.top) for r in self.rules))
+
+    def is_dirty(self):
+        """Whether the table changed since it was last applied."""
+        return (bool(self.remove_rules) or bool(self.remove_chains) or
+                self.applied_state != self.get_state())
 
     def add_chain(self, name, wrap=True):
         """Adds a named chain to the table.
@@ -287,10 +320,8 @@ class IptablesTable(object):
 
     def empty_chain(self, chain, wrap=True):
         """Remove all rules from a chain."""
-        chained_rules = [rule for rule in self.rules
-                              if rule.chain == chain and rule.wrap == wrap]
-        for rule in chained_rules:
-            self.rules.remove(rule)
+        self.rules = [rule for rule in self.rules
+                      if rule.chain != chain or rule.wrap != wrap]
 
 
 class IptablesManager(object):
@@ -406,17 +437,33 @@ class IptablesManager(object):
             s += [('ip6tables', self.ipv6)]
 
         for cmd, tables in s:
+            if CONF.iptables_incremental_apply:
+                # iptables-restore only flushes the tables it is given, so
+                # the tables we left alone keep their rules and counters.
+                tables = dict((table_name, table)
+                              for table_name, table in tables.iteritems()
+                              if table.is_dirty())
+                if not tables:
+                    continue
+
             all_tables, _err = self.execute('%s-save' % (cmd,), '-c',
                                                 run_as_root=True,
                                                 attempts=5)
             all_lines = all_tables.split('\n')
+            changed_lines = []
             for table_name, table in tables.iteritems():
                 start, end = self._find_table(all_lines, table_name)
-                all_lines[start:end] = self._modify_rules(
-                        all_lines[start:end], table, table_name)
+                new_lines = self._modify_rules(all_lines[start:end], table,
+                                               table_name)
+                all_lines[start:end] = new_lines
+                changed_lines += new_lines
+            if CONF.iptables_incremental_apply:
+                all_lines = changed_lines
             self.execute('%s-restore' % (cmd,), '-c', run_as_root=True,
                          process_input='\n'.join(all_lines),
                          attempts=5)
+            for table in tables.itervalues():
+                table.applied_state = table.get_state()
         LOG.debug(_("IPTablesManager.apply completed with success"))
 
     def _find_table(self, lines, table_name):
@@ -445,27 +492,19 @@ class IptablesManager(object):
             current_lines = fake_table
 
         # Remove any trace of our rules
-        new_filter = filter(lambda line: binary_name not in line,
-                            current_lines)
+        new_filter = [line for line in current_lines
+                      if binary_name not in line]
 
         top_rules = []
         bottom_rules = []
 
         if CONF.iptables_top_regex:
-            regex = re.compile(CONF.iptables_top_regex)
-            temp_filter = filter(lambda line: regex.search(line), new_filter)
-            for rule_str in temp_filter:
-                new_filter = filter(lambda s: s.strip() != rule_str.strip(),
-                                    new_filter)
-            top_rules = temp_filter
+            new_filter, top_rules = self._split_by_regex(
+                    new_filter, CONF.iptables_top_regex)
 
         if CONF.iptables_bottom_regex:
-            regex = re.compile(CONF.iptables_bottom_regex)
-            temp_filter = filter(lambda line: regex.search(line), new_filter)
-            for rule_str in temp_filter:
-                new_filter = filter(lambda s: s.strip() != rule_str.strip(),
-                    new_filter)
-            bottom_rules = temp_filter
+            new_filter, bottom_rules = self._split_by_regex(
+                    new_filter, CONF.iptables_bottom_regex)
 
         seen_chains = False
         rules_index = 0
@@ -480,41 +519,35 @@ class IptablesManager(object):
         if not seen_chains:
             rules_index = 2
 
-        our_rules = top_rules
+        # rule.top == True means we want this rule to be at the top.
+        # Further down, we weed out duplicates from the bottom of the
+        # list, so here we remove the dupes ahead of time.
+
+        # We don't want to remove an entry if it has non-zero
+        # [packet:byte] counts and replace it with [0:0], so let's
+        # remember the last duplicate of each top rule and use it in
+        # place of our table rule.
+        top_keys = set(_rule_key(str(rule)) for rule in rules if rule.top)
+        dup_lines = {}
+        if top_keys:
+            kept_lines = []
+            for line in new_filter:
+                key = _rule_key(line)
+                if key in top_keys:
+                    dup_lines[key] = line
+                else:
+                    kept_lines.append(line)
+            new_filter = kept_lines
+
+        our_rules = list(top_rules)
         bot_rules = []
         for rule in rules:
             rule_str = str(rule)
             if rule.top:
-                # rule.top == True means we want this rule to be at the top.
-                # Further down, we weed out duplicates from the bottom of the
-                # list, so here we remove the dupes ahead of time.
-
-                # We don't want to remove an entry if it has non-zero
-                # [packet:byte] counts and replace it with [0:0], so let's
-                # go look for a duplicate, and over-ride our table rule if
-                # found.
-
-                # ignore [packet:byte] counts at beginning of line
-                if rule_str.startswith('['):
-                    rule_str = rule_str.split(']', 1)[1]
-                dup_filter = filter(lambda s: rule_str.strip() in s.strip(),
-                                    new_filter)
-
-                new_filter = filter(lambda s:
-                                    rule_str.strip() not in s.strip(),
-                                    new_filter)
-                # if no duplicates, use original rule
-                if dup_filter:
-                    # grab the last entry, if there is one
-                    dup = dup_filter[-1]
-                    rule_str = str(dup)
-                else:
-                    rule_str = str(rule)
-                rule_str.strip()
-
-                our_rules += [rule_str]
+                our_rules.append(dup_lines.pop(_rule_key(rule_str),
+                                               rule_str))
             else:
-                bot_rules += [rule_str]
+                bot_rules.append(rule_str)
 
         our_rules += bot_rules
 
@@ -528,62 +561,60 @@ class IptablesManager(object):
 
         commit_index = new_filter.index('COMMIT')
         new_filter[commit_index:commit_index] = bottom_rules
-        seen_lines = set()
 
-        def _weed_out_duplicates(line):
-            # ignore [packet:byte] counts at beginning of lines
-            if line.startswith('['):
-                line = line.split(']', 1)[1]
-            line = line.strip()
-            if line in seen_lines:
-                return False
-            else:
-                seen_lines.add(line)
-                return True
+        removes = {}
+        for rule in remove_rules:
+            # ignore [packet:byte] counts at beginning of rules
+            rule_str = str(rule).split(' ', 1)[1].strip()
+            removes[rule_str] = removes.get(rule_str, 0) + 1
+
+        # We filter duplicates, letting the *last* occurrence take
+        # precendence.  We also filter out anything in the "remove"
+        # lists.
+        seen_lines = set()
+        kept_lines = []
+        for line in reversed(new_filter):
+            key = _rule_key(line)
+            if key in seen_lines:
+                continue
+            seen_lines.add(key)
 
-        def _weed_out_removes(line):
             # We need to find exact matches here
             if line.startswith(':'):
                 # it's a chain, for example, ":nova-billing - [0:0]"
                 # strip off everything except the chain name
-                line = line.split(':')[1]
-                line = line.split('- [')[0]
-                line = line.strip()
-                for chain in remove_chains:
-                    if chain == line:
-                        remove_chains.remove(chain)
-                        return False
-            elif line.startswith('['):
-                # it's a rule
-                # ignore [packet:byte] counts at beginning of lines
-                line = line.split(']', 1)[1]
-                line = line.strip()
-                for rule in remove_rules:
-                    # ignore [packet:byte] counts at beginning of rules
-                    rule_str = str(rule)
-                    rule_str = rule_str.split(' ', 1)[1]
-                    rule_str = rule_str.strip()
-                    if rule_str == line:
-                        remove_rules.remove(rule)
-                        return False
-
-            # Leave it alone
-            return True
+                chain = line.split(':')[1].split('- [')[0].strip()
+                if chain in remove_chains:
+                    remove_chains.remove(chain)
+                    continue
+            elif line.startswith('[') and removes.get(key):
+                removes[key] -= 1
+                continue
 
-        # We filter duplicates, letting the *last* occurrence take
-        # precendence.  We also filter out anything in the "remove"
-        # lists.
-        new_filter.reverse()
-        new_filter = filter(_weed_out_duplicates, new_filter)
-        new_filter = filter(_weed_out_removes, new_filter)
-        new_filter.reverse()
+            kept_lines.append(line)
+        kept_lines.reverse()
 
         # flush lists, just in case we didn't find something
         remove_chains.clear()
-        for rule in remove_rules:
-            remove_rules.remove(rule)
+        del remove_rules[:]
+
+        return kept_lines
 
-        return new_filter
+    @staticmethod
+    def _split_by_regex(lines, regex):
+        """Split out the lines matching regex, and any copies of them."""
+        regex = re.compile(regex)
+        matched = [line for line in lines if regex.search(line)]
+        matched_keys = set(line.strip() for line in matched)
+        lines = [line for line in lines if line.strip() not in matched_keys]
+        return lines, matched
+
+
+def _rule_key(line):
+    """Return an iptables-save line without its [packet:byte] counts."""
+    if line.startswith('['):
+        line = line.split(']', 1)[1]
+    return line.strip()
 
 
 # NOTE(jkoelker) This is just a nice little stub point since mocking
@@ -848,6 +879,72 @@ def get_dhcp_hosts(context, network_ref):
     return '\n'.join(hosts)
 
 
+class DhcpHostTable(object):
+    """A network's dhcp-host entries, kept in memory between updates.
+
+    Entries are keyed by fixed ip address and updated one address at a
+    time as ips are allocated and released; only sync() reads every
+    associated fixed ip of the network from the database.
+    """
+
+    def __init__(self):
+        self.entries = collections.OrderedDict()
+        self.synced_at = None
+        self.flush_args = None
+
+    def needs_sync(self):
+        return (self.synced_at is None or
+                timeutils.utcnow_ts() - self.synced_at >=
+                CONF.dhcp_hosts_resync_interval)
+
+    def sync(self, context, network_ref):
+        """Rebuilds the table from the database."""
+        self.entries.clear()
+        for data in self._get_fixed_ips(context, network_ref):
+            self.entries[data['address']] = (data['vif_address'],
+                                             _host_dhcp(data))
+        self.synced_at = timeutils.utcnow_ts()
+
+    def update(self, context, network_ref, address):
+        """Updates the entry of a single fixed ip from the database.
+
+        Returns False if the table turned out to disagree with the
+        database, in which case it should be synced.
+        """
+        fixed_ips = self._get_fixed_ips(context, network_ref, address)
+        if not fixed_ips:
+            # NOTE: releasing an ip we never had means we missed its
+            #       allocation, so other entries may be stale as well.
+            return self.entries.pop(address, None) is not None
+
+        data = fixed_ips[0]
+        self.entries[address] = (data['vif_address'], _host_dhcp(data))
+        return True
+
+    def render(self):
+        """Returns the table in dhcp-host format, like get_dhcp_hosts()."""
+        hosts = []
+        macs = set()
+        for mac, host in self.entries.itervalues():
+            if mac not in macs:
+                hosts.append(host)
+                macs.add(mac)
+        return '\n'.join(hosts)
+
+    def _get_fixed_ips(self, context, network_ref, address=None):
+        host = None
+        if network_ref['multi_host']:
+            host = CONF.host
+        return db.network_get_associated_fixed_ips(context,
+                                                   network_ref['id'],
+                                                   host=host,
+                                                   address=address)
+
+
+# dhcp-host entries of the networks served by this host, by device
+dhcp_host_tables = {}
+
+
 def get_dns_hosts(context, network_ref):
     """Get network's DNS hosts in hosts format."""
     hosts = []
@@ -932,10 +1029,60 @@ def release_dhcp(dev, address, mac_address):
     utils.execute('dhcp_release', dev, address, mac_address, run_as_root=True)
 
 
-def update_dhcp(context, dev, network_ref):
-    conffile = _dhcp_file(dev, 'conf')
-    write_to_file(conffile, get_dhcp_hosts(context, network_ref))
-    restart_dhcp(context, dev, network_ref)
+def update_dhcp(context, dev, network_ref, address=None):
+    """Writes the network's dhcp-host file and reloads dnsmasq.
+
+    With dhcp_hosts_incremental set and the address of the fixed ip
+    that was allocated or released given, only that entry is fetched
+    from the database, and the write and reload are put off for
+    dhcp_hosts_update_delay seconds to be shared with other updates.
+    """
+    if not CONF.dhcp_hosts_incremental:
+        conffile = _dhcp_file(dev, 'conf')
+        write_to_file(conffile, get_dhcp_hosts(context, network_ref))
+        restart_dhcp(context, dev, network_ref)
+        return
+
+    table = dhcp_host_tables.get(dev)
+    if table is None:
+        table = dhcp_host_tables[dev] = DhcpHostTable()
+
+    if (address is None or table.needs_sync() or
+            not table.update(context, network_ref, address)):
+        table.sync(context, network_ref)
+    elif CONF.dhcp_hosts_update_delay > 0:
+        if table.flush_args is None:
+            greenthread.spawn_after(CONF.dhcp_hosts_update_delay,
+                                    _flush_dhcp_hosts_later, dev)
+        table.flush_args = (context, network_ref)
+        return
+
+    table.flush_args = (context, network_ref)
+    _flush_dhcp_hosts(dev)
+
+
+def _flush_dhcp_hosts(dev):
+    table = dhcp_host_tables.get(dev)
+    if table is None or table.flush_args is None:
+        # killed, or already written by a sync in the meantime
+        return
+
+    context, network_ref = table.flush_args
+    table.flush_args = None
+    try:
+        write_to_file(_dhcp_file(dev, 'conf'), table.render())
+        restart_dhcp(context, dev, network_ref)
+    except Exception:
+        with excutils.save_and_reraise_exception():
+            # make the next update sync and write the file again
+            table.synced_at = None
+
+
+def _flush_dhcp_hosts_later(dev):
+    try:
+        _flush_dhcp_hosts(dev)
+    except Exception:
+        LOG.exception(_('Failed to update the dhcp hosts of %s'), dev)
 
 
 def update_dns(context, dev, network_ref):
@@ -950,6 +1097,7 @@ def update_dhcp_hostfile_with_text(dev, hosts_text):
 
 
 def kill_dhcp(dev):
+    dhcp_host_tables.pop(dev, None)
     pid = _dnsmasq_pid_for(dev)
     if pid:
         # Check that the process exists and looks like a dnsmasq process
@@ -1311,6 +1459,16 @@ class LinuxNetInterfaceDriver(object):
         raise NotImplementedError()
 
 
+def _vlan_num(cls, vlan_num, *args, **kwargs):
+    """Key of the lock_vlan lock, vlans are set up independently."""
+    return vlan_num
+
+
+def _bridge(cls, bridge, *args, **kwargs):
+    """Key of the lock_bridge lock, bridges are set up independently."""
+    return bridge
+
+
 # plugs interfaces using Linux Bridge
 class LinuxBridgeInterfaceDriver(LinuxNetInterfaceDriver):
 
@@ -1374,7 +1532,8 @@ class LinuxBridgeInterfaceDriver(LinuxNetInterfaceDriver):
         LinuxBridgeInterfaceDriver.remove_vlan(vlan_num)
 
     @classmethod
-    @lockutils.synchronized('lock_vlan', 'nova-', external=True)
+    @lockutils.synchronized('lock_vlan', 'nova-', external=True,
+                            key=_vlan_num)
     def ensure_vlan(_self, vlan_num, bridge_interface, mac_address=None):
         """Create a vlan unless it already exists."""
         interface = 'vlan%s' % vlan_num
@@ -1399,7 +1558,8 @@ class LinuxBridgeInterfaceDriver(LinuxNetInterfaceDriver):
         return interface
 
     @classmethod
-    @lockutils.synchronized('lock_vlan', 'nova-', external=True)
+    @lockutils.synchronized('lock_vlan', 'nova-', external=True,
+                            key=_vlan_num)
     def remove_vlan(cls, vlan_num):
         """Delete a vlan."""
         vlan_interface = 'vlan%s' % vlan_num
@@ -1416,7 +1576,8 @@ class LinuxBridgeInterfaceDriver(LinuxNetInterfaceDriver):
             LOG.debug(_("Unplugged VLAN interface '%s'"), vlan_interface)
 
     @classmethod
-    @lockutils.synchronized('lock_bridge', 'nova-', external=True)
+    @lockutils.synchronized('lock_bridge', 'nova-', external=True,
+                            key=_bridge)
     def ensure_bridge(_self, bridge, interface, net_attrs=None, gateway=True,
                       filtering=True):
         """Create a bridge unless it already exists.
@@ -1499,7 +1660,8 @@ class LinuxBridgeInterfaceDriver(LinuxNetInterfaceDriver):
                                      '--out-interface %s -j DROP' % bridge)
 
     @classmethod
-    @lockutils.synchronized('lock_bridge', 'nova-', external=True)
+    @lockutils.synchronized('lock_bridge', 'nova-', external=True,
+                            key=_bridge)
     def remove_bridge(cls, bridge, gateway=True, filtering=True):
         """Delete a bridge."""
         if not device_exists(bridge):
@@ -58,6 +58,7 @@ from nova import ipv6
 from nova import manager
 from nova.network import api as network_api
 from nova.network import driver
+from nova.network import fixed_ip_blocks
 from nova.network import floating_ips
 from nova.network import model as network_model
 from nova.network import rpcapi as network_rpcapi
@@ -130,6 +131,11 @@ network_opts = [
     cfg.IntOpt('fixed_ip_disassociate_timeout',
                default=600,
                help='Seconds after which a deallocated ip is disassociated'),
+    cfg.IntOpt('fixed_ip_claim_block_size',
+               default=0,
+               help='Number of free fixed ips a network host claims at a '
+                    'time and allocates from, instead of locking a free '
+                    'fixed ip for every allocation. 0 to disable'),
     cfg.IntOpt('create_unique_mac_address_attempts',
                default=5,
                help='Number of attempts to create unique mac address'),
@@ -306,6 +312,11 @@ class NetworkManager(manager.Manager):
 
         super(NetworkManager, self).__init__(*args, **kwargs)
 
+        self.fixed_ip_blocks = None
+        if CONF.fixed_ip_claim_block_size > 0:
+            self.fixed_ip_blocks = fixed_ip_blocks.BlockAllocator(
+                self.db, self.host, CONF.fixed_ip_claim_block_size)
+
     def _import_ipam_lib(self, ipam_lib):
         self.ipam = importutils.import_module(ipam_lib).get_ipam_lib(self)
 
@@ -347,6 +358,28 @@ class NetworkManager(manager.Manager):
                 dev = self.driver.get_dev(network)
                 self.driver.update_dns(ctxt, dev, network)
 
+    def cleanup_host(self):
+        """Release the fixed ips claimed but not allocated."""
+        if self.fixed_ip_blocks is not None:
+            ctxt = context.get_admin_context()
+            self.fixed_ip_blocks.release(ctxt)
+
+    def _associate_pool(self, context, network_id, instance_id):
+        """Associate a free fixed ip of the network to the instance, from
+        the blocks claimed by this host if fixed_ip_claim_block_size is set.
+        """
+        if self.fixed_ip_blocks is not None:
+            return self.fixed_ip_blocks.associate(context, network_id,
+                                                  instance_id)
+        return self.db.fixed_ip_associate_pool(context, network_id,
+                                               instance_id)
+
+    @manager.periodic_task
+    def _renew_fixed_ip_claims(self, context):
+        """Keep the claims on fixed ips not allocated yet from expiring."""
+        if self.fixed_ip_blocks is not None:
+            self.fixed_ip_blocks.renew(context)
+
     @manager.periodic_task
     def _disassociate_stale_fixed_ips(self, context):
         if self.timeout_fixed_ips:
@@ -845,7 +878,7 @@ class NetworkManager(manager.Manager):
                                                          instance_id,
                                                          network['id'])
                 else:
-                    address = self.db.fixed_ip_associate_pool(
+                    address = self._associate_pool(
                         context.elevated(), network['id'], instance_id)
                 self._do_trigger_security_group_members_refresh_for_instance(
                     instance_id)
@@ -867,7 +900,7 @@ class NetworkManager(manager.Manager):
                     name, address, "A", self.instance_dns_domain)
                 self.instance_dns_manager.create_entry(
                     instance_id, address, "A", self.instance_dns_domain)
-            self._setup_network_on_host(context, network)
+            self._setup_network_on_host(context, network, address=address)
 
             QUOTAS.commit(context, reservations)
             return address
@@ -935,7 +968,7 @@ class NetworkManager(manager.Manager):
                 #             callback will get called by nova-dhcpbridge.
                 self.driver.release_dhcp(dev, address, vif['address'])
 
-            self._teardown_network_on_host(context, network)
+            self._teardown_network_on_host(context, network, address=address)
 
         # Commit the reservations
         if reservations:
@@ -1288,12 +1321,18 @@ class NetworkManager(manager.Manager):
         network = self.db.network_get(context, network_id)
         call_func(context, network)
 
-    def _setup_network_on_host(self, context, network):
-        """Sets up network on this host."""
+    def _setup_network_on_host(self, context, network, address=None):
+        """Sets up network on this host.
+
+        address is the fixed ip just allocated on the network, if any.
+        """
         raise NotImplementedError()
 
-    def _teardown_network_on_host(self, context, network):
-        """Sets up network on this host."""
+    def _teardown_network_on_host(self, context, network, address=None):
+        """Sets up network on this host.
+
+        address is the fixed ip just released on the network, if any.
+        """
         raise NotImplementedError()
 
     def validate_networks(self, context, networks):
@@ -1474,7 +1513,7 @@ class FlatManager(NetworkManager):
                                                      teardown)
         self.db.fixed_ip_disassociate(context, address)
 
-    def _setup_network_on_host(self, context, network):
+    def _setup_network_on_host(self, context, network, address=None):
         """Setup Network on this host."""
         # NOTE(tr3buchet): this does not need to happen on every ip
         # allocation, this functionality makes more sense in create_network
@@ -1483,7 +1522,7 @@ class FlatManager(NetworkManager):
         net['injected'] = CONF.flat_injected
         self.db.network_update(context, network['id'], net)
 
-    def _teardown_network_on_host(self, context, network):
+    def _teardown_network_on_host(self, context, network, address=None):
         """Tear down network on this host."""
         pass
 
@@ -1602,7 +1641,7 @@ class FlatDHCPManager(RPCAllocateFixedIP, floating_ips.FloatingIP,
         super(FlatDHCPManager, self).init_host()
         self.init_host_floating_ips()
 
-    def _setup_network_on_host(self, context, network):
+    def _setup_network_on_host(self, context, network, address=None):
         """Sets up network on this host."""
         network['dhcp_server'] = self._get_dhcp_ip(context, network)
 
@@ -1614,20 +1653,20 @@ class FlatDHCPManager(RPCAllocateFixedIP, floating_ips.FloatingIP,
             dev = self.driver.get_dev(network)
             # NOTE(dprince): dhcp DB queries require elevated context
             elevated = context.elevated()
-            self.driver.update_dhcp(elevated, dev, network)
+            self.driver.update_dhcp(elevated, dev, network, address=address)
             if(CONF.use_ipv6):
                 self.driver.update_ra(context, dev, network)
                 gateway = utils.get_my_linklocal(dev)
                 self.db.network_update(context, network['id'],
                                        {'gateway_v6': gateway})
 
-    def _teardown_network_on_host(self, context, network):
+    def _teardown_network_on_host(self, context, network, address=None):
         if not CONF.fake_network:
             network['dhcp_server'] = self._get_dhcp_ip(context, network)
             dev = self.driver.get_dev(network)
             # NOTE(dprince): dhcp DB queries require elevated context
             elevated = context.elevated()
-            self.driver.update_dhcp(elevated, dev, network)
+            self.driver.update_dhcp(elevated, dev, network, address=address)
 
     def _get_network_dict(self, network):
         """Returns the dict representing necessary and meta network fields."""
@@ -1697,9 +1736,8 @@ class VlanManager(RPCAllocateFixedIP, floating_ips.FloatingIP, NetworkManager):
                                                      instance_id,
                                                      network['id'])
             else:
-                address = self.db.fixed_ip_associate_pool(context,
-                                                          network['id'],
-                                                          instance_id)
+                address = self._associate_pool(context, network['id'],
+                                               instance_id)
             self._do_trigger_security_group_members_refresh_for_instance(
                                                                    instance_id)
 
@@ -1723,7 +1761,7 @@ class VlanManager(RPCAllocateFixedIP, floating_ips.FloatingIP, NetworkManager):
                                                    "A",
                                                    self.instance_dns_domain)
 
-        self._setup_network_on_host(context, network)
+        self._setup_network_on_host(context, network, address=address)
         return address
 
     def add_network_to_project(self, context, project_id, network_uuid=None):
@@ -1808,15 +1846,15 @@ class VlanManager(RPCAllocateFixedIP, floating_ips.FloatingIP, NetworkManager):
             self, context, vpn=True, **kwargs)
 
     @lockutils.synchronized('setup_network', 'nova-', external=True)
-    def _setup_network_on_host(self, context, network):
+    def _setup_network_on_host(self, context, network, address=None):
         """Sets up network on this host."""
         if not network['vpn_public_address']:
             net = {}
-            address = CONF.vpn_ip
-            net['vpn_public_address'] = address
+            vpn_address = CONF.vpn_ip
+            net['vpn_public_address'] = vpn_address
             network = self.db.network_update(context, network['id'], net)
         else:
-            address = network['vpn_public_address']
+            vpn_address = network['vpn_public_address']
         network['dhcp_server'] = self._get_dhcp_ip(context, network)
 
         if not CONF.fixed_range:
@@ -1825,7 +1863,7 @@ class VlanManager(RPCAllocateFixedIP, floating_ips.FloatingIP, NetworkManager):
 
         # NOTE(vish): only ensure this forward if the address hasn't been set
         #             manually.
-        if address == CONF.vpn_ip and hasattr(self.driver,
+        if vpn_address == CONF.vpn_ip and hasattr(self.driver,
                                                "ensure_vpn_forward"):
             self.l3driver.add_vpn(CONF.vpn_ip,
                     network['vpn_public_port'],
@@ -1834,7 +1872,7 @@ class VlanManager(RPCAllocateFixedIP, floating_ips.FloatingIP, NetworkManager):
             dev = self.driver.get_dev(network)
             # NOTE(dprince): dhcp DB queries require elevated context
             elevated = context.elevated()
-            self.driver.update_dhcp(elevated, dev, network)
+            self.driver.update_dhcp(elevated, dev, network, address=address)
             if(CONF.use_ipv6):
                 self.driver.update_ra(context, dev, network)
                 gateway = utils.get_my_linklocal(dev)
@@ -1842,13 +1880,13 @@ class VlanManager(RPCAllocateFixedIP, floating_ips.FloatingIP, NetworkManager):
                                        {'gateway_v6': gateway})
 
     @lockutils.synchronized('setup_network', 'nova-', external=True)
-    def _teardown_network_on_host(self, context, network):
+    def _teardown_network_on_host(self, context, network, address=None):
         if not CONF.fake_network:
             network['dhcp_server'] = self._get_dhcp_ip(context, network)
             dev = self.driver.get_dev(network)
             # NOTE(dprince): dhcp DB queries require elevated context
             elevated = context.elevated()
-            self.driver.update_dhcp(elevated, dev, network)
+            self.driver.update_dhcp(elevated, dev, network, address=address)
 
             # NOTE(ethuleau): For multi hosted networks, if the network is no
             # more used on this host and if VPN forwarding rule aren't handed
@@ -1866,8 +1904,6 @@ class VlanManager(RPCAllocateFixedIP, floating_ips.FloatingIP, NetworkManager):
                               'host': None}
                     self.db.fixed_ip_update(context, network['dhcp_server'],
                                             values)
-            else:
-                self.driver.update_dhcp(context, dev, network)
 
     def _get_network_dict(self, network):
         """Returns the dict representing necessary and meta network fields."""
@@ -242,6 +242,7 @@ Efficient use of soft deletes:
 
 import os.path
 import re
+import sys
 import time
 
 from eventlet import greenthread
@@ -249,10 +250,11 @@ from oslo.config import cfg
 from sqlalchemy import exc as sqla_exc
 import sqlalchemy.interfaces
 import sqlalchemy.orm
-from sqlalchemy.pool import NullPool, StaticPool
+from sqlalchemy.pool import NullPool, QueuePool, StaticPool
 from sqlalchemy.sql.expression import literal_column
 
 from nova.openstack.common.db import exception
+from nova.openstack.common import local
 from nova.openstack.common import log as logging
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import timeutils
@@ -266,6 +268,13 @@ sql_opts = [
                help='The SQLAlchemy connection string used to connect to the '
                     'database',
                secret=True),
+    cfg.StrOpt('sql_slave_connection',
+               default='',
+               help='The SQLAlchemy connection string used to connect to a '
+                    'read-only replica of the database, for queries that can '
+                    'do with slightly stale data.  Those go to '
+                    'sql_connection if not set',
+               secret=True),
     cfg.StrOpt('sqlite_db',
                default='nova.sqlite',
                help='the filename to use with sqlite'),
@@ -300,6 +309,16 @@ sql_opts = [
     cfg.BoolOpt('sql_connection_trace',
                 default=False,
                 help='Add python stack traces to SQL as comment strings'),
+    cfg.BoolOpt('sql_statement_metrics_by_function',
+                default=False,
+                help='Keep the statement time metrics by the DB API function '
+                     'that issued the statements, which takes a look up the '
+                     'stack for every statement.  They are all kept under '
+                     '"all" otherwise'),
+    cfg.StrOpt('sql_api_module_suffix',
+               default='.db.sqlalchemy.api',
+               help='End of the name of the module of the DB API functions, '
+                    'for sql_statement_metrics_by_function'),
 ]
 
 CONF = cfg.CONF
@@ -308,6 +327,19 @@ LOG = logging.getLogger(__name__)
 
 _ENGINE = None
 _MAKER = None
+_SLAVE_ENGINE = None
+_SLAVE_MAKER = None
+
+# Upper bounds in seconds of the buckets of the statement time histograms,
+# the last bucket takes everything slower.
+STATEMENT_TIME_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+# The outermost function of the DB API module on the stack is looked for
+# up to this many frames up.
+_MAX_API_FRAME_DEPTH = 50
+
+_STATEMENT_METRICS = {}
+_POOL_METRICS = {}
 
 
 def set_defaults(sql_connection, sqlite_db):
@@ -317,9 +349,19 @@ def set_defaults(sql_connection, sqlite_db):
                      sqlite_db=sqlite_db)
 
 
-def get_session(autocommit=True, expire_on_commit=False):
-    """Return a SQLAlchemy session."""
-    global _MAKER
+def get_session(autocommit=True, expire_on_commit=False, slave_session=False):
+    """Return a SQLAlchemy session.
+
+    With slave_session the session reads from sql_slave_connection, if
+    set.  Only use it for queries that don't mind data a little behind.
+    """
+    global _MAKER, _SLAVE_MAKER
+
+    if slave_session and CONF.sql_slave_connection:
+        if _SLAVE_MAKER is None:
+            engine = get_engine(slave_engine=True)
+            _SLAVE_MAKER = get_maker(engine, autocommit, expire_on_commit)
+        return _SLAVE_MAKER()
 
     if _MAKER is None:
         engine = get_engine()
@@ -348,9 +390,10 @@ def get_session(autocommit=True, expire_on_commit=False):
 # N columns - (IntegrityError) (1062, "Duplicate entry 'values joined
 #               with -' for key 'name_of_our_constraint'")
 _DUP_KEY_RE_DB = {
-    "sqlite": re.compile(r"^.*columns?([^)]+)(is|are)\s+not\s+unique$"),
-    "postgresql": re.compile(r"^.*duplicate\s+key.*\"([^\"]+)\"\s*\n.*$"),
-    "mysql": re.compile(r"^.*\(1062,.*'([^\']+)'\"\)$")
+    "sqlite": (re.compile(r"^.*columns?([^)]+)(is|are)\s+not\s+unique$"),
+               re.compile(r"^.*UNIQUE\s+constraint\s+failed:\s+(.+)$")),
+    "postgresql": (re.compile(r"^.*duplicate\s+key.*\"([^\"]+)\"\s*\n.*$"),),
+    "mysql": (re.compile(r"^.*\(1062,.*'([^\']+)'\"\)$"),)
 }
 
 
@@ -373,13 +416,17 @@ def raise_if_duplicate_entry_error(integrity_error, engine_name):
     if engine_name not in ["mysql", "sqlite", "postgresql"]:
         return
 
-    m = _DUP_KEY_RE_DB[engine_name].match(integrity_error.message)
-    if not m:
+    for pattern in _DUP_KEY_RE_DB[engine_name]:
+        m = pattern.match(integrity_error.message)
+        if m:
+            break
+    else:
         return
     columns = m.group(1)
 
     if engine_name == "sqlite":
-        columns = columns.strip().split(", ")
+        # Newer versions of SQLite name the columns "table.column"
+        columns = [c.split('.')[-1] for c in columns.strip().split(", ")]
     else:
         columns = get_columns_from_uniq_cons_or_name(columns)
     raise exception.DBDuplicateEntry(columns, integrity_error)
@@ -439,9 +486,15 @@ def wrap_db_error(f):
     return _wrap
 
 
-def get_engine():
-    """Return a SQLAlchemy engine."""
-    global _ENGINE
+def get_engine(slave_engine=False):
+    """Return a SQLAlchemy engine, for sql_slave_connection if asked
+    for and set.
+    """
+    global _ENGINE, _SLAVE_ENGINE
+    if slave_engine and CONF.sql_slave_connection:
+        if _SLAVE_ENGINE is None:
+            _SLAVE_ENGINE = create_engine(CONF.sql_slave_connection)
+        return _SLAVE_ENGINE
     if _ENGINE is None:
         _ENGINE = create_engine(CONF.sql_connection)
     return _ENGINE
@@ -471,6 +524,135 @@ def greenthread_yield(dbapi_con, con_record):
     greenthread.sleep(0)
 
 
+def query_count_listener(conn, cursor, statement, parameters, context,
+                         executemany):
+    """
+    Count the statements executed on behalf of the request context of the
+    current greenthread, so that callers can see how many queries a single
+    request issued.
+    """
+    request_context = getattr(local.store, 'context', None)
+    if request_context is not None:
+        request_context.db_query_count = getattr(request_context,
+                                                 'db_query_count', 0) + 1
+
+
+def _get_api_function(module_suffix):
+    """Return the name of the outermost public function on the stack of
+    the DB API module, the one whose name ends with module_suffix.
+    Decorators and private helpers of the module are skipped.
+    """
+    name = None
+    frame = sys._getframe(2)
+    depth = 0
+    while frame is not None and depth < _MAX_API_FRAME_DEPTH:
+        module_globals = frame.f_globals
+        if module_globals.get('__name__', '').endswith(module_suffix):
+            code_name = frame.f_code.co_name
+            if not code_name.startswith('_') and code_name in module_globals:
+                name = code_name
+        elif name is not None:
+            break
+        frame = frame.f_back
+        depth += 1
+    return name or 'unknown'
+
+
+def statement_start_listener(conn, cursor, statement, parameters, context,
+                             executemany):
+    context._statement_started_at = time.time()
+
+
+def statement_end_listener(conn, cursor, statement, parameters, context,
+                           executemany):
+    """
+    Record how long the statement took, against the DB API function that
+    issued it with sql_statement_metrics_by_function.
+    """
+    started_at = getattr(context, '_statement_started_at', None)
+    if started_at is None:
+        return
+    elapsed = time.time() - started_at
+    if CONF.sql_statement_metrics_by_function:
+        name = _get_api_function(CONF.sql_api_module_suffix)
+    else:
+        name = 'all'
+    metrics = _STATEMENT_METRICS.get(name)
+    if metrics is None:
+        metrics = _STATEMENT_METRICS[name] = {
+            'count': 0,
+            'total_time': 0.0,
+            'max_time': 0.0,
+            'buckets': [0] * (len(STATEMENT_TIME_BUCKETS) + 1)}
+    metrics['count'] += 1
+    metrics['total_time'] += elapsed
+    metrics['max_time'] = max(metrics['max_time'], elapsed)
+    for i, bound in enumerate(STATEMENT_TIME_BUCKETS):
+        if elapsed <= bound:
+            break
+    else:
+        i = len(STATEMENT_TIME_BUCKETS)
+    metrics['buckets'][i] += 1
+
+
+class MeteredQueuePool(QueuePool):
+    """QueuePool that counts how long checkouts wait for a connection,
+    and how often all connections were in use.
+    """
+
+    def connect(self):
+        exhausted = (self._max_overflow > -1 and
+                     self.checkedout() >= self.size() + self._max_overflow)
+        started_at = time.time()
+        timed_out = False
+        try:
+            return super(MeteredQueuePool, self).connect()
+        except sqla_exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            wait = time.time() - started_at
+            metrics = _POOL_METRICS
+            if not metrics:
+                metrics.update({'checkouts': 0,
+                                'exhausted': 0,
+                                'timeouts': 0,
+                                'total_wait': 0.0,
+                                'max_wait': 0.0})
+            metrics['checkouts'] += 1
+            metrics['exhausted'] += exhausted
+            metrics['timeouts'] += timed_out
+            metrics['total_wait'] += wait
+            metrics['max_wait'] = max(metrics['max_wait'], wait)
+
+
+def get_metrics():
+    """Return the statement time histograms by DB API function, or under
+    'all' without sql_statement_metrics_by_function, and the connection
+    pool checkout counters.
+
+    The counts in 'buckets' are of statements that took up to the time
+    of the matching entry of STATEMENT_TIME_BUCKETS, with one more for
+    slower ones.  'exhausted' counts checkouts that found every
+    connection of the pool in use.
+    """
+    statements = {}
+    for name, metrics in _STATEMENT_METRICS.iteritems():
+        metrics = metrics.copy()
+        metrics['buckets'] = list(metrics['buckets'])
+        metrics['average_time'] = metrics['total_time'] / metrics['count']
+        statements[name] = metrics
+    pool = _POOL_METRICS.copy()
+    if pool:
+        pool['average_wait'] = pool['total_wait'] / pool['checkouts']
+    return {'statements': statements, 'pool': pool}
+
+
+def reset_metrics():
+    _STATEMENT_METRICS.clear()
+    _POOL_METRICS.clear()
+
+
 def ping_listener(dbapi_conn, connection_rec, connection_proxy):
     """
     Ensures that MySQL connections checked out of the
@@ -523,6 +705,7 @@ def create_engine(sql_connection):
             engine_args["poolclass"] = StaticPool
             engine_args["connect_args"] = {'check_same_thread': False}
     else:
+        engine_args['poolclass'] = MeteredQueuePool
         engine_args['pool_size'] = CONF.sql_max_pool_size
         if CONF.sql_max_overflow is not None:
             engine_args['max_overflow'] = CONF.sql_max_overflow
@@ -530,6 +713,12 @@ def create_engine(sql_connection):
     engine = sqlalchemy.create_engine(sql_connection, **engine_args)
 
     sqlalchemy.event.listen(engine, 'checkin', greenthread_yield)
+    sqlalchemy.event.listen(engine, 'before_cursor_execute',
+                            query_count_listener)
+    sqlalchemy.event.listen(engine, 'before_cursor_execute',
+                            statement_start_listener)
+    sqlalchemy.event.listen(engine, 'after_cursor_execute',
+                            statement_end_listener)
 
     if 'mysql' in connection_dict.drivername:
         sqlalchemy.event.listen(engine, 'checkout', ping_listener)
@@ -34,7 +34,6 @@ This module provides a few things:
 
 
 import datetime
-import functools
 import inspect
 import itertools
 import json
@@ -43,6 +42,69 @@ import xmlrpclib
 from nova.openstack.common import timeutils
 
 
+def _simple_to_primitive(value, convert_instances, convert_datetime,
+                         level, max_depth, seen):
+    return value
+
+
+def _dict_to_primitive(value, convert_instances, convert_datetime,
+                       level, max_depth, seen):
+    key = (id(value), level)
+    if key in seen:
+        return '?'
+    seen.add(key)
+    try:
+        return dict((k, _to_primitive(v, convert_instances, convert_datetime,
+                                      level, max_depth, seen))
+                    for k, v in value.iteritems())
+    finally:
+        seen.discard(key)
+
+
+def _list_to_primitive(value, convert_instances, convert_datetime,
+                       level, max_depth, seen):
+    key = (id(value), level)
+    if key in seen:
+        return '?'
+    seen.add(key)
+    try:
+        return [_to_primitive(v, convert_instances, convert_datetime,
+                              level, max_depth, seen)
+                for v in value]
+    finally:
+        seen.discard(key)
+
+
+def _datetime_to_primitive(value, convert_instances, convert_datetime,
+                           level, max_depth, seen):
+    if convert_datetime:
+        return timeutils.strtime(value)
+    return value
+
+
+_NASTY_TESTS = [inspect.ismodule, inspect.isclass, inspect.ismethod,
+                inspect.isfunction, inspect.isgeneratorfunction,
+                inspect.isgenerator, inspect.istraceback, inspect.isframe,
+                inspect.iscode, inspect.isbuiltin, inspect.isroutine,
+                inspect.isabstract]
+
+# Converters for the types most values are, looked up by exact type so
+# subclasses still get all the checks below.
+_TYPE_CONVERTERS = {
+    dict: _dict_to_primitive,
+    list: _list_to_primitive,
+    tuple: _list_to_primitive,
+    datetime.datetime: _datetime_to_primitive,
+    str: _simple_to_primitive,
+    unicode: _simple_to_primitive,
+    int: _simple_to_primitive,
+    long: _simple_to_primitive,
+    float: _simple_to_primitive,
+    bool: _simple_to_primitive,
+    type(None): _simple_to_primitive,
+}
+
+
 def to_primitive(value, convert_instances=False, convert_datetime=True,
                  level=0, max_depth=3):
     """Convert a complex object into primitives.
@@ -54,16 +116,26 @@ def to_primitive(value, convert_instances=False, convert_datetime=True,
     To handle cyclical data structures we could track the actual objects
     visited in a set, but not all objects are hashable. Instead we just
     track the depth of the object inspections and don't go too deep.
+    Dicts and lists that contain themselves, which the depth doesn't
+    stop, are tracked by id() and converted to '?' where they repeat.
 
     Therefore, convert_instances=True is lossy ... be aware.
 
     """
-    nasty = [inspect.ismodule, inspect.isclass, inspect.ismethod,
-             inspect.isfunction, inspect.isgeneratorfunction,
-             inspect.isgenerator, inspect.istraceback, inspect.isframe,
-             inspect.iscode, inspect.isbuiltin, inspect.isroutine,
-             inspect.isabstract]
-    for test in nasty:
+    return _to_primitive(value, convert_instances, convert_datetime,
+                         level, max_depth, set())
+
+
+def _to_primitive(value, convert_instances, convert_datetime, level,
+                  max_depth, seen):
+    converter = _TYPE_CONVERTERS.get(type(value))
+    if converter is not None:
+        if level > max_depth:
+            return '?'
+        return converter(value, convert_instances, convert_datetime,
+                         level, max_depth, seen)
+
+    for test in _NASTY_TESTS:
         if test(value):
             return unicode(value)
 
@@ -86,21 +158,25 @@ def to_primitive(value, convert_instances=False, convert_datetime=True,
     # The try block may not be necessary after the class check above,
     # but just in case ...
     try:
-        recursive = functools.partial(to_primitive,
-                                      convert_instances=convert_instances,
-                                      convert_datetime=convert_datetime,
-                                      level=level,
-                                      max_depth=max_depth)
+        def recursive(value, level=level):
+            return _to_primitive(value, convert_instances, convert_datetime,
+                                 level, max_depth, seen)
+
         # It's not clear why xmlrpclib created their own DateTime type, but
         # for our purposes, make it a datetime type which is explicitly
         # handled
         if isinstance(value, xmlrpclib.DateTime):
             value = datetime.datetime(*tuple(value.timetuple())[:6])
 
+        # Subclasses of dict, list and tuple are watched for cycles too
         if isinstance(value, (list, tuple)):
-            return [recursive(v) for v in value]
+            return _list_to_primitive(value, convert_instances,
+                                      convert_datetime, level, max_depth,
+                                      seen)
         elif isinstance(value, dict):
-            return dict((k, recursive(v)) for k, v in value.iteritems())
+            return _dict_to_primitive(value, convert_instances,
+                                      convert_datetime, level, max_depth,
+                                      seen)
         elif convert_datetime and isinstance(value, datetime.datetime):
             return timeutils.strtime(value)
         elif hasattr(value, 'iteritems'):
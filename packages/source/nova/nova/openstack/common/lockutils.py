@@ -16,6 +16,8 @@
 #    under the License.
 
 
+import collections
+import contextlib
 import errno
 import functools
 import os
@@ -24,6 +26,7 @@ import tempfile
 import time
 import weakref
 
+from eventlet import event
 from eventlet import semaphore
 from oslo.config import cfg
 
@@ -65,14 +68,19 @@ class _InterProcessLock(object):
     safe to close the file descriptor while another green thread holds the
     lock. Just opening and closing the lock file can break synchronisation,
     so lock files must be accessed only using this abstraction.
+
+    A shared lock can be held by several processes at once, as long as
+    none holds it exclusively.
     """
 
-    def __init__(self, name):
+    def __init__(self, name, shared=False):
         self.lockfile = None
         self.fname = name
+        self.shared = shared
 
     def __enter__(self):
-        self.lockfile = open(self.fname, 'w')
+        # Shared locks need the file to be open for reading
+        self.lockfile = open(self.fname, 'a+' if self.shared else 'w')
 
         while True:
             try:
@@ -106,6 +114,7 @@ class _InterProcessLock(object):
 
 
 class _WindowsLock(_InterProcessLock):
+    # msvcrt has no shared locks, so they are taken exclusively
     def trylock(self):
         msvcrt.locking(self.lockfile.fileno(), msvcrt.LK_NBLCK, 1)
 
@@ -115,7 +124,10 @@ class _WindowsLock(_InterProcessLock):
 
 class _PosixLock(_InterProcessLock):
     def trylock(self):
-        fcntl.lockf(self.lockfile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        if self.shared:
+            fcntl.lockf(self.lockfile, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        else:
+            fcntl.lockf(self.lockfile, fcntl.LOCK_EX | fcntl.LOCK_NB)
 
     def unlock(self):
         fcntl.lockf(self.lockfile, fcntl.LOCK_UN)
@@ -128,10 +140,249 @@ else:
     import fcntl
     InterProcessLock = _PosixLock
 
+
+class _ReaderWriterLock(object):
+    """A lock greenthreads hold either shared, to read, or exclusively,
+    to write.
+
+    The lock is granted in the order it was asked for, so a steady stream
+    of readers can't keep a writer waiting forever.  The greenthreads of
+    this process holding it also share a single file lock for external
+    locks, as closing any descriptor of a lock file drops the locks the
+    process holds on it.
+    """
+
+    def __init__(self):
+        self.readers = 0
+        self.writer = False
+        self.waiters = collections.deque()
+        self._file_lock = None
+        self._file_lock_users = 0
+        self._file_lock_sem = semaphore.Semaphore()
+
+    def _can_acquire(self, shared):
+        if shared:
+            return not self.writer
+        return not self.writer and not self.readers
+
+    def _grant(self, shared):
+        if shared:
+            self.readers += 1
+        else:
+            self.writer = True
+
+    def acquire(self, shared=False):
+        """Acquire the lock, returning whether we had to wait for it."""
+        if not self.waiters and self._can_acquire(shared):
+            self._grant(shared)
+            return False
+
+        waiter = (event.Event(), shared)
+        self.waiters.append(waiter)
+        try:
+            waiter[0].wait()
+        except BaseException:
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+                self._wake_waiters()
+            else:
+                # It was granted to us just as we were killed
+                self.release(shared)
+            raise
+        return True
+
+    def release(self, shared=False):
+        if shared:
+            self.readers -= 1
+        else:
+            self.writer = False
+        self._wake_waiters()
+
+    def _wake_waiters(self):
+        while self.waiters:
+            waiter_event, shared = self.waiters[0]
+            if not self._can_acquire(shared):
+                break
+            self.waiters.popleft()
+            self._grant(shared)
+            waiter_event.send()
+
+    @contextlib.contextmanager
+    def file_lock(self, path, shared):
+        with self._file_lock_sem:
+            if not self._file_lock_users:
+                file_lock = InterProcessLock(path, shared=shared)
+                file_lock.__enter__()
+                self._file_lock = file_lock
+            self._file_lock_users += 1
+        try:
+            yield
+        finally:
+            with self._file_lock_sem:
+                self._file_lock_users -= 1
+                if not self._file_lock_users:
+                    self._file_lock.__exit__(None, None, None)
+                    self._file_lock = None
+
+
 _semaphores = weakref.WeakValueDictionary()
 
+# Contention statistics, by lock name, or family name for keyed locks
+_lock_stats = {}
+
+
+def _get_lock_stats(family):
+    stats = _lock_stats.get(family)
+    if stats is None:
+        stats = _lock_stats[family] = {'acquired': 0,
+                                       'contended': 0,
+                                       'waiting': 0,
+                                       'held': 0,
+                                       'wait_time': 0.0,
+                                       'max_wait_time': 0.0,
+                                       'held_time': 0.0,
+                                       'max_held_time': 0.0}
+    return stats
+
+
+def get_lock_stats():
+    """Return contention statistics for every lock taken so far.
+
+    Locks taken with a key are counted under the name of their family.
+    For each there are the number of times it was acquired, how many of
+    those had to wait for it, the number of greenthreads waiting for and
+    holding it, and the total, average and maximum seconds it was waited
+    for and held.
+    """
+    result = {}
+    for family, stats in _lock_stats.iteritems():
+        stats = stats.copy()
+        acquired = stats['acquired']
+        stats['average_wait_time'] = (acquired and
+                                      stats['wait_time'] / acquired)
+        stats['average_held_time'] = (acquired and
+                                      stats['held_time'] / acquired)
+        result[family] = stats
+    return result
+
+
+def reset_lock_stats():
+    """Forget the statistics of the locks not being waited for or held."""
+    for family, stats in _lock_stats.items():
+        if not stats['waiting'] and not stats['held']:
+            del _lock_stats[family]
+
+
+def _get_lock(name):
+    # NOTE(soren): If we ever go natively threaded, this will be racy.
+    #              See http://stackoverflow.com/questions/5390569/dyn
+    #              amically-allocating-and-destroying-mutexes
+    lock = _semaphores.get(name, _ReaderWriterLock())
+    if name not in _semaphores:
+        # this check is not racy - we're already holding ref locally
+        # so GC won't remove the item and there was no IO switch
+        # (only valid in greenthreads)
+        _semaphores[name] = lock
+    return lock
+
+
+@contextlib.contextmanager
+def lock(name, lock_file_prefix='', external=False, lock_path=None,
+         shared=False, key=None):
+    """Context manager holding a lock, see synchronized() for the
+    meaning of the arguments.
+    """
+    family = name
+    if key is not None:
+        name = '%s-%s' % (name, key)
+    stats = _get_lock_stats(family)
+    rw_lock = _get_lock(name)
+
+    start = time.time()
+    stats['waiting'] += 1
+    try:
+        contended = rw_lock.acquire(shared)
+    finally:
+        stats['waiting'] -= 1
+    try:
+        # NOTE(mikal): I know this looks odd
+        if not hasattr(local.strong_store, 'locks_held'):
+            local.strong_store.locks_held = []
+        local.strong_store.locks_held.append(name)
 
-def synchronized(name, lock_file_prefix, external=False, lock_path=None):
+        try:
+            if external and not CONF.disable_process_locking:
+                cleanup_dir = False
+
+                # We need a copy of lock_path because it is non-local
+                local_lock_path = lock_path
+                if not local_lock_path:
+                    local_lock_path = CONF.lock_path
+
+                if not local_lock_path:
+                    cleanup_dir = True
+                    local_lock_path = tempfile.mkdtemp()
+
+                if not os.path.exists(local_lock_path):
+                    fileutils.ensure_tree(local_lock_path)
+
+                # NOTE(mikal): the lock name cannot contain directory
+                # separators
+                safe_name = name.replace(os.sep, '_')
+                lock_file_name = '%s%s' % (lock_file_prefix, safe_name)
+                lock_file_path = os.path.join(local_lock_path,
+                                              lock_file_name)
+
+                LOG.debug(_('Attempting to grab file lock "%(lock)s" at '
+                            '%(path)s'), {'lock': name,
+                                          'path': lock_file_path})
+                try:
+                    with rw_lock.file_lock(lock_file_path, shared):
+                        LOG.debug(_('Got file lock "%(lock)s" at %(path)s'),
+                                  {'lock': name, 'path': lock_file_path})
+                        with _hold(stats, start, contended):
+                            yield
+                finally:
+                    LOG.debug(_('Released file lock "%(lock)s" at '
+                                '%(path)s'), {'lock': name,
+                                              'path': lock_file_path})
+                    # NOTE(vish): This removes the tempdir if we needed
+                    #             to create one. This is used to
+                    #             cleanup the locks left behind by unit
+                    #             tests.
+                    if cleanup_dir:
+                        shutil.rmtree(local_lock_path)
+            else:
+                with _hold(stats, start, contended):
+                    yield
+        finally:
+            local.strong_store.locks_held.remove(name)
+    finally:
+        rw_lock.release(shared)
+
+
+@contextlib.contextmanager
+def _hold(stats, start, contended):
+    """Count a lock as held for the duration of the block."""
+    acquired_at = time.time()
+    wait_time = acquired_at - start
+    stats['acquired'] += 1
+    if contended:
+        stats['contended'] += 1
+    stats['wait_time'] += wait_time
+    stats['max_wait_time'] = max(stats['max_wait_time'], wait_time)
+    stats['held'] += 1
+    try:
+        yield
+    finally:
+        held_time = time.time() - acquired_at
+        stats['held'] -= 1
+        stats['held_time'] += held_time
+        stats['max_held_time'] = max(stats['max_held_time'], held_time)
+
+
+def synchronized(name, lock_file_prefix, external=False, lock_path=None,
+                 shared=False, key=None):
     """Synchronization decorator.
 
     Decorating a method like so::
@@ -165,85 +416,34 @@ def synchronized(name, lock_file_prefix, external=False, lock_path=None):
     The lock_path keyword argument is used to specify a special location for
     external lock files to live. If nothing is set, then CONF.lock_path is
     used as a default.
+
+    The shared keyword argument takes the lock shared, for methods that only
+    read what the lock protects.  Any number of them can run at a time, but
+    none while a method holding the lock exclusively runs.
+
+    The key keyword argument splits the lock into a family of locks, one for
+    each key.  It is a function called with the arguments of the method
+    that returns the key, for example::
+
+        @synchronized('instance', 'nova-', key=lambda self, uuid: uuid)
+        def foo(self, uuid):
+           ...
+
+    only keeps calls for the same uuid from running at the same time.
+    Statistics for the locks of a family are kept under its name.
     """
 
     def wrap(f):
         @functools.wraps(f)
         def inner(*args, **kwargs):
-            # NOTE(soren): If we ever go natively threaded, this will be racy.
-            #              See http://stackoverflow.com/questions/5390569/dyn
-            #              amically-allocating-and-destroying-mutexes
-            sem = _semaphores.get(name, semaphore.Semaphore())
-            if name not in _semaphores:
-                # this check is not racy - we're already holding ref locally
-                # so GC won't remove the item and there was no IO switch
-                # (only valid in greenthreads)
-                _semaphores[name] = sem
-
-            with sem:
+            lock_key = None
+            if key is not None:
+                lock_key = key(*args, **kwargs)
+            with lock(name, lock_file_prefix, external=external,
+                      lock_path=lock_path, shared=shared, key=lock_key):
                 LOG.debug(_('Got semaphore "%(lock)s" for method '
                             '"%(method)s"...'), {'lock': name,
                                                  'method': f.__name__})
-
-                # NOTE(mikal): I know this looks odd
-                if not hasattr(local.strong_store, 'locks_held'):
-                    local.strong_store.locks_held = []
-                local.strong_store.locks_held.append(name)
-
-                try:
-                    if external and not CONF.disable_process_locking:
-                        LOG.debug(_('Attempting to grab file lock "%(lock)s" '
-                                    'for method "%(method)s"...'),
-                                  {'lock': name, 'method': f.__name__})
-                        cleanup_dir = False
-
-                        # We need a copy of lock_path because it is non-local
-                        local_lock_path = lock_path
-                        if not local_lock_path:
-                            local_lock_path = CONF.lock_path
-
-                        if not local_lock_path:
-                            cleanup_dir = True
-                            local_lock_path = tempfile.mkdtemp()
-
-                        if not os.path.exists(local_lock_path):
-                            fileutils.ensure_tree(local_lock_path)
-
-                        # NOTE(mikal): the lock name cannot contain directory
-                        # separators
-                        safe_name = name.replace(os.sep, '_')
-                        lock_file_name = '%s%s' % (lock_file_prefix, safe_name)
-                        lock_file_path = os.path.join(local_lock_path,
-                                                      lock_file_name)
-
-                        try:
-                            lock = InterProcessLock(lock_file_path)
-                            with lock:
-                                LOG.debug(_('Got file lock "%(lock)s" at '
-                                            '%(path)s for method '
-                                            '"%(method)s"...'),
-                                          {'lock': name,
-                                           'path': lock_file_path,
-                                           'method': f.__name__})
-                                retval = f(*args, **kwargs)
-                        finally:
-                            LOG.debug(_('Released file lock "%(lock)s" at '
-                                        '%(path)s for method "%(method)s"...'),
-                                      {'lock': name,
-                                       'path': lock_file_path,
-                                       'method': f.__name__})
-                            # NOTE(vish): This removes the tempdir if we needed
-                            #             to create one. This is used to
-                            #             cleanup the locks left behind by unit
-                            #             tests.
-                            if cleanup_dir:
-                                shutil.rmtree(local_lock_path)
-                    else:
-                        retval = f(*args, **kwargs)
-
-                finally:
-                    local.strong_store.locks_held.remove(name)
-
-            return retval
+                return f(*args, **kwargs)
         return inner
     return wrap
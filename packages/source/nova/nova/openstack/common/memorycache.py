@@ -53,19 +53,27 @@ class Client(object):
     def __init__(self, *args, **kwargs):
         """Ignores the passed in args."""
         self.cache = {}
+        self._last_expunge = None
 
     def get(self, key):
         """Retrieves the value for a key or None.
 
-        this expunges expired keys during each get"""
+        this expunges expired keys, sweeping the whole cache at most once
+        a second so that a get doesn't cost O(number of keys)"""
 
         now = timeutils.utcnow_ts()
-        for k in self.cache.keys():
-            (timeout, _value) = self.cache[k]
-            if timeout and now >= timeout:
-                del self.cache[k]
-
-        return self.cache.get(key, (0, None))[1]
+        if now != self._last_expunge:
+            self._last_expunge = now
+            for k in self.cache.keys():
+                (timeout, _value) = self.cache[k]
+                if timeout and now >= timeout:
+                    del self.cache[k]
+
+        (timeout, value) = self.cache.get(key, (0, None))
+        if timeout and now >= timeout:
+            del self.cache[key]
+            return None
+        return value
 
     def set(self, key, value, time=0, min_compress_len=0):
         """Sets the value for a key."""
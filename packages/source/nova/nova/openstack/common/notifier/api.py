@@ -15,6 +15,9 @@
 
 import uuid
 
+import eventlet
+from eventlet import event
+from eventlet import queue
 from oslo.config import cfg
 
 from nova.openstack.common import context
@@ -38,6 +41,24 @@ notifier_opts = [
     cfg.StrOpt('default_publisher_id',
                default='$host',
                help='Default publisher_id for outgoing notifications'),
+    cfg.BoolOpt('notification_async',
+                default=False,
+                help='Queue notifications and send them from a greenthread '
+                     'of their own, in batches, rather than in the one '
+                     'sending the notification'),
+    cfg.IntOpt('notification_queue_size',
+               default=1000,
+               help='Maximum number of notifications queued for sending, '
+                    'with notification_async'),
+    cfg.IntOpt('notification_batch_size',
+               default=100,
+               help='Maximum number of queued notifications the drivers are '
+                    'handed at once, with notification_async'),
+    cfg.StrOpt('notification_overflow_policy',
+               default='block',
+               help='What to do with a notification when the queue is full, '
+                    'with notification_async: "block" waits for room in '
+                    'the queue, "drop" drops the notification'),
 ]
 
 CONF = cfg.CONF
@@ -52,6 +73,10 @@ DEBUG = 'DEBUG'
 log_levels = (DEBUG, WARN, INFO, ERROR, CRITICAL)
 
 
+OVERFLOW_BLOCK = 'block'
+OVERFLOW_DROP = 'drop'
+
+
 class BadPriorityException(Exception):
     pass
 
@@ -135,6 +160,10 @@ def notify(context, publisher_id, event_type, priority, payload):
                payload=payload,
                timestamp=str(timeutils.utcnow()))
 
+    if CONF.notification_async:
+        _get_emitter().put(context, msg)
+        return
+
     for driver in _get_drivers():
         try:
             driver.notify(context, msg)
@@ -145,6 +174,124 @@ def notify(context, publisher_id, event_type, priority, payload):
                           % dict(e=e, payload=payload))
 
 
+class _AsyncEmitter(object):
+    """Sends notifications from a greenthread of its own.
+
+    Notifications are queued, and the greenthread hands everything queued
+    to the drivers at once, up to batch_size at a time.  Drivers with a
+    notify_many() function get the whole batch, which they may send
+    together, the others get one notification at a time.  Notifications
+    are handed over in the order they were queued, so those about the
+    same instance are sent in order.
+    """
+
+    def __init__(self, queue_size, batch_size, overflow_policy):
+        if overflow_policy not in (OVERFLOW_BLOCK, OVERFLOW_DROP):
+            LOG.warn(_('Invalid notification_overflow_policy %s, using '
+                       'block'), overflow_policy)
+            overflow_policy = OVERFLOW_BLOCK
+        self.queue = queue.LightQueue(queue_size)
+        self.batch_size = batch_size
+        self.overflow_policy = overflow_policy
+        self.thread = None
+        self.idle = None
+        self.stats = {'queued': 0,
+                      'sent': 0,
+                      'dropped': 0,
+                      'batches': 0,
+                      'errors': 0}
+
+    def put(self, context, msg):
+        if self.thread is None:
+            self.thread = eventlet.spawn(self._run)
+        if self.idle is None or self.idle.ready():
+            self.idle = event.Event()
+        # A driver notifying from our own greenthread would wait forever
+        # for itself to make room in a full queue, so that is dropped
+        if (self.overflow_policy == OVERFLOW_DROP or
+                eventlet.getcurrent() is self.thread):
+            try:
+                self.queue.put_nowait((context, msg))
+            except queue.Full:
+                self.stats['dropped'] += 1
+                if self.stats['dropped'] % 100 == 1:
+                    LOG.warn(_('Notification queue full, %(dropped)d '
+                               'notifications dropped so far'), self.stats)
+                return
+        else:
+            self.queue.put((context, msg))
+        self.stats['queued'] += 1
+
+    def _run(self):
+        while True:
+            if not self.queue.qsize() and not self.idle.ready():
+                self.idle.send()
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._send(batch)
+
+    def _send(self, batch):
+        self.stats['batches'] += 1
+        failed = False
+        for driver in _get_drivers():
+            try:
+                if hasattr(driver, 'notify_many'):
+                    driver.notify_many(batch)
+                else:
+                    for ctxt, msg in batch:
+                        driver.notify(ctxt, msg)
+            except Exception as e:
+                failed = True
+                self.stats['errors'] += 1
+                LOG.exception(_("Problem '%(e)s' attempting to send "
+                                "%(count)d notifications to the "
+                                "notification system.")
+                              % dict(e=e, count=len(batch)))
+        if not failed:
+            self.stats['sent'] += len(batch)
+
+    def flush(self):
+        """Wait until everything queued so far was handed over."""
+        if self.thread is not None:
+            self.idle.wait()
+
+    def get_stats(self):
+        stats = self.stats.copy()
+        stats['in_queue'] = self.queue.qsize()
+        return stats
+
+
+_emitter = None
+
+
+def _get_emitter():
+    global _emitter
+    if _emitter is None:
+        _emitter = _AsyncEmitter(CONF.notification_queue_size,
+                                 CONF.notification_batch_size,
+                                 CONF.notification_overflow_policy)
+    return _emitter
+
+
+def flush():
+    """Wait for queued notifications to be handed to the drivers."""
+    if _emitter is not None:
+        _emitter.flush()
+
+
+def get_queue_stats():
+    """Return the counts of notifications queued, sent, dropped and still
+    in the queue, and of batches sent and failed, with notification_async.
+    """
+    if _emitter is None:
+        return {}
+    return _emitter.get_stats()
+
+
 _drivers = None
 
 
@@ -15,6 +15,8 @@
 
 '''messaging based notification driver, with message envelopes'''
 
+import sys
+
 from oslo.config import cfg
 
 from nova.openstack.common import context as req_context
@@ -50,3 +52,37 @@ def notify(context, message):
         except Exception:
             LOG.exception(_("Could not send notification to %(topic)s. "
                             "Payload=%(message)s"), locals())
+
+
+def notify_many(notifications):
+    """Sends several notifications via RPC, together for every topic.
+
+    notifications is a list of (context, message) tuples.  The topics
+    are all tried, and the first failure is raised after that.
+    """
+    topic_msgs = {}
+    topics = []
+    for context, message in notifications:
+        if not context:
+            context = req_context.get_admin_context()
+        priority = message.get('priority',
+                               CONF.default_notification_level)
+        priority = priority.lower()
+        for topic in CONF.rpc_notifier2.topics:
+            topic = '%s.%s' % (topic, priority)
+            if topic not in topic_msgs:
+                topic_msgs[topic] = []
+                topics.append(topic)
+            topic_msgs[topic].append((context, message))
+    exc_info = None
+    for topic in topics:
+        try:
+            rpc.notify_many(topic, topic_msgs[topic], envelope=True)
+        except Exception:
+            LOG.error(_("Could not send %(count)d notifications to "
+                        "%(topic)s."),
+                      {'count': len(topic_msgs[topic]), 'topic': topic})
+            if exc_info is None:
+                exc_info = sys.exc_info()
+    if exc_info is not None:
+        raise exc_info[0], exc_info[1], exc_info[2]
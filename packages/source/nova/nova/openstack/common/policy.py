@@ -54,6 +54,14 @@ always reject an access.  (Note that if a rule is either the empty
 list ("[]") or the empty string, this is equivalent to the "@" policy
 check.)  Of these, the "!" policy check is probably the most useful,
 as it allows particular rules to be explicitly disabled.
+
+When a set of rules is loaded, each Check tree is also compiled into a
+flat Python closure (see BaseCheck.compile()), folding away constant
+"@" and "!" branches, so that evaluating a rule does not have to walk
+the tree.  A Rules store may additionally be given a cache_size, in
+which case decisions are memoized in a bounded LRU keyed on the rule
+name and the credential and target fields the rule actually reads.
+Both are discarded along with the Rules object when new rules are set.
 """
 
 import abc
@@ -80,7 +88,7 @@ class Rules(dict):
     """
 
     @classmethod
-    def load_json(cls, data, default_rule=None):
+    def load_json(cls, data, default_rule=None, cache_size=0):
         """
         Allow loading of JSON rule data.
         """
@@ -89,13 +97,20 @@ class Rules(dict):
         rules = dict((k, parse_rule(v)) for k, v in
                      jsonutils.loads(data).items())
 
-        return cls(rules, default_rule)
+        return cls(rules, default_rule, cache_size)
+
+    def __init__(self, rules=None, default_rule=None, cache_size=0):
+        """
+        Initialize the Rules store.
 
-    def __init__(self, rules=None, default_rule=None):
-        """Initialize the Rules store."""
+        :param cache_size: If greater than zero, the number of policy
+                           decisions to memoize.
+        """
 
         super(Rules, self).__init__(rules or {})
         self.default_rule = default_rule
+        self.cache = DecisionCache(cache_size) if cache_size > 0 else None
+        self._compile()
 
     def __missing__(self, key):
         """Implements the default rule handling."""
@@ -122,6 +137,194 @@ class Rules(dict):
         # Dump a pretty-printed JSON representation
         return jsonutils.dumps(out_rules, indent=4)
 
+    def __setitem__(self, key, value):
+        super(Rules, self).__setitem__(key, value)
+        self._compile()
+
+    def __delitem__(self, key):
+        super(Rules, self).__delitem__(key)
+        self._compile()
+
+    def update(self, *args, **kwargs):
+        super(Rules, self).update(*args, **kwargs)
+        self._compile()
+
+    def clear(self):
+        super(Rules, self).clear()
+        self._compile()
+
+    def pop(self, *args):
+        value = super(Rules, self).pop(*args)
+        self._compile()
+        return value
+
+    def popitem(self):
+        item = super(Rules, self).popitem()
+        self._compile()
+        return item
+
+    def setdefault(self, key, default=None):
+        value = super(Rules, self).setdefault(key, default)
+        self._compile()
+        return value
+
+    def _compile(self):
+        """
+        Compile every rule into a closure and work out which fields
+        each decision depends on.  Drops any memoized decisions.
+        """
+
+        self._compiled = dict((k, v.compile()) for k, v in self.items())
+        self._fields = {}
+        for key in self:
+            fields = self._rule_fields(key, set())
+            if fields is not None:
+                # Sorted tuples give a stable cache key layout
+                fields = tuple(sorted(fields[0])), tuple(sorted(fields[1]))
+            self._fields[key] = fields
+        if self.cache is not None:
+            self.cache.clear()
+
+    def _rule_fields(self, key, seen):
+        """
+        Return the (cred fields, target fields) a rule depends on, or
+        None if the rule cannot be cached.
+        """
+
+        if key in seen:
+            # Recursive rule; don't try to be clever about it
+            return None
+
+        try:
+            rule = self[key]
+        except KeyError:
+            # Missing rules always fail closed
+            return frozenset(), frozenset()
+
+        seen.add(key)
+        try:
+            return rule.cache_fields(
+                lambda name: self._rule_fields(name, seen))
+        finally:
+            seen.discard(key)
+
+    def _lookup(self, key):
+        """Return the compiled form of a rule, honoring default_rule."""
+
+        try:
+            return self._compiled[key]
+        except KeyError:
+            if not self.default_rule or self.default_rule not in self:
+                raise
+            return self._compiled[self.default_rule]
+
+    def evaluate(self, rule, target, creds):
+        """
+        Evaluate the named rule against the target and credentials.
+        Raises KeyError if the rule does not exist.
+        """
+
+        func = self._lookup(rule)
+        if (self.cache is None or func is _always_true or
+                func is _always_false):
+            return func(target, creds)
+
+        try:
+            fields = self._fields[rule]
+        except KeyError:
+            fields = self._fields[self.default_rule]
+        if fields is None:
+            return func(target, creds)
+
+        cred_fields, target_fields = fields
+        key = (rule,
+               tuple([_hashable(creds.get(f, _MISSING))
+                      for f in cred_fields]),
+               tuple([_hashable(target.get(f, _MISSING))
+                      for f in target_fields]))
+        try:
+            return self.cache[key]
+        except KeyError:
+            pass
+        except TypeError:
+            # Some field value can't be hashed
+            return func(target, creds)
+
+        result = func(target, creds)
+        self.cache[key] = result
+        return result
+
+
+_MISSING = object()
+
+
+def _hashable(value):
+    """Turn list-valued fields (such as roles) into tuples."""
+
+    if isinstance(value, list):
+        return tuple(value)
+    return value
+
+
+class DecisionCache(object):
+    """
+    A bounded least-recently-used mapping of policy decisions.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self.clear()
+
+    def clear(self):
+        """Drop all memoized decisions."""
+
+        self._data = {}
+        # Circular doubly linked list of [prev, next, key, value]
+        self._root = root = []
+        root[:] = [root, root, None, None]
+
+    def __len__(self):
+        return len(self._data)
+
+    def __getitem__(self, key):
+        try:
+            link = self._data[key]
+        except KeyError:
+            self.misses += 1
+            raise
+
+        # Move the link to the most recently used end
+        link_prev, link_next = link[0], link[1]
+        link_prev[1] = link_next
+        link_next[0] = link_prev
+        root = self._root
+        last = root[0]
+        last[1] = root[0] = link
+        link[0] = last
+        link[1] = root
+
+        self.hits += 1
+        return link[3]
+
+    def __setitem__(self, key, value):
+        root = self._root
+        if key in self._data:
+            self._data[key][3] = value
+            return
+
+        if len(self._data) >= self.size:
+            # Evict the least recently used entry
+            oldest = root[1]
+            root[1] = oldest[1]
+            oldest[1][0] = root
+            del self._data[oldest[2]]
+
+        last = root[0]
+        link = [last, root, key, value]
+        last[1] = root[0] = self._data[key] = link
+
 
 # Really have to figure out a way to deprecate this
 def set_rules(rules):
@@ -163,8 +366,9 @@ def check(rule, target, creds, exc=None, *args, **kwargs):
              from the expression.
     """
 
-    # Allow the rule to be a Check tree
-    if isinstance(rule, BaseCheck):
+    # Allow the rule to be a Check tree; test for the common case of a
+    # rule name first, as isinstance() against an ABC is comparatively slow
+    if not isinstance(rule, basestring) and isinstance(rule, BaseCheck):
         result = rule(target, creds)
     elif not _rules:
         # No rules to reference means we're going to fail closed
@@ -172,7 +376,10 @@ def check(rule, target, creds, exc=None, *args, **kwargs):
     else:
         try:
             # Evaluate the rule
-            result = _rules[rule](target, creds)
+            if isinstance(_rules, Rules):
+                result = _rules.evaluate(rule, target, creds)
+            else:
+                result = _rules[rule](target, creds)
         except KeyError:
             # If the rule doesn't exist, fail closed
             result = False
@@ -209,6 +416,53 @@ class BaseCheck(object):
 
         pass
 
+    def compile(self):
+        """
+        Return a callable taking (target, cred) that performs this
+        check.  Subclasses may return a closure that avoids walking
+        the Check tree; by default the check itself is used.
+        """
+
+        return self.__call__
+
+    def cache_fields(self, rule_fields):
+        """
+        Return a tuple (cred fields, target fields) of the keys this
+        check reads, or None if its result cannot be memoized.  The
+        rule_fields callable returns the same for a named rule.
+        """
+
+        return None
+
+
+def _always_true(target, cred):
+    return True
+
+
+def _always_false(target, cred):
+    return False
+
+
+def _uses_call_of(check, cls):
+    """
+    Whether check is evaluated by cls.__call__, meaning the compiled
+    form provided by cls applies to it.
+    """
+
+    return type(check).__call__.im_func is cls.__dict__['__call__']
+
+
+def _union_fields(fields):
+    """Merge (cred fields, target fields) pairs; None is contagious."""
+
+    cred_fields, target_fields = set(), set()
+    for field in fields:
+        if field is None:
+            return None
+        cred_fields.update(field[0])
+        target_fields.update(field[1])
+    return frozenset(cred_fields), frozenset(target_fields)
+
 
 class FalseCheck(BaseCheck):
     """
@@ -225,6 +479,12 @@ class FalseCheck(BaseCheck):
 
         return False
 
+    def compile(self):
+        return _always_false
+
+    def cache_fields(self, rule_fields):
+        return frozenset(), frozenset()
+
 
 class TrueCheck(BaseCheck):
     """
@@ -241,6 +501,12 @@ class TrueCheck(BaseCheck):
 
         return True
 
+    def compile(self):
+        return _always_true
+
+    def cache_fields(self, rule_fields):
+        return frozenset(), frozenset()
+
 
 class Check(BaseCheck):
     """
@@ -292,6 +558,27 @@ class NotCheck(BaseCheck):
 
         return not self.rule(target, cred)
 
+    def compile(self):
+        """Compile the wrapped check, folding constant results."""
+
+        if not _uses_call_of(self, NotCheck):
+            return self.__call__
+
+        func = self.rule.compile()
+        if func is _always_true:
+            return _always_false
+        elif func is _always_false:
+            return _always_true
+
+        def not_check(target, cred):
+            return not func(target, cred)
+        return not_check
+
+    def cache_fields(self, rule_fields):
+        if not _uses_call_of(self, NotCheck):
+            return None
+        return self.rule.cache_fields(rule_fields)
+
 
 class AndCheck(BaseCheck):
     """
@@ -325,6 +612,46 @@ class AndCheck(BaseCheck):
 
         return True
 
+    def compile(self):
+        """
+        Compile the checks, dropping those that always pass and
+        short-circuiting to a rejection if any always fails.
+        """
+
+        if not _uses_call_of(self, AndCheck):
+            return self.__call__
+
+        funcs = []
+        for rule in self.rules:
+            func = rule.compile()
+            if func is _always_false:
+                return _always_false
+            elif func is not _always_true:
+                funcs.append(func)
+
+        if not funcs:
+            return _always_true
+        elif len(funcs) == 1:
+            func = funcs[0]
+
+            def and_check(target, cred):
+                return bool(func(target, cred))
+            return and_check
+
+        funcs = tuple(funcs)
+
+        def and_check(target, cred):
+            for func in funcs:
+                if not func(target, cred):
+                    return False
+            return True
+        return and_check
+
+    def cache_fields(self, rule_fields):
+        if not _uses_call_of(self, AndCheck):
+            return None
+        return _union_fields(r.cache_fields(rule_fields) for r in self.rules)
+
     def add_check(self, rule):
         """
         Allows addition of another rule to the list of rules that will
@@ -367,6 +694,46 @@ class OrCheck(BaseCheck):
 
         return False
 
+    def compile(self):
+        """
+        Compile the checks, dropping those that always fail and
+        short-circuiting to an acceptance if any always passes.
+        """
+
+        if not _uses_call_of(self, OrCheck):
+            return self.__call__
+
+        funcs = []
+        for rule in self.rules:
+            func = rule.compile()
+            if func is _always_true:
+                return _always_true
+            elif func is not _always_false:
+                funcs.append(func)
+
+        if not funcs:
+            return _always_false
+        elif len(funcs) == 1:
+            func = funcs[0]
+
+            def or_check(target, cred):
+                return bool(func(target, cred))
+            return or_check
+
+        funcs = tuple(funcs)
+
+        def or_check(target, cred):
+            for func in funcs:
+                if func(target, cred):
+                    return True
+            return False
+        return or_check
+
+    def cache_fields(self, rule_fields):
+        if not _uses_call_of(self, OrCheck):
+            return None
+        return _union_fields(r.cache_fields(rule_fields) for r in self.rules)
+
     def add_check(self, rule):
         """
         Allows addition of another rule to the list of rules that will
@@ -733,6 +1100,34 @@ class RuleCheck(Check):
             # We don't have any matching rule; fail closed
             return False
 
+    def compile(self):
+        """
+        Look the referenced rule up when called, since the rules in
+        effect may be replaced after this one is compiled.
+        """
+
+        if not _uses_call_of(self, RuleCheck):
+            return self.__call__
+
+        name = self.match
+        call = self.__call__
+
+        def rule_check(target, creds):
+            rules = _rules
+            if not isinstance(rules, Rules):
+                return call(target, creds)
+            try:
+                return rules._lookup(name)(target, creds)
+            except KeyError:
+                # We don't have any matching rule; fail closed
+                return False
+        return rule_check
+
+    def cache_fields(self, rule_fields):
+        if not _uses_call_of(self, RuleCheck):
+            return None
+        return rule_fields(self.match)
+
 
 @register("role")
 class RoleCheck(Check):
@@ -741,6 +1136,24 @@ class RoleCheck(Check):
 
         return self.match.lower() in [x.lower() for x in creds['roles']]
 
+    def compile(self):
+        if not _uses_call_of(self, RoleCheck):
+            return self.__call__
+
+        match = self.match.lower()
+
+        def role_check(target, creds):
+            for role in creds['roles']:
+                if role.lower() == match:
+                    return True
+            return False
+        return role_check
+
+    def cache_fields(self, rule_fields):
+        if not _uses_call_of(self, RoleCheck):
+            return None
+        return frozenset(['roles']), frozenset()
+
 
 @register('http')
 class HttpCheck(Check):
@@ -777,3 +1190,37 @@ class GenericCheck(Check):
         if self.kind in creds:
             return match == unicode(creds[self.kind])
         return False
+
+    def compile(self):
+        """Skip the string interpolation for literal matches."""
+
+        if not _uses_call_of(self, GenericCheck):
+            return self.__call__
+
+        kind = self.kind
+        match = self.match
+        if '%' in match:
+            def generic_check(target, creds):
+                value = match % target
+                if kind in creds:
+                    return value == unicode(creds[kind])
+                return False
+        else:
+            def generic_check(target, creds):
+                if kind in creds:
+                    return match == unicode(creds[kind])
+                return False
+        return generic_check
+
+    def cache_fields(self, rule_fields):
+        if not _uses_call_of(self, GenericCheck):
+            return None
+        if '%' in self.match and not _target_key_re.search(self.match):
+            # Interpolated against the target as a whole
+            return None
+        target_fields = frozenset(_target_key_re.findall(self.match))
+        return frozenset([self.kind]), target_fields
+
+
+# Used for finding the target keys interpolated by a GenericCheck
+_target_key_re = re.compile(r'%\(([^)]+)\)')
@@ -0,0 +1,119 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Client side of the rootwrap daemon."""
+
+import base64
+import json
+import logging
+
+from eventlet.green import socket
+from eventlet.green import subprocess
+from eventlet import semaphore
+
+
+LOG = logging.getLogger(__name__)
+
+
+class DaemonError(Exception):
+    """The rootwrap daemon could not be started or talked to."""
+    pass
+
+
+class Client(object):
+    """Runs commands through a rootwrap daemon it starts when needed.
+
+    Every command is sent over a connection of its own, so any number of
+    greenthreads can run commands through the same client at once.
+    """
+
+    def __init__(self, daemon_cmd):
+        """:param daemon_cmd: how to start the daemon, e.g. sudo and the
+                              daemon script with its configuration file
+        """
+        self._daemon_cmd = daemon_cmd
+        self._lock = semaphore.Semaphore()
+        self._process = None
+        self._socket_path = None
+        self._token = None
+
+    def _ensure_daemon(self):
+        with self._lock:
+            if self._process is not None and self._process.poll() is None:
+                return
+
+            LOG.debug('Starting rootwrap daemon: %s',
+                      ' '.join(self._daemon_cmd))
+            process = subprocess.Popen(self._daemon_cmd,
+                                       stdin=subprocess.PIPE,
+                                       stdout=subprocess.PIPE,
+                                       close_fds=True)
+            line = process.stdout.readline()
+            if not line:
+                raise DaemonError('Rootwrap daemon exited with %s' %
+                                  process.wait())
+            info = json.loads(line)
+            self._socket_path = info['socket']
+            self._token = info['token']
+            self._process = process
+
+    def stop(self):
+        """Makes the daemon exit, if it is running."""
+        with self._lock:
+            if self._process is not None:
+                self._process.stdin.close()
+                self._process.wait()
+                self._process = None
+
+    def execute(self, cmd, stdin=None):
+        """Runs cmd as root if it matches the daemon's filters.
+
+        Returns a (returncode, stdout, stderr) tuple.
+        """
+        request = {'cmd': list(cmd), 'stdin': None}
+        if stdin is not None:
+            request['stdin'] = base64.b64encode(stdin)
+
+        self._ensure_daemon()
+        try:
+            response = self._send(request)
+        except socket.error:
+            # A concurrent stop() may have let go of the daemon already
+            if self._process is not None and self._process.poll() is None:
+                raise
+            # the daemon died since we last used it, start another one
+            self._ensure_daemon()
+            response = self._send(request)
+
+        if 'error' in response:
+            raise DaemonError(response['error'])
+        return (response['returncode'],
+                base64.b64decode(response['stdout']),
+                base64.b64decode(response['stderr']))
+
+    def _send(self, request):
+        request = dict(request, token=self._token)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self._socket_path)
+            sock.sendall(json.dumps(request) + '\n')
+            line = sock.makefile('rb').readline()
+        finally:
+            sock.close()
+        if not line:
+            raise DaemonError('Rootwrap daemon closed the connection')
+        return json.loads(line)
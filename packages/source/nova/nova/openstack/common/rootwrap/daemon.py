@@ -0,0 +1,204 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Long-lived root wrapper, serving commands over a unix socket.
+
+Running sudo and a fresh rootwrap for every command means starting a
+Python interpreter and loading the filters each time. The daemon does
+that once, then runs the commands its caller sends over a unix socket,
+checking each of them against the filters exactly like rootwrap does.
+
+The socket is created in a new directory that only the calling user
+(SUDO_UID) may enter, and every request has to carry the token that
+the daemon printed on its stdout when it started. The daemon exits when
+its stdin is closed, i.e. when the process that started it goes away.
+"""
+
+import base64
+import json
+import logging
+import os
+import shutil
+import signal
+import SocketServer
+import subprocess
+import sys
+import tempfile
+import threading
+
+from nova.openstack.common.rootwrap import wrapper
+
+
+RC_UNAUTHORIZED = 99
+RC_NOEXECFOUND = 96
+
+SOCKET_NAME = 'rootwrap.sock'
+
+
+def _subprocess_setup():
+    # Python installs a SIGPIPE handler by default. This is usually not what
+    # non-Python subprocesses expect.
+    signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+
+
+def _constant_time_compare(first, second):
+    """Returns True if both strings are equal, in time independent of
+    where they differ."""
+    if len(first) != len(second):
+        return False
+    result = 0
+    for x, y in zip(first, second):
+        result |= ord(x) ^ ord(y)
+    return result == 0
+
+
+def run_one_command(config, filters, userargs, stdin=None):
+    """Runs userargs if they match one of the filters.
+
+    Returns a (returncode, stdout, stderr) tuple; commands that are not
+    allowed get the same return codes as from the rootwrap command.
+    """
+    try:
+        filtermatch = wrapper.match_filter(filters, userargs,
+                                           exec_dirs=config.exec_dirs)
+    except wrapper.FilterMatchNotExecutable as exc:
+        msg = ("Executable not found: %s (filter match = %s)"
+               % (exc.match.exec_path, exc.match.name))
+        if config.use_syslog:
+            logging.error(msg)
+        return RC_NOEXECFOUND, '', msg + '\n'
+    except wrapper.NoFilterMatched:
+        msg = ("Unauthorized command: %s (no filter matched)"
+               % ' '.join(userargs))
+        if config.use_syslog:
+            logging.error(msg)
+        return RC_UNAUTHORIZED, '', msg + '\n'
+
+    command = filtermatch.get_command(userargs, exec_dirs=config.exec_dirs)
+    if config.use_syslog:
+        logging.info("(%s > root) Executing %s (filter match = %s)" % (
+            os.environ.get('SUDO_USER', '?'), command, filtermatch.name))
+
+    obj = subprocess.Popen(command,
+                           stdin=subprocess.PIPE,
+                           stdout=subprocess.PIPE,
+                           stderr=subprocess.PIPE,
+                           close_fds=True,
+                           preexec_fn=_subprocess_setup,
+                           env=filtermatch.get_environment(userargs))
+    stdout, stderr = obj.communicate(stdin)
+    return obj.returncode, stdout, stderr
+
+
+class RequestHandler(SocketServer.StreamRequestHandler):
+    """Handles one request: a line of JSON, answered with one."""
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+            token = request.get('token', '').encode('utf-8')
+            if not _constant_time_compare(token, self.server.token):
+                response = {'error': 'Invalid token'}
+            else:
+                response = self._run(request)
+        except Exception as exc:
+            logging.exception('Failed to handle rootwrap request')
+            response = {'error': str(exc)}
+        self.wfile.write(json.dumps(response) + '\n')
+
+    def _run(self, request):
+        userargs = [arg.encode('utf-8') for arg in request['cmd']]
+        stdin = request.get('stdin')
+        if stdin is not None:
+            stdin = base64.b64decode(stdin)
+        returncode, stdout, stderr = run_one_command(self.server.config,
+                                                     self.server.filters,
+                                                     userargs, stdin)
+        return {'returncode': returncode,
+                'stdout': base64.b64encode(stdout),
+                'stderr': base64.b64encode(stderr)}
+
+
+class RootwrapServer(SocketServer.ThreadingMixIn,
+                     SocketServer.UnixStreamServer):
+    """Runs every request in a thread of its own."""
+
+    def __init__(self, path, config, filters, token):
+        SocketServer.UnixStreamServer.__init__(self, path, RequestHandler)
+        self.config = config
+        self.filters = filters
+        self.token = token
+        self._threads = set()
+        self._threads_lock = threading.Lock()
+
+    def process_request(self, request, client_address):
+        thread = threading.Thread(target=self._process_request_thread,
+                                  args=(request, client_address))
+        thread.daemon = True
+        with self._threads_lock:
+            self._threads.add(thread)
+        thread.start()
+
+    def _process_request_thread(self, request, client_address):
+        try:
+            self.process_request_thread(request, client_address)
+        finally:
+            with self._threads_lock:
+                self._threads.discard(threading.current_thread())
+
+    def stop(self):
+        """Stops serving, and waits for the requests being handled, so
+        none of them is cut off when the interpreter exits.
+        """
+        self.shutdown()
+        self.server_close()
+        with self._threads_lock:
+            threads = list(self._threads)
+        for thread in threads:
+            thread.join()
+
+
+def daemon_start(config, filters):
+    """Serves commands until stdin is closed.
+
+    The socket path and the token are written to stdout as a line of
+    JSON once the daemon accepts connections.
+    """
+    uid = int(os.environ.get('SUDO_UID', os.getuid()))
+    gid = int(os.environ.get('SUDO_GID', os.getgid()))
+    tmpdir = tempfile.mkdtemp(prefix='rootwrap-')
+    try:
+        os.chown(tmpdir, uid, gid)
+        path = os.path.join(tmpdir, SOCKET_NAME)
+        token = os.urandom(32).encode('hex')
+        server = RootwrapServer(path, config, filters, token)
+        os.chown(path, uid, gid)
+        os.chmod(path, 0600)
+
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        sys.stdout.write(json.dumps({'socket': path, 'token': token}) + '\n')
+        sys.stdout.flush()
+
+        # Block until whoever started us closes our stdin or goes away
+        sys.stdin.read()
+        server.stop()
+        thread.join()
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
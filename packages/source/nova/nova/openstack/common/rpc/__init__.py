@@ -158,6 +158,26 @@ def cast(context, topic, msg):
     return _get_impl().cast(CONF, context, topic, msg)
 
 
+def cast_many(context, topic, msgs):
+    """Invoke several remote methods that do not return anything.
+
+    Backends that can, send all of the messages at once.  Others cast
+    them one by one.
+
+    :param context: Information that identifies the user that has made this
+                    request.
+    :param topic: The topic to send the rpc messages to.  See cast().
+    :param msgs: A list of messages, each a dict like the msg for cast().
+
+    :returns: None
+    """
+    impl = _get_impl()
+    if hasattr(impl, 'cast_many'):
+        return impl.cast_many(CONF, context, topic, msgs)
+    for msg in msgs:
+        impl.cast(CONF, context, topic, msg)
+
+
 def fanout_cast(context, topic, msg):
     """Broadcast a remote method invocation with no return.
 
@@ -227,6 +247,25 @@ def notify(context, topic, msg, envelope=False):
     return _get_impl().notify(cfg.CONF, context, topic, msg, envelope)
 
 
+def notify_many(topic, msgs, envelope=False):
+    """Send several notification events.
+
+    Backends that can, send all of them at once.  Others send them one
+    by one.
+
+    :param topic: The topic to send the notifications to.
+    :param msgs: A list of (context, msg) tuples, for every notification.
+    :param envelope: Set to True to enable message envelope for notifications.
+
+    :returns: None
+    """
+    impl = _get_impl()
+    if hasattr(impl, 'notify_many'):
+        return impl.notify_many(cfg.CONF, topic, msgs, envelope)
+    for context, msg in msgs:
+        impl.notify(cfg.CONF, context, topic, msg, envelope)
+
+
 def cleanup():
     """Clean up resoruces in use by implementation.
 
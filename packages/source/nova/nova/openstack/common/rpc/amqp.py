@@ -27,9 +27,13 @@ AMQP, but is deprecated and predates this code.
 
 import collections
 import inspect
+import math
 import sys
+import time
 import uuid
 
+import eventlet
+from eventlet import event
 from eventlet import greenpool
 from eventlet import pools
 from eventlet import queue
@@ -46,12 +50,24 @@ from nova.openstack.common import log as logging
 from nova.openstack.common.rpc import common as rpc_common
 
 
-# TODO(pekowski): Remove this option in Havana.
 amqp_opts = [
+    # TODO(pekowski): Remove this option in Havana.
     cfg.BoolOpt('amqp_rpc_single_reply_queue',
                 default=False,
                 help='Enable a fast single reply queue if using AMQP based '
                 'RPC like RabbitMQ or Qpid.'),
+    cfg.ListOpt('rpc_method_priorities',
+                default=[],
+                help='Priorities of RPC methods, as '
+                     '[<topic>.]<method>:<priority> with a priority of '
+                     'high, normal or low.  These override the priorities '
+                     'declared by the managers.'),
+    cfg.IntOpt('rpc_high_priority_pool_size',
+               default=16,
+               help='Size of the RPC thread pool for high priority methods'),
+    cfg.IntOpt('rpc_low_priority_pool_size',
+               default=8,
+               help='Size of the RPC thread pool for low priority methods'),
 ]
 
 cfg.CONF.register_opts(amqp_opts)
@@ -59,6 +75,11 @@ cfg.CONF.register_opts(amqp_opts)
 UNIQUE_ID = '_unique_id'
 LOG = logging.getLogger(__name__)
 
+PRIORITY_HIGH = 'high'
+PRIORITY_NORMAL = 'normal'
+PRIORITY_LOW = 'low'
+PRIORITIES = (PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW)
+
 
 class Pool(pools.Pool):
     """Class that implements a Pool of Connections."""
@@ -182,12 +203,66 @@ class ConnectionContext(rpc_common.Connection):
             raise rpc_common.InvalidRPCConnectionReuse()
 
 
+class _TimeoutWheel(object):
+    """Times out call waiters whose deadline has passed.
+
+    Waiters are kept in slots of RESOLUTION seconds by their deadline,
+    and a single greenthread expires a whole slot at a time, rather than
+    every call waiting with a timer of its own.  Waiters whose deadline
+    moved on after they were added are put in a later slot, and those
+    that are done are removed right away.
+    """
+
+    RESOLUTION = 0.5
+
+    def __init__(self):
+        self.slots = {}
+        # waiter -> the slot it is in
+        self.waiters = {}
+        self.thread = None
+
+    def add(self, waiter):
+        slot = int(math.ceil(waiter.deadline / self.RESOLUTION))
+        self.slots.setdefault(slot, set()).add(waiter)
+        self.waiters[waiter] = slot
+        if self.thread is None:
+            self.thread = eventlet.spawn(self._run)
+
+    def remove(self, waiter):
+        slot = self.waiters.pop(waiter, None)
+        if slot is None:
+            return
+        waiters = self.slots[slot]
+        waiters.discard(waiter)
+        if not waiters:
+            del self.slots[slot]
+
+    def _run(self):
+        while self.slots:
+            eventlet.sleep(self.RESOLUTION)
+            now = time.time()
+            current = int(now / self.RESOLUTION)
+            for slot in [slot for slot in self.slots if slot <= current]:
+                for waiter in self.slots.pop(slot):
+                    del self.waiters[waiter]
+                    if waiter.deadline > now:
+                        self.add(waiter)
+                    else:
+                        waiter.expire()
+        self.thread = None
+
+
 class ReplyProxy(ConnectionContext):
     """ Connection class for RPC replies / callbacks """
     def __init__(self, conf, connection_pool):
         self._call_waiters = {}
-        self._num_call_waiters = 0
         self._num_call_waiters_wrn_threshhold = 10
+        self._timeouts = _TimeoutWheel()
+        self._stats = {'calls': 0,
+                       'timeouts': 0,
+                       'replied': 0,
+                       'total_latency': 0.0,
+                       'max_latency': 0.0}
         self._reply_q = 'reply_' + uuid.uuid4().hex
         super(ReplyProxy, self).__init__(conf, connection_pool, pooled=False)
         self.declare_direct_consumer(self._reply_q, self._process_data)
@@ -199,25 +274,46 @@ class ReplyProxy(ConnectionContext):
         if not waiter:
             LOG.warn(_('no calling threads waiting for msg_id : %s'
                        ', message : %s') % (msg_id, message_data))
-        else:
-            waiter.put(message_data)
+            return
+        if waiter.replied_at is None:
+            waiter.replied_at = time.time()
+            latency = waiter.replied_at - waiter.sent_at
+            self._stats['replied'] += 1
+            self._stats['total_latency'] += latency
+            self._stats['max_latency'] = max(self._stats['max_latency'],
+                                             latency)
+        waiter.put(message_data)
 
     def add_call_waiter(self, waiter, msg_id):
-        self._num_call_waiters += 1
-        if self._num_call_waiters > self._num_call_waiters_wrn_threshhold:
+        self._stats['calls'] += 1
+        if len(self._call_waiters) >= self._num_call_waiters_wrn_threshhold:
             LOG.warn(_('Number of call waiters is greater than warning '
                        'threshhold: %d. There could be a MulticallProxyWaiter '
                        'leak.') % self._num_call_waiters_wrn_threshhold)
             self._num_call_waiters_wrn_threshhold *= 2
         self._call_waiters[msg_id] = waiter
+        self._timeouts.add(waiter)
 
-    def del_call_waiter(self, msg_id):
-        self._num_call_waiters -= 1
-        del self._call_waiters[msg_id]
+    def del_call_waiter(self, msg_id, timed_out=False):
+        if timed_out:
+            self._stats['timeouts'] += 1
+        self._timeouts.remove(self._call_waiters.pop(msg_id))
 
     def get_reply_q(self):
         return self._reply_q
 
+    def get_stats(self):
+        """Return the number of calls waiting for a reply, along with
+        counts of calls and timeouts, and how long calls took to get
+        their first reply.
+        """
+        stats = self._stats.copy()
+        stats['in_flight'] = len(self._call_waiters)
+        replied = stats['replied']
+        stats['average_latency'] = (replied and
+                                    stats['total_latency'] / replied)
+        return stats
+
 
 def msg_reply(conf, msg_id, reply_q, connection_pool, reply=None,
               failure=None, ending=False, log_failure=True):
@@ -375,16 +471,130 @@ class CallbackWrapper(_ThreadPoolWithWait):
         self.pool.spawn_n(self.callback, message_data)
 
 
-class ProxyCallback(_ThreadPoolWithWait):
-    """Calls methods on a proxy object based on method and args."""
+class _DispatchPool(object):
+    """A bounded pool of greenthreads for the messages of one priority.
 
-    def __init__(self, conf, proxy, connection_pool):
-        super(ProxyCallback, self).__init__(
-            conf=conf,
-            connection_pool=connection_pool,
-        )
+    While all its greenthreads are busy, messages wait in a backlog; the
+    greenthreads take them from there once they are done.  The backlog
+    has no bound, as spawn() must never block: the pools of all the
+    priorities share the consumer taking messages from the broker, so a
+    busy low priority pool would hold up the high priority calls too.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.pool = greenpool.GreenPool(size)
+        self.backlog = queue.LightQueue()
+
+    def spawn(self, func, *args):
+        if self.pool.free():
+            # Any backlog is taken care of once this one is done
+            self.pool.spawn_n(self._run, func, args)
+        else:
+            self.backlog.put_nowait((func, args))
+
+    def _run(self, func, args):
+        while True:
+            if func is not None:
+                func(*args)
+            try:
+                func, args = self.backlog.get_nowait()
+            except queue.Empty:
+                return
+
+    def get_stats(self):
+        return {'size': self.size,
+                'running': self.pool.running(),
+                'backlog': self.backlog.qsize()}
+
+    def wait(self):
+        self.pool.waitall()
+
+
+class ProxyCallback(object):
+    """Calls methods on a proxy object based on method and args.
+
+    Methods are run in one of three pools by their priority, so a flood
+    of low priority casts can't hold up more urgent calls.  Priorities
+    are taken from the rpc_method_priorities option, or from the
+    RPC_METHOD_PRIORITIES dict of the manager (see rpc.dispatcher);
+    methods without one are run with normal priority.
+    """
+
+    def __init__(self, conf, proxy, connection_pool, topic=None):
+        self.conf = conf
+        self.connection_pool = connection_pool
         self.proxy = proxy
+        self.topic = topic
         self.msg_id_cache = _MsgIdCache()
+        self.pools = {
+            PRIORITY_HIGH: _DispatchPool(conf.rpc_high_priority_pool_size),
+            PRIORITY_NORMAL: _DispatchPool(conf.rpc_thread_pool_size),
+            PRIORITY_LOW: _DispatchPool(conf.rpc_low_priority_pool_size),
+        }
+        self.priorities = {}
+        self.stats = {}
+
+    def _get_configured_priorities(self):
+        priorities = {}
+        for entry in self.conf.rpc_method_priorities:
+            name, _sep, priority = entry.rpartition(':')
+            if priority not in PRIORITIES:
+                LOG.warn(_('Ignoring invalid RPC method priority %s'), entry)
+                continue
+            topic, _sep, method = name.rpartition('.')
+            if not topic or topic == self.topic:
+                # Entries for a topic win over ones for any topic
+                if topic or method not in priorities:
+                    priorities[method] = priority
+        return priorities
+
+    def get_priority(self, method):
+        """Return the priority the given method is run with."""
+        priority = self.priorities.get(method)
+        if priority is None:
+            priority = self._get_configured_priorities().get(method)
+            if priority is None and hasattr(self.proxy, 'get_priority'):
+                priority = self.proxy.get_priority(method)
+            if priority not in PRIORITIES:
+                priority = PRIORITY_NORMAL
+            self.priorities[method] = priority
+        return priority
+
+    def _get_method_stats(self, method):
+        stats = self.stats.get(method)
+        if stats is None:
+            stats = self.stats[method] = {
+                'priority': self.get_priority(method),
+                'calls': 0,
+                'total_wait': 0.0,
+                'max_wait': 0.0,
+                'total_time': 0.0,
+                'max_time': 0.0}
+        return stats
+
+    def get_stats(self):
+        """Return how busy the pool of every priority is, and for every
+        method called so far, how long it waited for a greenthread and
+        how long it ran.
+        """
+        methods = {}
+        for method, method_stats in self.stats.iteritems():
+            method_stats = method_stats.copy()
+            calls = method_stats['calls']
+            method_stats['average_wait'] = (calls and
+                                            method_stats['total_wait'] / calls)
+            method_stats['average_time'] = (calls and
+                                            method_stats['total_time'] / calls)
+            methods[method] = method_stats
+        pools = dict((priority, pool.get_stats())
+                     for priority, pool in self.pools.iteritems())
+        return {'pools': pools, 'methods': methods}
+
+    def wait(self):
+        """Wait for all callback threads to exit."""
+        for pool in self.pools.itervalues():
+            pool.wait()
 
     def __call__(self, message_data):
         """Consumer callback to call a method on a proxy object.
@@ -414,7 +624,24 @@ class ProxyCallback(_ThreadPoolWithWait):
             ctxt.reply(_('No method for message: %s') % message_data,
                        connection_pool=self.connection_pool)
             return
-        self.pool.spawn_n(self._process_data, ctxt, version, method, args)
+        pool = self.pools[self.get_priority(method)]
+        pool.spawn(self._timed_process_data, time.time(), ctxt, version,
+                   method, args)
+
+    def _timed_process_data(self, received_at, ctxt, version, method, args):
+        started_at = time.time()
+        try:
+            self._process_data(ctxt, version, method, args)
+        finally:
+            finished_at = time.time()
+            wait = started_at - received_at
+            elapsed = finished_at - started_at
+            stats = self._get_method_stats(method)
+            stats['calls'] += 1
+            stats['total_wait'] += wait
+            stats['max_wait'] = max(stats['max_wait'], wait)
+            stats['total_time'] += elapsed
+            stats['max_time'] = max(stats['max_time'], elapsed)
 
     def _process_data(self, ctxt, version, method, args):
         """Process a message in a new thread.
@@ -457,21 +684,40 @@ class MulticallProxyWaiter(object):
         self._reply_proxy = connection_pool.reply_proxy
         self._done = False
         self._got_ending = False
+        self._timed_out = False
         self._conf = conf
-        self._dataqueue = queue.LightQueue()
+        # Replies that arrived, and the event the caller waits on for more
+        self._replies = collections.deque()
+        self._event = None
+        self.sent_at = time.time()
+        self.replied_at = None
+        # Like the timeout of a queue get, this is moved along with
+        # every reply that arrives
+        self.deadline = self.sent_at + self._timeout
         # Add this caller to the reply proxy's call_waiters
         self._reply_proxy.add_call_waiter(self, self._msg_id)
         self.msg_id_cache = _MsgIdCache()
 
     def put(self, data):
-        self._dataqueue.put(data)
+        self.deadline = time.time() + self._timeout
+        self._replies.append(data)
+        self._wake()
+
+    def expire(self):
+        """Called by the reply proxy once the deadline has passed."""
+        self._timed_out = True
+        self._wake()
+
+    def _wake(self):
+        if self._event is not None and not self._event.ready():
+            self._event.send()
 
     def done(self):
         if self._done:
             return
         self._done = True
         # Remove this caller from reply proxy's call_waiters
-        self._reply_proxy.del_call_waiter(self._msg_id)
+        self._reply_proxy.del_call_waiter(self._msg_id, self._timed_out)
 
     def _process_data(self, data):
         result = None
@@ -491,12 +737,15 @@ class MulticallProxyWaiter(object):
         if self._done:
             raise StopIteration
         while True:
-            try:
-                data = self._dataqueue.get(timeout=self._timeout)
-                result = self._process_data(data)
-            except queue.Empty:
+            while not self._replies and not self._timed_out:
+                self._event = event.Event()
+                self._event.wait()
+            self._event = None
+            if not self._replies:
                 self.done()
                 raise rpc_common.Timeout()
+            try:
+                result = self._process_data(self._replies.popleft())
             except Exception:
                 with excutils.save_and_reraise_exception():
                     self.done()
@@ -600,8 +849,13 @@ def multicall(conf, context, topic, msg, timeout, connection_pool):
                 connection_pool.reply_proxy = ReplyProxy(conf, connection_pool)
         msg.update({'_reply_q': connection_pool.reply_proxy.get_reply_q()})
         wait_msg = MulticallProxyWaiter(conf, msg_id, timeout, connection_pool)
-        with ConnectionContext(conf, connection_pool) as conn:
-            conn.topic_send(topic, rpc_common.serialize_msg(msg), timeout)
+        try:
+            with ConnectionContext(conf, connection_pool) as conn:
+                conn.topic_send(topic, rpc_common.serialize_msg(msg),
+                                timeout)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                wait_msg.done()
     return wait_msg
 
 
@@ -624,6 +878,22 @@ def cast(conf, context, topic, msg, connection_pool):
         conn.topic_send(topic, rpc_common.serialize_msg(msg))
 
 
+def cast_many(conf, context, topic, msgs, connection_pool):
+    """Sends several messages on a topic without waiting for responses.
+
+    The messages are published together, on one connection.
+    """
+    LOG.debug(_('Making %(count)d asynchronous casts on %(topic)s...'),
+              {'count': len(msgs), 'topic': topic})
+    serialized = []
+    for msg in msgs:
+        _add_unique_id(msg)
+        pack_context(msg, context)
+        serialized.append(rpc_common.serialize_msg(msg))
+    with ConnectionContext(conf, connection_pool) as conn:
+        conn.topic_send_many(topic, serialized)
+
+
 def fanout_cast(conf, context, topic, msg, connection_pool):
     """Sends a message on a fanout exchange without waiting for a response."""
     LOG.debug(_('Making asynchronous fanout cast...'))
@@ -665,6 +935,25 @@ def notify(conf, context, topic, msg, connection_pool, envelope):
         conn.notify_send(topic, msg)
 
 
+def notify_many(conf, topic, msgs, connection_pool, envelope):
+    """Sends several notification events on a topic, on one connection.
+
+    msgs is a list of (context, msg) tuples.
+    """
+    LOG.debug(_('Sending %(count)d notifications on %(topic)s'),
+              {'count': len(msgs), 'topic': topic})
+    serialized = []
+    for context, msg in msgs:
+        msg = msg.copy()
+        _add_unique_id(msg)
+        pack_context(msg, context)
+        if envelope:
+            msg = rpc_common.serialize_msg(msg, force_envelope=True)
+        serialized.append(msg)
+    with ConnectionContext(conf, connection_pool) as conn:
+        conn.notify_send_many(topic, serialized)
+
+
 def cleanup(connection_pool):
     if connection_pool:
         connection_pool.empty()
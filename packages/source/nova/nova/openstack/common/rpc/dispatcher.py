@@ -103,6 +103,18 @@ class RpcDispatcher(object):
         self.callbacks = callbacks
         super(RpcDispatcher, self).__init__()
 
+    def get_priority(self, method):
+        """Return the priority a method was declared with, if any.
+
+        Proxy objects may declare priorities in an RPC_METHOD_PRIORITIES
+        dict of method name to 'high', 'normal' or 'low'.  The method is
+        run in the pool of RPC threads for that priority.
+        """
+        for proxyobj in self.callbacks:
+            priorities = getattr(proxyobj, 'RPC_METHOD_PRIORITIES', {})
+            if method in priorities:
+                return priorities[method]
+
     def dispatch(self, ctxt, version, method, **kwargs):
         """Dispatch a message based on a requested version.
 
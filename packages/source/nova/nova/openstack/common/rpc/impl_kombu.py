@@ -90,6 +90,18 @@ kombu_opts = [
                 help='use H/A queues in RabbitMQ (x-ha-policy: all).'
                      'You need to wipe RabbitMQ database when '
                      'changing this option.'),
+    cfg.BoolOpt('rabbit_publisher_confirms',
+                default=False,
+                help='wait for RabbitMQ to confirm it has taken every '
+                     'message that is sent, resending messages that were '
+                     'not confirmed when the connection fails'),
+    cfg.IntOpt('rabbit_prefetch_count',
+               default=0,
+               help='maximum number of messages RabbitMQ delivers to a '
+                    'consumer before it has taken earlier ones.  Set it to '
+                    'about the size of the RPC thread pools to leave the '
+                    'rest on the broker for other workers.  0 means '
+                    'unlimited'),
 
 ]
 
@@ -97,6 +109,9 @@ cfg.CONF.register_opts(kombu_opts)
 
 LOG = rpc_common.LOG
 
+# Publishers are cached per connection, up to this many
+PUBLISHER_CACHE_SIZE = 100
+
 
 def _get_queue_arguments(conf):
     """Construct the arguments for declaring a queue.
@@ -305,6 +320,15 @@ class Publisher(object):
                                                  channel=channel,
                                                  routing_key=self.routing_key)
 
+    @property
+    def cacheable(self):
+        """Publishers can be reused while their exchange can't go away
+        under them.  Auto-delete exchanges are deleted by the broker once
+        their last queue is, and publishing to one that is gone closes the
+        channel, so those are declared again for every message.
+        """
+        return not self.kwargs.get('auto_delete')
+
     def send(self, msg, timeout=None):
         """Send a message"""
         if timeout:
@@ -443,6 +467,8 @@ class Connection(object):
 
         self.memory_transport = self.conf.fake_rabbit
 
+        self.publishers = {}
+        self.confirms = False
         self.connection = None
         self.reconnect()
 
@@ -493,15 +519,60 @@ class Connection(object):
             self.connection.transport.polling_interval = 0.0
         self.consumer_num = itertools.count(1)
         self.connection.connect()
-        self.channel = self.connection.channel()
-        # work around 'memory' transport bug in 1.1.3
-        if self.memory_transport:
-            self.channel._new_queue('ae.undeliver')
+        self._open_channel()
         for consumer in self.consumers:
             consumer.reconnect(self.channel)
+        for publisher in self.publishers.itervalues():
+            publisher.reconnect(self.channel)
+        if self.conf.rabbit_publisher_confirms and not self.confirms:
+            LOG.warn(_('Publisher confirms are not supported by the %s '
+                       'transport'), self.connection.transport_cls)
         LOG.info(_('Connected to AMQP server on %(hostname)s:%(port)d') %
                  params)
 
+    def _open_channel(self):
+        self.channel = self.connection.channel()
+        # work around 'memory' transport bug in 1.1.3
+        if self.memory_transport:
+            self.channel._new_queue('ae.undeliver')
+        # Delivery tags of the messages published on the channel, and the
+        # last one the broker confirmed, along with the number it refused
+        self.published_tag = 0
+        self.confirmed_tag = 0
+        self.nacks = 0
+        self.confirms = (self.conf.rabbit_publisher_confirms and
+                         hasattr(self.channel, 'confirm_select'))
+        if self.confirms:
+            self.channel.events['basic_ack'].add(self._confirmed)
+            self.channel.events['basic_nack'].add(self._nacked)
+            self.channel.confirm_select()
+        if self.conf.rabbit_prefetch_count:
+            self.channel.basic_qos(0, self.conf.rabbit_prefetch_count, False)
+
+    def _confirmed(self, delivery_tag, multiple):
+        # RabbitMQ confirms messages in the order they were published
+        self.confirmed_tag = max(self.confirmed_tag, delivery_tag)
+
+    def _nacked(self, delivery_tag, multiple, requeue=False):
+        # The broker couldn't take the message, e.g. on an internal error
+        self.confirmed_tag = max(self.confirmed_tag, delivery_tag)
+        self.nacks += 1
+
+    def _wait_for_confirms(self):
+        """Wait until the broker confirmed every message published on the
+        channel.  The messages of a batch are all published before waiting,
+        so there's only one round trip for all of them.
+
+        Raises RPCException if the broker refused any of them.
+        """
+        while self.confirmed_tag < self.published_tag:
+            self.channel.wait(allowed_methods=[(60, 80), (60, 120)])
+        if self.nacks:
+            nacks = self.nacks
+            self.nacks = 0
+            raise rpc_common.RPCException(
+                _('The AMQP server refused %d published messages') % nacks)
+
     def reconnect(self):
         """Handles reconnecting and re-establishing queues.
         Will retry up to self.max_retries number of times.
@@ -592,11 +663,12 @@ class Connection(object):
         """Reset a connection so it can be used again"""
         self.cancel_consumer_thread()
         self.wait_on_proxy_callbacks()
-        self.channel.close()
-        self.channel = self.connection.channel()
-        # work around 'memory' transport bug in 1.1.3
-        if self.memory_transport:
-            self.channel._new_queue('ae.undeliver')
+        # Only a channel that consumers were declared on needs replacing,
+        # otherwise it's kept along with the publishers declared on it.
+        if self.consumers:
+            self.channel.close()
+            self._open_channel()
+            self.publishers.clear()
         self.consumers = []
 
     def declare_consumer(self, consumer_cls, topic, callback):
@@ -662,8 +734,28 @@ class Connection(object):
         for proxy_cb in self.proxy_callbacks:
             proxy_cb.wait()
 
+    def _get_publisher(self, cls, topic, kwargs):
+        """Return a publisher from the cache, or a new one."""
+        key = (cls, topic, tuple(sorted(kwargs.iteritems())))
+        publisher = self.publishers.get(key)
+        if publisher is None:
+            publisher = cls(self.conf, self.channel, topic, **kwargs)
+            if publisher.cacheable:
+                if len(self.publishers) >= PUBLISHER_CACHE_SIZE:
+                    self.publishers.clear()
+                self.publishers[key] = publisher
+        return publisher
+
     def publisher_send(self, cls, topic, msg, timeout=None, **kwargs):
         """Send to a publisher based on the publisher class"""
+        self.publisher_send_many(cls, topic, [msg], timeout, **kwargs)
+
+    def publisher_send_many(self, cls, topic, msgs, timeout=None, **kwargs):
+        """Send several messages to a publisher based on the publisher
+        class.  If the connection fails part way, the messages that were
+        not sent yet, or not confirmed yet, are sent after reconnecting.
+        """
+        sent = {'count': 0}
 
         def _error_callback(exc):
             log_info = {'topic': topic, 'err_str': str(exc)}
@@ -671,8 +763,24 @@ class Connection(object):
                           "'%(topic)s': %(err_str)s") % log_info)
 
         def _publish():
-            publisher = cls(self.conf, self.channel, topic, **kwargs)
-            publisher.send(msg, timeout)
+            publisher = self._get_publisher(cls, topic, kwargs)
+            if not self.confirms:
+                for msg in msgs[sent['count']:]:
+                    publisher.send(msg, timeout)
+                    sent['count'] += 1
+                return
+
+            # msgs[start + i] gets the delivery tag first_tag + i
+            start = sent['count']
+            first_tag = self.published_tag + 1
+            try:
+                for msg in msgs[start:]:
+                    publisher.send(msg, timeout)
+                    self.published_tag += 1
+                self._wait_for_confirms()
+            finally:
+                confirmed = max(self.confirmed_tag - first_tag + 1, 0)
+                sent['count'] = min(start + confirmed, len(msgs))
 
         self.ensure(_error_callback, _publish)
 
@@ -704,6 +812,10 @@ class Connection(object):
         """Send a 'topic' message"""
         self.publisher_send(TopicPublisher, topic, msg, timeout)
 
+    def topic_send_many(self, topic, msgs, timeout=None):
+        """Send several 'topic' messages at once"""
+        self.publisher_send_many(TopicPublisher, topic, msgs, timeout)
+
     def fanout_send(self, topic, msg):
         """Send a 'fanout' message"""
         self.publisher_send(FanoutPublisher, topic, msg)
@@ -712,6 +824,11 @@ class Connection(object):
         """Send a notify message on a topic"""
         self.publisher_send(NotifyPublisher, topic, msg, None, **kwargs)
 
+    def notify_send_many(self, topic, msgs, **kwargs):
+        """Send several notify messages on a topic at once"""
+        self.publisher_send_many(NotifyPublisher, topic, msgs, None,
+                                 **kwargs)
+
     def consume(self, limit=None):
         """Consume from all queues/consumers"""
         it = self.iterconsume(limit=limit)
@@ -736,7 +853,7 @@ class Connection(object):
         """Create a consumer that calls a method in a proxy object"""
         proxy_cb = rpc_amqp.ProxyCallback(
             self.conf, proxy,
-            rpc_amqp.get_connection_pool(self.conf, Connection))
+            rpc_amqp.get_connection_pool(self.conf, Connection), topic)
         self.proxy_callbacks.append(proxy_cb)
 
         if fanout:
@@ -748,7 +865,7 @@ class Connection(object):
         """Create a worker that calls a method in a proxy object"""
         proxy_cb = rpc_amqp.ProxyCallback(
             self.conf, proxy,
-            rpc_amqp.get_connection_pool(self.conf, Connection))
+            rpc_amqp.get_connection_pool(self.conf, Connection), topic)
         self.proxy_callbacks.append(proxy_cb)
         self.declare_topic_consumer(topic, proxy_cb, pool_name)
 
@@ -805,6 +922,13 @@ def cast(conf, context, topic, msg):
         rpc_amqp.get_connection_pool(conf, Connection))
 
 
+def cast_many(conf, context, topic, msgs):
+    """Sends several messages on a topic without waiting for responses."""
+    return rpc_amqp.cast_many(
+        conf, context, topic, msgs,
+        rpc_amqp.get_connection_pool(conf, Connection))
+
+
 def fanout_cast(conf, context, topic, msg):
     """Sends a message on a fanout exchange without waiting for a response."""
     return rpc_amqp.fanout_cast(
@@ -834,5 +958,13 @@ def notify(conf, context, topic, msg, envelope):
         envelope)
 
 
+def notify_many(conf, topic, msgs, envelope):
+    """Sends several notification events on a topic together."""
+    return rpc_amqp.notify_many(
+        conf, topic, msgs,
+        rpc_amqp.get_connection_pool(conf, Connection),
+        envelope)
+
+
 def cleanup():
     return rpc_amqp.cleanup(Connection.pool)
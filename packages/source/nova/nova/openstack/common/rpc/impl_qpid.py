@@ -534,7 +534,7 @@ class Connection(object):
         """Create a consumer that calls a method in a proxy object"""
         proxy_cb = rpc_amqp.ProxyCallback(
             self.conf, proxy,
-            rpc_amqp.get_connection_pool(self.conf, Connection))
+            rpc_amqp.get_connection_pool(self.conf, Connection), topic)
         self.proxy_callbacks.append(proxy_cb)
 
         if fanout:
@@ -550,7 +550,7 @@ class Connection(object):
         """Create a worker that calls a method in a proxy object"""
         proxy_cb = rpc_amqp.ProxyCallback(
             self.conf, proxy,
-            rpc_amqp.get_connection_pool(self.conf, Connection))
+            rpc_amqp.get_connection_pool(self.conf, Connection), topic)
         self.proxy_callbacks.append(proxy_cb)
 
         consumer = TopicConsumer(self.conf, self.session, topic, proxy_cb,
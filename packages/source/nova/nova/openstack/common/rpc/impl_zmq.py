@@ -22,6 +22,7 @@ import types
 import uuid
 
 import eventlet
+from eventlet import semaphore
 import greenlet
 from oslo.config import cfg
 
@@ -67,6 +68,23 @@ zmq_opts = [
                help='Maximum number of ingress messages to locally buffer '
                     'per topic. Default is unlimited.'),
 
+    cfg.IntOpt('rpc_zmq_proxy_credits', default=0,
+               help='Maximum number of messages the ZeroMQ receiver buffers '
+                    'for all topics together.  Once they are used up it '
+                    'stops receiving until messages were passed on, so '
+                    'senders are held up instead of the receiver growing '
+                    'without bound.  As the receiver takes the messages of '
+                    'all topics, a topic without consumers holds up all '
+                    'the others once it used up the credits.  0 means '
+                    'unlimited, so by default senders are never held up.'),
+
+    cfg.BoolOpt('rpc_zmq_batch_casts', default=False,
+                help='Send the messages of a cast_many() together, in a '
+                     'single batch.  Receivers older than this version '
+                     'can\'t read batches, so only enable this once all '
+                     'services were upgraded.  Otherwise the messages are '
+                     'cast one by one.'),
+
     cfg.StrOpt('rpc_zmq_ipc_dir', default='/var/run/openstack',
                help='Directory for holding IPC sockets'),
 
@@ -81,6 +99,10 @@ CONF.register_opts(zmq_opts)
 
 ZMQ_CTX = None  # ZeroMQ Context, must be global.
 matchmaker = None  # memoized matchmaker object
+CLIENTS = {}  # ZmqClient by address, see _get_client()
+
+# Envelope of several messages sent together, see ZmqClient.cast_many()
+BATCH_ENVELOPE = 'impl_zmq_v2_batch'
 
 
 def _serialize(data):
@@ -210,30 +232,87 @@ class ZmqSocket(object):
 
 
 class ZmqClient(object):
-    """Client for ZMQ sockets."""
+    """Client for ZMQ sockets.
+
+    Clients are kept open and shared by all greenthreads sending to the
+    same address.  The frames of a message are sent one at a time, so
+    sends are serialized, and a client whose send was interrupted is
+    closed, as the frames already sent can't be taken back.
+    """
 
     def __init__(self, addr, socket_type=None, bind=False):
         if socket_type is None:
             socket_type = zmq.PUSH
         self.outq = ZmqSocket(addr, socket_type, bind=bind)
+        self.lock = semaphore.Semaphore()
+        # Greenthreads waiting to send, and messages sent
+        self.pending = 0
+        self.sent = 0
+
+    @property
+    def closed(self):
+        return self.outq.sock is None
+
+    def _send(self, frames, count=1):
+        self.pending += count
+        try:
+            with self.lock:
+                try:
+                    self.outq.send(frames)
+                except BaseException:
+                    with excutils.save_and_reraise_exception():
+                        self.close()
+        finally:
+            self.pending -= count
+        self.sent += count
 
     def cast(self, msg_id, topic, data, envelope=False):
         msg_id = msg_id or 0
 
         if not (envelope or rpc_common._SEND_RPC_ENVELOPE):
-            self.outq.send(map(bytes,
+            self._send(map(bytes,
                            (msg_id, topic, 'cast', _serialize(data))))
             return
 
         rpc_envelope = rpc_common.serialize_msg(data[1], envelope)
         zmq_msg = reduce(lambda x, y: x + y, rpc_envelope.items())
-        self.outq.send(map(bytes,
+        self._send(map(bytes,
                        (msg_id, topic, 'impl_zmq_v2', data[0]) + zmq_msg))
 
+    def cast_many(self, msg_id, topic, context, msgs):
+        """Send several messages as one multipart message.
+
+        The frames of every message are preceded by their count.  Only
+        receivers that know BATCH_ENVELOPE can take these.
+        """
+        frames = [msg_id or 0, topic, BATCH_ENVELOPE, context]
+        for msg in msgs:
+            rpc_envelope = rpc_common.serialize_msg(msg, True)
+            zmq_msg = reduce(lambda x, y: x + y, rpc_envelope.items())
+            frames.append(len(zmq_msg))
+            frames.extend(zmq_msg)
+        self._send(map(bytes, frames), len(msgs))
+
     def close(self):
         self.outq.close()
 
 
+def _get_client(addr):
+    """Return the open client for addr, connecting a new one if needed."""
+    client = CLIENTS.get(addr)
+    if client is None or client.closed:
+        client = CLIENTS[addr] = ZmqClient(addr)
+    return client
+
+
+def get_client_stats():
+    """Return the messages waiting to be sent, and sent so far, by
+    the address they are sent to.
+    """
+    return dict((addr, {'pending': client.pending, 'sent': client.sent})
+                for addr, client in CLIENTS.iteritems())
+
+
 class RpcContext(rpc_common.CommonRpcContext):
     """Context that supports replying to a rpc.call."""
     def __init__(self, **kwargs):
@@ -433,12 +512,45 @@ class ZmqProxy(ZmqBaseReactor):
         super(ZmqProxy, self).__init__(conf)
 
         self.topic_proxy = {}
+        self.credits = None
+        if conf.rpc_zmq_proxy_credits > 0:
+            self.credits = semaphore.Semaphore(conf.rpc_zmq_proxy_credits)
+        self.stats = {'received': 0, 'sent': 0, 'dropped': 0}
+
+    def _release_credit(self):
+        if self.credits is not None:
+            self.credits.release()
+
+    def get_stats(self):
+        """Return counts of messages received, sent and dropped, the
+        number buffered for every topic, and the credits left.
+        """
+        stats = self.stats.copy()
+        stats['topics'] = dict((topic, topic_queue.qsize())
+                               for topic, topic_queue
+                               in self.topic_proxy.iteritems())
+        if self.credits is not None:
+            stats['credits'] = self.credits.balance
+        return stats
 
     def consume(self, sock):
+        # Every message buffered takes a credit, which is given back once
+        # it was passed on.  Without credits we stop receiving, and the
+        # senders' queues fill up instead.
+        if self.credits is not None:
+            self.credits.acquire()
+        try:
+            self._consume(sock)
+        except BaseException:
+            with excutils.save_and_reraise_exception():
+                self._release_credit()
+
+    def _consume(self, sock):
         ipc_dir = CONF.rpc_zmq_ipc_dir
 
         #TODO(ewindisch): use zero-copy (i.e. references, not copying)
         data = sock.recv()
+        self.stats['received'] += 1
         topic = data[1]
 
         LOG.debug(_("CONSUMER GOT %s"), ' '.join(map(pformat, data)))
@@ -476,7 +588,11 @@ class ZmqProxy(ZmqBaseReactor):
 
                 while(True):
                     data = self.topic_proxy[topic].get()
-                    out_sock.send(data)
+                    try:
+                        out_sock.send(data)
+                    finally:
+                        self._release_credit()
+                    self.stats['sent'] += 1
                     LOG.debug(_("ROUTER RELAY-OUT SUCCEEDED %(data)s") %
                               {'data': data})
 
@@ -487,6 +603,8 @@ class ZmqProxy(ZmqBaseReactor):
                 wait_sock_creation.wait()
             except RPCException:
                 LOG.error(_("Topic socket file creation failed."))
+                self.stats['dropped'] += 1
+                self._release_credit()
                 return
 
         try:
@@ -496,6 +614,8 @@ class ZmqProxy(ZmqBaseReactor):
         except eventlet.queue.Full:
             LOG.error(_("Local per-topic backlog buffer full for topic "
                         "%(topic)s. Dropping message.") % {'topic': topic})
+            self.stats['dropped'] += 1
+            self._release_credit()
 
     def consume_in_thread(self):
         """Runs the ZmqProxy service"""
@@ -580,6 +700,22 @@ class ZmqReactor(ZmqBaseReactor):
 
             # Unmarshal only after verifying the message.
             ctx = RpcContext.unmarshal(data[3])
+        elif data[2] == BATCH_ENVELOPE:
+            requests = []
+            frames = data[4:]
+            i = 0
+            while i < len(frames):
+                count = int(frames[i])
+                packenv = frames[i + 1:i + 1 + count]
+                requests.append(rpc_common.deserialize_msg(
+                    unflatten_envelope(packenv)))
+                i += 1 + count
+
+            # Every message gets a context of its own, for its replies.
+            for request in requests:
+                ctx = RpcContext.unmarshal(data[3])
+                self.pool.spawn_n(self.process, proxy, ctx, request)
+            return
         else:
             LOG.error(_("ZMQ Envelope version unsupported or unknown."))
             return
@@ -646,15 +782,24 @@ def _cast(addr, context, topic, msg, timeout=None, envelope=False,
 
     with Timeout(timeout_cast, exception=rpc_common.Timeout):
         try:
-            conn = ZmqClient(addr)
+            conn = _get_client(addr)
 
             # assumes cast can't return an exception
             conn.cast(_msg_id, topic, payload, envelope)
         except zmq.ZMQError:
             raise RPCException("Cast failed. ZMQ Socket Exception")
-        finally:
-            if 'conn' in vars():
-                conn.close()
+
+
+def _cast_many(addr, context, topic, msgs, timeout=None, envelope=False,
+               _msg_id=None):
+    timeout_cast = timeout or CONF.rpc_cast_timeout
+
+    with Timeout(timeout_cast, exception=rpc_common.Timeout):
+        try:
+            conn = _get_client(addr)
+            conn.cast_many(_msg_id, topic, RpcContext.marshal(context), msgs)
+        except zmq.ZMQError:
+            raise RPCException("Cast failed. ZMQ Socket Exception")
 
 
 def _call(addr, context, topic, msg, timeout=None,
@@ -758,7 +903,7 @@ def _multi_send(method, context, topic, msg, timeout=None,
         (_topic, ip_addr) = queue
         _addr = "tcp://%s:%s" % (ip_addr, conf.rpc_zmq_port)
 
-        if method.__name__ == '_cast':
+        if method.__name__ in ('_cast', '_cast_many'):
             eventlet.spawn_n(method, _addr, context,
                              _topic, msg, timeout, envelope,
                              _msg_id)
@@ -787,6 +932,17 @@ def cast(conf, *args, **kwargs):
     _multi_send(_cast, *args, **kwargs)
 
 
+def cast_many(conf, context, topic, msgs, **kwargs):
+    """Send several messages expecting no reply, together if
+    rpc_zmq_batch_casts is set.
+    """
+    if not conf.rpc_zmq_batch_casts:
+        for msg in msgs:
+            _multi_send(_cast, context, topic, msg, **kwargs)
+        return
+    _multi_send(_cast_many, context, topic, msgs, **kwargs)
+
+
 def fanout_cast(conf, context, topic, msg, **kwargs):
     """Send a message to all listening and expect no reply."""
     # NOTE(ewindisch): fanout~ is used because it avoid splitting on .
@@ -808,6 +964,10 @@ def notify(conf, context, topic, msg, envelope):
 
 def cleanup():
     """Clean up resources in use by implementation."""
+    for client in CLIENTS.values():
+        client.close()
+    CLIENTS.clear()
+
     global ZMQ_CTX
     if ZMQ_CTX:
         ZMQ_CTX.term()
@@ -112,6 +112,23 @@ class RpcProxy(object):
         self._set_version(msg, version)
         rpc.cast(context, self._get_topic(topic), msg)
 
+    def cast_many(self, context, msgs, topic=None, version=None):
+        """rpc.cast_many() several remote methods.
+
+        :param context: The request context
+        :param msgs: The messages to send, each including the method and
+               args.
+        :param topic: Override the topic for these messages.
+        :param version: (Optional) Override the requested API version in
+               these messages.
+
+        :returns: None.  rpc.cast_many() does not wait on any return value
+                  from the remote methods.
+        """
+        for msg in msgs:
+            self._set_version(msg, version)
+        rpc.cast_many(context, self._get_topic(topic), msgs)
+
     def fanout_cast(self, context, msg, topic=None, version=None):
         """rpc.fanout_cast() a remote method.
 
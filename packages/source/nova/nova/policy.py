@@ -33,6 +33,12 @@ policy_opts = [
     cfg.StrOpt('policy_default_rule',
                default='default',
                help=_('Rule checked when requested rule is not found')),
+    cfg.IntOpt('policy_cache_size',
+               default=0,
+               help=_('Number of policy decisions to memoize, keyed on the '
+                      'credential and target fields each rule reads. The '
+                      'cache is dropped whenever the policy file is '
+                      'reloaded. (Disable by setting to 0)')),
     ]
 
 CONF = cfg.CONF
@@ -65,7 +71,8 @@ def init():
 
 def _set_rules(data):
     default_rule = CONF.policy_default_rule
-    policy.set_rules(policy.Rules.load_json(data, default_rule))
+    policy.set_rules(policy.Rules.load_json(data, default_rule,
+                                            CONF.policy_cache_size))
 
 
 def enforce(context, action, target, do_raise=True):
@@ -130,3 +137,10 @@ class IsAdminCheck(policy.Check):
         """Determine whether is_admin matches the requested value."""
 
         return creds['is_admin'] == self.expected
+
+    def cache_fields(self, rule_fields):
+        """The decision only depends on the is_admin credential."""
+
+        if type(self) is not IsAdminCheck:
+            return None
+        return frozenset(['is_admin']), frozenset()
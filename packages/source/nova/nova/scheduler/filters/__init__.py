@@ -45,9 +45,10 @@ def all_filters():
     """Return a list of filter classes found in this directory.
 
     This method is used as the default for available scheduler filters
-    and should return a list of all filter classes available.
+    and should return a list of all filter classes available.  Filter
+    modules are only imported once their filters are used.
     """
-    return HostFilterHandler().get_all_classes()
+    return HostFilterHandler().get_all_classes(lazy=True)
 
 
 def standard_filters():
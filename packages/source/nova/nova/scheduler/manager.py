@@ -59,6 +59,10 @@ class SchedulerManager(manager.Manager):
 
     RPC_API_VERSION = '2.6'
 
+    # Every compute node casts its capabilities periodically, these must
+    # not hold up scheduling.
+    RPC_METHOD_PRIORITIES = {'update_service_capabilities': 'low'}
+
     def __init__(self, scheduler_driver=None, *args, **kwargs):
         if not scheduler_driver:
             scheduler_driver = CONF.scheduler_driver
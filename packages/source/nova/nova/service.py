@@ -37,6 +37,7 @@ from nova import exception
 from nova.openstack.common import eventlet_backdoor
 from nova.openstack.common import importutils
 from nova.openstack.common import log as logging
+from nova.openstack.common.notifier import api as notifier_api
 from nova.openstack.common import rpc
 from nova import servicegroup
 from nova import utils
@@ -551,6 +552,12 @@ class Service(object):
             self.conn.close()
         except Exception:
             pass
+        try:
+            self.manager.cleanup_host()
+        except Exception:
+            LOG.exception(_('Service error occurred during cleanup_host'))
+        # Hand over the notifications still queued with notification_async
+        notifier_api.flush()
         for x in self.timers:
             try:
                 x.stop()
@@ -30,7 +30,7 @@ servicegroup_driver_opt = cfg.StrOpt('servicegroup_driver',
                                      default=_default_driver,
                                      help='The driver for servicegroup '
                                           'service (valid options are: '
-                                          'db, zk, mc)')
+                                          'db, zk, mc, conductor)')
 
 CONF = cfg.CONF
 CONF.register_opt(servicegroup_driver_opt)
@@ -42,7 +42,8 @@ class API(object):
     _driver_name_class_mapping = {
         'db': 'nova.servicegroup.drivers.db.DbDriver',
         'zk': 'nova.servicegroup.drivers.zk.ZooKeeperDriver',
-        'mc': 'nova.servicegroup.drivers.mc.MemcachedDriver'
+        'mc': 'nova.servicegroup.drivers.mc.MemcachedDriver',
+        'conductor': 'nova.servicegroup.drivers.conductor.ConductorDriver',
     }
 
     def __new__(cls, *args, **kwargs):
@@ -0,0 +1,187 @@
+# Copyright 2013 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from oslo.config import cfg
+
+from nova.conductor import rpcapi as conductor_rpcapi
+from nova import context
+from nova.openstack.common import log as logging
+from nova.openstack.common import timeutils
+from nova.servicegroup.drivers import db
+from nova import utils
+
+
+conductor_driver_opts = [
+    cfg.IntOpt('servicegroup_snapshot_staleness',
+               default=5,
+               help='Seconds the service liveness fetched from '
+                    'nova-conductor is used for before it is fetched again, '
+                    'when the conductor servicegroup driver is used'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(conductor_driver_opts)
+CONF.import_opt('service_down_time', 'nova.service')
+
+LOG = logging.getLogger(__name__)
+
+
+class _ServiceHeartbeat(object):
+    """Returned by join() so stopping a service only stops heartbeats
+    for that service.
+    """
+
+    def __init__(self, driver, service):
+        self.driver = driver
+        self.service = service
+        self.report_count = service.service_ref['report_count']
+
+    def to_primitive(self):
+        self.report_count += 1
+        return {'topic': self.service.topic,
+                'host': self.service.host,
+                'service_id': self.service.service_ref['id'],
+                'report_count': self.report_count}
+
+    def stop(self):
+        self.driver._stop_heartbeat(self)
+
+    def wait(self):
+        pass
+
+
+class ConductorDriver(db.DbDriver):
+    """Services send heartbeats to nova-conductor, which keeps track of
+    them in memory and only writes them to the database now and then.
+
+    Heartbeats of all services in a process are sent together, as one
+    fanout cast to every nova-conductor.  Liveness is fetched from a
+    conductor in one call for all services and used for
+    servicegroup_snapshot_staleness seconds.  If the conductor can't be
+    reached, or doesn't know a service, the database is used like the
+    db driver does.
+
+    This always talks to nova-conductor over RPC, even where the
+    database may be used directly, as the heartbeats are only kept by
+    the nova-conductor services.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(ConductorDriver, self).__init__(*args, **kwargs)
+        self.conductor_rpcapi = conductor_rpcapi.ConductorAPI()
+        self.heartbeats = []
+        self.pulse = None
+        self.members = None
+        self.members_fetched_at = None
+        self.model_disconnected = False
+
+    def join(self, member_id, group_id, service=None):
+        """Join the given service with its group."""
+
+        msg = _('Conductor_Driver: join new ServiceGroup member '
+                '%(member_id)s to the %(group_id)s group, '
+                'service = %(service)s')
+        LOG.debug(msg, locals())
+        if service is None:
+            raise RuntimeError(_('service is a mandatory argument for '
+                                 'conductor based ServiceGroup driver'))
+        report_interval = service.report_interval
+        if not report_interval:
+            return
+        heartbeat = _ServiceHeartbeat(self, service)
+        self.heartbeats.append(heartbeat)
+        if self.pulse is None:
+            self.pulse = utils.FixedIntervalLoopingCall(self._report_state)
+            self.pulse.start(interval=report_interval,
+                             initial_delay=report_interval)
+        return heartbeat
+
+    def _stop_heartbeat(self, heartbeat):
+        if heartbeat in self.heartbeats:
+            self.heartbeats.remove(heartbeat)
+        if not self.heartbeats and self.pulse is not None:
+            self.pulse.stop()
+            self.pulse = None
+
+    def _report_state(self):
+        """Send the heartbeats of all services in this process."""
+        if not self.heartbeats:
+            return
+        ctxt = context.get_admin_context()
+        try:
+            heartbeats = [heartbeat.to_primitive()
+                          for heartbeat in self.heartbeats]
+            self.conductor_rpcapi.service_heartbeats(ctxt, heartbeats)
+
+            if self.model_disconnected:
+                self.model_disconnected = False
+                LOG.error(_('Recovered connection to conductor!'))
+
+        # TODO(vish): this should probably only catch connection errors
+        except Exception:  # pylint: disable=W0702
+            if not self.model_disconnected:
+                self.model_disconnected = True
+                LOG.exception(_('conductor went away'))
+
+    def _get_members(self):
+        """Return {(topic, host): seconds since last heartbeat}, as of
+        when it was fetched, along with the time it was fetched.
+
+        The members are None if nova-conductor couldn't be reached.  It
+        is not asked again until servicegroup_snapshot_staleness has
+        passed, so not every check waits for the call to time out.
+        """
+        now = timeutils.utcnow()
+        if (self.members_fetched_at is None or
+                utils.total_seconds(now - self.members_fetched_at) >
+                CONF.servicegroup_snapshot_staleness):
+            ctxt = context.get_admin_context()
+            try:
+                snapshot = self.conductor_rpcapi.service_membership(ctxt)
+                self.members = dict(((topic, host), age)
+                                    for topic, host, age in snapshot)
+            except Exception:
+                LOG.exception(_('Failed to get service liveness from '
+                                'conductor, falling back to the database'))
+                self.members = None
+            self.members_fetched_at = now
+        return self.members, self.members_fetched_at
+
+    def is_up(self, service_ref):
+        """Check whether a service is up based on the heartbeats the
+        conductor received.
+        """
+        members, fetched_at = self._get_members()
+        key = (service_ref['topic'], service_ref['host'])
+        if members is None or key not in members:
+            return super(ConductorDriver, self).is_up(service_ref)
+        elapsed = members[key] + utils.total_seconds(timeutils.utcnow() -
+                                                     fetched_at)
+        return elapsed <= CONF.service_down_time
+
+    def get_all(self, group_id):
+        """
+        Returns ALL members of the given group that are up.  Like with
+        the zk driver, this includes disabled services.
+        """
+        LOG.debug(_('Conductor_Driver: get_all members of the %s group') %
+                  group_id)
+        members, fetched_at = self._get_members()
+        if members is None:
+            return super(ConductorDriver, self).get_all(group_id)
+        elapsed = utils.total_seconds(timeutils.utcnow() - fetched_at)
+        return [host for (topic, host), age in members.iteritems()
+                if topic == group_id and
+                age + elapsed <= CONF.service_down_time]
@@ -0,0 +1,115 @@
+# Copyright 2013 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Service liveness kept in memory by nova-conductor.
+
+Services using the conductor servicegroup driver send their heartbeats
+to every nova-conductor instead of writing them to the database.  Each
+conductor keeps the time it last heard from every service, answers
+liveness queries from that, and only writes the heartbeats to the
+services table every servicegroup_persist_interval seconds.
+"""
+
+from oslo.config import cfg
+
+from nova import exception
+from nova.openstack.common import log as logging
+from nova.openstack.common import timeutils
+from nova import utils
+
+
+membership_opts = [
+    cfg.IntOpt('servicegroup_persist_interval',
+               default=30,
+               help='Seconds between writes of the service heartbeats '
+                    'received by nova-conductor to the database, when the '
+                    'conductor servicegroup driver is used.  Keep it below '
+                    'service_down_time, as the database is used whenever a '
+                    'conductor has not heard from a service itself'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(membership_opts)
+
+LOG = logging.getLogger(__name__)
+
+
+class Membership(object):
+    """When every service was last heard from, by topic and host."""
+
+    def __init__(self, db):
+        self.db = db
+        self.members = {}
+        self.loaded = False
+
+    def heartbeat(self, heartbeats):
+        """Record heartbeats that just arrived.
+
+        Each heartbeat is a dict with the topic, host, service_id and
+        report_count of a service.  The time they are received is used
+        rather than a time sent by the service, so clocks on the
+        compute hosts don't matter.
+        """
+        now = timeutils.utcnow()
+        for heartbeat in heartbeats:
+            key = (heartbeat['topic'], heartbeat['host'])
+            self.members[key] = {'last_seen': now,
+                                 'service_id': heartbeat['service_id'],
+                                 'report_count': heartbeat['report_count'],
+                                 'persisted': False}
+
+    def _load(self, context):
+        """Start out with the heartbeats in the database, so a conductor
+        that was just started does not think every service is down.
+        """
+        for service in self.db.service_get_all(context):
+            key = (service['topic'], service['host'])
+            if key in self.members:
+                continue
+            self.members[key] = {
+                'last_seen': service['updated_at'] or service['created_at'],
+                'service_id': service['id'],
+                'report_count': service['report_count'],
+                'persisted': True}
+        self.loaded = True
+
+    def snapshot(self, context):
+        """Return [topic, host, seconds since last heartbeat] for every
+        service we know about.
+        """
+        if not self.loaded:
+            self._load(context)
+        now = timeutils.utcnow()
+        return [[topic, host, utils.total_seconds(now - member['last_seen'])]
+                for (topic, host), member in self.members.iteritems()]
+
+    def persist(self, context):
+        """Write heartbeats received since the last call to the database."""
+        count = 0
+        for key, member in self.members.items():
+            if member['persisted']:
+                continue
+            values = {'report_count': member['report_count'],
+                      'updated_at': member['last_seen']}
+            try:
+                self.db.service_update(context, member['service_id'], values)
+            except exception.ServiceNotFound:
+                # The service was deleted, forget about it until it
+                # sends a heartbeat again.
+                del self.members[key]
+                continue
+            member['persisted'] = True
+            count += 1
+        LOG.debug(_('Saved heartbeats of %d services'), count)
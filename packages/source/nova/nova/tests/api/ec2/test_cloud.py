@@ -822,6 +822,52 @@ class CloudTestCase(test.TestCase):
         db.service_destroy(self.context, comp1['id'])
         db.service_destroy(self.context, comp2['id'])
 
+    def test_describe_instances_translates_in_bulk(self):
+        # Ids, images and zones are translated for all instances at once
+        self._stub_instance_get_with_fixed_ips('get_all')
+
+        image_uuid = 'cedef40a-ed67-4d10-800e-17455edce175'
+        kernel_uuid = 'a2459075-d96c-40d5-893e-577ff92e721c'
+        sys_meta = instance_types.save_instance_type_info(
+            {}, instance_types.get_instance_type(1))
+        instances = []
+        for i in xrange(3):
+            instances.append(db.instance_create(self.context, {
+                'reservation_id': 'a', 'image_ref': image_uuid,
+                'kernel_id': kernel_uuid, 'instance_type_id': 1,
+                'host': 'host%d' % i, 'vm_state': 'active',
+                'system_metadata': sys_meta}))
+        agg = db.aggregate_create(self.context,
+                {'name': 'agg1'}, {'availability_zone': 'zone1'})
+        db.aggregate_host_add(self.context, agg['id'], 'host1')
+
+        def not_called(*args, **kwargs):
+            self.fail('looked up a single item')
+
+        ec2utils.reset_cache()
+        self.stubs.Set(db, 'get_ec2_instance_id_by_uuid', not_called)
+        self.stubs.Set(db, 's3_image_get_by_uuid', not_called)
+        self.stubs.Set(db, 'aggregate_metadata_get_by_host', not_called)
+
+        result = self.cloud.describe_instances(self.context)
+        result = result['reservationSet'][0]['instancesSet']
+        self.stubs.UnsetAll()
+
+        self.assertEqual([i['instanceId'] for i in result],
+                         [ec2utils.id_to_ec2_inst_id(inst['uuid'])
+                          for inst in instances])
+        self.assertEqual([i['placement']['availabilityZone'] for i in result],
+                         ['nova', 'zone1', 'nova'])
+        for i in result:
+            self.assertEqual(i['imageId'],
+                ec2utils.glance_id_to_ec2_id(self.context, image_uuid))
+            self.assertEqual(i['kernelId'],
+                ec2utils.glance_id_to_ec2_id(self.context, kernel_uuid,
+                                             'aki'))
+
+        for inst in instances:
+            db.instance_destroy(self.context, inst['uuid'])
+
     def test_describe_instances_all_invalid(self):
         # Makes sure describe_instances works and filters results.
         self.flags(use_ipv6=True)
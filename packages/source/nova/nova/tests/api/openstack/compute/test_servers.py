@@ -17,6 +17,7 @@
 #    under the License.
 
 import base64
+import copy
 import datetime
 import urlparse
 import uuid
@@ -26,6 +27,7 @@ from lxml import etree
 from oslo.config import cfg
 import webob
 
+from nova.api.openstack import common
 from nova.api.openstack import compute
 from nova.api.openstack.compute import ips
 from nova.api.openstack.compute import servers
@@ -4188,6 +4190,43 @@ class ServersViewBuilderTest(test.TestCase):
         output = self.view_builder.show(self.request, self.instance)
         self.assertEqual(output['server']['image'], "")
 
+    def test_build_server_detail_list_view_hooks(self):
+        calls = []
+
+        def hook(server, instance):
+            calls.append(instance)
+            server['OS-TEST:name'] = instance['name']
+
+        self.request.add_view_hook('servers', hook)
+        output = self.view_builder.detail(self.request, [self.instance])
+        self.assertEqual(calls, [self.instance])
+        self.assertEqual(output['servers'][0]['OS-TEST:name'],
+                         self.instance['name'])
+
+        # Hooks are only applied to the list views
+        calls = []
+        output = self.view_builder.show(self.request, self.instance)
+        self.assertEqual(calls, [])
+        self.assertFalse('OS-TEST:name' in output['server'])
+
+    def test_build_server_detail_list_memoizes_links(self):
+        self.mox.StubOutWithMock(common, 'remove_version_from_href')
+        common.remove_version_from_href(
+            self.request.application_url).AndReturn('http://localhost')
+        self.mox.ReplayAll()
+
+        other = copy.deepcopy(self.instance)
+        other['uuid'] = 'deadbeef-feed-edee-beef-d0ea7beefedd'
+        output = self.view_builder.detail(self.request,
+                                          [self.instance, other])
+        first, second = output['servers']
+        self.assertEqual(first['image'], second['image'])
+        self.assertEqual(first['flavor'], second['flavor'])
+        self.assertEqual(first['image']['links'][0]['href'],
+                         "http://localhost/fake/images/5")
+        self.assertEqual(second['links'][1]['href'],
+                         "http://localhost/fake/servers/%s" % other['uuid'])
+
     def test_build_server_detail_with_fault(self):
         self.instance['vm_state'] = vm_states.ERROR
         self.instance['fault'] = {
@@ -97,6 +97,21 @@ class RequestTest(test.TestCase):
                  'uuid1': instances[1],
                  'uuid2': instances[2]})
 
+    def test_add_and_get_view_hooks(self):
+        request = wsgi.Request.blank('/foo')
+        self.assertEqual(request.get_view_hooks('servers'), [])
+
+        def hook1(item, db_item):
+            pass
+
+        def hook2(item, db_item):
+            pass
+
+        request.add_view_hook('servers', hook1)
+        request.add_view_hook('servers', hook2)
+        self.assertEqual(request.get_view_hooks('servers'), [hook1, hook2])
+        self.assertEqual(request.get_view_hooks('flavors'), [])
+
 
 class ActionDispatcherTest(test.TestCase):
     def test_dispatch(self):
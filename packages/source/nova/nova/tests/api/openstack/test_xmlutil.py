@@ -655,6 +655,32 @@ class TemplateTest(test.TestCase):
                          str(obj['test']['image']['id']))
         self.assertEqual(result[idx].text, obj['test']['image']['name'])
 
+    def test_compile_siblings(self):
+        root = xmlutil.TemplateElement('test', selector='test')
+        xmlutil.SubTemplateElement(root, 'name', selector='name')
+        xmlutil.SubTemplateElement(root, 'shared', selector='shared')
+        root_slave = xmlutil.TemplateElement('test', selector='test')
+        xmlutil.SubTemplateElement(root_slave, 'shared', selector='shared')
+        xmlutil.SubTemplateElement(root_slave, 'extra', selector='extra')
+
+        compiled = xmlutil.compile_siblings([root, root_slave])
+        self.assertEqual(compiled.element, root)
+        self.assertEqual(compiled.patches, [root_slave])
+        self.assertEqual([c.element.tag for c in compiled.children],
+                         ['name', 'shared', 'extra'])
+        self.assertEqual(compiled.children[1].patches,
+                         [root_slave['shared']])
+
+        # Compiled forms are reused...
+        self.assertTrue(
+            xmlutil.compile_siblings([root, root_slave]) is compiled)
+
+        # ...until a template changes shape
+        xmlutil.SubTemplateElement(root, 'late', selector='late')
+        compiled = xmlutil.compile_siblings([root, root_slave])
+        self.assertEqual([c.element.tag for c in compiled.children],
+                         ['name', 'shared', 'late', 'extra'])
+
 
 class MasterTemplateBuilder(xmlutil.TemplateBuilder):
     def construct(self):
@@ -101,6 +101,20 @@ class CellsManagerClassTestCase(test.TestCase):
         self.mox.ReplayAll()
         cells_manager.post_start_hook()
 
+    def test_cleanup_host(self):
+        cells_manager = fakes.get_cells_manager('child-cell2')
+        state_manager = cells_manager.state_manager
+        neighbors = (state_manager.get_parent_cells() +
+                     state_manager.get_child_cells())
+
+        self.mox.StubOutWithMock(cells_manager.driver, 'stop_consumers')
+        cells_manager.driver.stop_consumers()
+        for cell in neighbors:
+            self.mox.StubOutWithMock(cell.driver, 'stop_consumers')
+            cell.driver.stop_consumers()
+        self.mox.ReplayAll()
+        cells_manager.cleanup_host()
+
     def test_update_our_parents(self):
         self.mox.StubOutWithMock(self.msg_runner,
                                  'tell_parents_our_capabilities')
@@ -567,6 +567,59 @@ class CellsMessageClassesTestCase(test.TestCase):
             self.assertTrue(response.failure)
             self.assertRaises(test.TestingException, response.value_or_raise)
 
+    def test_collapse_key(self):
+        instance = {'uuid': 'fake-uuid', 'vm_state': 'active'}
+        message = messaging._BroadcastMessage(self.msg_runner, self.ctxt,
+                'instance_update_at_top', dict(instance=instance), 'up',
+                run_locally=False)
+        self.assertEqual(('broadcast', 'instance_update_at_top',
+                          'fake-uuid'), message.collapse_key())
+
+        message = messaging._BroadcastMessage(self.msg_runner, self.ctxt,
+                'instance_destroy_at_top', dict(instance=instance), 'up',
+                run_locally=False)
+        self.assertEqual(None, message.collapse_key())
+
+        message = messaging._BroadcastMessage(self.msg_runner, self.ctxt,
+                'instance_update_at_top', dict(instance=instance), 'up',
+                need_response=True)
+        self.assertEqual(None, message.collapse_key())
+
+    def test_messages_to_batch_and_back(self):
+        other_ctxt = context.RequestContext('other', 'other')
+        target_cell = 'api-cell!child-cell2'
+        messages = [
+            messaging._TargetedMessage(self.msg_runner, self.ctxt,
+                                       'fake_method', dict(arg1=1), 'down',
+                                       target_cell),
+            messaging._BroadcastMessage(self.msg_runner, other_ctxt,
+                                        'fake_method', dict(arg2=2), 'down',
+                                        run_locally=False),
+            messaging._TargetedMessage(self.msg_runner, self.ctxt,
+                                       'fake_method2', dict(arg3=3), 'down',
+                                       target_cell, fanout=True)]
+
+        batch = self.msg_runner.messages_to_batch(messages)
+        # Much smaller than the messages on their own
+        self.assertTrue(len(batch) <
+                        sum(len(message.to_json()) for message in messages))
+
+        msg_runner = fakes.get_message_runner('child-cell2')
+        received = msg_runner.messages_from_batch(batch)
+        self.assertEqual(3, len(received))
+        for message, got in zip(messages, received):
+            self.assertEqual(message.__class__, got.__class__)
+            self.assertEqual(message.uuid, got.uuid)
+            self.assertEqual(message.method_name, got.method_name)
+            self.assertEqual(message.method_kwargs, got.method_kwargs)
+            self.assertEqual(message.fanout, got.fanout)
+            self.assertEqual(message.ctxt.to_dict(), got.ctxt.to_dict())
+            self.assertEqual('api-cell!child-cell2', got.routing_path)
+            self.assertEqual(2, got.hop_count)
+        self.assertEqual(target_cell, received[0].target_cell)
+        # Equal contexts are only sent once
+        self.assertTrue(received[0].ctxt is received[2].ctxt)
+
 
 class CellsTargetedMethodsTestCase(test.TestCase):
     """Test case for _TargetedMessageMethods class.  Most of these
@@ -16,6 +16,7 @@
 Tests For Cells RPC Communication Driver
 """
 
+from eventlet import greenthread
 from oslo.config import cfg
 
 from nova.cells import messaging
@@ -194,6 +195,201 @@ class CellsRPCDriverTestCase(test.TestCase):
         self.assertEqual('cells.intercell42.fake-message-type',
                          call_info['topic'])
 
+    def _stub_batching(self, window=0.5):
+        self.flags(rpc_driver_batch_window=window, group='cells')
+        call_info = {'timers': [], 'sent': []}
+
+        class FakeTimer(object):
+            def __init__(_self, seconds, func, *args):
+                _self.seconds = seconds
+                _self.func = func
+                _self.args = args
+                _self.cancelled = False
+
+            def cancel(_self):
+                _self.cancelled = True
+
+        def _fake_spawn_after(seconds, func, *args):
+            timer = FakeTimer(seconds, func, *args)
+            call_info['timers'].append(timer)
+            return timer
+
+        def _fake_send_message_to_cell(cell_state, message):
+            call_info['sent'].append(message)
+
+        def _fake_send_messages_to_cell(cell_state, messages):
+            call_info['sent'].append(messages)
+
+        self.stubs.Set(greenthread, 'spawn_after', _fake_spawn_after)
+        self.stubs.Set(self.driver.intercell_rpcapi, 'send_message_to_cell',
+                       _fake_send_message_to_cell)
+        self.stubs.Set(self.driver.intercell_rpcapi, 'send_messages_to_cell',
+                       _fake_send_messages_to_cell)
+        return call_info
+
+    def _instance_update(self, msg_runner, uuid):
+        return messaging._BroadcastMessage(msg_runner, self.ctxt,
+                'instance_update_at_top', dict(instance={'uuid': uuid}),
+                'up', run_locally=False)
+
+    def test_send_message_to_cell_batched(self):
+        call_info = self._stub_batching()
+        msg_runner = fakes.get_message_runner('child-cell2')
+        cell_state = fakes.get_cell_state('child-cell2', 'api-cell')
+
+        update1 = self._instance_update(msg_runner, 'uuid1')
+        update2 = self._instance_update(msg_runner, 'uuid2')
+        fault = messaging._BroadcastMessage(msg_runner, self.ctxt,
+                'instance_fault_create_at_top',
+                dict(instance_fault={'instance_uuid': 'uuid1'}), 'up',
+                run_locally=False)
+        update1_again = self._instance_update(msg_runner, 'uuid1')
+        capacities = messaging._TargetedMessage(msg_runner, self.ctxt,
+                'update_capacities', {}, 'up', cell_state, fanout=True)
+
+        for message in (update1, update2, fault, update1_again, capacities):
+            self.driver.send_message_to_cell(cell_state, message)
+        self.assertEqual([], call_info['sent'])
+        self.assertEqual(1, len(call_info['timers']))
+        timer = call_info['timers'][0]
+        self.assertEqual(0.5, timer.seconds)
+        self.assertEqual({'depth': 4, 'max_depth': 4, 'queued': 5,
+                          'collapsed': 1, 'sent': 0, 'batches': 0},
+                         self.driver.get_hop_stats()['api-cell'])
+
+        timer.func(*timer.args)
+        # The older update for uuid1 is dropped, and the newer one is
+        # still sent after the fault.  Messages for different topics
+        # are sent separately.
+        self.assertEqual([[update2, fault, update1_again], [capacities]],
+                         call_info['sent'])
+        self.assertEqual({'depth': 0, 'max_depth': 4, 'queued': 5,
+                          'collapsed': 1, 'sent': 4, 'batches': 2},
+                         self.driver.get_hop_stats()['api-cell'])
+
+        # Another timer is started for the next message
+        self.driver.send_message_to_cell(cell_state, update1)
+        self.assertEqual(2, len(call_info['timers']))
+
+    def test_send_message_to_cell_batch_size(self):
+        self.flags(rpc_driver_batch_size=2, group='cells')
+        call_info = self._stub_batching()
+        msg_runner = fakes.get_message_runner('child-cell2')
+        cell_state = fakes.get_cell_state('child-cell2', 'api-cell')
+        update1 = self._instance_update(msg_runner, 'uuid1')
+        update2 = self._instance_update(msg_runner, 'uuid2')
+
+        self.driver.send_message_to_cell(cell_state, update1)
+        self.assertEqual([], call_info['sent'])
+        self.driver.send_message_to_cell(cell_state, update2)
+        self.assertEqual([[update1, update2]], call_info['sent'])
+        self.assertTrue(call_info['timers'][0].cancelled)
+
+    def test_send_message_to_cell_not_batched(self):
+        call_info = self._stub_batching(window=0)
+        msg_runner = fakes.get_message_runner('child-cell2')
+        cell_state = fakes.get_cell_state('child-cell2', 'api-cell')
+        update = self._instance_update(msg_runner, 'uuid1')
+
+        self.driver.send_message_to_cell(cell_state, update)
+        self.assertEqual([update], call_info['sent'])
+        self.assertEqual([], call_info['timers'])
+
+    def test_send_message_to_cell_call_sends_queue_first(self):
+        call_info = self._stub_batching()
+        msg_runner = fakes.get_message_runner('api-cell')
+        cell_state = fakes.get_cell_state('api-cell', 'child-cell2')
+        cast = messaging._TargetedMessage(msg_runner, self.ctxt, 'fake',
+                {}, 'down', cell_state)
+        call = messaging._TargetedMessage(msg_runner, self.ctxt, 'fake',
+                {}, 'down', cell_state, need_response=True)
+
+        self.driver.send_message_to_cell(cell_state, cast)
+        self.driver.send_message_to_cell(cell_state, call)
+        self.assertEqual([[cast], call], call_info['sent'])
+
+    def test_stop_consumers_sends_queued_messages(self):
+        call_info = self._stub_batching()
+        msg_runner = fakes.get_message_runner('child-cell2')
+        cell_state = fakes.get_cell_state('child-cell2', 'api-cell')
+        update = self._instance_update(msg_runner, 'uuid1')
+
+        self.driver.send_message_to_cell(cell_state, update)
+        self.driver.stop_consumers()
+        self.assertEqual([[update]], call_info['sent'])
+        self.assertTrue(call_info['timers'][0].cancelled)
+        self.assertEqual(0, self.driver.get_hop_stats()['api-cell']['depth'])
+
+    def test_flush_messages_logs_failures(self):
+        call_info = self._stub_batching()
+        msg_runner = fakes.get_message_runner('child-cell2')
+        cell_state = fakes.get_cell_state('child-cell2', 'api-cell')
+        update = self._instance_update(msg_runner, 'uuid1')
+
+        def _fake_send_messages_to_cell(cell_state, messages):
+            raise test.TestingException()
+
+        self.stubs.Set(self.driver.intercell_rpcapi, 'send_messages_to_cell',
+                       _fake_send_messages_to_cell)
+        self.driver.send_message_to_cell(cell_state, update)
+        self.driver.flush_messages(cell_state)
+        self.assertEqual([], call_info['sent'])
+        stats = self.driver.get_hop_stats()['api-cell']
+        self.assertEqual(0, stats['depth'])
+        self.assertEqual(0, stats['sent'])
+
+    def test_send_messages_to_cell(self):
+        msg_runner = fakes.get_message_runner('api-cell')
+        cell_state = fakes.get_cell_state('api-cell', 'child-cell2')
+        messages = [messaging._TargetedMessage(msg_runner, self.ctxt,
+                            'fake', {}, 'down', cell_state, fanout=True)
+                    for i in xrange(2)]
+
+        call_info = {}
+
+        def _fake_fanout_cast_to_server(*args, **kwargs):
+            call_info['cast_args'] = args
+            call_info['cast_kwargs'] = kwargs
+
+        self.stubs.Set(rpc, 'fanout_cast_to_server',
+                       _fake_fanout_cast_to_server)
+
+        self.driver.intercell_rpcapi.send_messages_to_cell(cell_state,
+                                                           messages)
+        ctxt, server_params, topic, rpc_message = call_info['cast_args']
+        self.assertEqual(self.ctxt, ctxt)
+        self.assertEqual('rpc_host2', server_params['hostname'])
+        self.assertEqual('cells.intercell.targeted', topic)
+        self.assertEqual('process_messages', rpc_message['method'])
+        self.assertEqual('1.1', rpc_message['version'])
+        received = msg_runner.messages_from_batch(
+                rpc_message['args']['batch'])
+        self.assertEqual([message.uuid for message in messages],
+                         [message.uuid for message in received])
+
+    def test_process_messages(self):
+        msg_runner = fakes.get_message_runner('api-cell')
+        dispatcher = rpc_driver.InterCellRPCDispatcher(msg_runner)
+        messages = [messaging._BroadcastMessage(msg_runner,
+                            self.ctxt, 'fake', 'fake', 'down', fanout=True)
+                    for i in xrange(2)]
+        processed = []
+
+        def _fake_messages_from_batch(batch):
+            self.assertEqual('fake-batch', batch)
+            return messages
+
+        def _fake_process(message):
+            return lambda: processed.append(message)
+
+        self.stubs.Set(msg_runner, 'messages_from_batch',
+                _fake_messages_from_batch)
+        for message in messages:
+            self.stubs.Set(message, 'process', _fake_process(message))
+
+        dispatcher.process_messages(self.ctxt, 'fake-batch')
+        self.assertEqual(messages, processed)
+
     def test_process_message(self):
         msg_runner = fakes.get_message_runner('api-cell')
         dispatcher = rpc_driver.InterCellRPCDispatcher(msg_runner)
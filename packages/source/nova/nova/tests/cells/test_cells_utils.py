@@ -34,10 +34,11 @@ class CellsUtilsTestCase(test.TestCase):
             call_info['shuffle'] += 1
 
         def instance_get_all_by_filters(context, filters,
-                sort_key, sort_order):
+                sort_key, sort_order, use_slave=False):
             self.assertEqual(context, fake_context)
             self.assertEqual(sort_key, 'deleted')
             self.assertEqual(sort_order, 'asc')
+            self.assertTrue(use_slave)
             call_info['got_filters'] = filters
             call_info['get_all'] += 1
             return ['fake_instance1', 'fake_instance2', 'fake_instance3']
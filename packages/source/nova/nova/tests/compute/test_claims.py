@@ -29,6 +29,7 @@ LOG = logging.getLogger(__name__)
 class DummyTracker(object):
     icalled = False
     rcalled = False
+    nodename = 'fakenode'
 
     def abort_instance_claim(self, *args, **kwargs):
         self.icalled = True
@@ -6088,6 +6088,32 @@ class ComputeAPITestCase(BaseTestCase):
 
         db.instance_destroy(_context, instance['uuid'])
 
+    def test_get_latest_instance_faults(self):
+        instance = self._create_fake_instance()
+
+        fault_fixture = {
+                'code': 404,
+                'instance_uuid': instance['uuid'],
+                'message': "HTTPNotFound",
+                'details': "Stock details for test",
+                'created_at': datetime.datetime(2010, 10, 10, 12, 0, 0),
+            }
+
+        def return_fault(_ctxt, instance_uuids):
+            return dict.fromkeys(instance_uuids, fault_fixture)
+
+        self.stubs.Set(nova.db,
+                       'instance_fault_get_latest_by_instance_uuids',
+                       return_fault)
+
+        _context = context.get_admin_context()
+        output = self.compute_api.get_latest_instance_faults(_context,
+                                                             [instance])
+        expected = {instance['uuid']: fault_fixture}
+        self.assertEqual(output, expected)
+
+        db.instance_destroy(_context, instance['uuid'])
+
     @staticmethod
     def _parse_db_block_device_mapping(bdm_ref):
         attr_list = ('delete_on_termination', 'device_name', 'no_device',
@@ -909,6 +909,25 @@ class ConductorRPCAPITestCase(_BaseTestCase, test.TestCase):
         self.conductor.security_groups_trigger_handler(self.context,
                                                        'event', ['arg'])
 
+    def test_service_heartbeats(self):
+        heartbeats = [{'topic': 'compute', 'host': 'fake-host',
+                       'service_id': 1, 'report_count': 2}]
+        self.mox.StubOutWithMock(self.conductor_manager.membership,
+                                 'heartbeat')
+        self.conductor_manager.membership.heartbeat(heartbeats)
+        self.mox.ReplayAll()
+        self.conductor.service_heartbeats(self.context, heartbeats)
+
+    def test_service_membership(self):
+        self.mox.StubOutWithMock(self.conductor_manager.membership,
+                                 'snapshot')
+        self.conductor_manager.membership.snapshot(
+            self.context.elevated()).AndReturn(
+                [['compute', 'fake-host', 1.5]])
+        self.mox.ReplayAll()
+        result = self.conductor.service_membership(self.context)
+        self.assertEqual([['compute', 'fake-host', 1.5]], result)
+
 
 class ConductorAPITestCase(_BaseTestCase, test.TestCase):
     """Conductor API Tests."""
@@ -32,6 +32,8 @@ CONF.import_opt('network_size', 'nova.network.manager')
 CONF.import_opt('num_networks', 'nova.network.manager')
 CONF.import_opt('floating_ip_dns_manager', 'nova.network.floating_ips')
 CONF.import_opt('instance_dns_manager', 'nova.network.floating_ips')
+CONF.import_opt('periodic_task_jitter', 'nova.manager')
+CONF.import_opt('periodic_task_pool_size', 'nova.manager')
 CONF.import_opt('policy_file', 'nova.policy')
 CONF.import_opt('compute_driver', 'nova.virt.driver')
 CONF.import_opt('api_paste_config', 'nova.wsgi')
@@ -59,6 +61,8 @@ class ConfFixture(fixtures.Fixture):
         self.conf.set_default('lock_path', None)
         self.conf.set_default('network_size', 8)
         self.conf.set_default('num_networks', 2)
+        self.conf.set_default('periodic_task_jitter', 0)
+        self.conf.set_default('periodic_task_pool_size', 0)
         self.conf.set_default('rpc_backend',
                               'nova.openstack.common.rpc.impl_fake')
         self.conf.set_default('rpc_cast_timeout', 5)
@@ -288,6 +288,92 @@ class LinuxNetworkTestCase(test.TestCase):
 
         self.driver.update_dhcp(self.context, "eth0", networks[0])
 
+    def _stub_incremental_dhcp(self, delay=0):
+        self.flags(dhcp_hosts_incremental=True,
+                   dhcp_hosts_update_delay=delay)
+        self.stubs.Set(linux_net, 'dhcp_host_tables', {})
+        self.queries = []
+        self.written = []
+
+        def fake_get_associated(context, network_id, host=None,
+                                address=None):
+            self.queries.append(address)
+            return get_associated(context, network_id, host, address)
+
+        def fake_write_to_file(path, data, mode='w'):
+            self.written.append(data)
+
+        self.stubs.Set(db, 'network_get_associated_fixed_ips',
+                       fake_get_associated)
+        self.stubs.Set(linux_net, 'write_to_file', fake_write_to_file)
+        self.stubs.Set(linux_net, 'restart_dhcp', lambda *args: None)
+
+    def _release_fixed_ip(self, index):
+        fixed_ips[index]['allocated'] = False
+        self.addCleanup(fixed_ips[index].__setitem__, 'allocated', True)
+        return fixed_ips[index]['address']
+
+    def test_update_dhcp_incremental(self):
+        self._stub_incremental_dhcp()
+        full_hosts = self.driver.get_dhcp_hosts(self.context, networks[0])
+
+        self.driver.update_dhcp(self.context, "eth0", networks[0],
+                                address='192.168.0.100')
+        address = self._release_fixed_ip(4)
+        self.driver.update_dhcp(self.context, "eth0", networks[0],
+                                address=address)
+        fixed_ips[4]['allocated'] = True
+        self.driver.update_dhcp(self.context, "eth0", networks[0],
+                                address=address)
+
+        # only the first update reads the whole network
+        self.assertEqual(self.queries, [None, None, address, address])
+        self.assertEqual(self.written[0], full_hosts)
+        self.assertFalse('192.168.0.102' in self.written[1])
+        self.assertEqual(sorted(self.written[2].split('\n')),
+                         sorted(full_hosts.split('\n')))
+
+    def test_update_dhcp_incremental_resync(self):
+        self._stub_incremental_dhcp()
+        self.driver.update_dhcp(self.context, "eth0", networks[0])
+
+        # releasing an ip the table never had means it is out of date
+        self.driver.update_dhcp(self.context, "eth0", networks[0],
+                                address='192.168.0.250')
+        self.assertEqual(self.queries, [None, '192.168.0.250', None])
+
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        self.driver.update_dhcp(self.context, "eth0", networks[0])
+        self.queries = []
+        timeutils.advance_time_seconds(CONF.dhcp_hosts_resync_interval)
+        self.driver.update_dhcp(self.context, "eth0", networks[0],
+                                address='192.168.0.100')
+        self.assertEqual(self.queries, [None])
+
+    def test_update_dhcp_incremental_debounced(self):
+        self._stub_incremental_dhcp(delay=0.5)
+        spawned = []
+        self.stubs.Set(linux_net.greenthread, 'spawn_after',
+                       lambda *args: spawned.append(args))
+
+        self.driver.update_dhcp(self.context, "eth0", networks[0])
+        self.assertEqual(len(self.written), 1)
+
+        self.driver.update_dhcp(self.context, "eth0", networks[0],
+                                address=self._release_fixed_ip(0))
+        self.driver.update_dhcp(self.context, "eth0", networks[0],
+                                address=self._release_fixed_ip(4))
+        self.assertEqual(len(self.written), 1)
+        self.assertEqual(len(spawned), 1)
+
+        delay, func, dev = spawned[0]
+        self.assertEqual(delay, 0.5)
+        func(dev)
+        self.assertEqual(self.written[1],
+                         self.driver.get_dhcp_hosts(self.context,
+                                                    networks[0]))
+
     def test_get_dhcp_hosts_for_nw00(self):
         self.flags(use_single_default_gateway=True)
 
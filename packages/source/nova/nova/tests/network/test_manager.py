@@ -16,6 +16,8 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import datetime
+
 import fixtures
 import mox
 from oslo.config import cfg
@@ -25,6 +27,7 @@ from nova import db
 from nova.db.sqlalchemy import models
 from nova import exception
 from nova import ipv6
+from nova.network import fixed_ip_blocks
 from nova.network import floating_ips
 from nova.network import linux_net
 from nova.network import manager as network_manager
@@ -34,6 +37,7 @@ from nova.openstack.common import importutils
 from nova.openstack.common import log as logging
 from nova.openstack.common import rpc
 from nova.openstack.common.rpc import common as rpc_common
+from nova.openstack.common import timeutils
 from nova import quota
 from nova import test
 from nova.tests import fake_ldap
@@ -1121,7 +1125,7 @@ class VlanNetworkTestCase(test.TestCase):
         def network_get(_context, network_id, project_only="allow_none"):
             return networks[network_id]
 
-        def teardown_network_on_host(_context, network):
+        def teardown_network_on_host(_context, network, address=None):
             if network['id'] == 0:
                 raise test.TestingException()
 
@@ -1951,6 +1955,68 @@ class AllocateTestCase(test.TestCase):
                           host=inst['host'], vpn=None, rxtx_factor=3,
                           project_id=project_id, macs=available_macs)
 
+    def test_allocate_for_instance_from_claimed_block(self):
+        self.flags(fixed_ip_claim_block_size=4)
+        self.network = self.start_service('network', host='blockhost')
+        inst = db.instance_create(self.context, {'host': self.compute.host,
+                                                 'display_name': HOST,
+                                                 'instance_type_id': 1})
+        networks = db.network_get_all(self.context)
+        for network in networks:
+            db.network_update(self.context, network['id'],
+                              {'host': self.network.host})
+        project_id = self.context.project_id
+        nw_info = self.network.allocate_for_instance(self.context,
+            instance_id=inst['id'], instance_uuid=inst['uuid'],
+            host=inst['host'], vpn=None, rxtx_factor=3,
+            project_id=project_id, macs=None)
+        fixed_ip = nw_info.fixed_ips()[0]['address']
+        self.assertTrue(utils.is_valid_ipv4(fixed_ip))
+        blocks = self.network.manager.fixed_ip_blocks
+        self.assertEqual(blocks.get_stats(), {'blocks': 1,
+                                              'claimed': 4,
+                                              'allocated': 1,
+                                              'lost': 0,
+                                              'free': 3})
+        claimed = [fixed_ip_ref for fixed_ip_ref
+                   in db.fixed_ip_get_all(self.context)
+                   if fixed_ip_ref['claimed_by'] == blocks.claimed_by]
+        self.assertEqual(len(claimed), 3)
+
+        self.network.manager.cleanup_host()
+        self.assertEqual(blocks.get_stats()['free'], 0)
+        self.assertFalse([fixed_ip_ref for fixed_ip_ref
+                          in db.fixed_ip_get_all(self.context)
+                          if fixed_ip_ref['claimed_by']])
+
+    def test_claimed_blocks_renewed(self):
+        self.flags(fixed_ip_claim_block_size=4)
+        self.network = self.start_service('network', host='blockhost')
+        inst = db.instance_create(self.context, {'host': self.compute.host,
+                                                 'display_name': HOST,
+                                                 'instance_type_id': 1})
+        network = db.network_get_all(self.context)[0]
+        ctxt = context.get_admin_context()
+        blocks = self.network.manager.fixed_ip_blocks
+        blocks.associate(ctxt, network['id'], inst['uuid'])
+
+        self.addCleanup(timeutils.clear_time_override)
+        timeutils.set_time_override(timeutils.utcnow() +
+                                    datetime.timedelta(seconds=100))
+        self.network.manager._renew_fixed_ip_claims(ctxt)
+        claimed_at = [fixed_ip_ref['claimed_at'] for fixed_ip_ref
+                      in db.fixed_ip_get_all(self.context)
+                      if fixed_ip_ref['claimed_by'] == blocks.claimed_by]
+        self.assertEqual(claimed_at, [timeutils.utcnow()] * 3)
+
+    def test_block_taken_while_claiming(self):
+        blocks = fixed_ip_blocks.BlockAllocator(db, 'blockhost', 4)
+        # Others took the whole block before we got back to it
+        self.stubs.Set(blocks, '_claim_block',
+                       lambda context, network_id: None)
+        self.assertRaises(exception.NoMoreFixedIps, blocks.associate,
+                          self.context, 1, 'fake_uuid')
+
 
 class FloatingIPTestCase(test.TestCase):
     """Tests nova.network.manager.FloatingIP."""
@@ -254,7 +254,8 @@ class HostFiltersTestCase(test.TestCase):
                 ['nova.scheduler.filters.all_filters'])
         self.class_map = {}
         for cls in classes:
-            self.class_map[cls.__name__] = cls
+            # Import the filters, for the options they register
+            self.class_map[cls.__name__] = cls.resolve()
 
     def test_standard_filters_is_deprecated(self):
         info = {'called': False}
@@ -20,6 +20,7 @@ Tests For Scheduler
 """
 
 import mox
+from oslo.config import cfg
 
 from nova.compute import api as compute_api
 from nova.compute import instance_types
@@ -46,6 +47,9 @@ from nova.tests import matchers
 from nova.tests.scheduler import fakes
 from nova import utils
 
+CONF = cfg.CONF
+CONF.import_opt('ram_allocation_ratio', 'nova.scheduler.filters.ram_filter')
+
 
 class SchedulerManagerTestCase(test.TestCase):
     """Test case for scheduler manager."""
@@ -0,0 +1,212 @@
+# Copyright 2013 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import datetime
+
+from nova import context
+from nova import db
+from nova.openstack.common import timeutils
+from nova import servicegroup
+from nova.servicegroup import membership
+from nova import test
+
+
+class FakeService(object):
+
+    def __init__(self, service_ref, report_interval=10):
+        self.service_ref = service_ref
+        self.topic = service_ref['topic']
+        self.host = service_ref['host']
+        self.report_interval = report_interval
+
+
+class MembershipTestCase(test.TestCase):
+
+    def setUp(self):
+        super(MembershipTestCase, self).setUp()
+        self.ctxt = context.get_admin_context()
+        self.membership = membership.Membership(db)
+        self.now = timeutils.utcnow()
+        timeutils.set_time_override(self.now)
+        self.addCleanup(timeutils.clear_time_override)
+
+    def _create_service(self, host, topic='compute'):
+        return db.service_create(self.ctxt, {'host': host, 'topic': topic,
+                                             'binary': 'nova-' + topic,
+                                             'report_count': 0})
+
+    def _heartbeat(self, service, report_count=1):
+        return {'topic': service['topic'], 'host': service['host'],
+                'service_id': service['id'], 'report_count': report_count}
+
+    def test_snapshot(self):
+        service1 = self._create_service('host1')
+        timeutils.advance_time_seconds(20)
+        service2 = self._create_service('host2')
+        self.membership.heartbeat([self._heartbeat(service2)])
+        timeutils.advance_time_seconds(5)
+
+        # host1 only comes from the database
+        self.assertEqual(sorted([['compute', 'host1', 25.0],
+                                 ['compute', 'host2', 5.0]]),
+                         sorted(self.membership.snapshot(self.ctxt)))
+
+        self.membership.heartbeat([self._heartbeat(service1)])
+        self.assertEqual(sorted([['compute', 'host1', 0.0],
+                                 ['compute', 'host2', 5.0]]),
+                         sorted(self.membership.snapshot(self.ctxt)))
+
+    def test_persist(self):
+        service = self._create_service('host1')
+        timeutils.advance_time_seconds(20)
+        self.membership.heartbeat([self._heartbeat(service, 7)])
+
+        self.mox.StubOutWithMock(db, 'service_update')
+        db.service_update(self.ctxt, service['id'],
+                          {'report_count': 7,
+                           'updated_at': timeutils.utcnow()})
+        self.mox.ReplayAll()
+        self.membership.persist(self.ctxt)
+        # Nothing new to save
+        self.membership.persist(self.ctxt)
+
+    def test_persist_deleted_service(self):
+        service = self._create_service('host1')
+        self.membership.heartbeat([self._heartbeat(service)])
+        db.service_destroy(self.ctxt, service['id'])
+
+        self.membership.persist(self.ctxt)
+        self.membership.loaded = True
+        self.assertEqual([], self.membership.snapshot(self.ctxt))
+
+
+class ConductorServiceGroupTestCase(test.TestCase):
+
+    def setUp(self):
+        super(ConductorServiceGroupTestCase, self).setUp()
+        self.flags(service_down_time=60)
+        self.conductor = self.start_service(
+            'conductor', manager='nova.conductor.manager.ConductorManager')
+        servicegroup.API._driver = None
+        self.flags(servicegroup_driver='conductor')
+        self.servicegroup_api = servicegroup.API()
+        self.driver = self.servicegroup_api._driver
+        self.ctxt = context.get_admin_context()
+        self.now = timeutils.utcnow()
+        timeutils.set_time_override(self.now)
+        self.addCleanup(timeutils.clear_time_override)
+        self.addCleanup(setattr, servicegroup.API, '_driver', None)
+
+    def _create_service(self, host, topic='compute'):
+        return db.service_create(self.ctxt, {'host': host, 'topic': topic,
+                                             'binary': 'nova-' + topic,
+                                             'report_count': 3})
+
+    def test_join_and_leave(self):
+        service1 = FakeService(self._create_service('host1'))
+        service2 = FakeService(self._create_service('host2'))
+        heartbeat1 = self.servicegroup_api.join('host1', 'compute', service1)
+        heartbeat2 = self.servicegroup_api.join('host2', 'compute', service2)
+        pulse = self.driver.pulse
+        self.assertNotEqual(None, pulse)
+
+        heartbeat1.stop()
+        self.assertEqual([heartbeat2], self.driver.heartbeats)
+        self.assertEqual(pulse, self.driver.pulse)
+        heartbeat2.stop()
+        self.assertEqual(None, self.driver.pulse)
+
+    def test_report_state_sends_all_heartbeats_at_once(self):
+        service_ref1 = self._create_service('host1')
+        service_ref2 = self._create_service('host2')
+        for service_ref in (service_ref1, service_ref2):
+            heartbeat = self.driver.join(service_ref['host'], 'compute',
+                                         FakeService(service_ref))
+            self.addCleanup(heartbeat.stop)
+
+        calls = []
+        self.stubs.Set(self.driver.conductor_rpcapi, 'service_heartbeats',
+                       lambda ctxt, heartbeats: calls.append(heartbeats))
+        self.driver._report_state()
+        self.assertEqual([[{'topic': 'compute', 'host': 'host1',
+                            'service_id': service_ref1['id'],
+                            'report_count': 4},
+                           {'topic': 'compute', 'host': 'host2',
+                            'service_id': service_ref2['id'],
+                            'report_count': 4}]], calls)
+
+    def test_is_up_and_get_all(self):
+        service_ref1 = self._create_service('host1')
+        service_ref2 = self._create_service('host2')
+        heartbeat = self.driver.join('host1', 'compute',
+                                     FakeService(service_ref1))
+        self.addCleanup(heartbeat.stop)
+
+        timeutils.advance_time_seconds(120)
+        # Goes through the conductor service
+        self.driver._report_state()
+        self.assertTrue(self.servicegroup_api.service_is_up(service_ref1))
+        self.assertFalse(self.servicegroup_api.service_is_up(service_ref2))
+        self.assertEqual(['host1'], self.servicegroup_api.get_all('compute'))
+        self.assertEqual([], self.servicegroup_api.get_all('network'))
+
+        # The heartbeats were not written to the database
+        service_ref1 = db.service_get(self.ctxt, service_ref1['id'])
+        self.assertEqual(3, service_ref1['report_count'])
+        self.conductor.manager._persist_service_heartbeats(self.ctxt)
+        service_ref1 = db.service_get(self.ctxt, service_ref1['id'])
+        self.assertEqual(4, service_ref1['report_count'])
+        self.assertEqual(self.now + datetime.timedelta(seconds=120),
+                         service_ref1['updated_at'])
+
+    def test_snapshot_staleness(self):
+        self.flags(servicegroup_snapshot_staleness=10)
+        service_ref = self._create_service('host1')
+        calls = []
+        orig_membership = self.driver.conductor_rpcapi.service_membership
+
+        def fake_service_membership(ctxt):
+            calls.append(ctxt)
+            return orig_membership(ctxt)
+
+        self.stubs.Set(self.driver.conductor_rpcapi, 'service_membership',
+                       fake_service_membership)
+
+        self.assertTrue(self.servicegroup_api.service_is_up(service_ref))
+        timeutils.advance_time_seconds(10)
+        self.assertTrue(self.servicegroup_api.service_is_up(service_ref))
+        self.assertEqual(1, len(calls))
+        # Still counts the time since the snapshot was fetched
+        timeutils.advance_time_seconds(55)
+        self.assertFalse(self.servicegroup_api.service_is_up(service_ref))
+        self.assertEqual(2, len(calls))
+
+    def test_falls_back_to_database(self):
+        service_ref = self._create_service('host1')
+        calls = []
+
+        def fake_service_membership(ctxt):
+            calls.append(ctxt)
+            raise test.TestingException()
+
+        self.stubs.Set(self.driver.conductor_rpcapi, 'service_membership',
+                       fake_service_membership)
+
+        self.assertTrue(self.servicegroup_api.service_is_up(service_ref))
+        self.assertEqual(['host1'], self.servicegroup_api.get_all('compute'))
+        # Not asked again right away
+        self.assertEqual(1, len(calls))
+        timeutils.advance_time_seconds(120)
+        self.assertFalse(self.servicegroup_api.service_is_up(service_ref))
+        self.assertEqual(2, len(calls))
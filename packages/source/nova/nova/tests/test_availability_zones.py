@@ -155,3 +155,14 @@ class AvailabilityZoneTestCases(test.TestCase):
 
         self.assertEquals(zones, ['nova-test', 'nova-test2'])
         self.assertEquals(not_zones, ['nova-test3', 'nova'])
+
+    def test_get_hosts_availability_zones(self):
+        """Test get right availability zones for many hosts."""
+        service = self._create_service_with_topic('compute', self.host)
+        self._add_to_aggregate(service, self.agg)
+
+        zones = az.get_hosts_availability_zones(self.context,
+                                                [self.host, 'other', None])
+        self.assertEquals(zones, {self.host: self.availability_zone,
+                                  'other': self.default_az,
+                                  None: self.default_az})
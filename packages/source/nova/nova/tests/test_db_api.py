@@ -128,6 +128,24 @@ class DbApiTestCase(DbTestCase):
         check_exc_format(db.get_ec2_instance_id_by_uuid)
         check_exc_format(db.get_instance_uuid_by_ec2_id)
 
+    def test_get_ec2_instance_ids_by_uuids(self):
+        ref1 = db.ec2_instance_create(self.context, 'fake-uuid-1')
+        ref2 = db.ec2_instance_create(self.context, 'fake-uuid-2')
+        ids = db.get_ec2_instance_ids_by_uuids(self.context,
+                ['fake-uuid-1', 'fake-uuid-2', 'fake-uuid-3'])
+        self.assertEqual(ids, {'fake-uuid-1': ref1['id'],
+                               'fake-uuid-2': ref2['id']})
+        self.assertEqual({}, db.get_ec2_instance_ids_by_uuids(self.context,
+                                                              []))
+
+    def test_s3_image_get_ids_by_uuids(self):
+        ref1 = db.s3_image_create(self.context, 'fake-image-1')
+        ref2 = db.s3_image_create(self.context, 'fake-image-2')
+        ids = db.s3_image_get_ids_by_uuids(self.context,
+                ['fake-image-1', 'fake-image-2', 'fake-image-3'])
+        self.assertEqual(ids, {'fake-image-1': ref1['id'],
+                               'fake-image-2': ref2['id']})
+
     def test_instance_get_all_with_meta(self):
         inst = self.create_instances_with_args()
         fake_meta, fake_sys = self.create_metadata_for_instance(inst['uuid'])
@@ -593,6 +611,115 @@ class DbApiTestCase(DbTestCase):
         expected = {uuids[0]: [], uuids[1]: []}
         self.assertEqual(expected, instance_faults)
 
+    def test_instance_fault_get_latest_by_instance_uuids(self):
+        ctxt = context.get_admin_context()
+        instance1 = db.instance_create(ctxt, {})
+        instance2 = db.instance_create(ctxt, {})
+        instance3 = db.instance_create(ctxt, {})
+        uuids = [instance1['uuid'], instance2['uuid'], instance3['uuid']]
+
+        def _fault(uuid, code, created_at):
+            return db.instance_fault_create(ctxt, {
+                'message': 'message',
+                'details': 'detail',
+                'instance_uuid': uuid,
+                'code': code,
+                'created_at': created_at})
+
+        old = datetime.datetime(2013, 1, 1)
+        new = datetime.datetime(2013, 1, 2)
+        _fault(uuids[0], 404, old)
+        fault2 = _fault(uuids[0], 500, new)
+        _fault(uuids[1], 404, new)
+        _fault(uuids[1], 500, old)
+        # Faults recorded at the same instant are ordered by id
+        _fault(uuids[1], 400, new)
+        fault6 = _fault(uuids[1], 409, new)
+
+        faults = db.instance_fault_get_latest_by_instance_uuids(ctxt, uuids)
+
+        self.assertEqual(faults, {uuids[0]: fault2, uuids[1]: fault6})
+
+    def test_instance_fault_get_latest_by_instance_uuids_empty(self):
+        ctxt = context.get_admin_context()
+        self.assertEqual({},
+            db.instance_fault_get_latest_by_instance_uuids(ctxt, []))
+
+    def test_query_count_on_request_context(self):
+        ctxt = context.RequestContext('fake', 'fake')
+        self.assertEqual(0, ctxt.db_query_count)
+        db.instance_get_all_by_filters(ctxt, {})
+        queries = ctxt.db_query_count
+        self.assertTrue(queries > 0)
+        db.instance_get_all_by_filters(ctxt, {})
+        self.assertEqual(2 * queries, ctxt.db_query_count)
+
+        # Queries are only counted against the current context
+        other = context.RequestContext('fake', 'fake')
+        db.instance_get_all_by_filters(ctxt, {})
+        self.assertEqual(2 * queries, ctxt.db_query_count)
+        self.assertEqual(queries, other.db_query_count)
+
+    def test_statement_metrics(self):
+        db_session.reset_metrics()
+        ctxt = context.get_admin_context()
+        db.compute_node_get_all(ctxt)
+        db.compute_node_get_all(ctxt)
+
+        metrics = db_session.get_metrics()['statements']
+        self.assertEqual(['all'], metrics.keys())
+        self.assertEqual(2, metrics['all']['count'])
+
+    def test_statement_metrics_by_api_function(self):
+        self.flags(sql_statement_metrics_by_function=True)
+        db_session.reset_metrics()
+        ctxt = context.get_admin_context()
+        db.instance_get_all_by_filters(ctxt, {})
+        db.compute_node_get_all(ctxt)
+
+        metrics = db_session.get_metrics()['statements']
+        self.assertTrue('instance_get_all_by_filters' in metrics)
+        stats = metrics['compute_node_get_all']
+        self.assertEqual(1, stats['count'])
+        self.assertEqual(1, sum(stats['buckets']))
+        self.assertEqual(len(db_session.STATEMENT_TIME_BUCKETS) + 1,
+                         len(stats['buckets']))
+        self.assertEqual(stats['total_time'], stats['average_time'])
+
+    def test_statement_metrics_other_api_module(self):
+        self.flags(sql_statement_metrics_by_function=True,
+                   sql_api_module_suffix='.db.other.api')
+        db_session.reset_metrics()
+        db.compute_node_get_all(context.get_admin_context())
+        self.assertEqual(['unknown'],
+                         db_session.get_metrics()['statements'].keys())
+
+    def test_use_slave(self):
+        slave_sessions = []
+
+        def fake_get_session(slave_session=False):
+            slave_sessions.append(slave_session)
+            return get_session(slave_session=slave_session)
+
+        self.stubs.Set(sqlalchemy_api, 'get_session', fake_get_session)
+        ctxt = context.get_admin_context()
+        db.compute_node_get_all(ctxt, use_slave=True)
+        db.instance_get_all_by_filters(ctxt, {}, use_slave=True)
+        db.compute_node_get_all(ctxt)
+        self.assertEqual([True, True, False], slave_sessions[:2] +
+                         slave_sessions[-1:])
+
+    def test_slave_engine(self):
+        # Without a slave connection the master is used
+        self.assertTrue(get_engine(slave_engine=True) is get_engine())
+
+        self.flags(sql_slave_connection='sqlite://')
+        self.addCleanup(setattr, db_session, '_SLAVE_ENGINE', None)
+        self.addCleanup(setattr, db_session, '_SLAVE_MAKER', None)
+        slave_engine = get_engine(slave_engine=True)
+        self.assertFalse(slave_engine is get_engine())
+        self.assertTrue(get_session(slave_session=True).bind is slave_engine)
+
     def test_instance_action_start(self):
         """Create an instance action."""
         ctxt = context.get_admin_context()
@@ -978,6 +1105,11 @@ class DbApiTestCase(DbTestCase):
         self.assertEqual(record['vif_address'], vif['address'])
         data = db.network_get_associated_fixed_ips(ctxt, 1, 'nothing')
         self.assertEqual(len(data), 0)
+        data = db.network_get_associated_fixed_ips(ctxt, 1,
+                                                   address=fixed_address)
+        self.assertEqual([r['address'] for r in data], [fixed_address])
+        data = db.network_get_associated_fixed_ips(ctxt, 1, address='qux')
+        self.assertEqual(len(data), 0)
 
     def test_network_get_all_by_host(self):
         ctxt = context.get_admin_context()
@@ -1352,6 +1484,27 @@ class AggregateDBApiTestCase(test.TestCase):
                                                key='good')
         self.assertFalse('good' in r2)
 
+    def test_aggregate_metadata_get_by_hosts(self):
+        ctxt = context.get_admin_context()
+        _create_aggregate_with_hosts(context=ctxt,
+                hosts=['foo.openstack.org', 'bar.openstack.org'])
+        _create_aggregate_with_hosts(context=ctxt,
+                values={'name': 'fake_aggregate2'},
+                hosts=['bar.openstack.org'],
+                metadata={'availability_zone': 'other_zone'})
+        r1 = db.aggregate_metadata_get_by_hosts(ctxt,
+                ['foo.openstack.org', 'bar.openstack.org', 'baz'])
+        self.assertEqual(r1['foo.openstack.org'],
+                db.aggregate_metadata_get_by_host(ctxt, 'foo.openstack.org'))
+        self.assertEqual(r1['bar.openstack.org']['availability_zone'],
+                         set(['fake_avail_zone', 'other_zone']))
+        self.assertFalse('baz' in r1)
+
+        r2 = db.aggregate_metadata_get_by_hosts(ctxt, ['foo.openstack.org'],
+                                                key='availability_zone')
+        self.assertEqual(r2, {'foo.openstack.org':
+                              {'availability_zone': set(['fake_avail_zone'])}})
+
     def test_aggregate_host_get_by_metadata_key(self):
         ctxt = context.get_admin_context()
         values = {'name': 'fake_aggregate2'}
@@ -2008,6 +2161,102 @@ class TestIpAllocation(test.TestCase):
         self.assertEqual(fixed_ip['instance_uuid'], self.instance['uuid'])
         self.assertEqual(fixed_ip['network_id'], self.network['id'])
 
+    def test_fixed_ip_claim_block(self):
+        for i in xrange(1, 6):
+            self.create_fixed_ip(address='192.168.0.%d' % i,
+                                 network_id=self.network['id'])
+        self.create_fixed_ip(address='192.168.0.6', reserved=True,
+                             network_id=self.network['id'])
+        self.create_fixed_ip(address='192.168.0.7',
+                             network_id=self.network['id'],
+                             instance_uuid=self.instance['uuid'])
+        first = db.fixed_ip_claim_block(self.ctxt, self.network['id'],
+                                        'host1', 3)
+        second = db.fixed_ip_claim_block(self.ctxt, self.network['id'],
+                                         'host2', 3)
+        self.assertEqual(len(first), 3)
+        self.assertEqual(len(second), 2)
+        self.assertEqual(sorted(first + second),
+                         ['192.168.0.%d' % i for i in xrange(1, 6)])
+        self.assertEqual(db.fixed_ip_claim_block(self.ctxt,
+                                                 self.network['id'],
+                                                 'host3', 3), [])
+        fixed_ip = db.fixed_ip_get_by_address(self.ctxt, first[0])
+        self.assertEqual(fixed_ip['claimed_by'], 'host1')
+
+    def test_fixed_ip_associate_claimed(self):
+        address = self.create_fixed_ip(network_id=self.network['id'])
+        db.fixed_ip_claim_block(self.ctxt, self.network['id'], 'host1', 1)
+        self.assertFalse(db.fixed_ip_associate_claimed(
+            self.ctxt, address, self.network['id'], self.instance['uuid'],
+            'host2'))
+        self.assertTrue(db.fixed_ip_associate_claimed(
+            self.ctxt, address, self.network['id'], self.instance['uuid'],
+            'host1'))
+        fixed_ip = db.fixed_ip_get_by_address(self.ctxt, address)
+        self.assertEqual(fixed_ip['instance_uuid'], self.instance['uuid'])
+        self.assertEqual(fixed_ip['claimed_by'], None)
+        self.assertFalse(db.fixed_ip_associate_claimed(
+            self.ctxt, address, self.network['id'], self.instance['uuid'],
+            'host1'))
+
+    def test_fixed_ip_release_claims(self):
+        address = self.create_fixed_ip(network_id=self.network['id'])
+        db.fixed_ip_claim_block(self.ctxt, self.network['id'], 'host1', 1)
+        self.assertEqual(db.fixed_ip_release_claims(self.ctxt, 'host1'), 1)
+        self.assertEqual(db.fixed_ip_release_claims(self.ctxt, 'host1'), 0)
+        self.assertEqual(db.fixed_ip_claim_block(self.ctxt,
+                                                 self.network['id'],
+                                                 'host2', 1), [address])
+
+    def test_fixed_ip_renew_claims(self):
+        self.flags(fixed_ip_claim_ttl=60)
+        address = self.create_fixed_ip(network_id=self.network['id'])
+        db.fixed_ip_claim_block(self.ctxt, self.network['id'], 'host1', 1)
+        self.addCleanup(timeutils.clear_time_override)
+        timeutils.set_time_override(timeutils.utcnow() +
+                                    datetime.timedelta(seconds=50))
+        self.assertEqual(db.fixed_ip_renew_claims(self.ctxt, 'host1'), 1)
+        self.assertEqual(db.fixed_ip_renew_claims(self.ctxt, 'host2'), 0)
+        timeutils.advance_time_seconds(50)
+        self.assertEqual(db.fixed_ip_claim_block(self.ctxt,
+                                                 self.network['id'],
+                                                 'host2', 1), [])
+        self.assertTrue(db.fixed_ip_associate_claimed(
+            self.ctxt, address, self.network['id'], self.instance['uuid'],
+            'host1'))
+        self.assertEqual(db.fixed_ip_renew_claims(self.ctxt, 'host1'), 0)
+
+    def test_fixed_ip_associate_pool_skips_claimed(self):
+        self.create_fixed_ip(address='192.168.0.1',
+                             network_id=self.network['id'])
+        self.create_fixed_ip(address='192.168.0.2',
+                             network_id=self.network['id'])
+        claimed = db.fixed_ip_claim_block(self.ctxt, self.network['id'],
+                                          'host1', 1)
+        address = db.fixed_ip_associate_pool(self.ctxt, self.network['id'],
+                                             self.instance['uuid'])
+        self.assertNotEqual(address, claimed[0])
+        self.assertRaises(exception.NoMoreFixedIps,
+                          db.fixed_ip_associate_pool,
+                          self.ctxt, self.network['id'],
+                          self.instance['uuid'])
+
+    def test_fixed_ip_associate_pool_takes_expired_claims(self):
+        self.flags(fixed_ip_claim_ttl=60)
+        address = self.create_fixed_ip(network_id=self.network['id'])
+        db.fixed_ip_claim_block(self.ctxt, self.network['id'], 'host1', 1)
+        timeutils.set_time_override(timeutils.utcnow() +
+                                    datetime.timedelta(seconds=61))
+        self.addCleanup(timeutils.clear_time_override)
+        self.assertEqual(db.fixed_ip_associate_pool(self.ctxt,
+                                                    self.network['id'],
+                                                    self.instance['uuid']),
+                         address)
+        self.assertFalse(db.fixed_ip_associate_claimed(
+            self.ctxt, address, self.network['id'], self.instance['uuid'],
+            'host1'))
+
 
 class InstanceDestroyConstraints(test.TestCase):
 
@@ -279,6 +279,197 @@ class ImageCacheManagerTestCase(test.TestCase):
         self.assertEquals(inuse_images, [found])
         self.assertEquals(len(image_cache_manager.unexplained_images), 0)
 
+    def _fake_backing_files(self, backing_files):
+        """Have disks backed by backing_files[disk path], counting the
+        lookups.
+        """
+        lookups = []
+
+        def fake_get_disk_backing_file(path):
+            lookups.append(path)
+            return backing_files.get(path)
+
+        self.stubs.Set(virtutils, 'get_disk_backing_file',
+                       fake_get_disk_backing_file)
+        return lookups
+
+    def test_backing_file_index(self):
+        with utils.tempdir() as tmpdir:
+            disk_1 = os.path.join(tmpdir, 'instance-1', 'disk')
+            disk_2 = os.path.join(tmpdir, 'instance-2', 'disk')
+            for disk_path in (disk_1, disk_2):
+                os.mkdir(os.path.dirname(disk_path))
+                open(disk_path, 'w').close()
+            lookups = self._fake_backing_files({disk_1: 'base1',
+                                                disk_2: 'base2'})
+            index_path = os.path.join(tmpdir, 'index.json')
+            lock_path = os.path.join(tmpdir, 'locks')
+
+            index = imagecache.BackingFileIndex(index_path, lock_path)
+            self.assertEqual('base1', index.get_backing_file(disk_1))
+            self.assertEqual('base2', index.get_backing_file(disk_2))
+            index.save()
+            self.assertEqual([disk_1, disk_2], lookups)
+
+            # Known disks are not looked up again, even after a restart
+            index = imagecache.BackingFileIndex(index_path, lock_path)
+            self.assertEqual('base1', index.get_backing_file(disk_1))
+            index.save()
+            self.assertEqual([disk_1, disk_2], lookups)
+
+            # Disks not seen during the pass are only forgotten once
+            # they are gone
+            with open(index_path) as f:
+                self.assertEqual(2, len(json.load(f)))
+            os.remove(disk_2)
+            index.get_backing_file(disk_1)
+            index.save()
+            with open(index_path) as f:
+                self.assertEqual([disk_1], json.load(f).keys())
+
+            # Only the index file is left behind
+            self.assertEqual(['index.json'],
+                             [ent for ent in os.listdir(tmpdir)
+                              if os.path.isfile(os.path.join(tmpdir, ent))])
+
+    def test_backing_file_index_forget(self):
+        with utils.tempdir() as tmpdir:
+            disk_path = os.path.join(tmpdir, 'instance-1', 'disk')
+            os.mkdir(os.path.dirname(disk_path))
+            open(disk_path, 'w').close()
+            backing_files = {disk_path: 'base1'}
+            lookups = self._fake_backing_files(backing_files)
+            index_path = os.path.join(tmpdir, 'index.json')
+
+            index = imagecache.BackingFileIndex(index_path, tmpdir)
+            index.get_backing_file(disk_path)
+            index.save()
+
+            # A rebuild onto another image keeps the path, and often
+            # the inode of the disk
+            backing_files[disk_path] = 'base2'
+            index.forget(os.path.dirname(disk_path))
+            self.assertEqual('base2', index.get_backing_file(disk_path))
+            self.assertEqual([disk_path, disk_path], lookups)
+
+            # Also when the index is loaded anew
+            index.save()
+            backing_files[disk_path] = 'base3'
+            imagecache.BackingFileIndex(index_path, tmpdir).forget(
+                os.path.dirname(disk_path))
+            index = imagecache.BackingFileIndex(index_path, tmpdir)
+            self.assertEqual('base3', index.get_backing_file(disk_path))
+
+    def test_backing_file_index_merges(self):
+        with utils.tempdir() as tmpdir:
+            disk_1 = os.path.join(tmpdir, 'instance-1', 'disk')
+            disk_2 = os.path.join(tmpdir, 'instance-2', 'disk')
+            for disk_path in (disk_1, disk_2):
+                os.mkdir(os.path.dirname(disk_path))
+                open(disk_path, 'w').close()
+            self._fake_backing_files({disk_1: 'base1', disk_2: 'base2'})
+            index_path = os.path.join(tmpdir, 'index.json')
+
+            # Both loaded the index before either wrote it
+            index_1 = imagecache.BackingFileIndex(index_path, tmpdir)
+            index_2 = imagecache.BackingFileIndex(index_path, tmpdir)
+            index_1.get_backing_file(disk_1)
+            index_2.get_backing_file(disk_2)
+            index_1.save()
+            index_2.save()
+            with open(index_path) as f:
+                self.assertEqual(sorted([disk_1, disk_2]),
+                                 sorted(json.load(f).keys()))
+
+    def _verify_pass(self, tmpdir, all_instances, use_index):
+        image_cache_manager = imagecache.ImageCacheManager()
+        if not use_index:
+            self.stubs.Set(image_cache_manager, '_get_backing_file',
+                           virtutils.get_disk_backing_file)
+        image_cache_manager.verify_base_images(None, all_instances)
+        return (sorted(image_cache_manager.active_base_files),
+                sorted(image_cache_manager.removable_base_files),
+                sorted(image_cache_manager.corrupt_base_files))
+
+    def test_verify_base_images_with_index(self):
+        hashed_1 = hashlib.sha1('1').hexdigest()
+        hashed_2 = hashlib.sha1('2').hexdigest()
+        hashed_3 = hashlib.sha1('3').hexdigest()
+
+        with utils.tempdir() as tmpdir:
+            self.flags(instances_path=tmpdir)
+            self.flags(remove_unused_base_images=False)
+            base_dir = os.path.join(tmpdir, '_base')
+            os.mkdir(base_dir)
+            for name in (hashed_1, hashed_2, hashed_3,
+                         '%s_10737418240' % hashed_1):
+                open(os.path.join(base_dir, name), 'w').close()
+
+            disks = {}
+            all_instances = []
+            for i, image in ((1, '1'), (2, '1'), (3, '2')):
+                name = 'instance-%d' % i
+                os.mkdir(os.path.join(tmpdir, name))
+                disk_path = os.path.join(tmpdir, name, 'disk')
+                open(disk_path, 'w').close()
+                hashed = hashlib.sha1(image).hexdigest()
+                disks[disk_path] = os.path.join(base_dir,
+                                                '%s_10737418240' % hashed)
+                all_instances.append({'image_ref': image,
+                                      'host': CONF.host,
+                                      'name': name,
+                                      'uuid': str(i),
+                                      'vm_state': '',
+                                      'task_state': ''})
+            lookups = self._fake_backing_files(disks)
+
+            expected = self._verify_pass(tmpdir, all_instances, False)
+            self.assertEqual(3, len(lookups))
+            self.assertEqual(expected,
+                             self._verify_pass(tmpdir, all_instances, True))
+            self.assertEqual(6, len(lookups))
+            # The next pass takes the backing files from the index
+            self.assertEqual(expected,
+                             self._verify_pass(tmpdir, all_instances, True))
+            self.assertEqual(6, len(lookups))
+
+            # instance-3 is rebuilt onto image 3, at the same disk path
+            disk_path = os.path.join(tmpdir, 'instance-3', 'disk')
+            disks[disk_path] = os.path.join(base_dir, hashed_3)
+            all_instances[2]['image_ref'] = '3'
+            imagecache.ImageCacheManager().forget_instance_disks(
+                os.path.dirname(disk_path))
+            expected = self._verify_pass(tmpdir, all_instances, False)
+            self.assertTrue(os.path.join(base_dir, hashed_3) in expected[0])
+            self.assertEqual(expected,
+                             self._verify_pass(tmpdir, all_instances, True))
+
+    def test_verify_checksum_per_pass_limit(self):
+        self.flags(checksum_base_images=True)
+        self.flags(checksum_base_images_per_pass=1)
+
+        with utils.tempdir() as tmpdir:
+            self.flags(instances_path=tmpdir)
+            self.flags(image_info_filename_pattern=('$instances_path/'
+                                                    '%(image)s.info'))
+            fname, info_fname, testdata = self._make_checksum(tmpdir)
+            other_fname = os.path.join(tmpdir, 'bbb')
+            with open(other_fname, 'w') as f:
+                f.write(testdata)
+
+            image_cache_manager = imagecache.ImageCacheManager()
+            image_cache_manager._verify_checksum('aaa', fname)
+            image_cache_manager._verify_checksum('bbb', other_fname)
+            self.assertTrue(os.path.exists(info_fname))
+            self.assertFalse(os.path.exists(
+                imagecache.get_info_filename(other_fname)))
+
+            # The next pass gets to the other image
+            image_cache_manager._reset_state()
+            image_cache_manager._verify_checksum('bbb', other_fname)
+            self.assertTrue(os.path.exists(
+                imagecache.get_info_filename(other_fname)))
+
     def test_find_base_file_nothing(self):
         self.stubs.Set(os.path, 'exists', lambda x: False)
 
@@ -861,6 +1052,9 @@ class ImageCacheManagerTestCase(test.TestCase):
 
         self.stubs.Set(os, 'remove', lambda x: remove(x))
 
+        # The lock files would live under the fake instances path
+        self.flags(disable_process_locking=True)
+
         # And finally we can make the call we're actually testing...
         # The argument here should be a context, but it is mocked out
         image_cache_manager.verify_base_images(None, all_instances)
@@ -17,6 +17,8 @@
 #    under the License.
 """Unit Tests for network code."""
 
+import fixtures
+
 from nova.network import linux_net
 from nova import test
 
@@ -253,3 +255,65 @@ class IptablesManagerTestCase(test.TestCase):
                                                self.manager.ipv4['filter'],
                                                'filter')
         self.assertEqual(current_lines, new_lines)
+
+    def test_top_rule_keeps_existing_counts(self):
+        current_lines = list(self.sample_filter)
+        current_lines[12] = '[42:4242] -A FORWARD -j nova-filter-top'
+        new_lines = self.manager._modify_rules(current_lines,
+                                               self.manager.ipv4['filter'],
+                                               'filter')
+        self.assertTrue('[42:4242] -A FORWARD -j nova-filter-top'
+                        in new_lines)
+        self.assertFalse('[0:0] -A FORWARD -j nova-filter-top' in new_lines)
+
+    def test_remove_unwrapped_rules_and_chains(self):
+        current_lines = list(self.sample_filter)
+        table = self.manager.ipv4['filter']
+        table.add_rule('FORWARD', '-i virbr0 -o virbr0 -j ACCEPT',
+                       wrap=False)
+        table.remove_rule('FORWARD', '-i virbr0 -o virbr0 -j ACCEPT',
+                          wrap=False)
+        table.remove_chain('nova-filter-top', wrap=False)
+        new_lines = self.manager._modify_rules(current_lines, table,
+                                               'filter')
+        self.assertFalse('[0:0] -A FORWARD -i virbr0 -o virbr0 -j ACCEPT'
+                         in new_lines)
+        self.assertFalse(':nova-filter-top - [0:0]' in new_lines)
+        self.assertEqual(table.remove_rules, [])
+        self.assertEqual(table.remove_chains, set())
+
+    def _fake_execute(self, tables):
+        self.executes = []
+        self.inputs = []
+
+        def fake_execute(*cmd, **kwargs):
+            self.executes.append(cmd)
+            if cmd[0].endswith('-save'):
+                return '\n'.join(tables), ''
+            self.inputs.append(kwargs['process_input'])
+            return '', ''
+        return fake_execute
+
+    def test_incremental_apply(self):
+        lock_path = self.useFixture(fixtures.TempDir()).path
+        self.flags(iptables_incremental_apply=True, lock_path=lock_path,
+                   use_ipv6=False)
+        self.manager.execute = self._fake_execute(self.sample_filter +
+                                                  self.sample_nat)
+        self.manager.apply()
+        self.assertEqual(self.executes, [('iptables-save', '-c'),
+                                         ('iptables-restore', '-c')])
+
+        # Nothing changed, so nothing is saved or restored
+        self.executes = []
+        self.manager.apply()
+        self.assertEqual(self.executes, [])
+
+        # Only the changed table is restored
+        self.manager.ipv4['nat'].add_rule('float-snat',
+                                          '-s 10.0.0.1 -j SNAT --to 1.2.3.4')
+        self.manager.apply()
+        self.assertEqual(len(self.inputs), 2)
+        self.assertTrue('*nat' in self.inputs[1])
+        self.assertFalse('*filter' in self.inputs[1])
+        self.assertTrue('-s 10.0.0.1 -j SNAT --to 1.2.3.4' in self.inputs[1])
@@ -0,0 +1,116 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for converting values to primitives with jsonutils."""
+
+import datetime
+
+from nova.openstack.common import jsonutils
+from nova.openstack.common import timeutils
+from nova import test
+
+
+class MyDict(dict):
+    pass
+
+
+class MyList(list):
+    pass
+
+
+class MyDatetime(datetime.datetime):
+    pass
+
+
+class Node(object):
+    def __init__(self, child=None):
+        self.child = child
+
+
+class ToPrimitiveTestCase(test.TestCase):
+
+    def test_simple_values(self):
+        value = {'a': [1, 2L, 3.0, u'four', 'five', True, None],
+                 'b': (6, 7)}
+        self.assertEqual({'a': [1, 2L, 3.0, u'four', 'five', True, None],
+                          'b': [6, 7]},
+                         jsonutils.to_primitive(value))
+
+    def test_datetime(self):
+        now = datetime.datetime(2013, 6, 1, 12, 30, 0)
+        self.assertEqual(timeutils.strtime(now),
+                         jsonutils.to_primitive(now))
+        self.assertEqual(now,
+                         jsonutils.to_primitive(now, convert_datetime=False))
+
+    def test_self_referencing_dict(self):
+        value = {'a': 1}
+        value['self'] = value
+        self.assertEqual({'a': 1, 'self': '?'},
+                         jsonutils.to_primitive(value))
+
+    def test_self_referencing_list(self):
+        value = [1]
+        value.append(value)
+        self.assertEqual([1, '?'], jsonutils.to_primitive(value))
+
+    def test_shared_values_converted_every_time(self):
+        shared = {'b': [1, 2]}
+        value = {'x': shared, 'y': [shared, shared]}
+        self.assertEqual({'x': {'b': [1, 2]},
+                          'y': [{'b': [1, 2]}, {'b': [1, 2]}]},
+                         jsonutils.to_primitive(value))
+
+    def test_subclasses(self):
+        now = MyDatetime(2013, 6, 1, 12, 30, 0)
+        value = MyDict(a=MyList([1, now]))
+        result = jsonutils.to_primitive(value)
+        self.assertEqual({'a': [1, timeutils.strtime(now)]}, result)
+        self.assertEqual(dict, type(result))
+        self.assertEqual(list, type(result['a']))
+
+    def test_self_referencing_subclasses(self):
+        value = MyDict(a=MyList([1]))
+        value['a'].append(value['a'])
+        value['self'] = value
+        self.assertEqual({'a': [1, '?'], 'self': '?'},
+                         jsonutils.to_primitive(value))
+
+    def test_instances_not_converted(self):
+        node = Node()
+        self.assertEqual(node, jsonutils.to_primitive(node))
+
+    def test_convert_instances(self):
+        value = [Node(Node())]
+        self.assertEqual([{'child': {'child': None}}],
+                         jsonutils.to_primitive(value,
+                                                convert_instances=True))
+
+    def test_max_depth(self):
+        node = Node(Node(Node(Node(Node()))))
+        self.assertEqual({'child': '?'},
+                         jsonutils.to_primitive(node, convert_instances=True,
+                                                max_depth=1))
+        self.assertEqual({'child': {'child': {'child': '?'}}},
+                         jsonutils.to_primitive(node, convert_instances=True))
+
+    def test_self_referencing_instance(self):
+        node = Node()
+        node.child = node
+        # Only the depth stops these
+        self.assertEqual({'child': {'child': {'child': '?'}}},
+                         jsonutils.to_primitive(node, convert_instances=True))
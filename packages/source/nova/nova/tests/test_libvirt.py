@@ -4632,7 +4632,8 @@ disk size: 4.4M''', ''))
         self.stubs.Set(utils, 'execute', fake_execute)
         self.stubs.Set(os, 'rename', fake_rename)
         self.stubs.Set(os, 'unlink', fake_unlink)
-        self.stubs.Set(images, 'fetch', lambda *_: None)
+        self.stubs.Set(images, 'fetch_and_inspect',
+                       lambda context, href, path: path.split('.')[-2])
         self.stubs.Set(images, 'qemu_img_info', fake_qemu_img_info)
         self.stubs.Set(utils, 'delete_if_exists', fake_rm_on_errror)
 
@@ -5140,3 +5141,20 @@ class LibvirtNonblockingTestCase(test.TestCase):
         import nova.virt.libvirt.driver as libvirt_driver
         connection = libvirt_driver.LibvirtDriver('')
         jsonutils.to_primitive(connection._conn, convert_instances=True)
+
+    def test_thread_pool_stats_logged(self):
+        import nova.virt.libvirt.driver as libvirt_driver
+        connection = libvirt_driver.LibvirtDriver('')
+        self.stubs.Set(connection, 'get_local_gb_info',
+                       lambda: {'total': 10, 'used': 0, 'free': 10})
+        for name in ('get_vcpu_total', 'get_memory_mb_total',
+                     'get_vcpu_used', 'get_memory_mb_used',
+                     'get_hypervisor_type', 'get_hypervisor_version',
+                     'get_hypervisor_hostname', 'get_cpu_info',
+                     'get_disk_over_committed_size_total'):
+            self.stubs.Set(connection, name, lambda: 0)
+        logged = []
+        self.stubs.Set(libvirt_driver.LOG, 'debug',
+                       lambda msg, *args: logged.append(args))
+        connection.get_available_resource(None)
+        self.assertEqual([(connection._thread_pool.get_stats(),)], logged)
@@ -0,0 +1,150 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import time
+
+import eventlet
+from eventlet import patcher
+
+from nova import test
+from nova.virt.libvirt import threadpool
+
+native_Queue = patcher.original("Queue")
+native_threading = patcher.original("threading")
+native_time = patcher.original("time")
+
+
+class FakeDomain:
+    """Old-style, like the classes of the libvirt bindings."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def info(self):
+        return [1, native_threading.current_thread().name]
+
+    def lookup(self, name):
+        return FakeDomain(name)
+
+    def fail(self):
+        raise test.TestingException()
+
+    def __str__(self):
+        return 'domain %s' % self.name
+
+
+class ThreadPoolTestCase(test.TestCase):
+
+    def setUp(self):
+        super(ThreadPoolTestCase, self).setUp()
+        self.pool = threadpool.ThreadPool('testpool', 2)
+
+    def test_execute_runs_in_named_thread(self):
+        thread_name = self.pool.execute(
+            lambda: native_threading.current_thread().name)
+        self.assertTrue(thread_name.startswith('testpool-'))
+        self.assertEqual(1, len(self.pool.threads))
+
+    def test_execute_does_not_block_greenthreads(self):
+        ticks = []
+
+        def ticker():
+            for i in xrange(5):
+                ticks.append(i)
+                eventlet.sleep(0.01)
+
+        thread = eventlet.spawn(ticker)
+        self.pool.execute(native_time.sleep, 0.2)
+        self.assertEqual(5, len(ticks))
+        thread.wait()
+
+    def test_execute_raises(self):
+        domain = FakeDomain('one')
+        self.assertRaises(test.TestingException, self.pool.execute,
+                          domain.fail)
+        stats = self.pool.get_stats()['methods']['fail']
+        self.assertEqual(1, stats['calls'])
+        self.assertEqual(1, stats['errors'])
+        self.assertEqual(0, stats['in_flight'])
+
+    def test_proxy(self):
+        domain = self.pool.proxy_call((FakeDomain,), FakeDomain, 'one')
+        self.assertTrue(isinstance(domain, threadpool.Proxy))
+        self.assertEqual('domain one', str(domain))
+        self.assertEqual('one', domain.name)
+
+        state, thread_name = domain.info()
+        self.assertEqual(1, state)
+        self.assertTrue(thread_name.startswith('testpool-'))
+        other = domain.lookup('two')
+        self.assertTrue(isinstance(other, threadpool.Proxy))
+        other.info()
+
+        stats = self.pool.get_stats()
+        self.assertEqual(0, stats['queued'])
+        self.assertEqual(set(['FakeDomain', 'FakeDomain.info',
+                              'FakeDomain.lookup']),
+                         set(stats['methods'].keys()))
+        info_stats = stats['methods']['FakeDomain.info']
+        self.assertEqual(2, info_stats['calls'])
+        self.assertEqual(0, info_stats['errors'])
+        self.assertEqual(info_stats['total_time'] / 2,
+                         info_stats['average_time'])
+
+    def test_in_flight_and_stuck_calls(self):
+        self.pool.stuck_threshold = 10
+        release = native_threading.Event()
+        started = native_Queue.Queue()
+
+        def slow():
+            started.put(True)
+            release.wait()
+
+        results = []
+        for i in xrange(3):
+            eventlet.spawn_n(lambda: results.append(self.pool.execute(slow)))
+        eventlet.sleep(0)
+        # Both threads are busy, the third call has to wait
+        started.get(timeout=5)
+        started.get(timeout=5)
+        stats = self.pool.get_stats()
+        self.assertEqual(3, stats['methods']['slow']['in_flight'])
+        self.assertEqual(1, stats['queued'])
+
+        warnings = []
+        self.stubs.Set(threadpool.LOG, 'warn',
+                       lambda msg, args: warnings.append(msg % args))
+        self.pool.check_stuck_calls()
+        self.assertEqual([], warnings)
+
+        now = time.time()
+        self.stubs.Set(time, 'time', lambda: now + 11)
+        self.pool.check_stuck_calls()
+        self.assertEqual(3, len(warnings))
+        self.assertEqual(1, len([w for w in warnings if 'waiting' in w]))
+        # Only reported once
+        self.pool.check_stuck_calls()
+        self.assertEqual(3, len(warnings))
+        self.assertEqual(3, self.pool.get_stats()['methods']['slow']['stuck'])
+
+        self.stubs.UnsetAll()
+        release.set()
+        while len(results) < 3:
+            eventlet.sleep(0.01)
+        stats = self.pool.get_stats()['methods']['slow']
+        self.assertEqual(0, stats['in_flight'])
+        self.assertEqual(3, stats['calls'])
@@ -16,6 +16,7 @@ Tests For Loadable class handling.
 """
 
 from nova import exception
+from nova import loadables
 from nova import test
 from nova.tests import fake_loadables
 
@@ -47,6 +48,23 @@ class LoadablesTestCase(test.TestCase):
                                 'FakeLoadableSubClass6']
         self._compare_classes(classes, expected_class_names)
 
+    def test_get_all_classes_lazy(self):
+        classes = self.fake_loader.get_all_classes(lazy=True)
+        expected_class_names = ['FakeLoadableSubClass1',
+                                'FakeLoadableSubClass2',
+                                'FakeLoadableSubClass5',
+                                'FakeLoadableSubClass6']
+        self._compare_classes(classes, expected_class_names)
+        for cls in classes:
+            self.assertTrue(isinstance(cls(), fake_loadables.FakeLoadable))
+            self.assertEqual(cls.__name__, cls.resolve().__name__)
+
+    def test_lazy_loadable_of_wrong_type(self):
+        cls = loadables.LazyLoadable(self.fake_loader,
+                                     self.test_package + '.fake_loadable2',
+                                     'FakeLoadableSubClass8')
+        self.assertRaises(exception.ClassNotFound, cls)
+
     def test_get_matching_classes(self):
         prefix = self.test_package
         test_classes = [prefix + '.fake_loadable1.FakeLoadableSubClass1',
@@ -0,0 +1,212 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the shared, exclusive and keyed locks of lockutils."""
+
+import os
+import subprocess
+import sys
+
+import eventlet
+from eventlet import event
+
+from nova.openstack.common import lockutils
+from nova import test
+from nova import utils
+
+
+class LockTestCase(test.TestCase):
+
+    def setUp(self):
+        super(LockTestCase, self).setUp()
+        self.stubs.Set(lockutils, '_lock_stats', {})
+        self.events = []
+
+    def _hold(self, label, release, shared=False, **kwargs):
+        """Hold the lock until release is sent, noting when we got it."""
+        with lockutils.lock('testlock', shared=shared, **kwargs):
+            self.events.append(label)
+            release.wait()
+            self.events.append('%s done' % label)
+
+    def _spawn(self, label, shared=False, **kwargs):
+        release = event.Event()
+        thread = eventlet.spawn(self._hold, label, release, shared, **kwargs)
+        eventlet.sleep(0)
+        return thread, release
+
+    def test_shared_held_together(self):
+        thread1, release1 = self._spawn('reader1', shared=True)
+        thread2, release2 = self._spawn('reader2', shared=True)
+        self.assertEqual(['reader1', 'reader2'], self.events)
+        release1.send()
+        release2.send()
+        thread1.wait()
+        thread2.wait()
+
+    def test_exclusive_held_alone(self):
+        writer, release_writer = self._spawn('writer')
+        reader, release_reader = self._spawn('reader', shared=True)
+        self.assertEqual(['writer'], self.events)
+        release_writer.send()
+        writer.wait()
+        eventlet.sleep(0)
+        self.assertEqual(['writer', 'writer done', 'reader'], self.events)
+        release_reader.send()
+        reader.wait()
+
+    def test_writer_not_starved(self):
+        reader1, release_reader1 = self._spawn('reader1', shared=True)
+        writer, release_writer = self._spawn('writer')
+        # The lock is shared at the moment, but the writer asked first
+        reader2, release_reader2 = self._spawn('reader2', shared=True)
+        self.assertEqual(['reader1'], self.events)
+        release_reader1.send()
+        release_writer.send()
+        release_reader2.send()
+        for thread in (reader1, writer, reader2):
+            thread.wait()
+        self.assertEqual(['reader1', 'reader1 done',
+                          'writer', 'writer done',
+                          'reader2', 'reader2 done'], self.events)
+
+    def test_killed_waiter(self):
+        reader1, release_reader1 = self._spawn('reader1', shared=True)
+        writer, release_writer = self._spawn('writer')
+        reader2, release_reader2 = self._spawn('reader2', shared=True)
+        # The readers behind the writer get the lock once it gives up
+        writer.kill()
+        eventlet.sleep(0)
+        self.assertEqual(['reader1', 'reader2'], self.events)
+        release_reader1.send()
+        release_reader2.send()
+        reader1.wait()
+        reader2.wait()
+
+        rw_lock = lockutils._get_lock('testlock')
+        self.assertEqual(0, rw_lock.readers)
+        self.assertFalse(rw_lock.writer)
+        self.assertEqual(0, len(rw_lock.waiters))
+        stats = lockutils.get_lock_stats()['testlock']
+        self.assertEqual(0, stats['waiting'])
+        self.assertEqual(2, stats['acquired'])
+
+    def test_keys_are_separate_locks(self):
+        thread1, release1 = self._spawn('key1', key='uuid1')
+        thread2, release2 = self._spawn('key2', key='uuid2')
+        thread3, release3 = self._spawn('key1 again', key='uuid1')
+        self.assertEqual(['key1', 'key2'], self.events)
+        release1.send()
+        release2.send()
+        release3.send()
+        for thread in (thread1, thread2, thread3):
+            thread.wait()
+
+        # Keyed locks are counted under the family name
+        stats = lockutils.get_lock_stats()
+        self.assertEqual(['testlock'], stats.keys())
+        self.assertEqual(3, stats['testlock']['acquired'])
+        self.assertEqual(1, stats['testlock']['contended'])
+
+    def test_synchronized_with_key(self):
+        @lockutils.synchronized('testlock', 'nova-',
+                                key=lambda label, release: label[:4])
+        def hold(label, release):
+            self.events.append(label)
+            release.wait()
+
+        releases = [event.Event() for i in xrange(3)]
+        threads = [eventlet.spawn(hold, label, release) for label, release
+                   in zip(['key1', 'key2', 'key1 again'], releases)]
+        eventlet.sleep(0)
+        self.assertEqual(['key1', 'key2'], self.events)
+        for release in releases:
+            release.send()
+        for thread in threads:
+            thread.wait()
+        self.assertEqual(['key1', 'key2', 'key1 again'], self.events)
+
+    def test_get_lock_stats(self):
+        writer, release_writer = self._spawn('writer')
+        reader, release_reader = self._spawn('reader', shared=True)
+        stats = lockutils.get_lock_stats()['testlock']
+        self.assertEqual(1, stats['held'])
+        self.assertEqual(1, stats['waiting'])
+        release_writer.send()
+        writer.wait()
+        release_reader.send()
+        reader.wait()
+
+        stats = lockutils.get_lock_stats()['testlock']
+        self.assertEqual(2, stats['acquired'])
+        self.assertEqual(1, stats['contended'])
+        self.assertEqual(0, stats['held'])
+        self.assertEqual(0, stats['waiting'])
+        self.assertTrue(stats['max_wait_time'] >= stats['average_wait_time'])
+        self.assertTrue(stats['max_held_time'] >= stats['average_held_time'])
+
+        lockutils.reset_lock_stats()
+        self.assertEqual({}, lockutils.get_lock_stats())
+
+
+class ExternalLockTestCase(test.TestCase):
+
+    def _try_lock_elsewhere(self, path, shared):
+        """Return whether another process could take the file lock."""
+        code = ('import fcntl, sys\n'
+                'f = open(sys.argv[1], "a+")\n'
+                'try:\n'
+                '    fcntl.lockf(f, %s | fcntl.LOCK_NB)\n'
+                'except IOError:\n'
+                '    sys.exit(1)\n'
+                % ('fcntl.LOCK_SH' if shared else 'fcntl.LOCK_EX'))
+        return subprocess.call([sys.executable, '-c', code, path]) == 0
+
+    def test_external_shared(self):
+        with utils.tempdir() as lock_path:
+            path = os.path.join(lock_path, 'nova-testlock')
+            inside = []
+
+            def hold(release):
+                with lockutils.lock('testlock', 'nova-', external=True,
+                                    lock_path=lock_path, shared=True):
+                    inside.append(True)
+                    release.wait()
+
+            releases = [event.Event(), event.Event()]
+            threads = [eventlet.spawn(hold, release) for release in releases]
+            eventlet.sleep(0)
+            # The greenthreads hold it together, and so could other
+            # processes, but none of them exclusively
+            self.assertEqual(2, len(inside))
+            self.assertTrue(self._try_lock_elsewhere(path, shared=True))
+            self.assertFalse(self._try_lock_elsewhere(path, shared=False))
+
+            releases[0].send()
+            threads[0].wait()
+            self.assertFalse(self._try_lock_elsewhere(path, shared=False))
+            releases[1].send()
+            threads[1].wait()
+            self.assertTrue(self._try_lock_elsewhere(path, shared=False))
+
+    def test_external_exclusive(self):
+        with utils.tempdir() as lock_path:
+            path = os.path.join(lock_path, 'nova-testlock')
+            with lockutils.lock('testlock', 'nova-', external=True,
+                                lock_path=lock_path):
+                self.assertFalse(self._try_lock_elsewhere(path, shared=True))
+            self.assertTrue(self._try_lock_elsewhere(path, shared=True))
@@ -25,6 +25,8 @@ import hmac
 import json
 import re
 
+from eventlet import greenthread
+
 try:
     import cPickle as pickle
 except ImportError:
@@ -389,6 +391,48 @@ class OpenStackMetadataTestCase(test.TestCase):
         mdjson = mdinst.lookup("/openstack/2012-08-10/meta_data.json")
         self.assertFalse("random_seed" in json.loads(mdjson))
 
+    def test_prerender_matches_lookup(self):
+        inst = copy.copy(self.instance)
+        mdinst = fake_InstanceMetadata(self.stubs, inst,
+                                       content=[('/etc/motd', 'hello')])
+        mdinst.prerender()
+
+        paths = ['/openstack', '/openstack/content/0000',
+                 '/latest/meta-data/public-keys/0/openssh-key']
+        for version in base.VERSIONS + ['latest']:
+            paths.append('/%s' % version)
+            paths.append('/ec2/%s/' % version)
+            for key in mdinst.get_ec2_metadata(version)['meta-data']:
+                paths.append('/%s/meta-data/%s' % (version, key))
+        for version in ['2012-08-10', 'latest']:
+            paths.append('/openstack/%s' % version)
+            paths.append('/openstack/%s/user_data' % version)
+        paths.append('/openstack/2012-08-10/meta_data.json')
+
+        for path in paths:
+            self.assertEqual(mdinst.get_rendered(path),
+                             base.ec2_md_print(mdinst.lookup(path)))
+
+        # unknown and callable paths are left to lookup()
+        self.assertEqual(mdinst.get_rendered('/2009-04-04/foo'), None)
+        self.assertEqual(mdinst.get_rendered('/openstack/latest/password'),
+                         None)
+
+    def test_prerender_random_seed(self):
+        inst = copy.copy(self.instance)
+        mdinst = fake_InstanceMetadata(self.stubs, inst)
+        mdinst.prerender()
+
+        path = "/openstack/2013-04-04/meta_data.json"
+        first = json.loads(mdinst.get_rendered(path))
+        second = json.loads(mdinst.get_rendered(path))
+        self.assertEqual(len(base64.b64decode(first["random_seed"])), 512)
+        self.assertNotEqual(first["random_seed"], second["random_seed"])
+
+        expected = json.loads(mdinst.lookup(path))
+        del first["random_seed"], expected["random_seed"]
+        self.assertEqual(first, expected)
+
     def test_no_dashes_in_metadata(self):
         # top level entries in meta_data should not contain '-' in their name
         inst = copy.copy(self.instance)
@@ -419,6 +463,9 @@ class MetadataHandlerTestCase(test.TestCase):
             return "foo"
 
         class CallableMD(object):
+            def get_rendered(self, path_info):
+                return None
+
             def lookup(self, path_info):
                 return verify
 
@@ -567,6 +614,77 @@ class MetadataHandlerTestCase(test.TestCase):
                      'X-Instance-ID-Signature': signed})
         self.assertEqual(response.status_int, 500)
 
+    def test_serves_prerendered(self):
+        self.stubs.Set(base, 'get_metadata_by_address',
+                       lambda *args: self.mdinst)
+        app = handler.MetadataRequestHandler()
+        meta_data = app.get_metadata_by_remote_address('127.0.0.1')
+
+        def fake_lookup(path):
+            raise Exception('prerendered path looked up: %s' % path)
+
+        self.stubs.Set(meta_data, 'lookup', fake_lookup)
+        request = webob.Request.blank('/2009-04-04/user-data')
+        request.remote_addr = '127.0.0.1'
+        response = request.get_response(app)
+        self.assertEqual(response.status_int, 200)
+        self.assertEqual(response.body, USER_DATA_STRING)
+
+    def test_concurrent_misses_fetch_once(self):
+        calls = []
+
+        def fake_get_metadata(conductor_api, address):
+            calls.append(address)
+            greenthread.sleep(0)
+            return self.mdinst
+
+        self.stubs.Set(base, 'get_metadata_by_address', fake_get_metadata)
+        app = handler.MetadataRequestHandler()
+        threads = [greenthread.spawn(app.get_metadata_by_remote_address,
+                                     '10.0.0.2') for i in xrange(5)]
+        for thread in threads:
+            self.assertEqual(thread.wait(), self.mdinst)
+        self.assertEqual(calls, ['10.0.0.2'])
+
+        app.get_metadata_by_remote_address('10.0.0.2')
+        self.assertEqual(calls, ['10.0.0.2'])
+
+    def test_concurrent_misses_not_found(self):
+        calls = []
+
+        def fake_get_metadata(conductor_api, address):
+            calls.append(address)
+            greenthread.sleep(0)
+            raise exception.NotFound()
+
+        self.stubs.Set(base, 'get_metadata_by_address', fake_get_metadata)
+        app = handler.MetadataRequestHandler()
+        threads = [greenthread.spawn(app.get_metadata_by_remote_address,
+                                     '10.0.0.2') for i in xrange(3)]
+        for thread in threads:
+            self.assertEqual(thread.wait(), None)
+        self.assertEqual(calls, ['10.0.0.2'])
+        self.assertEqual(app._cache.get('metadata-10.0.0.2-lock'), None)
+
+    def test_miss_waits_for_other_worker(self):
+        def fake_get_metadata(conductor_api, address):
+            raise Exception('metadata fetched twice')
+
+        self.stubs.Set(base, 'get_metadata_by_address', fake_get_metadata)
+        self.stubs.Set(handler, 'FILL_POLL_INTERVAL', 0)
+        app = handler.MetadataRequestHandler()
+
+        # another worker holds the lock and fills the shared cache
+        app._cache.add('metadata-10.0.0.2-lock', '1')
+
+        def other_worker():
+            app._cache.set('metadata-10.0.0.2', self.mdinst)
+            app._cache.delete('metadata-10.0.0.2-lock')
+
+        greenthread.spawn_after(0, other_worker)
+        self.assertEqual(app.get_metadata_by_remote_address('10.0.0.2'),
+                         self.mdinst)
+
 
 class MetadataPasswordTestCase(test.TestCase):
     def setUp(self):
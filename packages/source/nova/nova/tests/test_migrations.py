@@ -1106,6 +1106,47 @@ class TestNovaMigrations(BaseMigrationTestCase, CommonTestsMixIn):
                 self.assertEqual(result['value'], original['value'])
                 self.assertEqual(result['created_at'], None)
 
+    # migration 162, add version to quota_usages
+    def _pre_upgrade_162(self, engine):
+        quota_usages = get_table(engine, 'quota_usages')
+        data = [dict(project_id='m162-project', resource='instances',
+                     in_use=1, reserved=0, deleted=0)]
+        engine.execute(quota_usages.insert(), data)
+        return data
+
+    def _check_162(self, engine, data):
+        for table_name in ('quota_usages', 'shadow_quota_usages'):
+            table = get_table(engine, table_name)
+            self.assertTrue('version' in table.c)
+        quota_usages = get_table(engine, 'quota_usages')
+        row = quota_usages.select().\
+            where(quota_usages.c.project_id == 'm162-project').\
+            execute().first()
+        self.assertEqual(0, row['version'])
+
+    def _check_163(self, engine, data):
+        for table_name in ('fixed_ips', 'shadow_fixed_ips'):
+            table = get_table(engine, table_name)
+            self.assertTrue('claimed_by' in table.c)
+            self.assertTrue('claimed_at' in table.c)
+
+    # migration 164, add a unique constraint to quota_usages
+    def _pre_upgrade_164(self, engine):
+        quota_usages = get_table(engine, 'quota_usages')
+        data = [dict(project_id='m164-project', resource='instances',
+                     in_use=1, reserved=0, deleted=0)] * 2
+        engine.execute(quota_usages.insert(), data)
+        return data
+
+    def _check_164(self, engine, data):
+        quota_usages = get_table(engine, 'quota_usages')
+        rows = quota_usages.select().\
+                    where(quota_usages.c.project_id == 'm164-project').\
+                    where(quota_usages.c.deleted != quota_usages.c.id).\
+                    execute().\
+                    fetchall()
+        self.assertEqual(len(rows), 1)
+
 
 class TestBaremetalMigrations(BaseMigrationTestCase, CommonTestsMixIn):
     """Test sqlalchemy-migrate migrations."""
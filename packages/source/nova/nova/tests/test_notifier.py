@@ -0,0 +1,223 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for sending notifications from a greenthread of their own."""
+
+import eventlet
+from eventlet import event
+
+from nova import context
+from nova.openstack.common.notifier import api as notifier_api
+from nova.openstack.common.notifier import rpc_notifier
+from nova.openstack.common import rpc
+from nova import test
+
+
+class FakeDriver(object):
+    """Keeps the notifications, after waiting for release if it is set."""
+
+    def __init__(self):
+        self.notifications = []
+        self.release = None
+
+    def notify(self, ctxt, msg):
+        if self.release is not None:
+            self.release.wait()
+        self.notifications.append(msg['payload'])
+
+
+class FakeBatchDriver(FakeDriver):
+
+    def __init__(self):
+        super(FakeBatchDriver, self).__init__()
+        self.batches = []
+
+    def notify_many(self, notifications):
+        self.batches.append([msg['payload'] for ctxt, msg in notifications])
+
+
+class FailingDriver(object):
+
+    def notify(self, ctxt, msg):
+        raise test.TestingException()
+
+
+class AsyncNotifyTestCase(test.TestCase):
+
+    def setUp(self):
+        super(AsyncNotifyTestCase, self).setUp()
+        self.flags(notification_driver=[], notification_async=True)
+        notifier_api._reset_drivers()
+        self.addCleanup(notifier_api._reset_drivers)
+        self.stubs.Set(notifier_api, '_emitter', None)
+        self.addCleanup(self._stop_emitter)
+        self.context = context.RequestContext('user', 'project')
+
+    def _stop_emitter(self):
+        emitter = notifier_api._emitter
+        if emitter is not None and emitter.thread is not None:
+            emitter.thread.kill()
+
+    def _notify(self, payload):
+        notifier_api.notify(self.context, 'compute.host1', 'test.event',
+                            notifier_api.INFO, payload)
+
+    def test_notifications_sent_in_order(self):
+        driver = FakeDriver()
+        notifier_api.add_driver(driver)
+        for i in xrange(5):
+            self._notify(i)
+        # Nothing is sent from the greenthread notifying
+        self.assertEqual([], driver.notifications)
+        notifier_api.flush()
+        self.assertEqual(range(5), driver.notifications)
+        stats = notifier_api.get_queue_stats()
+        self.assertEqual(5, stats['queued'])
+        self.assertEqual(5, stats['sent'])
+        self.assertEqual(0, stats['in_queue'])
+
+    def test_batches(self):
+        self.flags(notification_batch_size=2)
+        driver = FakeBatchDriver()
+        notifier_api.add_driver(driver)
+        for i in xrange(5):
+            self._notify(i)
+        notifier_api.flush()
+        self.assertEqual([[0, 1], [2, 3], [4]], driver.batches)
+        self.assertEqual(3, notifier_api.get_queue_stats()['batches'])
+
+    def _fill_queue(self, policy):
+        """Have the driver hold on to the first notification, and fill
+        the queue of one notification behind it.
+        """
+        self.flags(notification_queue_size=1,
+                   notification_batch_size=1,
+                   notification_overflow_policy=policy)
+        driver = FakeDriver()
+        driver.release = event.Event()
+        notifier_api.add_driver(driver)
+        self._notify(0)
+        eventlet.sleep(0)
+        self._notify(1)
+        return driver
+
+    def test_full_queue_blocks(self):
+        driver = self._fill_queue(notifier_api.OVERFLOW_BLOCK)
+        thread = eventlet.spawn(self._notify, 2)
+        eventlet.sleep(0)
+        self.assertEqual(1, notifier_api.get_queue_stats()['in_queue'])
+        self.assertEqual(2, notifier_api.get_queue_stats()['queued'])
+        driver.release.send()
+        thread.wait()
+        notifier_api.flush()
+        self.assertEqual([0, 1, 2], driver.notifications)
+        self.assertEqual(0, notifier_api.get_queue_stats()['dropped'])
+
+    def test_full_queue_drops(self):
+        driver = self._fill_queue(notifier_api.OVERFLOW_DROP)
+        self._notify(2)
+        driver.release.send()
+        notifier_api.flush()
+        self.assertEqual([0, 1], driver.notifications)
+        stats = notifier_api.get_queue_stats()
+        self.assertEqual(1, stats['dropped'])
+        self.assertEqual(2, stats['sent'])
+
+    def test_failed_batches_not_sent(self):
+        notifier_api.add_driver(FailingDriver())
+        self._notify(0)
+        notifier_api.flush()
+        stats = notifier_api.get_queue_stats()
+        self.assertEqual(1, stats['errors'])
+        self.assertEqual(0, stats['sent'])
+
+    def test_notify_from_emitter_does_not_block(self):
+        self.flags(notification_queue_size=1,
+                   notification_batch_size=1,
+                   notification_overflow_policy=notifier_api.OVERFLOW_BLOCK)
+        notifications = []
+
+        class NotifyingDriver(object):
+            def notify(driver, ctxt, msg):
+                notifications.append(msg['payload'])
+                if msg['payload'] == 0:
+                    # The second one doesn't fit in the queue
+                    self._notify(1)
+                    self._notify(2)
+
+        notifier_api.add_driver(NotifyingDriver())
+        self._notify(0)
+        notifier_api.flush()
+        self.assertEqual([0, 1], notifications)
+        self.assertEqual(1, notifier_api.get_queue_stats()['dropped'])
+
+    def test_failed_batch_driver(self):
+        self.flags(notification_topics=['notifications', 'other'])
+        failed = []
+
+        def notify_many(topic, msgs):
+            if topic == 'notifications.info':
+                failed.append(topic)
+                raise test.TestingException()
+
+        self.stubs.Set(rpc, 'notify_many', notify_many)
+        notifier_api.add_driver(rpc_notifier)
+        self._notify(0)
+        notifier_api.flush()
+        stats = notifier_api.get_queue_stats()
+        self.assertEqual(['notifications.info'], failed)
+        self.assertEqual(1, stats['errors'])
+        self.assertEqual(0, stats['sent'])
+
+    def test_flush_without_notifications(self):
+        notifier_api.flush()
+        self.assertEqual({}, notifier_api.get_queue_stats())
+
+
+class RpcNotifyManyTestCase(test.TestCase):
+
+    def test_notify_many_by_topic(self):
+        self.flags(notification_topics=['notifications', 'other'])
+        sent = []
+        self.stubs.Set(rpc, 'notify_many',
+                       lambda topic, msgs: sent.append(
+                           (topic, [msg['payload'] for ctxt, msg in msgs])))
+        ctxt = context.RequestContext('user', 'project')
+        rpc_notifier.notify_many([
+            (ctxt, {'priority': 'INFO', 'payload': 0}),
+            (ctxt, {'priority': 'ERROR', 'payload': 1}),
+            (ctxt, {'priority': 'INFO', 'payload': 2})])
+        self.assertEqual([('notifications.info', [0, 2]),
+                          ('other.info', [0, 2]),
+                          ('notifications.error', [1]),
+                          ('other.error', [1])],
+                         sent)
+
+    def test_notify_many_raises_after_all_topics(self):
+        self.flags(notification_topics=['notifications', 'other'])
+        sent = []
+
+        def notify_many(topic, msgs):
+            sent.append(topic)
+            if topic == 'notifications.info':
+                raise test.TestingException()
+
+        self.stubs.Set(rpc, 'notify_many', notify_many)
+        ctxt = context.RequestContext('user', 'project')
+        self.assertRaises(test.TestingException, rpc_notifier.notify_many,
+                          [(ctxt, {'priority': 'INFO', 'payload': 0})])
+        self.assertEqual(['notifications.info', 'other.info'], sent)
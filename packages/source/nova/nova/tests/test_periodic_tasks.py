@@ -17,6 +17,8 @@
 
 import time
 
+import eventlet
+
 from testtools import matchers
 
 from nova import manager
@@ -122,3 +124,131 @@ class Manager(test.TestCase):
 
         m = Manager()
         self.assertEqual([], m._periodic_tasks)
+
+    def test_periodic_tasks_initial_jitter(self):
+        self.flags(periodic_task_jitter=0.5)
+
+        class Manager(manager.Manager):
+            @manager.periodic_task(spacing=100)
+            def bar(self):
+                return 'bar'
+
+            @manager.periodic_task(spacing=100, run_immediately=True)
+            def baz(self):
+                return 'baz'
+
+            @manager.periodic_task
+            def qux(self, context):
+                called.append('qux')
+
+        called = []
+        self.stubs.Set(manager.random, 'uniform', lambda a, b: b)
+        now = time.time()
+        m = Manager()
+        self.assertThat(m._periodic_last_run['bar'],
+                        matchers.GreaterThan(now + 49))
+        self.assertThat(m._periodic_last_run['baz'],
+                        matchers.LessThan(now - 49))
+        # Tasks run on every pass are delayed by up to half the default
+        # interval, and only at first
+        self.assertThat(m._periodic_last_run['qux'],
+                        matchers.GreaterThan(now + 29))
+        self.assertThat(m.periodic_tasks(None), matchers.GreaterThan(29))
+        self.assertEqual([], called)
+        m._periodic_last_run['qux'] = now
+        m.periodic_tasks(None)
+        m.periodic_tasks(None)
+        self.assertEqual(['qux', 'qux'], called)
+        # The schedule on the class itself is left untouched
+        self.assertThat(Manager._periodic_last_run['bar'],
+                        matchers.LessThan(now + 1))
+        self.assertEqual(None, Manager._periodic_last_run['baz'])
+
+    def test_periodic_tasks_default_pool_size(self):
+        # The test configuration runs them in the caller, unlike the
+        # default, which runs them one at a time on a greenthread
+        default = [opt.default for opt in manager.periodic_opts
+                   if opt.name == 'periodic_task_pool_size'][0]
+        self.flags(periodic_task_pool_size=default)
+        called = []
+
+        class Manager(manager.Manager):
+            @manager.periodic_task
+            def bar(self, context):
+                called.append('bar')
+                eventlet.sleep(0.1)
+                called.append('bar done')
+
+            @manager.periodic_task
+            def baz(self, context):
+                called.append('baz')
+
+        m = Manager()
+        m.periodic_tasks(None)
+        m._periodic_pool.waitall()
+        self.assertEqual(['bar', 'bar done', 'baz'], called)
+
+    def test_periodic_tasks_run_on_pool(self):
+        self.flags(periodic_task_pool_size=2)
+        called = []
+
+        class Manager(manager.Manager):
+            @manager.periodic_task
+            def bar(self, context):
+                called.append('bar')
+                eventlet.sleep(0.1)
+
+            @manager.periodic_task
+            def baz(self, context):
+                called.append('baz')
+
+        m = Manager()
+        m.periodic_tasks(None)
+        self.assertEqual(['bar', 'baz'], sorted(called))
+        self.assertTrue(m.get_periodic_task_metrics()['bar']['running'])
+
+        # bar is still sleeping so it must not be started a second time
+        m.periodic_tasks(None)
+        self.assertEqual(['bar', 'baz', 'baz'], sorted(called))
+        m._periodic_pool.waitall()
+
+        metrics = m.get_periodic_task_metrics()
+        self.assertEqual(1, metrics['bar']['runs'])
+        self.assertEqual(1, metrics['bar']['skipped'])
+        self.assertFalse(metrics['bar']['running'])
+        self.assertThat(metrics['bar']['max_runtime'],
+                        matchers.GreaterThan(0.09))
+        self.assertEqual(2, metrics['baz']['runs'])
+        self.assertEqual(0, metrics['baz']['skipped'])
+
+    def test_periodic_tasks_metrics(self):
+        class Manager(manager.Manager):
+            @manager.periodic_task(spacing=0.01)
+            def bar(self, context):
+                time.sleep(0.02)
+
+            @manager.periodic_task
+            def baz(self, context):
+                raise test.TestingException()
+
+        m = Manager()
+        m.periodic_tasks(None)
+        metrics = m.get_periodic_task_metrics()
+        self.assertEqual(1, metrics['bar']['runs'])
+        self.assertEqual(1, metrics['bar']['overruns'])
+        self.assertEqual(1, metrics['baz']['runs'])
+        self.assertEqual(1, metrics['baz']['errors'])
+        self.assertFalse(metrics['baz']['running'])
+
+    def test_periodic_tasks_raise_on_error(self):
+        self.flags(periodic_task_pool_size=2)
+
+        class Manager(manager.Manager):
+            @manager.periodic_task
+            def bar(self, context):
+                raise test.TestingException()
+
+        m = Manager()
+        self.assertRaises(test.TestingException,
+                          m.periodic_tasks, None, raise_on_error=True)
+        self.assertFalse(m.get_periodic_task_metrics()['bar']['running'])
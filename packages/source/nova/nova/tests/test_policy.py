@@ -180,6 +180,178 @@ class DefaultPolicyTestCase(test.TestCase):
                 self.context, "example:noexist", {})
 
 
+class CompiledPolicyTestCase(test.TestCase):
+    def _rules(self, rules, default_rule=None, cache_size=0):
+        return common_policy.Rules(
+            dict((k, common_policy.parse_rule(v)) for k, v in rules.items()),
+            default_rule, cache_size)
+
+    def test_constant_folding(self):
+        rules = self._rules({
+            "and_false": "role:admin and ! and project_id:%(project_id)s",
+            "and_true": "@ and @",
+            "or_true": "role:admin or @",
+            "or_false": "! or !",
+            "not_false": "not !",
+            "single": "@ and role:admin",
+        })
+        self.assertTrue(rules._lookup("and_false") is
+                        common_policy._always_false)
+        self.assertTrue(rules._lookup("and_true") is
+                        common_policy._always_true)
+        self.assertTrue(rules._lookup("or_true") is
+                        common_policy._always_true)
+        self.assertTrue(rules._lookup("or_false") is
+                        common_policy._always_false)
+        self.assertTrue(rules._lookup("not_false") is
+                        common_policy._always_true)
+        self.assertEqual(
+            True, rules._lookup("single")({}, {'roles': ['Admin']}))
+        self.assertEqual(
+            False, rules._lookup("single")({}, {'roles': ['member']}))
+
+    def test_compiled_matches_tree(self):
+        rules = self._rules({
+            "admin": "role:admin or is_admin:True",
+            "owner": "project_id:%(project_id)s and not role:dunce",
+            "literal": "user_id:fake",
+            "ref": "rule:admin or rule:owner",
+        })
+        common_policy.set_rules(rules)
+        targets = [{'project_id': 'fake'}, {'project_id': 'other'}]
+        creds = [
+            {'roles': ['member'], 'project_id': 'fake', 'user_id': 'fake',
+             'is_admin': False},
+            {'roles': ['Dunce'], 'project_id': 'fake', 'user_id': 'x',
+             'is_admin': False},
+            {'roles': ['ADMIN'], 'project_id': 'other', 'is_admin': False},
+            {'roles': [], 'project_id': 'other', 'is_admin': True},
+        ]
+        for name, check in rules.items():
+            for target in targets:
+                for cred in creds:
+                    self.assertEqual(check(target, cred),
+                                     rules._lookup(name)(target, cred))
+
+    def test_uncompiled_subclass_is_honored(self):
+        class UpperRoleCheck(common_policy.RoleCheck):
+            def __call__(self, target, creds):
+                return self.match in creds['roles']
+
+        check = UpperRoleCheck('role', 'Admin')
+        func = check.compile()
+        self.assertEqual(False, func({}, {'roles': ['admin']}))
+        self.assertEqual(None, check.cache_fields(lambda name: None))
+
+    def test_decision_cache(self):
+        rules = self._rules({
+            "owner": "project_id:%(project_id)s",
+            "admin": "role:admin",
+            "either": "rule:admin or rule:owner",
+            "http": "http://www.example.com",
+        }, cache_size=2)
+        common_policy.set_rules(rules)
+        self.assertEqual((('project_id', 'roles'), ('project_id',)),
+                         rules._fields['either'])
+        self.assertEqual(None, rules._fields['http'])
+
+        creds = {'roles': ['member'], 'project_id': 'fake', 'user_id': 'a'}
+        self.assertTrue(common_policy.check('either', {'project_id': 'fake'},
+                                            creds))
+        self.assertEqual(1, rules.cache.misses)
+        # Fields the rule doesn't read don't affect the cache key
+        creds['user_id'] = 'b'
+        self.assertTrue(common_policy.check('either', {'project_id': 'fake',
+                                                       'host': 'h'}, creds))
+        self.assertEqual(1, rules.cache.hits)
+        self.assertFalse(common_policy.check('either',
+                                             {'project_id': 'other'}, creds))
+        self.assertEqual(2, rules.cache.misses)
+        self.assertEqual(2, len(rules.cache))
+
+        # Least recently used decisions are evicted
+        self.assertFalse(common_policy.check('admin', {}, creds))
+        self.assertEqual(2, len(rules.cache))
+        self.assertFalse(common_policy.check('either',
+                                             {'project_id': 'other'}, creds))
+        self.assertEqual(2, rules.cache.hits)
+        self.assertTrue(common_policy.check('either', {'project_id': 'fake'},
+                                            creds))
+        self.assertEqual(4, rules.cache.misses)
+
+        # Modifying the rules drops cached decisions
+        rules['owner'] = common_policy.parse_rule('!')
+        self.assertEqual(0, len(rules.cache))
+        self.assertFalse(common_policy.check('either', {'project_id': 'fake'},
+                                             creds))
+
+    def test_changes_recompile(self):
+        rules = self._rules({"admin": "role:admin", "owner": "@",
+                             "either": "rule:admin or rule:owner"},
+                            "admin", cache_size=10)
+        common_policy.set_rules(rules)
+        creds = {'roles': ['member']}
+
+        def check(name):
+            return rules._lookup(name)({}, creds)
+
+        self.assertTrue(check('either'))
+        rules.pop('owner')
+        self.assertFalse(check('either'))
+        self.assertEqual(None, rules.pop('owner', None))
+
+        rules.setdefault('owner', common_policy.parse_rule('@'))
+        self.assertTrue(check('either'))
+        rules.setdefault('owner', common_policy.parse_rule('!'))
+        self.assertTrue(check('either'))
+
+        del rules['either']
+        rules.default_rule = None
+        name, rule = rules.popitem()
+        self.assertRaises(KeyError, rules._lookup, name)
+        rules.popitem()
+        self.assertEqual({}, rules._compiled)
+
+        rules.update(admin=common_policy.parse_rule('@'))
+        self.assertTrue(check('admin'))
+        rules.clear()
+        self.assertRaises(KeyError, rules._lookup, 'admin')
+
+    def test_decision_cache_default_rule(self):
+        rules = self._rules({"default": "role:admin"}, "default",
+                            cache_size=10)
+        common_policy.set_rules(rules)
+        self.assertTrue(common_policy.check('noexist', {},
+                                            {'roles': ['admin']}))
+        self.assertFalse(common_policy.check('noexist', {},
+                                             {'roles': ['member']}))
+        self.assertTrue(common_policy.check('noexist', {},
+                                            {'roles': ['admin']}))
+        self.assertEqual(1, rules.cache.hits)
+
+    def test_policy_file_reload_drops_cache(self):
+        self.flags(policy_cache_size=10)
+        ctxt = context.RequestContext('fake', 'fake')
+        with utils.tempdir() as tmpdir:
+            tmpfilename = os.path.join(tmpdir, 'policy')
+            self.flags(policy_file=tmpfilename)
+            policy.reset()
+
+            target = {'project_id': 'fake'}
+            with open(tmpfilename, "w") as policyfile:
+                policyfile.write(
+                    '{"example:test": "project_id:%(project_id)s"}')
+            policy.enforce(ctxt, "example:test", target)
+            policy.enforce(ctxt, "example:test", target)
+            self.assertEqual(1, common_policy._rules.cache.hits)
+
+            with open(tmpfilename, "w") as policyfile:
+                policyfile.write('{"example:test": "role:admin"}')
+            policy._POLICY_CACHE = {}
+            self.assertRaises(exception.PolicyNotAuthorized, policy.enforce,
+                              ctxt, "example:test", target)
+
+
 class IsAdminCheckTestCase(test.TestCase):
     def test_init_true(self):
         check = policy.IsAdminCheck('is_admin', 'True')
@@ -206,3 +378,9 @@ class IsAdminCheckTestCase(test.TestCase):
 
         self.assertEqual(check('target', dict(is_admin=True)), False)
         self.assertEqual(check('target', dict(is_admin=False)), True)
+
+    def test_cache_fields(self):
+        check = policy.IsAdminCheck('is_admin', 'True')
+
+        self.assertEqual((frozenset(['is_admin']), frozenset()),
+                         check.cache_fields(lambda name: None))
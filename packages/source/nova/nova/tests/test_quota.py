@@ -1934,6 +1934,190 @@ class QuotaReserveSqlAlchemyTestCase(test.TestCase):
                 ])
 
 
+class OptimisticQuotaReserveTestCase(test.TestCase):
+    """quota_reserve() and friends against the database, without locking."""
+
+    def setUp(self):
+        super(OptimisticQuotaReserveTestCase, self).setUp()
+        self.flags(quota_optimistic_reservations=True,
+                   quota_reserve_retry_interval=0)
+        self.context = context.RequestContext('fake', 'fake_project')
+        self.in_use = dict(instances=0, cores=0, ram=0)
+        self.sync_calls = 0
+
+        def sync(context, project_id, session):
+            self.sync_calls += 1
+            return self.in_use.copy()
+
+        self.resources = dict(
+            (name, quota.ReservableResource(name, sync))
+            for name in ('instances', 'cores', 'ram'))
+        self.quotas = dict(instances=10, cores=20, ram=2048)
+        self.expire = timeutils.utcnow() + datetime.timedelta(seconds=3600)
+
+        self.refreshes = []
+        self.stubs.Set(sqa_api.greenthread, 'spawn_n',
+                       lambda func, *args: self.refreshes.append(args))
+
+    def _reserve(self, until_refresh=None, **deltas):
+        return sqa_api.quota_reserve(self.context, self.resources,
+                                     self.quotas, deltas, self.expire,
+                                     until_refresh, 0)
+
+    def _usages(self):
+        session = sqa_api.get_session()
+        return sqa_api._get_quota_usages(self.context, session,
+                                         'fake_project', lock=False)
+
+    def _assert_usages(self, **expected):
+        usages = self._usages()
+        for resource, (in_use, reserved) in expected.items():
+            self.assertEqual((in_use, reserved),
+                             (usages[resource].in_use,
+                              usages[resource].reserved))
+
+    def test_reserve_commit(self):
+        reservations = self._reserve(instances=2, cores=4)
+        self.assertEqual(1, self.sync_calls)
+        self._assert_usages(instances=(0, 2), cores=(0, 4))
+
+        db.reservation_commit(self.context, reservations)
+        self._assert_usages(instances=(2, 0), cores=(4, 0))
+
+        # Committing again changes nothing
+        db.reservation_commit(self.context, reservations)
+        self._assert_usages(instances=(2, 0), cores=(4, 0))
+
+    def test_reserve_rollback(self):
+        reservations = self._reserve(instances=2, cores=4)
+        db.reservation_rollback(self.context, reservations)
+        self._assert_usages(instances=(0, 0), cores=(0, 0))
+
+    def test_reserve_expire(self):
+        self.expire = timeutils.utcnow() - datetime.timedelta(seconds=1)
+        reservations = self._reserve(instances=2)
+        db.reservation_expire(self.context.elevated())
+        self._assert_usages(instances=(0, 0))
+        db.reservation_commit(self.context, reservations)
+        self._assert_usages(instances=(0, 0))
+
+    def test_reserve_over_quota(self):
+        self._reserve(instances=8)
+        self.assertRaises(exception.OverQuota, self._reserve, instances=3)
+        self._assert_usages(instances=(0, 8))
+
+    def test_only_in_use_changes_bump_version(self):
+        reservations = self._reserve(instances=1)
+        version = self._usages()['instances'].version
+        db.reservation_rollback(self.context, self._reserve(instances=1))
+        self._reserve(until_refresh=5, instances=1)
+        self.assertEqual(version, self._usages()['instances'].version)
+        db.reservation_commit(self.context, reservations)
+        self.assertEqual(version + 1, self._usages()['instances'].version)
+
+    def test_refresh_lands_despite_reservations(self):
+        self._reserve(until_refresh=1, instances=1)
+        self._reserve(until_refresh=1, instances=1)
+        self.assertEqual(1, len(self.refreshes))
+        orig_sync = self.resources['instances'].sync
+
+        def racing_sync(context, project_id, session):
+            # Somebody else reserves while we count
+            self.resources['instances'].sync = orig_sync
+            self._reserve(instances=1)
+            self.in_use['instances'] = 3
+            return orig_sync(context, project_id, session)
+
+        self.resources['instances'].sync = racing_sync
+        sqa_api._quota_usage_refresh(*self.refreshes[0])
+        self._assert_usages(instances=(3, 3))
+
+    def test_reserve_checks_quota_when_updating(self):
+        self._reserve(instances=5)
+        orig_get_quota_usages = sqa_api._get_quota_usages
+
+        def racing_get_quota_usages(*args, **kwargs):
+            # Somebody else reserves right after we read the usages
+            usages = orig_get_quota_usages(*args, **kwargs)
+            sqa_api.quota_usage_update(self.context.elevated(),
+                                       'fake_project', 'instances',
+                                       reserved=8)
+            return usages
+
+        self.stubs.Set(sqa_api, '_get_quota_usages', racing_get_quota_usages)
+        self.assertRaises(exception.OverQuota, self._reserve,
+                          instances=3, cores=1)
+        self._assert_usages(instances=(0, 8), cores=(0, 0))
+
+    def test_racing_first_reservations(self):
+        orig_get_quota_usages = sqa_api._get_quota_usages
+        raced = []
+
+        def racing_get_quota_usages(*args, **kwargs):
+            usages = orig_get_quota_usages(*args, **kwargs)
+            if not raced:
+                # Somebody else creates the usages right after we
+                # found there were none
+                raced.append(True)
+                self._reserve(instances=1)
+            return usages
+
+        self.stubs.Set(sqa_api, '_get_quota_usages', racing_get_quota_usages)
+        self._reserve(instances=2)
+        self.assertEqual(['cores', 'instances', 'ram'],
+                         sorted(self._usages().keys()))
+        self._assert_usages(instances=(0, 3))
+
+    def test_refresh_retries_on_conflict(self):
+        self._reserve(instances=1)
+        sqa_api.quota_usage_update(self.context.elevated(), 'fake_project',
+                                   'instances', in_use=-1)
+        self.in_use['instances'] = 4
+        orig_cas = sqa_api._quota_usage_cas
+        raced = []
+
+        def racing_cas(context, session, usage, **values):
+            if not raced:
+                # Somebody else changed the usage while we counted
+                raced.append(usage.resource)
+                raise sqa_api._QuotaUsageConflict()
+            return orig_cas(context, session, usage, **values)
+
+        self.stubs.Set(sqa_api, '_quota_usage_cas', racing_cas)
+        self._reserve(instances=1)
+        self.assertEqual(3, self.sync_calls)
+        self._assert_usages(instances=(4, 2))
+
+    def test_reserve_falls_back_to_locking(self):
+        self.flags(quota_reserve_retries=2)
+        attempts = []
+
+        def conflict(*args):
+            attempts.append(args)
+            raise sqa_api._QuotaUsageConflict()
+
+        self.stubs.Set(sqa_api, '_quota_reserve_optimistic', conflict)
+        reservations = self._reserve(instances=1)
+        self.assertEqual(3, len(attempts))
+        self.assertEqual(1, len(reservations))
+        self._assert_usages(instances=(0, 1))
+
+    def test_refresh_in_background(self):
+        self._reserve(until_refresh=1, instances=1, cores=1, ram=1)
+        self.assertEqual(1, self.sync_calls)
+        self.in_use = dict(instances=3, cores=3, ram=3)
+
+        self._reserve(until_refresh=1, instances=1, cores=1, ram=1)
+        self.assertEqual(1, self.sync_calls)
+        self.assertEqual(1, len(self.refreshes))
+        self._assert_usages(instances=(0, 2))
+
+        sqa_api._quota_usage_refresh(*self.refreshes[0])
+        self.assertEqual(2, self.sync_calls)
+        self._assert_usages(instances=(3, 2), cores=(3, 2), ram=(3, 2))
+        self.assertEqual(1, self._usages()['instances'].until_refresh)
+
+
 class NoopQuotaDriverTestCase(test.TestCase):
     def setUp(self):
         super(NoopQuotaDriverTestCase, self).setUp()
@@ -0,0 +1,309 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the dispatching of messages, and the waiting for replies to
+calls, in the AMQP RPC code.
+"""
+
+import eventlet
+from oslo.config import cfg
+
+from nova import context
+from nova.openstack.common.rpc import amqp
+from nova.openstack.common.rpc import common as rpc_common
+from nova.openstack.common.rpc import dispatcher
+from nova import test
+
+CONF = cfg.CONF
+
+
+class DispatchPoolTestCase(test.TestCase):
+
+    def setUp(self):
+        super(DispatchPoolTestCase, self).setUp()
+        self.ran = []
+
+    def _func(self, value):
+        self.ran.append(value)
+
+    def test_spawn_runs(self):
+        pool = amqp._DispatchPool(2)
+        pool.spawn(self._func, 1)
+        pool.wait()
+        self.assertEqual([1], self.ran)
+
+    def test_busy_pool_queues_in_order(self):
+        pool = amqp._DispatchPool(1)
+        blocker = eventlet.event.Event()
+        pool.spawn(blocker.wait)
+        eventlet.sleep(0)
+        pool.spawn(self._func, 1)
+        self.assertEqual({'size': 1, 'running': 1, 'backlog': 1},
+                         pool.get_stats())
+        blocker.send()
+        pool.spawn(self._func, 2)
+        pool.wait()
+        self.assertEqual([1, 2], self.ran)
+        self.assertEqual({'size': 1, 'running': 0, 'backlog': 0},
+                         pool.get_stats())
+
+    def test_spawn_never_blocks(self):
+        pool = amqp._DispatchPool(1)
+        blocker = eventlet.event.Event()
+        pool.spawn(blocker.wait)
+        eventlet.sleep(0)
+        with eventlet.Timeout(1):
+            for i in xrange(4):
+                pool.spawn(self._func, i)
+        self.assertEqual(4, pool.get_stats()['backlog'])
+        blocker.send()
+        pool.wait()
+        self.assertEqual([0, 1, 2, 3], self.ran)
+        self.assertEqual({'size': 1, 'running': 0, 'backlog': 0},
+                         pool.get_stats())
+        # And the pool still takes messages
+        with eventlet.Timeout(1):
+            pool.spawn(self._func, 4)
+            pool.wait()
+        self.assertEqual(5, len(self.ran))
+
+
+class FakeManager(object):
+
+    RPC_API_VERSION = '1.0'
+    RPC_METHOD_PRIORITIES = {'urgent': amqp.PRIORITY_HIGH,
+                             'chatty': amqp.PRIORITY_LOW}
+
+    def __init__(self):
+        self.calls = []
+        self.release = None
+
+    def urgent(self, context):
+        self.calls.append('urgent')
+
+    def chatty(self, context, value):
+        if self.release is not None:
+            self.release.wait()
+        self.calls.append(('chatty', value))
+
+
+class ProxyCallbackTestCase(test.TestCase):
+
+    def setUp(self):
+        super(ProxyCallbackTestCase, self).setUp()
+        self.manager = FakeManager()
+        self.proxy = dispatcher.RpcDispatcher([self.manager])
+
+    def _callback(self):
+        return amqp.ProxyCallback(CONF, self.proxy, None, topic='compute')
+
+    def test_get_priority_from_manager(self):
+        callback = self._callback()
+        self.assertEqual(amqp.PRIORITY_HIGH, callback.get_priority('urgent'))
+        self.assertEqual(amqp.PRIORITY_LOW, callback.get_priority('chatty'))
+        self.assertEqual(amqp.PRIORITY_NORMAL,
+                         callback.get_priority('undeclared'))
+
+    def test_get_priority_configured(self):
+        self.flags(rpc_method_priorities=['chatty:high',
+                                          'undeclared:low',
+                                          'urgent:bogus'])
+        callback = self._callback()
+        self.assertEqual(amqp.PRIORITY_HIGH, callback.get_priority('chatty'))
+        self.assertEqual(amqp.PRIORITY_LOW,
+                         callback.get_priority('undeclared'))
+        # Invalid entries are ignored
+        self.assertEqual(amqp.PRIORITY_HIGH, callback.get_priority('urgent'))
+
+    def test_get_priority_configured_for_topic(self):
+        self.flags(rpc_method_priorities=['compute.chatty:normal',
+                                          'chatty:high',
+                                          'network.urgent:low'])
+        callback = self._callback()
+        # Entries for our topic win over ones for any topic
+        self.assertEqual(amqp.PRIORITY_NORMAL,
+                         callback.get_priority('chatty'))
+        # and those for other topics don't apply
+        self.assertEqual(amqp.PRIORITY_HIGH, callback.get_priority('urgent'))
+
+    def test_busy_low_priority_pool(self):
+        self.flags(rpc_low_priority_pool_size=2)
+        self.manager.release = eventlet.event.Event()
+        callback = self._callback()
+        with eventlet.Timeout(1):
+            for i in xrange(10):
+                callback({'method': 'chatty', 'args': {'value': i}})
+            eventlet.sleep(0)
+            # The low priority pool and its backlog are busy, yet urgent
+            # calls are taken and dispatched right away
+            callback({'method': 'urgent', 'args': {}})
+            eventlet.sleep(0)
+        self.assertEqual(['urgent'], self.manager.calls)
+        low = callback.get_stats()['pools'][amqp.PRIORITY_LOW]
+        self.assertEqual(2, low['running'])
+        self.assertEqual(8, low['backlog'])
+
+        self.manager.release.send()
+        callback.wait()
+        self.assertEqual(11, len(self.manager.calls))
+
+    def test_call_dispatches_and_counts(self):
+        callback = self._callback()
+        callback({'method': 'chatty', 'args': {'value': 42}})
+        callback({'method': 'urgent', 'args': {}})
+        callback.wait()
+        self.assertEqual(sorted(['urgent', ('chatty', 42)]),
+                         sorted(self.manager.calls))
+
+        stats = callback.get_stats()
+        self.assertEqual(set(amqp.PRIORITIES), set(stats['pools']))
+        self.assertEqual(CONF.rpc_low_priority_pool_size,
+                         stats['pools'][amqp.PRIORITY_LOW]['size'])
+        for pool_stats in stats['pools'].itervalues():
+            self.assertEqual(0, pool_stats['running'])
+            self.assertEqual(0, pool_stats['backlog'])
+        chatty = stats['methods']['chatty']
+        self.assertEqual(amqp.PRIORITY_LOW, chatty['priority'])
+        self.assertEqual(1, chatty['calls'])
+        self.assertTrue(chatty['max_time'] >= chatty['average_time'] >= 0)
+        self.assertEqual(amqp.PRIORITY_HIGH,
+                         stats['methods']['urgent']['priority'])
+
+
+class FakeConnection(object):
+    """Keeps the messages sent, rather than sending them anywhere."""
+
+    fail_sends = False
+
+    def __init__(self, conf, server_params=None):
+        self.sent = []
+
+    def declare_direct_consumer(self, topic, callback):
+        pass
+
+    def consume_in_thread(self):
+        pass
+
+    def topic_send(self, topic, msg, timeout=None):
+        if self.fail_sends:
+            raise test.TestingException()
+        self.sent.append(msg)
+
+    def reset(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeConnectionPool(object):
+
+    connection_cls = FakeConnection
+
+    def __init__(self):
+        self.connection = FakeConnection(CONF)
+        self.reply_proxy = None
+
+    def get(self):
+        return self.connection
+
+    def put(self, connection):
+        pass
+
+
+class ReplyWaitTestCase(test.TestCase):
+
+    def setUp(self):
+        super(ReplyWaitTestCase, self).setUp()
+        self.flags(amqp_rpc_single_reply_queue=True)
+        self.stubs.Set(amqp._TimeoutWheel, 'RESOLUTION', 0.01)
+        self.pool = FakeConnectionPool()
+        self.context = context.RequestContext('user', 'project')
+
+    def _multicall(self, timeout):
+        waiter = amqp.multicall(CONF, self.context, 'compute',
+                                {'method': 'echo', 'args': {}}, timeout,
+                                self.pool)
+        return waiter, self.pool.connection.sent[-1]['_msg_id']
+
+    def _reply(self, msg_id, result=None, ending=False):
+        self.pool.reply_proxy._process_data({'_msg_id': msg_id,
+                                             'result': result,
+                                             'failure': None,
+                                             'ending': ending})
+
+    def _assert_nothing_waits(self):
+        proxy = self.pool.reply_proxy
+        self.assertEqual(0, proxy.get_stats()['in_flight'])
+        self.assertEqual({}, proxy._timeouts.slots)
+        self.assertEqual({}, proxy._timeouts.waiters)
+
+    def test_timeout(self):
+        waiter, msg_id = self._multicall(0.05)
+        self.assertRaises(rpc_common.Timeout, list, waiter)
+        self._assert_nothing_waits()
+        self.assertEqual(1, self.pool.reply_proxy.get_stats()['timeouts'])
+
+    def test_reply_extends_deadline(self):
+        waiter, msg_id = self._multicall(0.1)
+
+        def reply():
+            for i in xrange(3):
+                eventlet.sleep(0.06)
+                self._reply(msg_id, i)
+            eventlet.sleep(0.06)
+            self._reply(msg_id, ending=True)
+
+        eventlet.spawn(reply)
+        # Replies came in for longer than the timeout, but none of them
+        # later than the timeout after the one before
+        self.assertEqual([0, 1, 2], list(waiter))
+        self._assert_nothing_waits()
+        self.assertEqual(0, self.pool.reply_proxy.get_stats()['timeouts'])
+
+    def test_done_removes_from_wheel(self):
+        waiter, msg_id = self._multicall(60)
+        timeouts = self.pool.reply_proxy._timeouts
+        self.assertEqual(1, len(timeouts.waiters))
+        self._reply(msg_id, 42)
+        self._reply(msg_id, ending=True)
+        self.assertEqual([42], list(waiter))
+        # Long before the deadline
+        self._assert_nothing_waits()
+        eventlet.sleep(0.02)
+        self.assertTrue(timeouts.thread is None)
+
+    def test_send_failure_removes_waiter(self):
+        self.stubs.Set(FakeConnection, 'fail_sends', True)
+        self.assertRaises(test.TestingException, self._multicall, 60)
+        self._assert_nothing_waits()
+
+    def test_get_stats(self):
+        for i in xrange(2):
+            waiter, msg_id = self._multicall(60)
+            self._reply(msg_id, i)
+            self._reply(msg_id, ending=True)
+            list(waiter)
+        waiter, msg_id = self._multicall(60)
+
+        stats = self.pool.reply_proxy.get_stats()
+        self.assertEqual(3, stats['calls'])
+        self.assertEqual(2, stats['replied'])
+        self.assertEqual(1, stats['in_flight'])
+        self.assertEqual(0, stats['timeouts'])
+        self.assertTrue(stats['max_latency'] >= stats['average_latency'] >= 0)
+        waiter.done()
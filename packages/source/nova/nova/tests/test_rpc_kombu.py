@@ -0,0 +1,156 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for publishing with the kombu RPC driver, on the memory
+transport.  The memory transport has no publisher confirms, so the
+broker's side of those is faked.
+"""
+
+from oslo.config import cfg
+import testtools
+
+from nova import context
+from nova.openstack.common.rpc import common as rpc_common
+from nova.openstack.common import uuidutils
+from nova import test
+
+try:
+    from nova.openstack.common.rpc import impl_kombu
+except ImportError:
+    impl_kombu = None
+
+CONF = cfg.CONF
+
+
+@testtools.skipIf(impl_kombu is None, 'kombu is not available')
+class KombuPublishTestCase(test.TestCase):
+
+    def setUp(self):
+        super(KombuPublishTestCase, self).setUp()
+        self.flags(fake_rabbit=True)
+        # The memory transport's queues outlive the connections
+        self.topic = 'testtopic-%s' % uuidutils.generate_uuid()
+        self.received = []
+        self.conn = impl_kombu.Connection(CONF)
+        self.addCleanup(self.conn.close)
+        self.addCleanup(impl_kombu.cleanup)
+
+    def _consume(self):
+        consumer = impl_kombu.Connection(CONF)
+        consumer.declare_topic_consumer(self.topic, self.received.append)
+        self.addCleanup(consumer.close)
+        return consumer
+
+    def _msgs(self, count):
+        return [{'method': 'echo', 'args': {'value': i}}
+                for i in xrange(count)]
+
+    def _received_values(self):
+        return [msg['args']['value'] for msg in self.received]
+
+    def test_topic_send_many(self):
+        consumer = self._consume()
+        self.conn.topic_send_many(self.topic, self._msgs(5))
+        consumer.consume(limit=5)
+        self.assertEqual(range(5), self._received_values())
+
+    def test_cast_many(self):
+        consumer = self._consume()
+        ctxt = context.RequestContext('user', 'project')
+        impl_kombu.cast_many(CONF, ctxt, self.topic, self._msgs(3))
+        consumer.consume(limit=3)
+        self.assertEqual(range(3), self._received_values())
+        self.assertEqual('user', self.received[0]['_context_user_id'])
+
+    def test_publishers_are_cached(self):
+        publisher = self.conn._get_publisher(impl_kombu.TopicPublisher,
+                                             self.topic, {})
+        self.assertTrue(publisher is self.conn._get_publisher(
+            impl_kombu.TopicPublisher, self.topic, {}))
+        self.assertFalse(publisher is self.conn._get_publisher(
+            impl_kombu.TopicPublisher, 'othertopic', {}))
+
+    def test_auto_delete_publishers_are_not_cached(self):
+        publisher = self.conn._get_publisher(impl_kombu.DirectPublisher,
+                                             'msg_id', {})
+        self.assertFalse(publisher.cacheable)
+        self.assertFalse(publisher is self.conn._get_publisher(
+            impl_kombu.DirectPublisher, 'msg_id', {}))
+        self.assertEqual({}, self.conn.publishers)
+
+    def test_reset_keeps_channel_without_consumers(self):
+        channel = self.conn.channel
+        self.conn.topic_send(self.topic, {'method': 'echo'})
+        self.conn.reset()
+        self.assertTrue(channel is self.conn.channel)
+        self.assertEqual(1, len(self.conn.publishers))
+
+    def test_reset_replaces_channel_with_consumers(self):
+        channel = self.conn.channel
+        self.conn.topic_send(self.topic, {'method': 'echo'})
+        self.conn.declare_topic_consumer(self.topic, self.received.append)
+        self.conn.reset()
+        self.assertFalse(channel is self.conn.channel)
+        self.assertEqual({}, self.conn.publishers)
+        self.assertEqual([], self.conn.consumers)
+
+    def _fake_confirms(self, on_wait):
+        """Have the connection wait for confirms, which on_wait gives."""
+        self.conn.confirms = True
+        self.sent = []
+        orig_send = impl_kombu.TopicPublisher.send
+
+        def send(publisher, msg, timeout=None):
+            self.sent.append(msg['args']['value'])
+            orig_send(publisher, msg, timeout)
+
+        self.stubs.Set(impl_kombu.TopicPublisher, 'send', send)
+        # The memory transport's channel has no wait()
+        self.conn.channel.wait = lambda allowed_methods: on_wait()
+
+    def test_confirms(self):
+        self._fake_confirms(
+            lambda: self.conn._confirmed(self.conn.published_tag, True))
+        self.conn.topic_send_many(self.topic, self._msgs(3))
+        self.assertEqual([0, 1, 2], self.sent)
+        self.assertEqual(3, self.conn.confirmed_tag)
+
+    def test_reconnect_only_resends_unconfirmed(self):
+        def on_wait():
+            # The broker confirms the first two, then the connection fails
+            self.conn._confirmed(2, True)
+            raise IOError()
+
+        self._fake_confirms(on_wait)
+        self.conn.topic_send_many(self.topic, self._msgs(5))
+        self.assertEqual([0, 1, 2, 3, 4, 2, 3, 4], self.sent)
+
+    def test_nack_raises(self):
+        def on_wait():
+            self.conn._confirmed(1, False)
+            self.conn._nacked(2, False)
+
+        self._fake_confirms(on_wait)
+        self.assertRaises(rpc_common.RPCException,
+                          self.conn.topic_send_many, self.topic,
+                          self._msgs(2))
+        self.assertEqual([0, 1], self.sent)
+
+        # Later batches aren't failed for it
+        self._fake_confirms(
+            lambda: self.conn._confirmed(self.conn.published_tag, True))
+        self.conn.topic_send_many(self.topic, self._msgs(1))
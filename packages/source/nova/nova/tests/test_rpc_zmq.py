@@ -0,0 +1,134 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the shared clients and batches of the ZeroMQ RPC driver.
+
+The sockets are faked, so these run without ZeroMQ.
+"""
+
+from oslo.config import cfg
+
+from nova import context
+from nova.openstack.common.rpc import impl_zmq
+from nova import test
+
+CONF = cfg.CONF
+
+
+class FakeZmq(object):
+    PUSH, PULL, PUB, SUB = range(4)
+
+
+class FakeSocket(object):
+    """Keeps the multipart messages sent, and receives them back."""
+
+    fail_sends = 0
+
+    def __init__(self, addr, zmq_type, bind=True, subscribe=None):
+        self.addr = addr
+        self.sock = True
+        self.sent = []
+
+    def send(self, data):
+        if FakeSocket.fail_sends:
+            FakeSocket.fail_sends -= 1
+            raise test.TestingException()
+        self.sent.append(data)
+
+    def recv(self):
+        return self.sent.pop(0)
+
+    def close(self):
+        self.sock = None
+
+
+class FakeProxy(object):
+
+    def __init__(self):
+        self.dispatched = []
+
+    def dispatch(self, ctxt, version, method, **kwargs):
+        self.dispatched.append((ctxt.to_dict()['user_id'], method, kwargs))
+
+
+class ZmqClientTestCase(test.TestCase):
+
+    def setUp(self):
+        super(ZmqClientTestCase, self).setUp()
+        self.stubs.Set(impl_zmq, 'zmq', FakeZmq)
+        self.stubs.Set(impl_zmq, 'ZmqSocket', FakeSocket)
+        self.stubs.Set(impl_zmq, 'CLIENTS', {})
+        self.stubs.Set(FakeSocket, 'fail_sends', 0)
+        self.context = context.RequestContext('user', 'project')
+
+    def test_clients_are_shared(self):
+        client = impl_zmq._get_client('tcp://host1:9501')
+        self.assertTrue(client is impl_zmq._get_client('tcp://host1:9501'))
+        self.assertFalse(client is impl_zmq._get_client('tcp://host2:9501'))
+
+    def test_reconnect_after_failed_send(self):
+        client = impl_zmq._get_client('tcp://host1:9501')
+        FakeSocket.fail_sends = 1
+        self.assertRaises(test.TestingException, client.cast, None,
+                          'compute.host1', ['{}', {'method': 'noop'}], True)
+        self.assertTrue(client.closed)
+        self.assertEqual(0, client.pending)
+
+        new_client = impl_zmq._get_client('tcp://host1:9501')
+        self.assertFalse(new_client is client)
+        new_client.cast(None, 'compute.host1', ['{}', {'method': 'noop'}],
+                        True)
+        self.assertEqual(1, len(new_client.outq.sent))
+        self.assertEqual({'tcp://host1:9501': {'pending': 0, 'sent': 1}},
+                         impl_zmq.get_client_stats())
+
+    def test_cast_many_round_trip(self):
+        msgs = [{'method': 'echo', 'args': {'value': i}} for i in xrange(3)]
+        msgs.append({'method': 'other', 'args': {}})
+        impl_zmq._cast_many('tcp://host1:9501', self.context,
+                            'compute.host1', msgs)
+        client = impl_zmq._get_client('tcp://host1:9501')
+        self.assertEqual(4, client.sent)
+        self.assertEqual(1, len(client.outq.sent))
+        self.assertEqual(impl_zmq.BATCH_ENVELOPE, client.outq.sent[0][2])
+
+        reactor = impl_zmq.ZmqReactor(CONF)
+        proxy = FakeProxy()
+        reactor.proxies[client.outq] = proxy
+        reactor.consume(client.outq)
+        reactor.pool.waitall()
+        self.assertEqual([('user', 'echo', {'value': 0}),
+                          ('user', 'echo', {'value': 1}),
+                          ('user', 'echo', {'value': 2}),
+                          ('user', 'other', {})],
+                         proxy.dispatched)
+
+    def test_cast_many_batches_only_if_enabled(self):
+        sent = []
+        self.stubs.Set(impl_zmq, '_multi_send',
+                       lambda method, context, topic, msg, **kwargs:
+                           sent.append((method, msg)))
+        msgs = [{'method': 'echo', 'args': {'value': i}} for i in xrange(2)]
+
+        impl_zmq.cast_many(CONF, self.context, 'compute.host1', msgs)
+        self.assertEqual([(impl_zmq._cast, msgs[0]),
+                          (impl_zmq._cast, msgs[1])], sent)
+
+        del sent[:]
+        self.flags(rpc_zmq_batch_casts=True)
+        impl_zmq.cast_many(CONF, self.context, 'compute.host1', msgs)
+        self.assertEqual([(impl_zmq._cast_many, msgs)], sent)
@@ -21,15 +21,21 @@ import hashlib
 import importlib
 import os
 import os.path
+import shutil
+import socket
 import StringIO
+import sys
 import tempfile
 
+from eventlet import greenpool
 import mox
 import netaddr
 from oslo.config import cfg
 
 import nova
 from nova import exception
+from nova.openstack.common import importutils
+from nova.openstack.common.rootwrap import client as rootwrap_client
 from nova.openstack.common import timeutils
 from nova import test
 from nova import utils
@@ -155,6 +161,85 @@ grep foo
             os.unlink(tmpfilename2)
 
 
+class RootwrapDaemonTestCase(test.TestCase):
+
+    def setUp(self):
+        super(RootwrapDaemonTestCase, self).setUp()
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        os.mkdir(os.path.join(tmpdir, 'rootwrap.d'))
+        with open(os.path.join(tmpdir, 'rootwrap.d', 'test.filters'),
+                  'w') as f:
+            f.write('[Filters]\n'
+                    'cat: CommandFilter, /bin/cat, root\n'
+                    'sh: CommandFilter, /bin/sh, root\n')
+        conffile = os.path.join(tmpdir, 'rootwrap.conf')
+        with open(conffile, 'w') as f:
+            f.write('[DEFAULT]\nfilters_path=%s\n'
+                    % os.path.join(tmpdir, 'rootwrap.d'))
+
+        daemon = os.path.join(os.path.dirname(nova.__file__), os.pardir,
+                              'bin', 'nova-rootwrap-daemon')
+        self.client = rootwrap_client.Client([sys.executable, daemon,
+                                              conffile])
+        self.addCleanup(self.client.stop)
+
+    def test_execute(self):
+        returncode, out, err = self.client.execute(['cat'], 'foo\0bar')
+        self.assertEqual((returncode, out, err), (0, 'foo\0bar', ''))
+
+        returncode, out, err = self.client.execute(
+            ['sh', '-c', 'echo out; echo err >&2; exit 3'])
+        self.assertEqual((returncode, out, err), (3, 'out\n', 'err\n'))
+
+    def test_unauthorized(self):
+        returncode, out, err = self.client.execute(['rm', '-rf', '/tmp/x'])
+        self.assertEqual(returncode, 99)
+        self.assertTrue('Unauthorized command' in err)
+
+    def test_invalid_token(self):
+        self.client.execute(['cat'], '')
+        self.client._token = 'x' * len(self.client._token)
+        self.assertRaises(rootwrap_client.DaemonError,
+                          self.client.execute, ['cat'], '')
+
+    def test_concurrent_commands(self):
+        pool = greenpool.GreenPool()
+        results = list(pool.imap(
+            lambda i: self.client.execute(['sh', '-c',
+                                           'sleep 0.2; echo %d' % i]),
+            range(5)))
+        self.assertEqual(results, [(0, '%d\n' % i, '') for i in range(5)])
+
+    def test_restarts_daemon(self):
+        self.client.execute(['cat'], '')
+        self.client._process.stdin.close()
+        self.client._process.wait()
+        self.assertEqual(self.client.execute(['cat'], 'foo'), (0, 'foo', ''))
+
+    def test_stopped_while_sending(self):
+        self.client.execute(['cat'], '')
+        orig_send = self.client._send
+
+        def send(request):
+            # stop() is called by another greenthread meanwhile
+            self.stubs.Set(self.client, '_send', orig_send)
+            self.client.stop()
+            raise socket.error()
+
+        self.stubs.Set(self.client, '_send', send)
+        self.assertEqual(self.client.execute(['cat'], 'foo'), (0, 'foo', ''))
+
+    def test_utils_execute(self):
+        self.flags(use_rootwrap_daemon=True)
+        self.stubs.Set(os, 'geteuid', lambda: 1000)
+        self.stubs.Set(utils, '_ROOTWRAP_CLIENT', self.client)
+        self.assertEqual(utils.execute('cat', process_input='foo',
+                                       run_as_root=True), ('foo', ''))
+        self.assertRaises(exception.ProcessExecutionError, utils.execute,
+                          'sh', '-c', 'exit 1', run_as_root=True)
+
+
 class GetFromPathTestCase(test.TestCase):
     def test_tolerates_nones(self):
         f = utils.get_from_path
@@ -310,6 +395,22 @@ class GetFromPathTestCase(test.TestCase):
         self.assertEquals(['b_1'], f(input, "a/b"))
 
 
+class LazyModuleTestCase(test.TestCase):
+    def test_imported_on_first_use(self):
+        imported = []
+
+        def fake_import_module(name):
+            imported.append(name)
+            return os
+
+        self.stubs.Set(importutils, 'import_module', fake_import_module)
+        module = utils.LazyModule('os')
+        self.assertEqual([], imported)
+        self.assertEqual(os.sep, module.sep)
+        self.assertEqual(os.path, module.path)
+        self.assertEqual(['os'], imported)
+
+
 class GenericUtilsTestCase(test.TestCase):
     def test_parse_server_string(self):
         result = utils.parse_server_string('::1')
@@ -12,8 +12,15 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import hashlib
+import os
 
+import fixtures
+
+from nova import exception
+from nova.image import glance
 from nova import test
+from nova import utils
 from nova.virt import images
 
 
@@ -22,3 +29,80 @@ class QemuTestCase(test.TestCase):
         image_info = images.qemu_img_info("/path/that/does/not/exist")
         self.assertTrue(image_info)
         self.assertTrue(str(image_info))
+
+
+class FakeImageService(object):
+    def __init__(self, data, checksum=None):
+        self.data = data
+        self.checksum = checksum
+        if checksum is None:
+            self.checksum = hashlib.md5(data).hexdigest()
+
+    def show(self, context, image_id):
+        return {'id': image_id, 'size': len(self.data),
+                'checksum': self.checksum}
+
+    def download(self, context, image_id, data):
+        for i in xrange(0, len(self.data), 1000):
+            data.write(self.data[i:i + 1000])
+
+
+class FetchTestCase(test.TestCase):
+    def setUp(self):
+        super(FetchTestCase, self).setUp()
+        self.tmpdir = self.useFixture(fixtures.TempDir()).path
+        self.path = os.path.join(self.tmpdir, 'image')
+        self.flags(preallocate_images='none')
+
+    def _stub_image(self, data, checksum=None):
+        image_service = FakeImageService(data, checksum)
+        self.stubs.Set(glance, 'get_remote_image_service',
+                       lambda context, href: (image_service, href))
+
+    def test_detect_format(self):
+        self.assertEqual('raw', images.detect_format('\0' * 4096))
+        self.assertEqual('raw', images.detect_format(''))
+        self.assertEqual('qcow2',
+                         images.detect_format('QFI\xfb\0\0\0\x02' + '\0' * 64))
+        self.assertEqual('vdi', images.detect_format('<<< Oracle VM >>>' +
+                                                     '\0' * 47 +
+                                                     '\x7f\x10\xda\xbe'))
+        self.assertEqual('vmdk', images.detect_format(
+            '# Disk DescriptorFile\nversion=1\nCID=fffffffe\n'))
+
+    def test_fetch_and_inspect(self):
+        data = 'QFI\xfb\0\0\0\x02' + 'x' * 9000
+        self._stub_image(data)
+        fmt = images.fetch_and_inspect('ctxt', 'fake-image', self.path)
+        self.assertEqual('qcow2', fmt)
+        with open(self.path) as f:
+            self.assertEqual(data, f.read())
+
+    def test_fetch_and_inspect_short_image(self):
+        self._stub_image('tiny')
+        fmt = images.fetch_and_inspect('ctxt', 'fake-image', self.path)
+        self.assertEqual('raw', fmt)
+
+    def test_fetch_and_inspect_bad_checksum(self):
+        self._stub_image('x' * 5000, checksum='0' * 32)
+        self.assertRaises(exception.ImageUnacceptable,
+                          images.fetch_and_inspect,
+                          'ctxt', 'fake-image', self.path)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_fetch_and_inspect_preallocates(self):
+        self.flags(preallocate_images='space')
+        self._stub_image('x' * 5000)
+        self.mox.StubOutWithMock(utils, 'trycmd')
+        utils.trycmd('fallocate', '-n', '-l', 5000,
+                     self.path).AndReturn(('', ''))
+        self.mox.ReplayAll()
+        images.fetch_and_inspect('ctxt', 'fake-image', self.path)
+
+    def test_fetch_to_raw_raw_image(self):
+        self._stub_image('\0' * 5000)
+        self.mox.StubOutWithMock(images, 'qemu_img_info')
+        self.mox.ReplayAll()
+        images.fetch_to_raw('ctxt', 'fake-image', self.path, 'user', 'proj')
+        self.assertTrue(os.path.exists(self.path))
+        self.assertFalse(os.path.exists(self.path + '.part'))
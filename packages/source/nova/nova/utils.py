@@ -49,6 +49,7 @@ from nova import exception
 from nova.openstack.common import excutils
 from nova.openstack.common import importutils
 from nova.openstack.common import log as logging
+from nova.openstack.common.rootwrap import client as rootwrap_client
 from nova.openstack.common.rpc import common as rpc_common
 from nova.openstack.common import timeutils
 
@@ -80,6 +81,11 @@ utils_opts = [
                default="/etc/nova/rootwrap.conf",
                help='Path to the rootwrap configuration file to use for '
                     'running commands as root'),
+    cfg.BoolOpt('use_rootwrap_daemon',
+                default=False,
+                help='Run commands as root through a nova-rootwrap-daemon '
+                     'started once, instead of starting nova-rootwrap '
+                     'with sudo for each command'),
     cfg.StrOpt('tempdir',
                default=None,
                help='Explicitly specify the temporary working directory'),
@@ -155,6 +161,44 @@ def _subprocess_setup():
     signal.signal(signal.SIGPIPE, signal.SIG_DFL)
 
 
+_ROOTWRAP_CLIENT = None
+
+
+def _get_rootwrap_client():
+    global _ROOTWRAP_CLIENT
+    if _ROOTWRAP_CLIENT is None:
+        _ROOTWRAP_CLIENT = rootwrap_client.Client(
+            ['sudo', 'nova-rootwrap-daemon', CONF.rootwrap_config])
+    return _ROOTWRAP_CLIENT
+
+
+def _run_subprocess(cmd, process_input, shell):
+    LOG.debug(_('Running cmd (subprocess): %s'), ' '.join(cmd))
+    _PIPE = subprocess.PIPE  # pylint: disable=E1101
+
+    if os.name == 'nt':
+        preexec_fn = None
+        close_fds = False
+    else:
+        preexec_fn = _subprocess_setup
+        close_fds = True
+
+    obj = subprocess.Popen(cmd,
+                           stdin=_PIPE,
+                           stdout=_PIPE,
+                           stderr=_PIPE,
+                           close_fds=close_fds,
+                           preexec_fn=preexec_fn,
+                           shell=shell)
+    result = None
+    if process_input is not None:
+        result = obj.communicate(process_input)
+    else:
+        result = obj.communicate()
+    obj.stdin.close()  # pylint: disable=E1101
+    return result, obj.returncode  # pylint: disable=E1101
+
+
 def execute(*cmd, **kwargs):
     """Helper method to execute command with optional retry.
 
@@ -197,38 +241,27 @@ def execute(*cmd, **kwargs):
         raise exception.NovaException(_('Got unknown keyword args '
                                         'to utils.execute: %r') % kwargs)
 
+    use_rootwrap_daemon = False
     if run_as_root and os.geteuid() != 0:
-        cmd = ['sudo', 'nova-rootwrap', CONF.rootwrap_config] + list(cmd)
+        if CONF.use_rootwrap_daemon:
+            use_rootwrap_daemon = True
+        else:
+            cmd = ['sudo', 'nova-rootwrap', CONF.rootwrap_config] + list(cmd)
 
     cmd = map(str, cmd)
 
     while attempts > 0:
         attempts -= 1
         try:
-            LOG.debug(_('Running cmd (subprocess): %s'), ' '.join(cmd))
-            _PIPE = subprocess.PIPE  # pylint: disable=E1101
-
-            if os.name == 'nt':
-                preexec_fn = None
-                close_fds = False
-            else:
-                preexec_fn = _subprocess_setup
-                close_fds = True
-
-            obj = subprocess.Popen(cmd,
-                                   stdin=_PIPE,
-                                   stdout=_PIPE,
-                                   stderr=_PIPE,
-                                   close_fds=close_fds,
-                                   preexec_fn=preexec_fn,
-                                   shell=shell)
-            result = None
-            if process_input is not None:
-                result = obj.communicate(process_input)
+            if use_rootwrap_daemon:
+                LOG.debug(_('Running cmd (rootwrap daemon): %s'),
+                          ' '.join(cmd))
+                _returncode, stdout, stderr = \
+                    _get_rootwrap_client().execute(cmd, process_input)
+                result = (stdout, stderr)
             else:
-                result = obj.communicate()
-            obj.stdin.close()  # pylint: disable=E1101
-            _returncode = obj.returncode  # pylint: disable=E1101
+                result, _returncode = _run_subprocess(cmd, process_input,
+                                                      shell)
             LOG.debug(_('Result was %s') % _returncode)
             if not ignore_exit_code and _returncode not in check_exit_code:
                 (stdout, stderr) = result
@@ -546,6 +579,22 @@ class LazyPluggable(object):
         return getattr(backend, key)
 
 
+class LazyModule(object):
+    """A module that is only imported when one of its attributes is
+    first looked up, for modules that are slow to import and only
+    needed by a few code paths.
+    """
+
+    def __init__(self, name):
+        self.__name = name
+        self.__module = None
+
+    def __getattr__(self, key):
+        if self.__module is None:
+            self.__module = importutils.import_module(self.__name)
+        return getattr(self.__module, key)
+
+
 class LoopingCallDone(Exception):
     """Exception to break out and stop a LoopingCall.
 
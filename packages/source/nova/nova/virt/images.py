@@ -21,6 +21,7 @@
 Handling of VM disk images.
 """
 
+import hashlib
 import os
 import re
 
@@ -41,6 +42,30 @@ image_opts = [
 
 CONF = cfg.CONF
 CONF.register_opts(image_opts)
+CONF.import_opt('preallocate_images', 'nova.virt.driver')
+
+# Magic numbers of the image formats qemu-img knows about, with the offset
+# they are found at. Anything that matches none of these is what qemu-img
+# would call raw. Every format that can have a backing file is in here.
+_FORMAT_MAGIC = [
+    ('qcow2', 0, 'QFI\xfb'),
+    ('qed', 0, 'QED\x00'),
+    ('cow', 0, 'OOOM'),
+    ('vmdk', 0, 'KDMV'),
+    ('vmdk', 0, 'COWD'),
+    ('vpc', 0, 'conectix'),
+    ('vhdx', 0, 'vhdxfile'),
+    ('vdi', 64, '\x7f\x10\xda\xbe'),
+    ('cloop', 0, '#!/bin/sh\n#V2.0 Format\n'),
+    ('bochs', 0, 'Bochs Virtual HD Image'),
+    ('parallels', 0, 'WithoutFreeSpace'),
+    ('parallels', 0, 'WithouFreSpacExt'),
+]
+# Like qemu-img, take any text with a version line near the start for a
+# vmdk descriptor file
+_VMDK_DESCRIPTOR_RE = re.compile(r'^\s*version=[123]', re.M)
+# How much qemu-img looks at to tell formats apart
+_FORMAT_PROBE_SIZE = 2048
 
 
 class QemuImgInfo(object):
@@ -190,6 +215,82 @@ def convert_image(source, dest, out_format, run_as_root=False):
     utils.execute(*cmd, run_as_root=run_as_root)
 
 
+def detect_format(head):
+    """Return the format of an image, given its first bytes."""
+    for name, offset, magic in _FORMAT_MAGIC:
+        if head[offset:offset + len(magic)] == magic:
+            return name
+    if _VMDK_DESCRIPTOR_RE.search(head):
+        return 'vmdk'
+    return 'raw'
+
+
+class ImageFile(object):
+    """File-like object to download an image into.
+
+    Works out the checksum and the format of the image as it is written.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, 'wb')
+        self._md5 = hashlib.md5()
+        self._head = ''
+        self.format = None
+        self.size = 0
+
+    def write(self, data):
+        if self.format is None:
+            self._head += data[:_FORMAT_PROBE_SIZE - len(self._head)]
+            if len(self._head) == _FORMAT_PROBE_SIZE:
+                self.format = detect_format(self._head)
+        self._md5.update(data)
+        self._file.write(data)
+        self.size += len(data)
+
+    def close(self):
+        self._file.close()
+        if self.format is None:
+            self.format = detect_format(self._head)
+
+    def checksum(self):
+        return self._md5.hexdigest()
+
+
+def _preallocate(path, size):
+    """Reserve size bytes for path, if we can."""
+    if CONF.preallocate_images == 'space' and size:
+        _out, err = utils.trycmd('fallocate', '-n', '-l', size, path)
+        if err:
+            LOG.debug(_('Unable to preallocate %(size)s bytes for %(path)s: '
+                        '%(err)s') % locals())
+
+
+def fetch_and_inspect(context, image_href, path):
+    """Download an image, checking its checksum on the way.
+
+    Returns the format of the image, going by its first bytes.
+    """
+    (image_service, image_id) = glance.get_remote_image_service(context,
+                                                                image_href)
+    image_meta = image_service.show(context, image_id)
+    with utils.remove_path_on_error(path):
+        image_file = ImageFile(path)
+        try:
+            _preallocate(path, image_meta.get('size'))
+            image_service.download(context, image_id, image_file)
+        finally:
+            image_file.close()
+
+        expected = image_meta.get('checksum')
+        if expected and image_file.checksum() != expected:
+            raise exception.ImageUnacceptable(image_id=image_href,
+                reason=_("checksum mismatch, expected %(expected)s but "
+                         "got %(actual)s") %
+                       {'expected': expected,
+                        'actual': image_file.checksum()})
+    return image_file.format
+
+
 def fetch(context, image_href, path, _user_id, _project_id):
     # TODO(vish): Improve context handling and add owner and auth data
     #             when it is added to glance.  Right now there is no
@@ -204,9 +305,15 @@ def fetch(context, image_href, path, _user_id, _project_id):
 
 def fetch_to_raw(context, image_href, path, user_id, project_id):
     path_tmp = "%s.part" % path
-    fetch(context, image_href, path_tmp, user_id, project_id)
+    fmt = fetch_and_inspect(context, image_href, path_tmp)
 
     with utils.remove_path_on_error(path_tmp):
+        if fmt == 'raw':
+            # Nothing qemu-img would recognise, so it has no backing file
+            # and is good to go as it is.
+            os.rename(path_tmp, path)
+            return
+
         data = qemu_img_info(path_tmp)
 
         fmt = data.file_format
@@ -55,7 +55,6 @@ import uuid
 from eventlet import greenio
 from eventlet import greenthread
 from eventlet import patcher
-from eventlet import tpool
 from eventlet import util as eventlet_util
 from lxml import etree
 from oslo.config import cfg
@@ -88,6 +87,7 @@ from nova.virt.libvirt import config as vconfig
 from nova.virt.libvirt import firewall as libvirt_firewall
 from nova.virt.libvirt import imagebackend
 from nova.virt.libvirt import imagecache
+from nova.virt.libvirt import threadpool
 from nova.virt.libvirt import utils as libvirt_utils
 from nova.virt import netutils
 
@@ -185,6 +185,15 @@ libvirt_opts = [
                 default=True,
                 help='Use a separated OS thread pool to realize non-blocking'
                      ' libvirt calls'),
+    cfg.IntOpt('libvirt_thread_pool_size',
+               default=20,
+               help='Number of OS threads to run libvirt calls on, if '
+                    'libvirt_nonblocking is set'),
+    cfg.IntOpt('libvirt_stuck_call_threshold',
+               default=60,
+               help='Log libvirt calls that have been running, or waiting '
+                    'for a thread, for more than this many seconds.  0 '
+                    'disables this'),
     cfg.StrOpt('libvirt_cpu_mode',
                default=None,
                help='Set to "host-model" to clone the host CPU feature flags; '
@@ -228,22 +237,25 @@ DEFAULT_FIREWALL_DRIVER = "%s.%s" % (
 MAX_CONSOLE_BYTES = 102400
 
 
-def patch_tpool_proxy():
-    """eventlet.tpool.Proxy doesn't work with old-style class in __str__()
-    or __repr__() calls. See bug #962840 for details.
-    We perform a monkey patch to replace those two instance methods.
-    """
-    def str_method(self):
-        return str(self._obj)
+# Objects returned by libvirt whose methods are called in the thread
+# pool, if this version of libvirt has them.
+LIBVIRT_PROXIED_CLASSES = ['virConnect', 'virDomain', 'virInterface',
+                           'virNetwork', 'virNodeDevice', 'virNWFilter',
+                           'virSecret', 'virStoragePool', 'virStorageVol',
+                           'virStream']
 
-    def repr_method(self):
-        return repr(self._obj)
+# One pool for all drivers, so the number of threads stays bounded
+_thread_pool = None
 
-    tpool.Proxy.__str__ = str_method
-    tpool.Proxy.__repr__ = repr_method
 
+def _get_thread_pool():
+    global _thread_pool
+    if _thread_pool is None:
+        _thread_pool = threadpool.ThreadPool(
+            'libvirt', CONF.libvirt_thread_pool_size,
+            CONF.libvirt_stuck_call_threshold)
+    return _thread_pool
 
-patch_tpool_proxy()
 
 VIR_DOMAIN_NOSTATE = 0
 VIR_DOMAIN_RUNNING = 1
@@ -319,6 +331,7 @@ class LibvirtDriver(driver.ComputeDriver):
         self._event_queue = None
 
         self._disk_cachemode = None
+        self._thread_pool = _get_thread_pool()
         self.image_cache_manager = imagecache.ImageCacheManager()
         self.image_backend = imagebackend.Backend(CONF.use_cow_images)
 
@@ -555,9 +568,11 @@ class LibvirtDriver(driver.ComputeDriver):
                 self._wrapped_conn = self._connect(self.uri(),
                                                self.read_only)
             else:
-                self._wrapped_conn = tpool.proxy_call(
-                    (libvirt.virDomain, libvirt.virConnect),
-                    self._connect, self.uri(), self.read_only)
+                proxied = tuple(getattr(libvirt, name)
+                                for name in LIBVIRT_PROXIED_CLASSES
+                                if hasattr(libvirt, name))
+                self._wrapped_conn = self._thread_pool.proxy_call(
+                    proxied, self._connect, self.uri(), self.read_only)
 
             try:
                 LOG.debug("Registering for lifecycle events %s" % str(self))
@@ -847,6 +862,7 @@ class LibvirtDriver(driver.ComputeDriver):
             target = libvirt_utils.get_instance_path(instance)
             LOG.info(_('Deleting instance files %(target)s') % locals(),
                      instance=instance)
+            self.image_cache_manager.forget_instance_disks(target)
             if os.path.exists(target):
                 # If we fail to get rid of the directory
                 # tree, this shouldn't block deletion of
@@ -1744,6 +1760,10 @@ class LibvirtDriver(driver.ComputeDriver):
             return os.path.join(libvirt_utils.get_instance_path(instance),
                                 fname + suffix)
 
+        # The disks may be created again, e.g. on a rebuild
+        self.image_cache_manager.forget_instance_disks(
+            libvirt_utils.get_instance_path(instance))
+
         def image(fname, image_type=CONF.libvirt_images_type):
             return self.image_backend.image(instance,
                                             fname + suffix, image_type)
@@ -2826,6 +2846,9 @@ class LibvirtDriver(driver.ComputeDriver):
                'hypervisor_hostname': self.get_hypervisor_hostname(),
                'cpu_info': self.get_cpu_info(),
                'disk_available_least': _get_disk_available_least()}
+        if CONF.libvirt_nonblocking:
+            LOG.debug(_("libvirt thread pool stats: %s"),
+                      self._thread_pool.get_stats())
         return dic
 
     def check_can_live_migrate_destination(self, ctxt, instance_ref,
@@ -3233,6 +3256,7 @@ class LibvirtDriver(driver.ComputeDriver):
         """
         disk_info = jsonutils.loads(disk_info_json)
         instance_dir = libvirt_utils.get_instance_path(instance)
+        self.image_cache_manager.forget_instance_disks(instance_dir)
 
         for info in disk_info:
             base = os.path.basename(info['path'])
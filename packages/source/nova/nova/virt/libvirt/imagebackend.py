@@ -203,8 +203,10 @@ class Raw(Image):
             self.driver_format = data.file_format or 'raw'
 
     def create_image(self, prepare_template, base, size, *args, **kwargs):
+        # Only reads the base image, the image cache manager takes the
+        # lock exclusively to remove it.
         @lockutils.synchronized(base, 'nova-', external=True,
-                                lock_path=self.lock_path)
+                                lock_path=self.lock_path, shared=True)
         def copy_raw_image(base, target, size):
             libvirt_utils.copy_image(base, target)
             if size:
@@ -243,8 +245,10 @@ class Qcow2(Image):
         self.preallocate = CONF.preallocate_images != 'none'
 
     def create_image(self, prepare_template, base, size, *args, **kwargs):
+        # Only reads the base image, the image cache manager takes the
+        # lock exclusively to remove it.
         @lockutils.synchronized(base, 'nova-', external=True,
-                                lock_path=self.lock_path)
+                                lock_path=self.lock_path, shared=True)
         def copy_qcow2_image(base, target, size):
             # TODO(pbrady): Consider copying the cow image here
             # with preallocation=metadata set for performance reasons.
@@ -309,8 +313,10 @@ class Lvm(Image):
         return False
 
     def create_image(self, prepare_template, base, size, *args, **kwargs):
+        # Only reads the base image, the image cache manager takes the
+        # lock exclusively to remove it.
         @lockutils.synchronized(base, 'nova-', external=True,
-                                lock_path=self.lock_path)
+                                lock_path=self.lock_path, shared=True)
         def create_lvm_image(base, size):
             base_size = disk.get_disk_size(base)
             resize = size > base_size
@@ -26,6 +26,7 @@ import hashlib
 import json
 import os
 import re
+import tempfile
 import time
 
 from oslo.config import cfg
@@ -74,6 +75,11 @@ imagecache_opts = [
     cfg.IntOpt('checksum_interval_seconds',
                default=3600,
                help='How frequently to checksum base images'),
+    cfg.IntOpt('checksum_base_images_per_pass',
+               default=0,
+               help='How many base images to checksum at most in one image '
+                    'cache manager pass, 0 for no limit. Images that are '
+                    'due are then checksummed over the following passes'),
     ]
 
 CONF = cfg.CONF
@@ -81,6 +87,10 @@ CONF.register_opts(imagecache_opts)
 CONF.import_opt('host', 'nova.netconf')
 CONF.import_opt('instances_path', 'nova.compute.manager')
 
+# Name of the file in the base directory that remembers the backing file
+# of each instance disk of a host
+BACKING_FILE_INDEX = 'backing-files-%s.json'
+
 
 def get_cache_fname(images, key):
     """Return a filename based on the SHA1 hash of a given image ID.
@@ -175,7 +185,7 @@ def read_stored_info(target, field=None, timestamped=False):
         lock_path = os.path.join(CONF.instances_path, 'locks')
 
         @lockutils.synchronized(lock_name, 'nova-', external=True,
-                                lock_path=lock_path)
+                                lock_path=lock_path, shared=True)
         def read_file(info_file):
             LOG.debug(_('Reading image info file: %s'), info_file)
             with open(info_file, 'r') as f:
@@ -239,9 +249,127 @@ def write_stored_checksum(target):
     write_stored_info(target, field='sha1', value=checksum)
 
 
+class BackingFileIndex(object):
+    """Remembers the backing file of instance disks between passes.
+
+    Looking up a backing file runs qemu-img on the disk, but the backing
+    file of a disk doesn't change until the disk is created again, which
+    the driver reports with forget(). As a safety net, entries are keyed
+    by the inode of the disk too, though a new file may well get the
+    inode of the one it replaces. Entries for disks that are gone are
+    dropped when the index is saved.
+
+    Every host has an index file of its own, as _base may be shared, and
+    merges its changes into it under an external lock.
+    """
+
+    def __init__(self, path, lock_path):
+        self.path = path
+        self.lock_path = lock_path
+        self._entries = None
+        # Entries looked up, and disks seen, since the index was saved
+        self._updated = {}
+        self._seen = set()
+
+    def _read(self):
+        try:
+            with open(self.path, 'r') as f:
+                return _read_possible_json(f.read(), self.path)
+        except IOError:
+            return {}
+
+    def _write(self, entries):
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(self.path),
+            prefix='.%s.' % os.path.basename(self.path))
+        with utils.remove_path_on_error(tmp_path):
+            with os.fdopen(fd, 'w') as f:
+                f.write(jsonutils.dumps(entries))
+            os.rename(tmp_path, self.path)
+
+    def _merge(self, change):
+        """Apply change to the entries in the index file, and write them
+        back if it returns True.
+        """
+        try:
+            with lockutils.lock('backing-file-index', 'nova-',
+                                external=True, lock_path=self.lock_path):
+                entries = self._read()
+                if change(entries):
+                    self._write(entries)
+        except (IOError, OSError), e:
+            LOG.warning(_('Failed to write %(path)s: %(error)s'),
+                        {'path': self.path, 'error': e})
+            return
+        self._entries = entries
+
+    def get_backing_file(self, disk_path):
+        if self._entries is None:
+            self._entries = self._read()
+        self._seen.add(disk_path)
+
+        try:
+            inode = os.stat(disk_path).st_ino
+        except OSError:
+            return virtutils.get_disk_backing_file(disk_path)
+
+        entry = self._entries.get(disk_path)
+        if entry and entry['inode'] == inode:
+            return entry['backing_file']
+
+        backing_file = virtutils.get_disk_backing_file(disk_path)
+        entry = {'inode': inode, 'backing_file': backing_file}
+        self._entries[disk_path] = self._updated[disk_path] = entry
+        return backing_file
+
+    def forget(self, instance_path):
+        """Forget the disks of an instance, which are about to be created
+        again or deleted.
+        """
+        prefix = os.path.join(instance_path, '')
+
+        def forget_disks(entries):
+            disk_paths = [disk_path for disk_path in entries
+                          if disk_path.startswith(prefix)]
+            for disk_path in disk_paths:
+                del entries[disk_path]
+            return bool(disk_paths)
+
+        forget_disks(self._updated)
+        if self._entries is not None:
+            forget_disks(self._entries)
+        if os.path.exists(self.path):
+            self._merge(forget_disks)
+
+    def save(self):
+        """Write the entries looked up during the pass, and forget about
+        disks that are gone.
+        """
+        if self._entries is None:
+            return
+        updated, self._updated = self._updated, {}
+        seen, self._seen = self._seen, set()
+
+        def merge(entries):
+            gone = [disk_path for disk_path in entries
+                    if disk_path not in seen and
+                    not os.path.exists(disk_path)]
+            for disk_path in gone:
+                del entries[disk_path]
+            changed = bool(gone)
+            for disk_path, entry in updated.iteritems():
+                if entries.get(disk_path) != entry:
+                    entries[disk_path] = entry
+                    changed = True
+            return changed
+
+        self._merge(merge)
+
+
 class ImageCacheManager(object):
     def __init__(self):
         self.lock_path = os.path.join(CONF.instances_path, 'locks')
+        self.backing_file_index = None
         self._reset_state()
 
     def _reset_state(self):
@@ -257,6 +385,8 @@ class ImageCacheManager(object):
         self.removable_base_files = []
         self.unexplained_images = []
 
+        self.checksums_this_pass = 0
+
     def _store_image(self, base_dir, ent, original=False):
         """Store a base image for later examination."""
         entpath = os.path.join(base_dir, ent)
@@ -276,7 +406,11 @@ class ImageCacheManager(object):
         variable with a list of images that we need to try and explain.
         """
         digest_size = hashlib.sha1().digestsize * 2
+        index_prefix = BACKING_FILE_INDEX.split('%')[0]
         for ent in os.listdir(base_dir):
+            if ent.lstrip('.').startswith(index_prefix):
+                continue
+
             if len(ent) == digest_size:
                 self._store_image(base_dir, ent, original=True)
 
@@ -333,7 +467,7 @@ class ImageCacheManager(object):
                 disk_path = os.path.join(CONF.instances_path, ent, 'disk')
                 if os.path.exists(disk_path):
                     LOG.debug(_('%s has a disk file'), ent)
-                    backing_file = virtutils.get_disk_backing_file(disk_path)
+                    backing_file = self._get_backing_file(disk_path)
                     LOG.debug(_('Instance %(instance)s is backed by '
                                 '%(backing)s'),
                               {'instance': ent,
@@ -357,6 +491,40 @@ class ImageCacheManager(object):
 
         return inuse_images
 
+    def _get_backing_file_index(self):
+        if self.backing_file_index is None:
+            base_dir = os.path.join(CONF.instances_path, CONF.base_dir_name)
+            self.backing_file_index = BackingFileIndex(
+                os.path.join(base_dir, BACKING_FILE_INDEX % CONF.host),
+                self.lock_path)
+        return self.backing_file_index
+
+    def _get_backing_file(self, disk_path):
+        if self.backing_file_index is None:
+            return virtutils.get_disk_backing_file(disk_path)
+        return self.backing_file_index.get_backing_file(disk_path)
+
+    def forget_instance_disks(self, instance_path):
+        """Called when the disks of an instance are created or deleted,
+        so their backing files are looked up afresh.
+        """
+        self._get_backing_file_index().forget(instance_path)
+
+    def _checksum_allowed(self, img_id, base_file):
+        """Count a checksum against checksum_base_images_per_pass.
+
+        Returns False if the limit for this pass has been reached.
+        """
+        limit = CONF.checksum_base_images_per_pass
+        if limit and self.checksums_this_pass >= limit:
+            LOG.debug(_('image %(id)s at (%(base_file)s): checksum deferred '
+                        'to a later pass'),
+                      {'id': img_id,
+                       'base_file': base_file})
+            return False
+        self.checksums_this_pass += 1
+        return True
+
     def _find_base_file(self, base_dir, fingerprint):
         """Find the base file matching this fingerprint.
 
@@ -419,6 +587,9 @@ class ImageCacheManager(object):
                     write_stored_info(base_file, field='sha1',
                                       value=stored_checksum)
 
+                if not self._checksum_allowed(img_id, base_file):
+                    return None
+
                 with open(base_file, 'r') as f:
                     current_checksum = utils.hash_file(f)
 
@@ -441,7 +612,8 @@ class ImageCacheManager(object):
                 # NOTE(mikal): If the checksum file is missing, then we should
                 # create one. We don't create checksums when we download images
                 # from glance because that would delay VM startup.
-                if CONF.checksum_base_images and create_if_missing:
+                if (CONF.checksum_base_images and create_if_missing and
+                        self._checksum_allowed(img_id, base_file)):
                     LOG.info(_('%(id)s (%(base_file)s): generating checksum'),
                              {'id': img_id,
                               'base_file': base_file})
@@ -474,7 +646,10 @@ class ImageCacheManager(object):
         else:
             LOG.info(_('Removing base file: %s'), base_file)
             try:
-                os.remove(base_file)
+                # Wait for images being created from it to be done
+                with lockutils.lock(base_file, 'nova-', external=True,
+                                    lock_path=self.lock_path):
+                    os.remove(base_file)
                 signature = get_info_filename(base_file)
                 if os.path.exists(signature):
                     os.remove(signature)
@@ -573,6 +748,8 @@ class ImageCacheManager(object):
                       base_dir)
             return
 
+        self._get_backing_file_index()
+
         LOG.debug(_('Verify base images'))
         self._list_base_images(base_dir)
         self._list_running_instances(context, all_instances)
@@ -592,6 +769,7 @@ class ImageCacheManager(object):
 
         # Elements remaining in unexplained_images might be in use
         inuse_backing_images = self._list_backing_images()
+        self.backing_file_index.save()
         for backing_path in inuse_backing_images:
             if backing_path not in self.active_base_files:
                 self.active_base_files.append(backing_path)
@@ -0,0 +1,284 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""A pool of native threads for blocking calls into libvirt.
+
+The libvirt bindings block the calling OS thread until libvirtd answers,
+which would stop every greenthread in nova-compute.  Calls are therefore
+run on up to a fixed number of native threads of their own, like
+eventlet.tpool does, so a slow libvirtd can't use up the threads other
+code runs on with tpool.  The pool keeps latency and in-flight counts
+for every method called, and a watchdog logs calls that run or wait for
+a thread for too long.
+
+This code is based on the eventlet tpool module, under terms of the
+Apache License v2.0.
+"""
+
+import imp
+import os
+import sys
+import time
+
+import eventlet
+from eventlet import event
+from eventlet import hubs
+from eventlet import patcher
+
+from nova.openstack.common import log as logging
+
+native_threading = patcher.original("threading")
+native_Queue = patcher.original("Queue")
+
+LOG = logging.getLogger(__name__)
+
+
+class _Call(object):
+    """A call waiting for, or running on, a thread of the pool."""
+
+    def __init__(self, name, func, args, kwargs):
+        self.name = name
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.event = event.Event()
+        self.queued_at = time.time()
+        # Set by the native thread running the call
+        self.started_at = None
+        self.elapsed = None
+        self.result = None
+        self.exc_info = None
+        self.reported = False
+
+
+class ThreadPool(object):
+    """Runs functions on up to a fixed number of named native threads.
+
+    Greenthreads calling execute() wait for the function to finish
+    without blocking the others.  All bookkeeping is done by the
+    greenthreads, so it needs no locking.
+    """
+
+    def __init__(self, name, size, stuck_threshold=0):
+        """:param name: name of the pool, used for its threads and logging
+           :param size: number of native threads
+           :param stuck_threshold: seconds after which calls that are still
+                                   running or waiting for a thread are
+                                   logged, 0 to never log them
+        """
+        self.name = name
+        self.size = size
+        self.stuck_threshold = stuck_threshold
+        self.threads = []
+        self.in_flight = set()
+        self.stats = {}
+        self._requests = None
+        self._responses = None
+        self._notify_send = None
+        self._notify_recv = None
+
+    def _start(self):
+        self._requests = native_Queue.Queue()
+        self._responses = native_Queue.Queue()
+        self._notify_recv, self._notify_send = os.pipe()
+        eventlet.spawn_n(self._dispatch_responses)
+        if self.stuck_threshold:
+            eventlet.spawn_n(self._watchdog)
+
+    def _add_thread(self):
+        thread = native_threading.Thread(
+            target=self._worker, name='%s-%d' % (self.name, len(self.threads)))
+        thread.setDaemon(True)
+        thread.start()
+        self.threads.append(thread)
+
+    def _worker(self):
+        """Runs calls from the queue, in a native thread."""
+        while True:
+            call = self._requests.get()
+            call.started_at = time.time()
+            try:
+                call.result = call.func(*call.args, **call.kwargs)
+            except (KeyboardInterrupt, SystemExit):
+                raise
+            except BaseException:
+                call.exc_info = sys.exc_info()
+            call.elapsed = time.time() - call.started_at
+            self._responses.put(call)
+            call = None
+            # Wake up the greenthread waiting for responses
+            os.write(self._notify_send, ' ')
+
+    def _dispatch_responses(self):
+        """Hands finished calls back to the greenthreads waiting on them."""
+        while True:
+            hubs.trampoline(self._notify_recv, read=True)
+            os.read(self._notify_recv, 1)
+            while True:
+                try:
+                    call = self._responses.get(block=False)
+                except native_Queue.Empty:
+                    break
+                call.event.send()
+
+    def _watchdog(self):
+        interval = min(self.stuck_threshold, 10)
+        while True:
+            eventlet.sleep(interval)
+            self.check_stuck_calls()
+
+    def check_stuck_calls(self):
+        """Log calls that have been running, or waiting for a thread,
+        longer than the stuck threshold.  Each call is only logged once.
+        """
+        now = time.time()
+        for call in list(self.in_flight):
+            if call.reported:
+                continue
+            if call.started_at is not None:
+                seconds = now - call.started_at
+                msg = _("%(name)s has been running for %(seconds)d "
+                        "seconds on the %(pool)s thread pool")
+            else:
+                seconds = now - call.queued_at
+                msg = _("%(name)s has been waiting for a thread of the "
+                        "%(pool)s thread pool for %(seconds)d seconds, all "
+                        "%(size)d are busy")
+            if seconds < self.stuck_threshold:
+                continue
+            LOG.warn(msg, {'name': call.name, 'seconds': seconds,
+                           'pool': self.name, 'size': self.size})
+            call.reported = True
+            self.stats[call.name]['stuck'] += 1
+
+    def _get_method_stats(self, name):
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = {'calls': 0,
+                                        'errors': 0,
+                                        'in_flight': 0,
+                                        'stuck': 0,
+                                        'total_time': 0.0,
+                                        'max_time': 0.0}
+        return stats
+
+    def execute(self, func, *args, **kwargs):
+        """Run func in the pool and wait for it to finish.
+
+        Returns what func returned, or raises what it raised.
+        """
+        name = getattr(func, '__name__', repr(func))
+        return self._execute(name, func, args, kwargs)
+
+    def _execute(self, name, func, args, kwargs):
+        # Run the call right away if we're in one of our own threads
+        # already (e.g. a libvirt callback), or if we hold the import
+        # lock, as the call might import something and would hang.
+        if (native_threading.current_thread() in self.threads or
+                imp.lock_held()):
+            return func(*args, **kwargs)
+        if self._requests is None:
+            self._start()
+
+        stats = self._get_method_stats(name)
+        call = _Call(name, func, args, kwargs)
+        stats['in_flight'] += 1
+        self.in_flight.add(call)
+        # Threads are only started once there are calls for them
+        if len(self.in_flight) > len(self.threads) < self.size:
+            self._add_thread()
+        try:
+            self._requests.put(call)
+            call.event.wait()
+        finally:
+            stats['in_flight'] -= 1
+            self.in_flight.discard(call)
+
+        stats['calls'] += 1
+        if call.elapsed is not None:
+            stats['total_time'] += call.elapsed
+            stats['max_time'] = max(stats['max_time'], call.elapsed)
+            if call.reported:
+                LOG.warn(_("%(name)s finished after %(seconds).1f seconds"),
+                         {'name': name, 'seconds': call.elapsed})
+        if call.exc_info is not None:
+            stats['errors'] += 1
+            exc_info = call.exc_info
+            call.exc_info = None
+            raise exc_info[0], exc_info[1], exc_info[2]
+        return call.result
+
+    def proxy_call(self, autowrap, func, *args, **kwargs):
+        """Call func in the pool.  If the result is an instance of one
+        of the classes in autowrap, wrap it in a Proxy, so calling its
+        methods goes through the pool too.
+        """
+        name = getattr(func, '__name__', repr(func))
+        result = self._execute(name, func, args, kwargs)
+        if isinstance(result, autowrap):
+            return Proxy(result, self, autowrap)
+        return result
+
+    def get_stats(self):
+        """Return the counters for every method called so far, by name,
+        along with 'queued' for the number of calls waiting for a thread.
+        """
+        stats = {}
+        for name, method_stats in self.stats.iteritems():
+            method_stats = method_stats.copy()
+            calls = method_stats['calls']
+            method_stats['average_time'] = (calls and
+                                            method_stats['total_time'] / calls)
+            stats[name] = method_stats
+        queued = self._requests and self._requests.qsize() or 0
+        return {'queued': queued, 'methods': stats}
+
+
+class Proxy(object):
+    """Calls every method of the wrapped object in a ThreadPool.
+
+    Return values that are instances of the autowrap classes are wrapped
+    too.  Calls are counted as <class name>.<method name>.
+    """
+
+    def __init__(self, obj, pool, autowrap=()):
+        self._obj = obj
+        # Only keep the bound method, so jsonutils.to_primitive() doesn't
+        # walk into the threads and pipes of the pool (bug #962840).
+        self._execute = pool._execute
+        self._autowrap = autowrap
+
+    def _wrap(self, result):
+        if isinstance(result, self._autowrap):
+            return Proxy(result, self._execute.im_self, self._autowrap)
+        return result
+
+    def __getattr__(self, attr_name):
+        f = getattr(self._obj, attr_name)
+        if not callable(f):
+            return self._wrap(f)
+        name = '%s.%s' % (self._obj.__class__.__name__, attr_name)
+
+        def call(*args, **kwargs):
+            return self._wrap(self._execute(name, f, args, kwargs))
+        return call
+
+    def __str__(self):
+        return str(self._obj)
+
+    def __repr__(self):
+        return repr(self._obj)
@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Benchmark for EC2 DescribeInstances id translation.
+
+Formats a list of fake instances with CloudController._format_instances()
+against an in-memory fake database that counts the id translation calls
+made to it: when the ec2 ids still have to be created, with a cold id
+cache and with a warm one. For comparison it also translates the same
+instances one at a time, the way DescribeInstances used to.
+
+Run like:
+
+    ./tools/benchmarks/ec2_describe_instances.py --instances 100 2000
+"""
+import argparse
+import collections
+import gettext
+import os
+import sys
+import time
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+gettext.install('nova', unicode=1)
+
+from oslo.config import cfg
+
+from nova.api.ec2 import cloud
+from nova.api.ec2 import ec2utils
+from nova.compute import instance_types
+from nova import context
+from nova import db
+from nova import exception
+
+
+CONF = cfg.CONF
+
+NUM_HOSTS = 50
+NUM_IMAGES = 20
+
+
+class FakeDB(object):
+    """The few database calls DescribeInstances makes, counted."""
+
+    def __init__(self):
+        self.calls = collections.defaultdict(int)
+        self.instance_ids = {}
+        self.image_ids = {}
+        self.zones = dict(('host%d' % i, set(['zone%d' % (i % 3)]))
+                          for i in xrange(0, NUM_HOSTS, 2))
+
+    def stub_out(self):
+        for name in dir(self):
+            if not name.startswith('_') and name != 'stub_out':
+                setattr(db, name, self._counted(name, getattr(self, name)))
+        # Not an id translation, so not counted
+        db.block_device_mapping_get_all_by_instance = lambda *args: []
+
+    def _counted(self, name, func):
+        def wrapper(*args, **kwargs):
+            self.calls[name] += 1
+            return func(*args, **kwargs)
+        return wrapper
+
+    def get_ec2_instance_id_by_uuid(self, context, instance_uuid):
+        try:
+            return self.instance_ids[instance_uuid]
+        except KeyError:
+            raise exception.InstanceNotFound(instance_id=instance_uuid)
+
+    def get_ec2_instance_ids_by_uuids(self, context, instance_uuids):
+        return dict((uuid, self.instance_ids[uuid]) for uuid in instance_uuids
+                    if uuid in self.instance_ids)
+
+    def ec2_instance_create(self, context, instance_uuid):
+        self.instance_ids[instance_uuid] = len(self.instance_ids) + 1
+        return {'id': self.instance_ids[instance_uuid]}
+
+    def s3_image_get_by_uuid(self, context, image_uuid):
+        try:
+            return {'id': self.image_ids[image_uuid]}
+        except KeyError:
+            raise exception.ImageNotFound(image_id=image_uuid)
+
+    def s3_image_get_ids_by_uuids(self, context, image_uuids):
+        return dict((uuid, self.image_ids[uuid]) for uuid in image_uuids
+                    if uuid in self.image_ids)
+
+    def s3_image_create(self, context, image_uuid):
+        self.image_ids[image_uuid] = len(self.image_ids) + 1
+        return {'id': self.image_ids[image_uuid]}
+
+    def aggregate_metadata_get_by_host(self, context, host, key=None):
+        if host in self.zones:
+            return {'availability_zone': self.zones[host]}
+        return {}
+
+    def aggregate_metadata_get_by_hosts(self, context, hosts, key=None):
+        return dict((host, {'availability_zone': self.zones[host]})
+                    for host in hosts if host in self.zones)
+
+
+def make_instances(count):
+    sys_meta = instance_types.save_instance_type_info(
+        {}, {'id': 1, 'name': 'm1.small', 'flavorid': '2',
+             'memory_mb': 2048, 'vcpus': 1, 'root_gb': 20,
+             'ephemeral_gb': 0, 'swap': 0, 'rxtx_factor': 1.0,
+             'vcpu_weight': None})
+    sys_meta = [{'key': k, 'value': v} for k, v in sys_meta.items()]
+    instances = []
+    for i in xrange(count):
+        instances.append({
+            'uuid': '00000000-0000-0000-0000-%012d' % i,
+            'image_ref': '00000000-0000-0000-0000-0000000000%02d' % (
+                i % NUM_IMAGES),
+            'kernel_id': 'aaaaaaaa-0000-0000-0000-000000000001',
+            'ramdisk_id': 'aaaaaaaa-0000-0000-0000-000000000002',
+            'host': 'host%d' % (i % NUM_HOSTS),
+            'hostname': 'server-%d' % i,
+            'project_id': 'fake',
+            'reservation_id': 'r-%08x' % (i / 10),
+            'vm_state': 'active',
+            'shutdown_terminate': False,
+            'key_name': None,
+            'launch_index': i % 10,
+            'created_at': None,
+            'root_device_name': None,
+            'security_groups': [],
+            'info_cache': {'network_info': []},
+            'system_metadata': sys_meta})
+    return instances
+
+
+def one_at_a_time(ctxt, instances):
+    """Translate the way _format_instances did it before."""
+    for instance in instances:
+        ec2utils.id_to_ec2_inst_id(instance['uuid'])
+        ec2utils.glance_id_to_ec2_id(ctxt, instance['image_ref'])
+        ec2utils.glance_id_to_ec2_id(ctxt, instance['kernel_id'], 'aki')
+        ec2utils.glance_id_to_ec2_id(ctxt, instance['ramdisk_id'], 'ari')
+        ec2utils.get_availability_zone_by_host(instance['host'])
+
+
+def run(label, fake_db, func):
+    fake_db.calls.clear()
+    start = time.time()
+    func()
+    elapsed = time.time() - start
+    print "  %-30s %8.1f ms %6d db calls" % (label, elapsed * 1000,
+                                             sum(fake_db.calls.values()))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--instances', type=int, nargs='+',
+                        default=[100, 2000])
+    args = parser.parse_args()
+
+    CONF([], project='nova')
+
+    fake_db = FakeDB()
+    fake_db.stub_out()
+    ctxt = context.get_admin_context()
+    controller = cloud.CloudController()
+
+    for count in args.instances:
+        instances = make_instances(count)
+        controller.compute_api.get_all = lambda *a, **kw: instances
+        print "%d instances:" % count
+        for label, func in (
+                ('one at a time', lambda: one_at_a_time(ctxt, instances)),
+                ('_format_instances', lambda: controller._format_instances(
+                    ctxt))):
+            fake_db.instance_ids.clear()
+            fake_db.image_ids.clear()
+            ec2utils.reset_cache()
+            run(label + ', new ids', fake_db, func)
+            ec2utils.reset_cache()
+            run(label + ', cold cache', fake_db, func)
+            run(label + ', warm cache', fake_db, func)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Profile the time taken to import modules.
+
+Imports the given modules, or the ones nova-api, nova-scheduler and
+nova-rootwrap import at startup, timing the import of every module they
+pull in.  Reports the total time, and the modules that took longest to
+import themselves, not counting the modules they import in turn
+(--sort self, the default), or including them (--sort total).
+
+Run like:
+
+    ./tools/benchmarks/import_time.py --top 20 nova.scheduler.manager
+"""
+import __builtin__
+import argparse
+import gettext
+import os
+import sys
+import time
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+gettext.install('nova', unicode=1)
+
+# What the services import at startup, before reading their config
+DEFAULT_MODULES = [
+    'nova.service',
+    'nova.api.openstack.compute',
+    'nova.scheduler.manager',
+    'nova.openstack.common.rootwrap.wrapper',
+]
+
+
+class ImportTimer(object):
+    """Wraps __import__, timing the first import of every module."""
+
+    def __init__(self):
+        self.total = {}
+        self.children = {}
+        self.stack = []
+        self.real_import = __builtin__.__import__
+
+    def install(self):
+        __builtin__.__import__ = self._import
+
+    def uninstall(self):
+        __builtin__.__import__ = self.real_import
+
+    def _import(self, name, globals=None, locals=None, fromlist=None,
+                level=-1):
+        before = set(sys.modules)
+        # Time spent in, and modules loaded by, the imports this one makes
+        self.stack.append([0.0, set()])
+        start = time.time()
+        try:
+            return self.real_import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.time() - start
+            children, nested = self.stack.pop()
+            new = set(mod for mod in set(sys.modules) - before
+                      if sys.modules[mod] is not None)
+            direct = new - nested
+            if direct:
+                # Charge the time to the innermost module loaded, the
+                # others are the packages it lives in.
+                mod = max(direct, key=len)
+                self.total[mod] = elapsed
+                self.children[mod] = children
+            if self.stack:
+                self.stack[-1][0] += elapsed
+                self.stack[-1][1].update(new)
+
+    def report(self, top, sort):
+        results = []
+        for mod, total in self.total.iteritems():
+            results.append((mod, total, total - self.children[mod]))
+        key = {'self': lambda r: r[2], 'total': lambda r: r[1]}[sort]
+        results.sort(key=key, reverse=True)
+        print "%-50s %10s %10s" % ('module', 'self ms', 'total ms')
+        for mod, total, self_time in results[:top]:
+            print "%-50s %10.1f %10.1f" % (mod, self_time * 1000,
+                                           total * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('modules', nargs='*', default=DEFAULT_MODULES)
+    parser.add_argument('--top', type=int, default=25)
+    parser.add_argument('--sort', choices=('self', 'total'), default='self')
+    args = parser.parse_args()
+
+    timer = ImportTimer()
+    timer.install()
+    for name in args.modules:
+        start = time.time()
+        try:
+            __import__(name)
+        except Exception as e:
+            print "Failed to import %s: %s" % (name, e)
+        print "%-50s %10.1f ms" % (name, (time.time() - start) * 1000)
+    timer.uninstall()
+    print
+    timer.report(args.top, args.sort)
+
+
+if __name__ == '__main__':
+    main()
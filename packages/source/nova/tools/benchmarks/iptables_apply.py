@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Benchmark for IptablesManager.apply() with a large number of rules.
+
+Fills an IptablesManager with security-group style rules and times
+applying them against a fake iptables-save/iptables-restore that hands
+back whatever was last restored, i.e. the steady state of a busy host.
+Each apply is timed with a full rewrite and with the incremental mode,
+after changing a single rule.
+
+Run like:
+
+    ./tools/benchmarks/iptables_apply.py --rules 10000
+"""
+import argparse
+import gettext
+import os
+import sys
+import tempfile
+import time
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+gettext.install('nova', unicode=1)
+
+from oslo.config import cfg
+
+from nova.network import linux_net
+
+
+CONF = cfg.CONF
+
+
+class FakeIptables(object):
+    """Keeps the last restored tables around for the next save."""
+
+    def __init__(self):
+        self.saved = {'iptables': '', 'ip6tables': ''}
+        self.restored_bytes = 0
+        self.calls = 0
+
+    def __call__(self, *cmd, **kwargs):
+        self.calls += 1
+        binary, action = cmd[0].rsplit('-', 1)
+        if action == 'save':
+            return self.saved[binary], ''
+        process_input = kwargs['process_input']
+        self.restored_bytes += len(process_input)
+        # Like iptables-restore, only the tables we were given change
+        tables = dict(self._split_tables(self.saved[binary]))
+        tables.update(self._split_tables(process_input))
+        self.saved[binary] = '\n'.join('\n'.join(lines)
+                                       for lines in tables.values())
+        return '', ''
+
+    @staticmethod
+    def _split_tables(data):
+        lines = data.split('\n')
+        for i, line in enumerate(lines):
+            if line.startswith('*'):
+                end = lines.index('COMMIT', i) + 2
+                yield line, lines[i - 1:end]
+
+
+def fill(manager, num_rules):
+    table = manager.ipv4['filter']
+    num_chains = max(num_rules / 20, 1)
+    for i in xrange(num_chains):
+        chain = 'inst-%d' % i
+        table.add_chain(chain)
+        table.add_rule('local', '-d 10.%d.%d.%d -j $%s' %
+                       (i / 65536, i / 256 % 256, i % 256, chain))
+    for i in xrange(num_rules):
+        table.add_rule('inst-%d' % (i % num_chains),
+                       '-s 192.168.%d.0/24 -p tcp -m tcp --dport %d '
+                       '-j ACCEPT' % (i / 1000, i % 1000 + 1))
+
+
+def timed_apply(manager, fake, incremental):
+    CONF.set_override('iptables_incremental_apply', incremental)
+    fake.calls = fake.restored_bytes = 0
+    start = time.time()
+    manager.apply()
+    elapsed = time.time() - start
+    print "  %-24s %8.1f ms %4d calls %10d bytes restored" % (
+        incremental and 'incremental' or 'full rewrite', elapsed * 1000,
+        fake.calls, fake.restored_bytes)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rules', type=int, default=10000)
+    args = parser.parse_args()
+
+    CONF([], project='nova')
+    CONF.set_override('lock_path', tempfile.mkdtemp())
+    CONF.set_override('use_ipv6', True)
+
+    fake = FakeIptables()
+    manager = linux_net.IptablesManager(execute=fake)
+    fill(manager, args.rules)
+
+    print "initial apply of %d rules:" % args.rules
+    timed_apply(manager, fake, False)
+
+    print "re-apply without changes:"
+    for incremental in (False, True):
+        timed_apply(manager, fake, incremental)
+
+    print "re-apply after changing one nat rule:"
+    for incremental in (False, True):
+        manager.ipv4['nat'].add_rule('float-snat', '-s 10.0.0.%d '
+                                     '-j SNAT --to 172.16.0.1' % incremental)
+        timed_apply(manager, fake, incremental)
+
+    print "re-apply after changing one filter rule:"
+    for incremental in (False, True):
+        manager.ipv4['filter'].add_rule('inst-0', '-s 172.16.%d.0/24 '
+                                        '-j DROP' % incremental)
+        timed_apply(manager, fake, incremental)
+
+    table = manager.ipv4['filter']
+    current = fake.saved['iptables'].split('\n')
+    start, end = manager._find_table(current, 'filter')
+    current = current[start:end]
+    start = time.time()
+    manager._modify_rules(current, table, 'filter')
+    print "_modify_rules on %d lines: %.1f ms" % (len(current),
+                                                 (time.time() - start) * 1000)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Benchmark for casts through the kombu RPC driver.
+
+Casts messages to a topic with a consumer queue, declaring a new
+publisher for every message like the driver used to, through the
+cached publishers of a connection, and through rpc.cast() and
+rpc.cast_many(), reporting the casts per second.  Without a
+--rabbit-host the kombu memory transport stands in for the broker, so
+the numbers only show the client side cost; declaring an exchange on
+a real broker is a round trip on top of that.
+
+Run like:
+
+    ./tools/benchmarks/kombu_cast.py --casts 5000 --batch-size 50
+"""
+import argparse
+import gettext
+import os
+import sys
+import time
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+gettext.install('nova', unicode=1)
+
+from oslo.config import cfg
+
+from nova import context
+from nova.openstack.common import rpc
+from nova.openstack.common.rpc import impl_kombu
+
+
+CONF = cfg.CONF
+
+TOPIC = 'benchmark'
+
+
+def make_msg(i):
+    return {'method': 'noop', 'args': {'i': i, 'data': 'x' * 200}}
+
+
+def timed(label, count, func):
+    start = time.time()
+    func()
+    elapsed = time.time() - start
+    print "%-36s %8.0f casts/sec" % (label, count / elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--casts', type=int, default=5000)
+    parser.add_argument('--batch-size', type=int, default=50)
+    parser.add_argument('--rabbit-host', default=None,
+                        help='use this broker instead of the memory '
+                             'transport')
+    parser.add_argument('--confirms', action='store_true',
+                        help='use publisher confirms, needs a broker')
+    args = parser.parse_args()
+
+    CONF([], project='nova')
+    CONF.set_override('rpc_backend', impl_kombu.__name__)
+    CONF.set_override('rabbit_publisher_confirms', args.confirms)
+    if args.rabbit_host:
+        CONF.set_override('rabbit_host', args.rabbit_host)
+    else:
+        CONF.set_override('fake_rabbit', True)
+
+    # Messages are dropped without a queue bound to the exchange
+    consumer = impl_kombu.Connection(CONF)
+    consumer.declare_topic_consumer(TOPIC, lambda msg: None)
+    conn = impl_kombu.Connection(CONF)
+    ctxt = context.get_admin_context()
+    casts = args.casts
+    batches = [[make_msg(i) for i in xrange(start, start + args.batch_size)]
+               for start in xrange(0, casts, args.batch_size)]
+
+    def new_publishers():
+        for i in xrange(casts):
+            publisher = impl_kombu.TopicPublisher(CONF, conn.channel, TOPIC)
+            publisher.send(make_msg(i))
+
+    def cached_publishers():
+        for i in xrange(casts):
+            conn.topic_send(TOPIC, make_msg(i))
+
+    def batched():
+        for batch in batches:
+            conn.topic_send_many(TOPIC, batch)
+
+    def rpc_cast():
+        for i in xrange(casts):
+            rpc.cast(ctxt, TOPIC, make_msg(i))
+
+    def rpc_cast_many():
+        for batch in batches:
+            rpc.cast_many(ctxt, TOPIC, [dict(msg) for msg in batch])
+
+    timed('new publisher per cast', casts, new_publishers)
+    timed('cached publisher', casts, cached_publishers)
+    timed('batches of %d' % args.batch_size, casts, batched)
+    timed('rpc.cast()', casts, rpc_cast)
+    timed('rpc.cast_many(), batches of %d' % args.batch_size, casts,
+          rpc_cast_many)
+
+    consumer.channel.queue_purge(TOPIC)
+    rpc.cleanup()
+    conn.close()
+    consumer.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Benchmark for calling a slow libvirt through the libvirt thread pool.
+
+Makes getInfo() calls on a fake libvirt connection that blocks its OS
+thread for --call-time seconds, like a busy libvirtd does, from several
+greenthreads at once.  Meanwhile a greenthread standing in for the RPC
+consumer of nova-compute wakes up every 10ms and records how late it was.
+The calls are made directly, as with libvirt_nonblocking=False, and
+through the thread pool, reporting the time taken, how late the RPC
+greenthread got to run and the stats of the pool.
+
+Run like:
+
+    ./tools/benchmarks/libvirt_threadpool.py --calls 50 --concurrency 10
+"""
+import argparse
+import gettext
+import os
+import sys
+import time
+
+import eventlet
+from eventlet import greenpool
+from eventlet import patcher
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+gettext.install('nova', unicode=1)
+
+from nova.tests import fakelibvirt
+from nova.virt.libvirt import threadpool
+
+native_time = patcher.original('time')
+
+TICK = 0.01
+
+
+class SlowConnection(fakelibvirt.Connection):
+
+    call_time = 0.05
+
+    def getInfo(self):
+        native_time.sleep(self.call_time)
+        return super(SlowConnection, self).getInfo()
+
+
+def rpc_consumer(delays, done):
+    while not done:
+        start = time.time()
+        eventlet.sleep(TICK)
+        delays.append(time.time() - start - TICK)
+
+
+def run(label, conn, calls, concurrency):
+    delays = []
+    done = []
+    consumer = eventlet.spawn(rpc_consumer, delays, done)
+    eventlet.sleep(0)
+    pool = greenpool.GreenPool(concurrency)
+    start = time.time()
+    for i in xrange(calls):
+        pool.spawn_n(conn.getInfo)
+    pool.waitall()
+    elapsed = time.time() - start
+    done.append(True)
+    consumer.wait()
+    delays = delays or [0.0]
+    print "%-28s %8.2f s %6d rpc ticks, late %8.1f ms avg %8.1f ms max" % (
+        label, elapsed, len(delays), sum(delays) * 1000 / len(delays),
+        max(delays) * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--call-time', type=float, default=0.05,
+                        help='seconds every libvirt call blocks for')
+    parser.add_argument('--pool-size', type=int, default=20)
+    args = parser.parse_args()
+
+    SlowConnection.call_time = args.call_time
+    conn = SlowConnection('qemu:///system', False)
+    pool = threadpool.ThreadPool('libvirt', args.pool_size)
+    proxy = pool.proxy_call((fakelibvirt.Connection,), SlowConnection,
+                            'qemu:///system', False)
+
+    run('direct', conn, args.calls, args.concurrency)
+    run('thread pool', proxy, args.calls, args.concurrency)
+
+    stats = pool.get_stats()
+    for name, method_stats in sorted(stats['methods'].iteritems()):
+        print "%-28s %6d calls %8.1f ms avg %8.1f ms max" % (
+            name, method_stats['calls'], method_stats['average_time'] * 1000,
+            method_stats['max_time'] * 1000)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Benchmark for running commands through rootwrap.
+
+Runs a trivial command through bin/nova-rootwrap, once per command like
+utils.execute(run_as_root=True) does, and through bin/nova-rootwrap-daemon,
+one at a time and from several greenthreads at once, reporting the time
+per command. Both use a throwaway rootwrap configuration that only allows
+the benchmarked command; pass --sudo to run them as root.
+
+Run like:
+
+    ./tools/benchmarks/rootwrap_exec.py --commands 200 --concurrency 10
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from eventlet.green import subprocess
+from eventlet import greenpool
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+from nova.openstack.common.rootwrap import client as rootwrap_client
+
+
+COMMAND = ['true']
+
+
+def write_config(tmpdir):
+    filters_path = os.path.join(tmpdir, 'rootwrap.d')
+    os.mkdir(filters_path)
+    with open(os.path.join(filters_path, 'benchmark.filters'), 'w') as f:
+        f.write('[Filters]\ntrue: CommandFilter, /bin/true, root\n')
+    conffile = os.path.join(tmpdir, 'rootwrap.conf')
+    with open(conffile, 'w') as f:
+        f.write('[DEFAULT]\nfilters_path=%s\n' % filters_path)
+    return conffile
+
+
+def run_rootwrap(prefix, conffile):
+    cmd = prefix + [os.path.join(POSSIBLE_TOPDIR, 'bin', 'nova-rootwrap'),
+                    conffile] + COMMAND
+    obj = subprocess.Popen(cmd, stdin=subprocess.PIPE,
+                           stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                           close_fds=True)
+    obj.communicate()
+    assert obj.returncode == 0, 'rootwrap exited with %s' % obj.returncode
+
+
+def run_daemon(client):
+    returncode, _out, _err = client.execute(COMMAND)
+    assert returncode == 0, 'daemon returned %s' % returncode
+
+
+def timed(label, count, func, concurrency=1):
+    pool = greenpool.GreenPool(concurrency)
+    start = time.time()
+    for i in xrange(count):
+        pool.spawn_n(func)
+    pool.waitall()
+    elapsed = time.time() - start
+    print "%-32s %8.2f ms/command %8.0f commands/sec" % (
+        label, elapsed * 1000 / count, count / elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--commands', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--sudo', action='store_true',
+                        help='run rootwrap and the daemon with sudo')
+    args = parser.parse_args()
+
+    prefix = [sys.executable]
+    if args.sudo:
+        prefix = ['sudo'] + prefix
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        conffile = write_config(tmpdir)
+        daemon = os.path.join(POSSIBLE_TOPDIR, 'bin', 'nova-rootwrap-daemon')
+        client = rootwrap_client.Client(prefix + [daemon, conffile])
+
+        start = time.time()
+        run_daemon(client)
+        print "daemon startup: %.1f ms" % ((time.time() - start) * 1000)
+
+        timed('rootwrap per command', args.commands,
+              lambda: run_rootwrap(prefix, conffile))
+        timed('rootwrap per command, %d at once' % args.concurrency,
+              args.commands, lambda: run_rootwrap(prefix, conffile),
+              args.concurrency)
+        timed('daemon', args.commands, lambda: run_daemon(client))
+        timed('daemon, %d at once' % args.concurrency, args.commands,
+              lambda: run_daemon(client), args.concurrency)
+        client.stop()
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
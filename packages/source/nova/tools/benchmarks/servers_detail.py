@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Benchmark for building and serializing /servers/detail responses.
+
+Renders a list of fake instances with the servers view builder, the
+extended_status and extended_server_attributes extensions, and the JSON
+and XML serializers, reporting the time spent building the view and
+serializing it for each response size.
+
+Run like:
+
+    ./tools/benchmarks/servers_detail.py --servers 100 1000 5000
+"""
+import argparse
+import datetime
+import gettext
+import os
+import sys
+import time
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+gettext.install('nova', unicode=1)
+
+from oslo.config import cfg
+
+from nova.api.openstack.compute.contrib import extended_server_attributes
+from nova.api.openstack.compute.contrib import extended_status
+from nova.api.openstack.compute import servers
+from nova.api.openstack.compute.views import servers as views_servers
+from nova.api.openstack import wsgi
+from nova.compute import instance_types
+from nova import context
+
+
+CONF = cfg.CONF
+
+CONTENT_TYPES = ('application/json', 'application/xml')
+
+
+def make_instances(count):
+    instance_type = {'id': 2, 'name': 'm1.small', 'flavorid': '2',
+                     'memory_mb': 2048, 'vcpus': 1, 'root_gb': 20,
+                     'ephemeral_gb': 0, 'swap': 0, 'rxtx_factor': 1.0,
+                     'vcpu_weight': None}
+    sys_meta = instance_types.save_instance_type_info({}, instance_type)
+    nw_info = ('[{"id": "vif-1", "address": "aa:bb:cc:dd:ee:ff", '
+               '"network": {"id": "net-1", "label": "private", '
+               '"subnets": [{"cidr": "10.0.0.0/24", "ips": '
+               '[{"address": "10.0.0.2", "type": "fixed", '
+               '"floating_ips": []}]}]}}]')
+
+    instances = []
+    for i in xrange(count):
+        instances.append({
+            'uuid': '00000000-0000-0000-0000-%012d' % i,
+            'name': 'instance-%08x' % i,
+            'display_name': 'server%d' % i,
+            'project_id': 'fake',
+            'user_id': 'fake_user',
+            'host': 'compute%d' % (i % 20),
+            'node': 'compute%d' % (i % 20),
+            'vm_state': 'active',
+            'task_state': None,
+            'power_state': 1,
+            'image_ref': '155d900f-4e14-4e4c-a73d-069cbf4541e6',
+            'metadata': [{'key': 'seq', 'value': str(i)}],
+            'system_metadata': [{'key': k, 'value': v}
+                                for k, v in sys_meta.items()],
+            'info_cache': {'network_info': nw_info},
+            'created_at': datetime.datetime(2013, 1, 1, 12, 0, 0),
+            'updated_at': datetime.datetime(2013, 1, 2, 12, 0, 0),
+            'access_ip_v4': None,
+            'access_ip_v6': None,
+            'progress': 0})
+    return instances
+
+
+def make_request(instances):
+    req = wsgi.Request.blank('/v2/fake/servers/detail',
+                             base_url='http://localhost/v2')
+    req.environ['nova.context'] = context.RequestContext('fake_user', 'fake',
+                                                         is_admin=True)
+    req.cache_db_instances(instances)
+    return req
+
+
+def run(instances, content_type):
+    """Build and serialize one response, like Resource does."""
+    req = make_request(instances)
+    status = extended_status.ExtendedStatusController()
+    attrs = extended_server_attributes.ExtendedServerAttributesController()
+    extensions = [status.detail(req), attrs.detail(req)]
+    for ext in extensions:
+        ext.next()
+
+    start = time.time()
+    obj = views_servers.ViewBuilder().detail(req, instances)
+    built = time.time()
+
+    resp_obj = wsgi.ResponseObject(obj)
+    resp_obj._bind_method_serializers({'xml': servers.ServersTemplate})
+    resp_obj.preserialize(content_type,
+                          {'json': wsgi.JSONDictSerializer,
+                           'xml': wsgi.XMLDictSerializer})
+    for ext in reversed(extensions):
+        try:
+            ext.send(resp_obj)
+        except StopIteration:
+            pass
+    body = resp_obj.serialize(req, content_type).body
+    done = time.time()
+
+    return built - start, done - built, len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--servers', type=int, nargs='+',
+                        default=[100, 1000, 5000])
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='report the best of this many runs')
+    parser.add_argument('--policy-file',
+                        default=os.path.join(POSSIBLE_TOPDIR, 'etc', 'nova',
+                                             'policy.json'))
+    args = parser.parse_args()
+
+    CONF([], project='nova')
+    CONF.set_override('policy_file', args.policy_file)
+
+    print "%8s %-18s %10s %10s %10s %10s" % ('servers', 'content type',
+                                             'view ms', 'serial ms',
+                                             'total ms', 'bytes')
+    for count in args.servers:
+        instances = make_instances(count)
+        for content_type in CONTENT_TYPES:
+            results = [run(instances, content_type)
+                       for i in xrange(args.repeat)]
+            view, serialize, size = min(results,
+                                        key=lambda r: r[0] + r[1])
+            print "%8d %-18s %10.1f %10.1f %10.1f %10d" % (
+                count, content_type, view * 1000, serialize * 1000,
+                (view + serialize) * 1000, size)
+
+
+if __name__ == '__main__':
+    main()
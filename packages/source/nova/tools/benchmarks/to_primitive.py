@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Benchmark for jsonutils.to_primitive() on instances.
+
+Creates an instance with metadata, system_metadata, an info_cache and
+security groups in a throwaway sqlite database, and converts it the way
+RPC messages and notifications do: the instance model as the compute
+rpcapi sends it, the resulting dict as the conductor passes it on, a
+list of instances like instance_get_all_by_host() returns, and a
+message with convert_instances like the notifier converts payloads.
+Reports the time per conversion.
+
+Run like:
+
+    ./tools/benchmarks/to_primitive.py --iterations 2000
+"""
+import argparse
+import datetime
+import gettext
+import os
+import sys
+import tempfile
+import time
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+gettext.install('nova', unicode=1)
+
+from oslo.config import cfg
+
+from nova import context
+from nova import db
+from nova.db.sqlalchemy import models
+from nova.openstack.common.db.sqlalchemy import session as db_session
+from nova.openstack.common import jsonutils
+
+
+CONF = cfg.CONF
+
+
+def create_instance(ctxt):
+    system_metadata = dict(('image_prop%d' % i, 'value%d' % i)
+                           for i in xrange(10))
+    system_metadata.update({'instance_type_id': '1',
+                            'instance_type_name': 'm1.small',
+                            'instance_type_memory_mb': '2048',
+                            'instance_type_vcpus': '1',
+                            'instance_type_root_gb': '20',
+                            'instance_type_ephemeral_gb': '0',
+                            'instance_type_flavorid': '2',
+                            'instance_type_swap': '0',
+                            'instance_type_rxtx_factor': '1.0',
+                            'instance_type_vcpu_weight': ''})
+    instance = db.instance_create(ctxt, {
+        'host': 'compute1',
+        'node': 'compute1',
+        'project_id': 'project',
+        'user_id': 'user',
+        'image_ref': 'cedef40a-ed67-4d10-800e-17455edce175',
+        'vm_state': 'active',
+        'power_state': 1,
+        'memory_mb': 2048,
+        'vcpus': 1,
+        'root_gb': 20,
+        'launched_at': datetime.datetime.utcnow(),
+        'metadata': {'role': 'webserver', 'tier': 'frontend'},
+        'system_metadata': system_metadata,
+        'security_groups': ['default']})
+    network_info = jsonutils.dumps([{
+        'id': 'a7d3c5f1-bb43-4f0f-9e16-e5a2bbe53d53',
+        'address': 'fa:16:3e:00:00:01',
+        'network': {'id': 'net1', 'bridge': 'br100', 'label': 'private',
+                    'subnets': [{'cidr': '10.0.0.0/24',
+                                 'gateway': {'address': '10.0.0.1'},
+                                 'ips': [{'address': '10.0.0.2',
+                                          'floating_ips': []}],
+                                 'dns': [{'address': '8.8.8.8'}]}]}}])
+    db.instance_info_cache_update(ctxt, instance['uuid'],
+                                  {'network_info': network_info})
+    return db.instance_get_by_uuid(ctxt, instance['uuid'])
+
+
+def timed(label, iterations, func):
+    start = time.time()
+    for i in xrange(iterations):
+        func()
+    elapsed = time.time() - start
+    print "%-32s %10.1f us/conversion" % (label, elapsed * 1000000 /
+                                          iterations)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--instances', type=int, default=50,
+                        help='number of instances in the list')
+    args = parser.parse_args()
+
+    CONF([], project='nova')
+    fd, tmpfile = tempfile.mkstemp(suffix='.sqlite')
+    os.close(fd)
+    CONF.set_override('sql_connection', 'sqlite:///%s' % tmpfile)
+
+    try:
+        engine = db_session.get_engine()
+        models.BASE.metadata.create_all(engine)
+        ctxt = context.get_admin_context()
+        instance = create_instance(ctxt)
+        instance_dict = jsonutils.to_primitive(instance)
+        instances = [instance_dict] * args.instances
+        msg = {'method': 'run_instance',
+               'args': {'instance': instance_dict,
+                        'filter_properties': {'retry': {'num_attempts': 1,
+                                                        'hosts': []}},
+                        'request_spec': {'instance_properties':
+                                         instance_dict,
+                                         'instance_uuids': [
+                                             instance['uuid']]}}}
+
+        iterations = args.iterations
+        timed('instance model', iterations,
+              lambda: jsonutils.to_primitive(instance))
+        timed('instance dict', iterations,
+              lambda: jsonutils.to_primitive(instance_dict))
+        timed('%d instance dicts' % args.instances,
+              max(iterations / args.instances, 1),
+              lambda: jsonutils.to_primitive(instances))
+        timed('message, convert_instances', iterations,
+              lambda: jsonutils.to_primitive(msg, convert_instances=True))
+    finally:
+        os.unlink(tmpfile)
+
+
+if __name__ == '__main__':
+    main()